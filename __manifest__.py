@@ -1,6 +1,6 @@
 {
     'name': 'WOOW Dashboard',
-    'version': '18.0.7.0',
+    'version': '18.0.7.2',
     'category': 'WOOW/Extra Tools',
     'summary': 'Dashboard with Home Assistant integration',
     'depends': ['base', 'web', 'mail', 'portal'],
@@ -146,6 +146,9 @@
             # 6. Views - 按依賴順序載入
             # HaHistory 視圖 (Model -> Renderer -> Parser -> Controller -> View)
             'odoo_ha_addon/static/src/views/hahistory/hahistory_model.js',
+            'odoo_ha_addon/static/src/views/hahistory/hahistory_chart_data.js',
+            'odoo_ha_addon/static/src/views/hahistory/hahistory_worker_client.js',
+            'odoo_ha_addon/static/src/views/hahistory/hahistory_live.js',
             'odoo_ha_addon/static/src/views/hahistory/hahistory_renderer.js',
             'odoo_ha_addon/static/src/views/hahistory/hahistory_renderer.xml',
             'odoo_ha_addon/static/src/views/hahistory/hahistory_arch_parser.js',
@@ -191,12 +194,13 @@
             # Portal Service Layer - Session-based API
             'odoo_ha_addon/static/src/portal/portal_entity_service.js',
             'odoo_ha_addon/static/src/portal/hooks/usePortalEntityControl.js',
+            'odoo_ha_addon/static/src/portal/hooks/usePortalLiveState.js',
 
             # Portal Entity Controller (registered to public_components)
             'odoo_ha_addon/static/src/portal/portal_entity_controller.js',
             'odoo_ha_addon/static/src/portal/portal_entity_controller.xml',
 
-            # Portal Entity Info Component (info cards with auto-polling)
+            # Portal Entity Info Component (info cards with live updates)
             'odoo_ha_addon/static/src/portal/portal_entity_info.js',
             'odoo_ha_addon/static/src/portal/portal_entity_info.xml',
 
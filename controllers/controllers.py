@@ -6,6 +6,8 @@ import logging
 import time
 from psycopg2 import errors as psycopg2_errors
 from odoo.addons.odoo_ha_addon.models.common.instance_helper import HAInstanceHelper
+from odoo.addons.odoo_ha_addon.models.ha_realtime_update import INSTANCE_CHANNEL_PREFIX
+from odoo.addons.odoo_ha_addon.models.common.portal_state import BATCH_STATE_MAX_IDS, read_batch_states
 
 _logger = logging.getLogger(__name__)
 
@@ -598,6 +600,138 @@ class AwesomeDashboard(http.Controller):
                 'error': str(e)
             })
 
+    @http.route('/odoo_ha_addon/websocket_statuses', type='json', auth='user')
+    def get_websocket_statuses(self):
+        """
+        一次取得所有可用實例的 WebSocket 狀態（Dashboard / systray 使用）
+
+        本 process 的連線表 + 一次心跳查詢（per-process 短暫快取），
+        不需為每個實例各呼叫一次 /odoo_ha_addon/websocket_status。
+
+        ⚠️ Permission Filtering:
+        - ir.rule 會自動過濾使用者可存取的實例
+
+        Returns:
+            dict: 標準化響應格式
+                {
+                    'success': bool,
+                    'data': {
+                        'statuses': {
+                            instance_id: {
+                                'status': 'connected' | 'disconnected',
+                                'is_running': bool,
+                                'source': 'local' | 'heartbeat',
+                                'heartbeat_age': float or None,
+                            }
+                        }
+                    }
+                }
+        """
+        try:
+            from odoo.addons.odoo_ha_addon.models.common.websocket_thread_manager import (
+                get_websocket_status_details
+            )
+
+            instances = request.env['ha.instance'].search([('active', '=', True)])
+            details = get_websocket_status_details(request.env, instances.ids)
+
+            return self._standardize_response({
+                'success': True,
+                'data': {
+                    'statuses': {
+                        instance_id: {
+                            'status': 'connected' if detail['running'] else 'disconnected',
+                            'is_running': detail['running'],
+                            'source': detail['source'],
+                            'heartbeat_age': detail['heartbeat_age'],
+                        }
+                        for instance_id, detail in details.items()
+                    }
+                }
+            })
+
+        except Exception as e:
+            _logger.error(f"Failed to get WebSocket statuses: {e}")
+            return self._standardize_response({
+                'success': False,
+                'error': str(e)
+            })
+
+    @http.route('/odoo_ha_addon/entity_states', type='json', auth='user')
+    def get_entity_states(self, entity_ids=None, group_ids=None, device_ids=None,
+                          since=None, fields=None, attributes=None):
+        """
+        批次取得多個實體的狀態（後端 widget 使用，portal 對應端點為 /my/ha/<instance_id>/states）
+
+        一次授權所有請求的實體 / 群組 / 裝置，一次查詢讀取狀態，
+        只回傳 since 游標之後變更的實體。
+
+        ⚠️ Permission Filtering:
+        - ir.rule 會自動過濾使用者可存取的實體、群組與裝置，無權限的 id 不會出現在回應中
+
+        Args:
+            entity_ids (list): ha.entity record IDs
+            group_ids (list): ha.entity.group record IDs（展開為群組內的實體）
+            device_ids (list): ha.device record IDs（展開為裝置的實體）
+            since (str): 前一次回應的 cursor
+            fields (list): 要回傳的欄位（BATCH_STATE_FIELDS 的子集合，id 一定回傳）
+            attributes (list): 只保留這些 attributes key（預設全部）
+
+        Returns:
+            dict: 標準化響應格式
+                {
+                    'success': bool,
+                    'data': {
+                        'entities': [...],      # since 之後變更的實體狀態
+                        'entity_ids': [...],    # 所有已授權的實體 ID
+                        'cursor': str,          # 下一次請求的 since
+                    }
+                }
+        """
+        try:
+            entity_ids = [_safe_int(value, 'entity_ids') for value in entity_ids or []]
+            group_ids = [_safe_int(value, 'group_ids') for value in group_ids or []]
+            device_ids = [_safe_int(value, 'device_ids') for value in device_ids or []]
+            if len(entity_ids) + len(group_ids) + len(device_ids) > BATCH_STATE_MAX_IDS:
+                raise ValueError(_("Too many ids (maximum %s)") % BATCH_STATE_MAX_IDS)
+
+            Entity = request.env['ha.entity']
+            requested_ids = set(entity_ids)
+            if group_ids:
+                groups = request.env['ha.entity.group'].search([('id', 'in', group_ids)])
+                requested_ids.update(groups.entity_ids.ids)
+            if device_ids:
+                devices = request.env['ha.device'].search([('id', 'in', device_ids)])
+                requested_ids.update(devices.entity_ids.ids)
+
+            # 一次查詢套用 ir.rule
+            authorized_ids = Entity.search([('id', 'in', list(requested_ids))], order='id').ids
+            states, cursor = read_batch_states(
+                Entity, authorized_ids,
+                since=since, fields=fields, attribute_keys=attributes, sanitize=False,
+            )
+
+            return self._standardize_response({
+                'success': True,
+                'data': {
+                    'entities': states,
+                    'entity_ids': authorized_ids,
+                    'cursor': cursor,
+                }
+            })
+
+        except ValueError as e:
+            return self._standardize_response({
+                'success': False,
+                'error': str(e)
+            })
+        except Exception as e:
+            _logger.error(f"Failed to get entity states: {e}")
+            return self._standardize_response({
+                'success': False,
+                'error': str(e)
+            })
+
     @http.route('/odoo_ha_addon/areas', type='json', auth='user')
     def get_areas(self, ha_instance_id=None):
         """
@@ -1338,6 +1472,33 @@ class AwesomeDashboard(http.Controller):
                 'error': _('Failed to load HA instances. Please try again.')
             })
 
+    @http.route('/odoo_ha_addon/bus_channels', type='json', auth='user')
+    def get_bus_channels(self):
+        """
+        取得前端應訂閱的 HA instance bus channels
+
+        即時通知以 instance channel 發送（每則通知一筆 bus.bus），
+        前端以 busService.addChannel() 訂閱這些 channel。
+        實際授權在 ir.websocket._build_bus_channel_list 訂閱時再檢查一次。
+
+        Returns:
+            dict: {'success': True, 'data': {'channels': [...]}}
+        """
+        try:
+            instances = request.env['ha.instance'].search([('active', '=', True)])
+            return self._standardize_response({
+                'success': True,
+                'data': {
+                    'channels': [f'{INSTANCE_CHANNEL_PREFIX}{inst.id}' for inst in instances],
+                }
+            })
+        except Exception as e:
+            _logger.error(f"Failed to get HA bus channels: {e}", exc_info=True)
+            return self._standardize_response({
+                'success': False,
+                'error': _('Failed to load HA bus channels.')
+            })
+
     @http.route('/odoo_ha_addon/switch_instance', type='json', auth='user')
     def switch_instance(self, instance_id):
         """
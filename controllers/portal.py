@@ -18,6 +18,13 @@ from collections import OrderedDict
 from odoo import http, _
 from odoo.http import request
 from odoo.addons.portal.controllers.portal import CustomerPortal, pager as portal_pager
+from odoo.addons.odoo_ha_addon.models.common.portal_state import (
+    BATCH_STATE_MAX_IDS,
+    read_batch_states,
+    sanitize_portal_attributes as _sanitize_portal_attributes,
+    state_version,
+)
+from odoo.addons.odoo_ha_addon.models.common import share_access
 from odoo.osv.expression import AND
 import logging
 
@@ -38,25 +45,6 @@ PORTAL_ENTITY_FIELDS = [
     'attributes',
 ]
 
-# Attribute keys that should be stripped from portal responses
-# These may contain sensitive network/auth info from Home Assistant
-PORTAL_SENSITIVE_ATTRIBUTE_KEYS = {
-    'access_token', 'token', 'api_key', 'password', 'secret',
-    'ip_address', 'mac_address', 'network_key', 'host',
-    'latitude', 'longitude', 'gps_accuracy',
-}
-
-
-def _sanitize_portal_attributes(attributes):
-    """Strip sensitive keys from HA entity attributes for portal display."""
-    if not attributes or not isinstance(attributes, dict):
-        return attributes or {}
-    return {
-        k: v for k, v in attributes.items()
-        if k.lower() not in PORTAL_SENSITIVE_ATTRIBUTE_KEYS
-    }
-
-
 # Field whitelist for portal entity group access
 PORTAL_GROUP_FIELDS = [
     'id',
@@ -151,60 +139,48 @@ class HAPortalController(CustomerPortal):
     # Access Control Helpers
     # ========================================
 
-    def _check_entity_share_access(self, entity_id, user_id, required_permission='view'):
+    def _check_share_access(self, target, target_id, user_id, required_permission='view'):
         """
-        Check if user has access to entity via direct share OR via group share.
+        Check a user's access to an entity, group or device.
 
-        This method first checks for a direct entity share, then falls back to
-        checking if the entity belongs to any group that the user has access to.
+        Single lookup in the materialized share access index (cached per
+        user and target, see ha.entity.share._get_effective_permission).
 
         Args:
-            entity_id: ha.entity record ID
+            target: 'entity', 'group' or 'device'
+            target_id: Record ID of the target
             user_id: res.users record ID
             required_permission: 'view' or 'control'
 
         Returns:
-            ha.entity.share record if access granted, False otherwise
+            Effective permission ('view' or 'control') if access granted, False otherwise
         """
-        # 1. Check direct entity share
-        share = request.env['ha.entity.share'].sudo().search([
-            ('entity_id', '=', entity_id),
-            ('user_id', '=', user_id),
-            ('is_expired', '=', False),
-        ], limit=1)
+        permission = request.env['ha.entity.share'].sudo()._get_effective_permission(
+            target, target_id, user_id
+        )
+        if not permission:
+            return False
+        if required_permission == 'control' and permission != 'control':
+            _logger.debug(
+                f"{target.capitalize()} {target_id} control denied "
+                f"(user: {user_id}, permission: {permission})"
+            )
+            return False
+        return permission
 
-        if share:
-            if required_permission == 'control' and share.permission != 'control':
-                pass  # Continue to check group share
-            else:
-                return share
+    def _check_entity_share_access(self, entity_id, user_id, required_permission='view'):
+        """
+        Check if user has access to entity via a direct, group or device share.
 
-        # 2. Fall back to group share: find groups that contain this entity
-        groups = request.env['ha.entity.group'].sudo().search([
-            ('entity_ids', 'in', [entity_id])
-        ])
+        Args:
+            entity_id: ha.entity record ID
+            user_id: res.users record ID
+            required_permission: 'view' or 'control'
 
-        if groups:
-            group_share = request.env['ha.entity.share'].sudo().search([
-                ('group_id', 'in', groups.ids),
-                ('user_id', '=', user_id),
-                ('is_expired', '=', False),
-            ], limit=1)
-
-            if group_share:
-                if required_permission == 'control' and group_share.permission != 'control':
-                    _logger.debug(
-                        f"Entity {entity_id} control denied via group share "
-                        f"(user: {user_id}, group share permission: {group_share.permission})"
-                    )
-                    return False
-                _logger.debug(
-                    f"Entity {entity_id} access granted via group share "
-                    f"(user: {user_id}, permission: {required_permission})"
-                )
-                return group_share
-
-        return False
+        Returns:
+            Effective permission ('view' or 'control') if access granted, False otherwise
+        """
+        return self._check_share_access('entity', entity_id, user_id, required_permission)
 
     def _check_group_share_access(self, group_id, user_id, required_permission='view'):
         """
@@ -216,21 +192,9 @@ class HAPortalController(CustomerPortal):
             required_permission: 'view' or 'control'
 
         Returns:
-            ha.entity.share record if access granted, False otherwise
+            Effective permission ('view' or 'control') if access granted, False otherwise
         """
-        share = request.env['ha.entity.share'].sudo().search([
-            ('group_id', '=', group_id),
-            ('user_id', '=', user_id),
-            ('is_expired', '=', False),
-        ], limit=1)
-
-        if not share:
-            return False
-
-        if required_permission == 'control' and share.permission != 'control':
-            return False
-
-        return share
+        return self._check_share_access('group', group_id, user_id, required_permission)
 
     def _check_device_share_access(self, device_id, user_id, required_permission='view'):
         """
@@ -242,21 +206,9 @@ class HAPortalController(CustomerPortal):
             required_permission: 'view' or 'control'
 
         Returns:
-            ha.entity.share record if access granted, False otherwise
+            Effective permission ('view' or 'control') if access granted, False otherwise
         """
-        share = request.env['ha.entity.share'].sudo().search([
-            ('device_id', '=', device_id),
-            ('user_id', '=', user_id),
-            ('is_expired', '=', False),
-        ], limit=1)
-
-        if not share:
-            return False
-
-        if required_permission == 'control' and share.permission != 'control':
-            return False
-
-        return share
+        return self._check_share_access('device', device_id, user_id, required_permission)
 
     # ========================================
     # Data Extraction Helpers
@@ -285,6 +237,20 @@ class HAPortalController(CustomerPortal):
         data['attributes'] = _sanitize_portal_attributes(data.get('attributes'))
         return data
 
+    def _get_state_version(self, entities, *extra_dates):
+        """State version of the given entities, used as the polling ``since`` / ETag."""
+        request.env['ha.entity'].flush_model(['write_date'])
+        return state_version(request.env.cr, entities.ids, *extra_dates)
+
+    def _not_modified_response(self, version):
+        """304-equivalent polling response: nothing changed since ``version``."""
+        return {
+            'success': True,
+            'data': None,
+            'not_modified': True,
+            'version': version,
+        }
+
     def _get_safe_group_data(self, group):
         """Extract whitelisted fields from an entity group record."""
         data = group.read(PORTAL_GROUP_FIELDS)[0]
@@ -392,9 +358,8 @@ class HAPortalController(CustomerPortal):
             ('domain', {'label': _('Domain'), 'order': 'domain asc, name asc'}),
         ])
 
-    def _get_entity_searchbar_filters(self, entity_shares):
+    def _get_entity_searchbar_filters(self, entities):
         """Build dynamic filter options based on user's actual entity domains."""
-        entities = entity_shares.mapped('entity_id')
         domains = sorted(set(d for d in entities.mapped('domain') if d))
         searchbar_filters = OrderedDict([
             ('all', {'label': _('All'), 'domain': []}),
@@ -420,9 +385,8 @@ class HAPortalController(CustomerPortal):
             ('manufacturer', {'label': _('Manufacturer'), 'order': 'manufacturer asc, name asc'}),
         ])
 
-    def _get_device_searchbar_filters(self, device_shares):
+    def _get_device_searchbar_filters(self, devices):
         """Build dynamic filter options based on user's actual device manufacturers."""
-        devices = device_shares.mapped('device_id')
         manufacturers = sorted(set(m for m in devices.mapped('manufacturer') if m))
         searchbar_filters = OrderedDict([
             ('all', {'label': _('All'), 'domain': []}),
@@ -459,27 +423,13 @@ class HAPortalController(CustomerPortal):
             _logger.warning(f"Portal /my/ha access for non-existent instance: {instance_id}")
             return request.render('odoo_ha_addon.portal_error_404', status=404)
 
-        # Get shares for this instance
-        entity_shares = request.env['ha.entity.share'].sudo().search([
-            ('user_id', '=', user.id),
-            ('entity_id', '!=', False),
-            ('entity_id.ha_instance_id', '=', instance_id),
-            ('is_expired', '=', False),
-        ])
-        group_shares = request.env['ha.entity.share'].sudo().search([
-            ('user_id', '=', user.id),
-            ('group_id', '!=', False),
-            ('group_id.ha_instance_id', '=', instance_id),
-            ('is_expired', '=', False),
-        ])
-        device_shares = request.env['ha.entity.share'].sudo().search([
-            ('user_id', '=', user.id),
-            ('device_id', '!=', False),
-            ('device_id.ha_instance_id', '=', instance_id),
-            ('is_expired', '=', False),
-        ])
+        # Shared targets for this instance (one query on the share access index)
+        targets = share_access.read_user_targets(request.env.cr, user.id, instance_id)
+        entity_ids = list(targets['entity'])
+        group_ids = list(targets['group'])
+        device_ids = list(targets['device'])
 
-        if not entity_shares and not group_shares and not device_shares:
+        if not entity_ids and not group_ids and not device_ids:
             _logger.warning(f"Portal /my/ha/{instance_id} access denied: user {user.id} has no shares")
             return request.render('odoo_ha_addon.portal_error_403', status=403)
 
@@ -489,7 +439,9 @@ class HAPortalController(CustomerPortal):
 
         if tab == 'entities':
             searchbar_sortings = self._get_entity_searchbar_sortings()
-            searchbar_filters = self._get_entity_searchbar_filters(entity_shares)
+            searchbar_filters = self._get_entity_searchbar_filters(
+                request.env['ha.entity'].sudo().browse(entity_ids)
+            )
 
             if not sortby or sortby not in searchbar_sortings:
                 sortby = 'name_asc'
@@ -497,7 +449,6 @@ class HAPortalController(CustomerPortal):
                 filterby = 'all'
 
             order = searchbar_sortings[sortby]['order']
-            entity_ids = entity_shares.mapped('entity_id').ids
             base_domain = [('id', 'in', entity_ids)]
             domain = AND([base_domain, searchbar_filters[filterby]['domain']])
 
@@ -516,8 +467,8 @@ class HAPortalController(CustomerPortal):
                 'instance': instance,
                 'entities': entities,
                 'entity_count': entity_count,
-                'group_count': len(group_shares),
-                'device_count': len(device_shares),
+                'group_count': len(group_ids),
+                'device_count': len(device_ids),
                 'pager': pager,
                 'searchbar_sortings': searchbar_sortings,
                 'sortby': sortby,
@@ -540,7 +491,6 @@ class HAPortalController(CustomerPortal):
             filterby = 'all'
 
             order = searchbar_sortings[sortby]['order']
-            group_ids = group_shares.mapped('group_id').ids
             domain = [('id', 'in', group_ids)]
 
             Group = request.env['ha.entity.group'].sudo()
@@ -557,9 +507,9 @@ class HAPortalController(CustomerPortal):
             values = {
                 'instance': instance,
                 'groups': groups,
-                'entity_count': len(entity_shares),
+                'entity_count': len(entity_ids),
                 'group_count': group_count,
-                'device_count': len(device_shares),
+                'device_count': len(device_ids),
                 'pager': pager,
                 'searchbar_sortings': searchbar_sortings,
                 'sortby': sortby,
@@ -573,7 +523,9 @@ class HAPortalController(CustomerPortal):
 
         elif tab == 'devices':
             searchbar_sortings = self._get_device_searchbar_sortings()
-            searchbar_filters = self._get_device_searchbar_filters(device_shares)
+            searchbar_filters = self._get_device_searchbar_filters(
+                request.env['ha.device'].sudo().browse(device_ids)
+            )
 
             if not sortby or sortby not in searchbar_sortings:
                 sortby = 'name_asc'
@@ -581,7 +533,6 @@ class HAPortalController(CustomerPortal):
                 filterby = 'all'
 
             order = searchbar_sortings[sortby]['order']
-            device_ids = device_shares.mapped('device_id').ids
             base_domain = [('id', 'in', device_ids)]
             domain = AND([base_domain, searchbar_filters[filterby]['domain']])
 
@@ -599,8 +550,8 @@ class HAPortalController(CustomerPortal):
             values = {
                 'instance': instance,
                 'devices': devices,
-                'entity_count': len(entity_shares),
-                'group_count': len(group_shares),
+                'entity_count': len(entity_ids),
+                'group_count': len(group_ids),
                 'device_count': device_count,
                 'pager': pager,
                 'searchbar_sortings': searchbar_sortings,
@@ -644,27 +595,24 @@ class HAPortalController(CustomerPortal):
             _logger.warning(f"Portal access attempt for non-existent entity: {entity_id}")
             return request.render('odoo_ha_addon.portal_error_404', status=404)
 
-        share = self._check_entity_share_access(entity_id, user.id)
-        if not share:
+        permission = self._check_entity_share_access(entity_id, user.id)
+        if not permission:
             _logger.warning(f"Portal access denied for entity {entity_id}: user {user.id} has no share")
             return request.render('odoo_ha_addon.portal_error_403', status=403)
 
         _logger.info(f"Portal access granted for entity: {entity.entity_id} (user: {user.login})")
 
         controllable_domains = []
-        if share.permission == 'control':
+        if permission == 'control':
             controllable_domains = list(PORTAL_CONTROL_SERVICES.keys())
 
         entity._portal_ensure_token()
 
         # Prev/Next navigation within this instance's shared entities
-        entity_shares = request.env['ha.entity.share'].sudo().search([
-            ('user_id', '=', user.id),
-            ('entity_id', '!=', False),
-            ('entity_id.ha_instance_id', '=', instance_id),
-            ('is_expired', '=', False),
-        ])
-        all_entity_ids = entity_shares.mapped('entity_id').sorted(
+        shared_entity_ids = share_access.read_user_targets(
+            request.env.cr, user.id, instance_id
+        )['entity']
+        all_entity_ids = request.env['ha.entity'].sudo().browse(list(shared_entity_ids)).sorted(
             key=lambda e: e.name or ''
         ).ids
         idx = all_entity_ids.index(entity.id) if entity.id in all_entity_ids else -1
@@ -680,7 +628,7 @@ class HAPortalController(CustomerPortal):
         return request.render('odoo_ha_addon.portal_entity_detail', {
             'entity': entity,
             'instance': entity.ha_instance_id,
-            'permission': share.permission,
+            'permission': permission,
             'page_name': 'portal_entity',
             'controllable_domains': controllable_domains,
             'token': entity.access_token,
@@ -694,12 +642,18 @@ class HAPortalController(CustomerPortal):
         type='json',
         auth='user',
     )
-    def portal_entity_state(self, instance_id, entity_id, **kw):
-        """JSON polling endpoint for entity state updates."""
+    def portal_entity_state(self, instance_id, entity_id, since=None, **kw):
+        """
+        JSON polling endpoint for entity state updates.
+
+        Pages receive live updates over the bus; this endpoint is the initial
+        sync and the fallback. ``since`` is the ``version`` of the previous
+        response; if nothing changed the response has ``not_modified`` and no data.
+        """
         user = request.env.user
-        share = self._check_entity_share_access(entity_id, user.id)
+        permission = self._check_entity_share_access(entity_id, user.id)
 
-        if not share:
+        if not permission:
             _logger.warning(f"Portal state access denied for entity {entity_id}: user {user.id}")
             return {
                 'success': False,
@@ -715,9 +669,136 @@ class HAPortalController(CustomerPortal):
                 'error_code': 'not_found'
             }
 
+        version = self._get_state_version(entity)
+        if since and since == version:
+            return self._not_modified_response(version)
+
         return {
             'success': True,
             'data': self._get_safe_entity_data(entity),
+            'version': version,
+        }
+
+    # ========================================
+    # Batched State API: /my/ha/<instance_id>/states
+    # ========================================
+
+    @staticmethod
+    def _parse_id_list(values):
+        """Normalize a JSON id list param to a de-duplicated list of ints (ValueError if invalid)."""
+        if not values:
+            return []
+        if not isinstance(values, (list, tuple)):
+            raise ValueError(values)
+        return list(dict.fromkeys(int(value) for value in values))
+
+    @http.route(
+        '/my/ha/<int:instance_id>/states',
+        type='json',
+        auth='user',
+    )
+    def portal_entity_states(self, instance_id, entity_ids=None, group_ids=None, device_ids=None,
+                             since=None, fields=None, attributes=None, **kw):
+        """
+        Batched JSON state endpoint for any set of shared entities, groups and devices.
+
+        All requested ids are authorized with a single query on the share access
+        index; ids the user cannot access are left out of the response. Only
+        entities changed since the ``cursor`` of the previous response (``since``)
+        are returned, in one query.
+
+        Args:
+            entity_ids: ha.entity record IDs
+            group_ids: ha.entity.group record IDs (expanded to their entities)
+            device_ids: ha.device record IDs (expanded to their entities)
+            since: ``cursor`` of the previous response
+            fields: Entity fields to return (subset of BATCH_STATE_FIELDS; ``id`` is always returned)
+            attributes: Attribute keys to keep (default: all non-sensitive attributes)
+
+        Returns:
+            dict: {
+                'success': True,
+                'data': {
+                    'entities': [changed entity states],
+                    'entity_ids': [all authorized entity ids],
+                    'groups': {group_id: [entity ids]},
+                    'devices': {device_id: [entity ids]},
+                    'cursor': str,
+                },
+            }
+        """
+        user = request.env.user
+        try:
+            entity_ids = self._parse_id_list(entity_ids)
+            group_ids = self._parse_id_list(group_ids)
+            device_ids = self._parse_id_list(device_ids)
+        except (TypeError, ValueError):
+            return {
+                'success': False,
+                'error': _('Invalid ids'),
+                'error_code': 'invalid_params'
+            }
+
+        if len(entity_ids) + len(group_ids) + len(device_ids) > BATCH_STATE_MAX_IDS:
+            return {
+                'success': False,
+                'error': _('Too many ids (maximum %s)') % BATCH_STATE_MAX_IDS,
+                'error_code': 'too_many_ids'
+            }
+
+        # One query: every entity / group / device the user can access in this instance
+        targets = share_access.read_user_targets(request.env.cr, user.id, instance_id, direct=False)
+        accessible = targets['entity']
+
+        groups = request.env['ha.entity.group'].sudo().browse(
+            [group_id for group_id in group_ids if group_id in targets['group']]
+        )
+        devices = request.env['ha.device'].sudo().browse(
+            [device_id for device_id in device_ids if device_id in targets['device']]
+        )
+        group_members = {
+            group.id: [entity_id for entity_id in group.entity_ids.ids if entity_id in accessible]
+            for group in groups
+        }
+        device_members = {
+            device.id: [entity_id for entity_id in device.entity_ids.ids if entity_id in accessible]
+            for device in devices
+        }
+
+        authorized_ids = [entity_id for entity_id in entity_ids if entity_id in accessible]
+        for member_ids in (*group_members.values(), *device_members.values()):
+            authorized_ids.extend(member_ids)
+        authorized_ids = list(dict.fromkeys(authorized_ids))
+
+        if (entity_ids or group_ids or device_ids) and not (authorized_ids or group_members or device_members):
+            _logger.warning(f"Portal batched state access denied: user {user.id}, instance {instance_id}")
+            return {
+                'success': False,
+                'error': _('Access denied'),
+                'error_code': 'access_denied'
+            }
+
+        try:
+            states, cursor = read_batch_states(
+                request.env['ha.entity'].sudo(), authorized_ids,
+                since=since, fields=fields, attribute_keys=attributes,
+            )
+        except ValueError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'error_code': 'invalid_params'
+            }
+
+        return {
+            'success': True,
+            'data': {
+                'entities': states,
+                'entity_ids': authorized_ids,
+                'groups': group_members,
+                'devices': device_members,
+                'cursor': cursor,
+            },
         }
 
     # ========================================
@@ -757,8 +838,8 @@ class HAPortalController(CustomerPortal):
                 'error_code': 'not_found'
             }
 
-        share = self._check_entity_share_access(entity_id, user.id, required_permission='control')
-        if not share:
+        permission = self._check_entity_share_access(entity_id, user.id, required_permission='control')
+        if not permission:
             _logger.warning(f"Portal call-service denied for entity {entity_id}: user {user.id} lacks control permission")
             return {
                 'success': False,
@@ -853,27 +934,24 @@ class HAPortalController(CustomerPortal):
             _logger.warning(f"Portal access attempt for non-existent group: {group_id}")
             return request.render('odoo_ha_addon.portal_error_404', status=404)
 
-        share = self._check_group_share_access(group_id, user.id)
-        if not share:
+        permission = self._check_group_share_access(group_id, user.id)
+        if not permission:
             _logger.warning(f"Portal access denied for group {group_id}: user {user.id} has no share")
             return request.render('odoo_ha_addon.portal_error_403', status=403)
 
         _logger.info(f"Portal access granted for entity group: {group.name} (user: {user.login})")
 
         controllable_domains = []
-        if share.permission == 'control':
+        if permission == 'control':
             controllable_domains = list(PORTAL_CONTROL_SERVICES.keys())
 
         group._portal_ensure_token()
 
         # Prev/Next navigation within this instance's shared groups
-        group_shares = request.env['ha.entity.share'].sudo().search([
-            ('user_id', '=', user.id),
-            ('group_id', '!=', False),
-            ('group_id.ha_instance_id', '=', instance_id),
-            ('is_expired', '=', False),
-        ])
-        all_group_ids = group_shares.mapped('group_id').sorted(
+        shared_group_ids = share_access.read_user_targets(
+            request.env.cr, user.id, instance_id
+        )['group']
+        all_group_ids = request.env['ha.entity.group'].sudo().browse(list(shared_group_ids)).sorted(
             key=lambda g: g.name or ''
         ).ids
         idx = all_group_ids.index(group.id) if group.id in all_group_ids else -1
@@ -889,7 +967,7 @@ class HAPortalController(CustomerPortal):
         return request.render('odoo_ha_addon.portal_group_detail', {
             'group': group,
             'instance': group.ha_instance_id,
-            'permission': share.permission,
+            'permission': permission,
             'page_name': 'portal_entity_group',
             'controllable_domains': controllable_domains,
             'token': group.access_token,
@@ -903,12 +981,17 @@ class HAPortalController(CustomerPortal):
         type='json',
         auth='user',
     )
-    def portal_entity_group_state(self, instance_id, group_id, **kw):
-        """JSON polling endpoint for entity group state updates."""
+    def portal_entity_group_state(self, instance_id, group_id, since=None, **kw):
+        """
+        JSON polling endpoint for entity group state updates.
+
+        Supports ``since`` like portal_entity_state; the version also covers
+        group membership changes.
+        """
         user = request.env.user
-        share = self._check_group_share_access(group_id, user.id)
+        permission = self._check_group_share_access(group_id, user.id)
 
-        if not share:
+        if not permission:
             _logger.warning(f"Portal group state access denied for group {group_id}: user {user.id}")
             return {
                 'success': False,
@@ -924,6 +1007,10 @@ class HAPortalController(CustomerPortal):
                 'error_code': 'not_found'
             }
 
+        version = self._get_state_version(group.entity_ids, group.write_date)
+        if since and since == version:
+            return self._not_modified_response(version)
+
         group_data = self._get_safe_group_data(group)
 
         entities_with_state = []
@@ -942,6 +1029,7 @@ class HAPortalController(CustomerPortal):
         return {
             'success': True,
             'data': group_data,
+            'version': version,
         }
 
     # ========================================
@@ -964,28 +1052,25 @@ class HAPortalController(CustomerPortal):
             _logger.warning(f"Portal access attempt for non-existent device: {device_id}")
             return request.render('odoo_ha_addon.portal_error_404', status=404)
 
-        share = self._check_device_share_access(device_id, user.id)
-        if not share:
+        permission = self._check_device_share_access(device_id, user.id)
+        if not permission:
             _logger.warning(f"Portal access denied for device {device_id}: user {user.id} has no share")
             return request.render('odoo_ha_addon.portal_error_403', status=403)
 
         _logger.info(f"Portal access granted for device: {device.name} (user: {user.login})")
 
         controllable_domains = []
-        if share.permission == 'control':
+        if permission == 'control':
             controllable_domains = list(PORTAL_CONTROL_SERVICES.keys())
 
         entities = device.entity_ids
         device._portal_ensure_token()
 
         # Prev/Next navigation within this instance's shared devices
-        device_shares = request.env['ha.entity.share'].sudo().search([
-            ('user_id', '=', user.id),
-            ('device_id', '!=', False),
-            ('device_id.ha_instance_id', '=', instance_id),
-            ('is_expired', '=', False),
-        ])
-        all_device_ids = device_shares.mapped('device_id').sorted(
+        shared_device_ids = share_access.read_user_targets(
+            request.env.cr, user.id, instance_id
+        )['device']
+        all_device_ids = request.env['ha.device'].sudo().browse(list(shared_device_ids)).sorted(
             key=lambda d: d.name or ''
         ).ids
         idx = all_device_ids.index(device.id) if device.id in all_device_ids else -1
@@ -1002,7 +1087,7 @@ class HAPortalController(CustomerPortal):
             'device': device,
             'instance': device.ha_instance_id,
             'entities': entities,
-            'permission': share.permission,
+            'permission': permission,
             'page_name': 'portal_device',
             'controllable_domains': controllable_domains,
             'token': device.access_token,
@@ -1016,12 +1101,16 @@ class HAPortalController(CustomerPortal):
         type='json',
         auth='user',
     )
-    def portal_device_state(self, instance_id, device_id, **kw):
-        """JSON polling endpoint for device state updates."""
+    def portal_device_state(self, instance_id, device_id, since=None, **kw):
+        """
+        JSON polling endpoint for device state updates.
+
+        Supports ``since`` like portal_entity_state.
+        """
         user = request.env.user
-        share = self._check_device_share_access(device_id, user.id)
+        permission = self._check_device_share_access(device_id, user.id)
 
-        if not share:
+        if not permission:
             _logger.warning(f"Portal device state access denied for device {device_id}: user {user.id}")
             return {
                 'success': False,
@@ -1037,6 +1126,10 @@ class HAPortalController(CustomerPortal):
                 'error_code': 'not_found'
             }
 
+        version = self._get_state_version(device.entity_ids, device.write_date)
+        if since and since == version:
+            return self._not_modified_response(version)
+
         device_data = {
             'id': device.id,
             'name': device.name_by_user or device.name,
@@ -1056,6 +1149,7 @@ class HAPortalController(CustomerPortal):
         return {
             'success': True,
             'data': device_data,
+            'version': version,
         }
 
     # ========================================
@@ -1092,9 +1186,9 @@ class HAPortalController(CustomerPortal):
     def portal_entity_state_redirect(self, entity_id, **kw):
         """Backward-compatible JSON state endpoint for old URL."""
         user = request.env.user
-        share = self._check_entity_share_access(entity_id, user.id)
+        permission = self._check_entity_share_access(entity_id, user.id)
 
-        if not share:
+        if not permission:
             return {
                 'success': False,
                 'error': _('Access denied'),
@@ -1185,9 +1279,9 @@ class HAPortalController(CustomerPortal):
     def portal_entity_group_state_redirect(self, group_id, **kw):
         """Backward-compatible JSON state endpoint for old group URL."""
         user = request.env.user
-        share = self._check_group_share_access(group_id, user.id)
+        permission = self._check_group_share_access(group_id, user.id)
 
-        if not share:
+        if not permission:
             return {
                 'success': False,
                 'error': _('Access denied'),
@@ -1250,9 +1344,9 @@ class HAPortalController(CustomerPortal):
     def portal_device_state_redirect(self, device_id, **kw):
         """Backward-compatible JSON state endpoint for old device URL."""
         user = request.env.user
-        share = self._check_device_share_access(device_id, user.id)
+        permission = self._check_device_share_access(device_id, user.id)
 
-        if not share:
+        if not permission:
             return {
                 'success': False,
                 'error': _('Access denied'),
@@ -14,6 +14,7 @@ def _check_python_dependencies():
 
     required_packages = {
         'websockets': 'websockets>=10.0',
+        'numpy': 'numpy>=1.21',
     }
 
     missing_packages = []
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+移除 ha_entity_history 中重複的 (entity_id, last_updated) 記錄，
+讓 entity_last_updated_unique 約束可以建立（每組只保留 id 最小的一筆）。
+"""
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    cr.execute("""
+        DELETE FROM ha_entity_history
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY entity_id, last_updated ORDER BY id
+                ) AS rn
+                FROM ha_entity_history
+                WHERE last_updated IS NOT NULL
+            ) AS ranked
+            WHERE ranked.rn > 1
+        )
+    """)
+    _logger.info(f"Removed {cr.rowcount} duplicate ha_entity_history rows before adding unique constraint")
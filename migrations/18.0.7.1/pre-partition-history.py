@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+把 ha_entity_history 從一般 table 轉換為依 last_changed RANGE partition 的 partitioned table。
+
+在 pre-migrate.py 去除重複記錄之後執行（檔名排序），資料依 id 分批搬移，
+init() 只建立新 table，不會在模組載入時搬移資料。
+"""
+import logging
+
+from odoo.addons.odoo_ha_addon.models.common import history_partitions
+from odoo.addons.odoo_ha_addon.models.common.ws_config import (
+    HISTORY_PARTITION_INTERVAL,
+    HISTORY_PARTITION_PREMAKE,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    moved = history_partitions.convert_legacy_table(
+        cr, HISTORY_PARTITION_INTERVAL, HISTORY_PARTITION_PREMAKE
+    )
+    _logger.info(f"Converted ha_entity_history to a partitioned table ({moved} rows moved)")
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+重建 ha_entity_history_rollup：舊版本的 rollup 把非數值狀態（num_state = -1，例如 unavailable）
+計入 min / sum / count，與 raw table 的平均值不一致。
+
+只處理升級前已存在的 rollup table；第一次建立時 init() 會自行重建。
+"""
+import logging
+
+from odoo.addons.odoo_ha_addon.models.common import history_rollups
+from odoo.addons.odoo_ha_addon.models.common.ws_config import (
+    HISTORY_NUMERIC_DOMAINS,
+    HISTORY_ROLLUP_RESOLUTIONS,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    cr.execute("SELECT to_regclass(%s)", (history_rollups.TABLE,))
+    if cr.fetchone()[0] is None:
+        return
+
+    count = history_rollups.rebuild(cr, HISTORY_ROLLUP_RESOLUTIONS, HISTORY_NUMERIC_DOMAINS)
+    _logger.info(f"Rebuilt history rollups without non-numeric states ({count} rows)")
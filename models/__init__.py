@@ -2,14 +2,15 @@
 from . import common  # Must load first for mixin classes
 from . import ir_action
 from . import ir_ui_view
+from . import ir_websocket
 from . import res_users
 from . import ha_instance
 from . import ha_label
 from . import ha_area
 from . import ha_device
 from . import ha_device_tag
-from . import ha_entity_history
 from . import ha_entity
+from . import ha_entity_history  # after ha_entity: init() creates the partitioned table referencing ha_entity
 from . import ha_entity_group
 from . import ha_entity_group_tag
 from . import ha_entity_tag
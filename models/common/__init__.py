@@ -1,7 +1,11 @@
 from . import hass_rest_api
 from . import hass_websocket_service
+from . import history_partitions
+from . import history_rollups
 from . import instance_helper
 from . import mixins
+from . import request_dispatch
+from . import state_ingestion
 from . import utils
 from . import websocket_client
 from . import websocket_thread_manager
\ No newline at end of file
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Shape-preserving Downsampling (NumPy)
+
+get_downsampled_history 的 numeric 降採樣演算法：
+- lttb: Largest-Triangle-Three-Buckets，保留視覺上最重要的點（尖峰、轉折）
+- minmax: 每個時間桶保留最小值與最大值（envelope），短暫的尖峰不會被平均掉
+
+兩者都回傳原始序列中被保留的點的 index（遞增排序），呼叫端以 index 取出原始的
+時間、數值與狀態，因此輸出的每一點都是真實的歷史記錄。
+
+numpy 在函式內 import（與 websockets 相同），缺少時由 pre_init_hook 安裝。
+"""
+
+ALGORITHMS = ('avg', 'lttb', 'minmax')
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets
+
+    第一點與最後一點固定保留，其餘點分成 threshold - 2 個桶；每個桶選出與
+    「上一個已選點」和「下一個桶平均點」構成最大三角形面積的點。
+    桶之間有先後依賴，因此以桶為單位迴圈（最多 threshold 次），桶內以向量運算。
+
+    Args:
+        x: 時間（epoch 秒），遞增排序
+        y: 數值
+        threshold: 輸出點數
+
+    Returns:
+        numpy.ndarray: 保留的 index
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # 桶邊界：第 0 點與第 n-1 點各自成桶，中間 n-2 點均分
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    # 每個桶的平均點（下一個桶的代表點），最後一個桶為最後一點
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        # 三角形面積的兩倍（省略常數 0.5 不影響 argmax）
+        area = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, threshold):
+    """
+    Min/max envelope：以等寬時間桶（threshold // 2 個）保留每桶的最小值與最大值
+
+    完全向量化：以 reduceat 取每個桶的極值，再找出每個桶第一個達到極值的點。
+    第一點與最後一點固定保留，輸出最多 threshold + 2 點。
+
+    Returns:
+        numpy.ndarray: 保留的 index（遞增排序、不重複）
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+
+    buckets = max(threshold // 2, 1)
+    span = x[-1] - x[0]
+    if span <= 0:
+        bucket = np.floor(np.arange(n) * buckets / n).astype(np.int64)
+    else:
+        bucket = np.minimum(((x - x[0]) / span * buckets).astype(np.int64), buckets - 1)
+
+    # x 已排序，因此 bucket 也是遞增的，可用 reduceat 直接在連續區段上聚合
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    counts = np.diff(np.append(starts, n))
+    group = np.repeat(np.arange(len(starts)), counts)
+    keep = [np.array([0, n - 1])]
+    for reducer in (np.minimum, np.maximum):
+        extreme = np.repeat(reducer.reduceat(y, starts), counts)
+        hits = np.flatnonzero(y == extreme)
+        # 每個桶取第一個達到極值的點
+        _groups, first = np.unique(group[hits], return_index=True)
+        keep.append(hits[first])
+    keep = np.concatenate(keep)
+    return np.unique(keep)
+
+
+def select(algorithm, x, y, threshold):
+    """依演算法名稱回傳保留的 index"""
+    if algorithm == 'lttb':
+        return lttb(x, y, threshold)
+    if algorithm == 'minmax':
+        return minmax(x, y, threshold)
+    raise ValueError(f"Unknown downsampling algorithm: {algorithm}")
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+WebSocket Event Loop Pool
+
+所有 HA 實例的 WebSocket 服務共用少量固定的 event loop 執行緒（而非每個實例一個執行緒）：
+- 每個 loop 執行緒承載多個 HassWebSocketService，每個服務是該 loop 上的一個 asyncio task
+- (db_name, instance_id) 以一致性雜湊分配 loop：重啟後落在同一個 loop，
+  調整 loop 數量時只有少數實例需要搬移
+- loop 執行緒在第一個分配到它的服務啟動時才建立
+- 每個 loop 有一個延遲探針：sleep(interval) 實際醒來的延遲即為 loop lag，
+  用來觀察是否有忙碌的實例拖慢同一個 loop 上的其他實例
+
+統計數據透過 get_loop_pool_stats() 提供，只在運行 WebSocket 服務的 process 中可取得。
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import threading
+
+from odoo.addons.odoo_ha_addon.models.common.ws_config import (
+    WS_LOOP_POOL_SIZE,
+    WS_LOOP_HASH_REPLICAS,
+    WS_LOOP_LAG_INTERVAL,
+    WS_THREAD_JOIN_TIMEOUT,
+)
+
+_logger = logging.getLogger(__name__)
+
+# 本 process 的 loop pool（延遲建立）
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _hash_key(key):
+    """穩定的 64-bit 雜湊（不受 PYTHONHASHSEED 影響）"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class ConsistentHashRing:
+    """一致性雜湊環：每個節點在環上放置 replicas 個虛擬節點"""
+
+    def __init__(self, nodes, replicas=WS_LOOP_HASH_REPLICAS):
+        points = sorted(
+            (_hash_key(f'{node}#{replica}'), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _node in points]
+        self._nodes = [node for _point, node in points]
+
+    def get_node(self, key):
+        """
+        取得 key 所屬的節點（環上順時針第一個虛擬節點）
+
+        Returns:
+            節點，環為空時為 None
+        """
+        if not self._nodes:
+            return None
+        index = bisect.bisect(self._hashes, _hash_key(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class EventLoopThread:
+    """執行一個 event loop 的 daemon 執行緒，承載多個 WebSocket 服務"""
+
+    def __init__(self, index, lag_interval=WS_LOOP_LAG_INTERVAL):
+        self.index = index
+        self.lag_interval = lag_interval
+        self.loop = asyncio.new_event_loop()
+        self._lock = threading.Lock()
+        self._services = set()  # {(db_name, instance_id)}
+        self._lag_ms = 0.0
+        self._lag_avg_ms = 0.0
+        self._lag_max_ms = 0.0
+        self._lag_samples = 0
+        self._task_count = 0
+        self._started = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            daemon=True,  # daemon thread 會在主程序結束時自動結束
+            name=f"HomeAssistantWebSocketLoop-{index}"
+        )
+
+    def start(self):
+        """啟動執行緒並等待 loop 開始運行"""
+        self._thread.start()
+        self._started.wait(timeout=WS_THREAD_JOIN_TIMEOUT)
+
+    def is_alive(self):
+        return self._thread.is_alive() and self.loop.is_running()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.create_task(self._probe_lag())
+        self.loop.call_soon(self._started.set)
+        _logger.info(f"WebSocket event loop {self.index} started")
+        try:
+            self.loop.run_forever()
+        finally:
+            # loop 停止時取消殘留的 task（服務與延遲探針），讓它們執行清理後再關閉 loop
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+            _logger.info(f"WebSocket event loop {self.index} stopped")
+
+    async def _probe_lag(self):
+        """定期量測 loop lag：預期醒來時間與實際醒來時間的差"""
+        while True:
+            started = self.loop.time()
+            await asyncio.sleep(self.lag_interval)
+            lag_ms = max(self.loop.time() - started - self.lag_interval, 0.0) * 1000
+            task_count = len(asyncio.all_tasks(self.loop))
+            with self._lock:
+                self._lag_ms = lag_ms
+                self._lag_max_ms = max(self._lag_max_ms, lag_ms)
+                # 指數移動平均（約最近 10 個樣本）
+                self._lag_avg_ms = lag_ms if not self._lag_samples else self._lag_avg_ms * 0.9 + lag_ms * 0.1
+                self._lag_samples += 1
+                self._task_count = task_count
+
+    def submit(self, coro):
+        """
+        在此 loop 上執行 coroutine（可從任何執行緒呼叫）
+
+        Returns:
+            concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """在此 loop 上執行 callback（可從任何執行緒呼叫）；loop 已關閉時返回 False"""
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+            return True
+        except RuntimeError:
+            return False
+
+    def attach(self, key):
+        with self._lock:
+            self._services.add(key)
+
+    def detach(self, key):
+        with self._lock:
+            self._services.discard(key)
+
+    def stop(self, timeout=WS_THREAD_JOIN_TIMEOUT):
+        """停止 loop 並等待執行緒結束"""
+        self.call_soon(self.loop.stop)
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def get_stats(self, db_name=None):
+        """
+        Args:
+            db_name: 只列出此資料庫的實例（None 表示全部）
+
+        Returns:
+            dict: index / thread / alive / service_count / instance_ids /
+                  lag_ms（最近一次）/ lag_avg_ms / lag_max_ms / tasks
+        """
+        with self._lock:
+            services = sorted(self._services)
+            return {
+                'index': self.index,
+                'thread': self._thread.name,
+                'alive': self.is_alive(),
+                'service_count': len(services),
+                'instance_ids': [inst_id for db, inst_id in services if db_name is None or db == db_name],
+                'lag_ms': round(self._lag_ms, 3),
+                'lag_avg_ms': round(self._lag_avg_ms, 3),
+                'lag_max_ms': round(self._lag_max_ms, 3),
+                'lag_samples': self._lag_samples,
+                'tasks': self._task_count,
+            }
+
+
+class EventLoopPool:
+    """固定數量的 EventLoopThread，以一致性雜湊分配實例"""
+
+    def __init__(self, size=WS_LOOP_POOL_SIZE):
+        self.size = max(1, int(size))
+        self._ring = ConsistentHashRing(range(self.size))
+        self._loops = [None] * self.size
+        self._lock = threading.Lock()
+
+    def get_index(self, db_name, instance_id):
+        return self._ring.get_node(f'{db_name}:{instance_id}')
+
+    def get_loop(self, db_name, instance_id):
+        """
+        取得實例所屬的 loop 執行緒；尚未啟動（或已意外結束）時建立新的
+
+        Returns:
+            EventLoopThread
+        """
+        index = self.get_index(db_name, instance_id)
+        with self._lock:
+            loop_thread = self._loops[index]
+            if loop_thread is None or not loop_thread.is_alive():
+                loop_thread = self._loops[index] = EventLoopThread(index)
+                loop_thread.start()
+            return loop_thread
+
+    def get_stats(self, db_name=None):
+        with self._lock:
+            loops = [loop_thread for loop_thread in self._loops if loop_thread is not None]
+        return [loop_thread.get_stats(db_name) for loop_thread in loops]
+
+    def shutdown(self, timeout=WS_THREAD_JOIN_TIMEOUT):
+        with self._lock:
+            loops, self._loops = self._loops, [None] * self.size
+        for loop_thread in loops:
+            if loop_thread is not None:
+                loop_thread.stop(timeout)
+
+
+def get_loop_pool():
+    """取得本 process 的 loop pool（第一次呼叫時建立）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = EventLoopPool()
+        return _pool
+
+
+def shutdown_loop_pool(timeout=WS_THREAD_JOIN_TIMEOUT):
+    """停止所有 loop 執行緒（在所有服務停止後呼叫）"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(timeout)
+
+
+def get_loop_pool_stats(db_name=None):
+    """
+    取得本 process 各 loop 的統計數據
+
+    Args:
+        db_name: 只列出此資料庫的實例（None 表示全部）
+
+    Returns:
+        list: 每個已啟動 loop 一個 dict（見 EventLoopThread.get_stats）
+    """
+    with _pool_lock:
+        pool = _pool
+    return pool.get_stats(db_name) if pool is not None else []
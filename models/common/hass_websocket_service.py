@@ -5,8 +5,7 @@ import logging
 import time
 from typing import List, Dict, Optional, Any
 # Note: websockets is imported lazily in connect_and_listen() to allow auto-installation
-from datetime import datetime
-from odoo import api
+from odoo import api, fields
 from odoo.service import db
 import traceback
 from concurrent.futures import ThreadPoolExecutor
@@ -75,7 +74,18 @@ from odoo.addons.odoo_ha_addon.models.common.ws_config import (
     WS_POLL_DELAY_SHORT,
     WS_POLL_DELAY_STANDARD,
     WS_RETRY_SLEEP,
+    WS_REQUEST_IDLE_TIMEOUT,
+    STATE_FLUSH_SIZE,
+    STATE_FLUSH_INTERVAL_MS,
+    STATE_QUEUE_DEPTH,
 )
+from odoo.addons.odoo_ha_addon.models.common.state_ingestion import (
+    StateIngestionPipeline,
+    record_write_stats,
+)
+from odoo.addons.odoo_ha_addon.models.common.utils import compute_state_hash, parse_iso_datetime
+from odoo.addons.odoo_ha_addon.models.common.request_dispatch import request_channel
+from odoo.addons.odoo_ha_addon.models.common import ws_liveness
 
 
 def is_valid_entity_id(entity_id: str) -> bool:
@@ -169,6 +179,12 @@ class HassWebSocketService:
         # Device sync timeout 常數 (from ws_config)
         self._device_list_timeout = WS_DEVICE_LIST_TIMEOUT
 
+        # state_changed 微批次寫入管線（連線成功後建立）
+        self._ingestion = None
+
+        # 請求隊列 LISTEN 連線是否正常（False 時退回短間隔輪詢）
+        self._request_listener_ok = False
+
     async def _run_sync(self, func, *args):
         """
         在 executor 中執行同步方法
@@ -343,6 +359,16 @@ class HassWebSocketService:
                         # 訂閱狀態變更事件
                         await self._subscribe_to_events(websocket)
 
+                        # 啟動 state_changed 微批次寫入管線
+                        ingestion_config = await self._run_sync(self._load_ingestion_config)
+                        self._ingestion = StateIngestionPipeline(
+                            self._flush_state_batch,
+                            db_name=self.db_name,
+                            instance_id=self.instance_id,
+                            **ingestion_config
+                        )
+                        ingestion_task = asyncio.create_task(self._ingestion.run())
+
                         # 啟動背景任務
                         queue_task = asyncio.create_task(self._process_request_queue())
                         heartbeat_task = asyncio.create_task(self._heartbeat_loop())
@@ -351,7 +377,15 @@ class HassWebSocketService:
                         try:
                             await self._listen_messages(websocket)
                         finally:
-                            # WebSocket 斷線時取消背景任務
+                            # WebSocket 斷線時先寫入緩衝中的狀態，再取消背景任務
+                            await self._ingestion.drain()
+                            ingestion_task.cancel()
+                            try:
+                                await ingestion_task
+                            except asyncio.CancelledError:
+                                pass
+                            self._ingestion.close()
+                            self._ingestion = None
                             queue_task.cancel()
                             heartbeat_task.cancel()
                             try:
@@ -551,12 +585,15 @@ class HassWebSocketService:
                     # 處理陣列回應（根據文檔，server 可能回傳陣列）
                     # 使用 create_task 讓消息處理非阻塞，避免死鎖
                     # （當消息處理中需要發送請求並等待結果時）
+                    # state_changed 事件例外：直接 await，ingestion 佇列已滿時暫停讀取（backpressure）
+                    messages = data if isinstance(data, list) else [data]
                     if isinstance(data, list):
                         self._logger.debug(f"Received array response with {len(data)} messages")
-                        for item in data:
+                    for item in messages:
+                        if self._is_state_changed_event(item):
+                            await self._handle_message(item)
+                        else:
                             asyncio.create_task(self._handle_message(item))
-                    else:
-                        asyncio.create_task(self._handle_message(data))
 
                 except json.JSONDecodeError:
                     self._logger.error(f"Invalid JSON message: {message}")
@@ -568,6 +605,16 @@ class HassWebSocketService:
         except Exception as e:
             self._logger.error(f"Error in message listening: {e}")
 
+    def _is_state_changed_event(self, data):
+        """是否為 state_changed 訂閱事件（不屬於 subscription 請求的事件訊息）"""
+        return (
+            isinstance(data, dict)
+            and data.get('type') == 'event'
+            and data.get('id') not in self._subscriptions
+            and data.get('id') not in self._pending_requests
+            and (data.get('event') or {}).get('event_type') == 'state_changed'
+        )
+
     async def _handle_message(self, data):
         """
         處理接收到的 WebSocket 訊息（單一訊息）
@@ -829,8 +876,11 @@ class HassWebSocketService:
 
             self._logger.debug(f"State changed: {entity_id} -> {new_state.get('state')}")
 
-            # 在新的資料庫連線中更新實體狀態
-            await self._update_entity_in_odoo(entity_id, new_state, old_state)
+            # 交給微批次管線合併寫入；管線尚未建立時退回逐筆更新
+            if self._ingestion is not None:
+                await self._ingestion.submit(entity_id, new_state, old_state)
+            else:
+                await self._update_entity_in_odoo(entity_id, new_state, old_state)
 
         except Exception as e:
             self._logger.error(f"Error handling state change: {e}")
@@ -2596,11 +2646,15 @@ class HassWebSocketService:
         except Exception as e:
             self._logger.error(f"Failed to update entity in Odoo: {e}")
 
-    def _sync_update_entity(self, entity_id, new_state_data, old_state_data=None):
+    def _sync_update_entity(self, entity_id, new_state_data, old_state_data=None, transitions=None):
         """
         同步版本的實體更新（在背景執行緒中執行）
         Phase 2: 加入 ha_instance_id 過濾和設定
 
+        Args:
+            transitions: 批次 flush 失敗時帶入的合併前轉換列表（可選），
+                未提供時只以 new_state_data 建立一次轉換
+
         Returns:
             bool: True if a new entity was created, False if existing entity was updated
         """
@@ -2625,14 +2679,33 @@ class HassWebSocketService:
                     'domain': entity_id.split('.')[0],
                     'name': friendly_name,  # 使用 friendly_name 作為顯示名稱
                     'entity_state': new_state_data.get('state'),
-                    'last_changed': datetime.now(),
+                    'last_changed': self._get_ha_last_changed(new_state_data, fields.Datetime.now()),
                     'attributes': attributes,
                     'ha_instance_id': self.instance_id  # Phase 2: 新增實例 ID
                 }
 
+                if transitions is None:
+                    transitions = [{
+                        'state': new_state_data.get('state', ''),
+                        'last_changed': entity_values['last_changed'],
+                        'last_updated': self._get_ha_last_changed(
+                            new_state_data, entity_values['last_changed'], key='last_updated'
+                        ),
+                        'attributes': attributes,
+                    }]
+                # 去重：在寫入前先以舊的 state 值找出實際變更的轉換
+                old_state_value = entity.entity_state if entity else False
+                changed_transitions = self._changed_transitions(old_state_value, transitions)
+
+                # 指紋相同且 state 從未變動（只有 last_updated 變動）：不寫入、不通知
+                if entity and not changed_transitions and entity.state_hash == compute_state_hash(
+                    entity_values['entity_state'], attributes
+                ):
+                    record_write_stats(self.db_name, self.instance_id, skipped=1)
+                    self._logger.debug(f"Entity {entity_id} unchanged (same fingerprint), skipping write")
+                    return False
+
                 if entity:
-                    # 去重：在寫入前先記錄舊的 state 值
-                    old_state_value = entity.entity_state
                     # 更新現有實體
                     entity.write({
                         'entity_state': entity_values['entity_state'],
@@ -2641,25 +2714,23 @@ class HassWebSocketService:
                     })
                     self._logger.debug(f"Updated entity: {entity_id} (instance {self.instance_id})")
                 else:
-                    old_state_value = False
                     # 建立新實體
                     entity = env['ha.entity'].create(entity_values)
                     is_new = True
                     self._logger.info(f"Created new entity: {entity_id} (instance {self.instance_id})")
+                record_write_stats(self.db_name, self.instance_id, applied=1)
 
                 # 如果啟用歷史記錄，則建立歷史記錄
                 if entity.enable_record:
-                    # 去重：只有當 state 實際變更時才建立歷史記錄
-                    new_state_value = new_state_data.get('state', '')
-                    if old_state_value != new_state_value or old_state_value is False:
-                        env['ha.entity.history'].create({
+                    if changed_transitions:
+                        env['ha.entity.history']._bulk_insert_history([{
                             'entity_id': entity.id,
                             'domain': entity_values['domain'],
-                            'entity_state': entity_values['entity_state'],
-                            'last_changed': entity_values['last_changed'],
-                            'last_updated': entity_values['last_changed'],
-                            'attributes': entity_values['attributes']
-                        })
+                            'entity_state': transition['state'],
+                            'last_changed': transition['last_changed'],
+                            'last_updated': transition['last_updated'],
+                            'attributes': transition['attributes'],
+                        } for transition in changed_transitions])
                     else:
                         self._logger.debug(
                             f"Skipping history record for {entity_id}: "
@@ -2675,6 +2746,7 @@ class HassWebSocketService:
                         new_state_data,
                         ha_instance_id=self.instance_id  # Phase 2: 附加實例 ID
                     )
+                    realtime_service.notify_portal_entity_states([entity.id])
                     self._logger.debug(f"Broadcast state change notification for: {entity_id} (instance {self.instance_id})")
                 except Exception as notify_error:
                     self._logger.error(f"Failed to notify state change: {notify_error}")
@@ -2687,6 +2759,216 @@ class HassWebSocketService:
 
         return is_new
 
+    @staticmethod
+    def _changed_transitions(previous, transitions):
+        """
+        依序比較每次轉換與前一個 state，回傳 state 實際變更的轉換（需要寫入歷史記錄者）
+
+        previous 為 False 表示新建立的 entity，第一次轉換一定記錄。
+        """
+        changed = []
+        for transition in transitions:
+            if previous is False or previous != transition['state']:
+                changed.append(transition)
+            previous = transition['state']
+        return changed
+
+    @staticmethod
+    def _get_ha_last_changed(state_data, default, key='last_changed'):
+        """
+        取得 HA 回報的 last_changed（只在 state 實際變更時前進），缺少或格式錯誤時使用 default
+
+        與 sync_entity_states_from_ha 使用相同來源，避免全量同步時誤判為變更。
+        key='last_updated' 取得歷史記錄去重使用的 last_updated（與歷史同步相同來源）。
+        """
+        try:
+            return parse_iso_datetime(state_data[key])
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    def _load_ingestion_config(self) -> Dict[str, int]:
+        """
+        讀取此實例的 state ingestion 管線設定（flush size / window / queue depth）
+
+        Returns:
+            dict: StateIngestionPipeline 的關鍵字參數
+        """
+        config = {
+            'flush_size': STATE_FLUSH_SIZE,
+            'flush_interval_ms': STATE_FLUSH_INTERVAL_MS,
+            'queue_depth': STATE_QUEUE_DEPTH,
+        }
+        try:
+            with db.db_connect(self.db_name).cursor() as cr:
+                env = api.Environment(cr, 1, {})
+                instance = env['ha.instance'].browse(self.instance_id)
+                if instance.exists():
+                    config['flush_size'] = instance.state_flush_size or STATE_FLUSH_SIZE
+                    config['flush_interval_ms'] = instance.state_flush_interval_ms or STATE_FLUSH_INTERVAL_MS
+                    config['queue_depth'] = instance.state_queue_depth or STATE_QUEUE_DEPTH
+        except Exception as e:
+            self._logger.warning(
+                f"Failed to load ingestion config for instance {self.instance_id}, using defaults: {e}"
+            )
+        return config
+
+    async def _flush_state_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        StateIngestionPipeline 的 flush callback（非阻塞版本）
+        新建立的 entity 會排程 registry 同步以設定 device/area 關聯
+
+        Args:
+            batch: 已合併的狀態更新列表
+        """
+        new_entity_ids = await self._run_sync(self._sync_flush_state_batch, batch)
+        for entity_id in new_entity_ids:
+            self._logger.info(
+                f"New entity {entity_id} created, scheduling registry sync "
+                f"(instance {self.instance_id})"
+            )
+            asyncio.create_task(self._fetch_and_sync_entity_registry_full(entity_id))
+
+    def _sync_flush_state_batch(self, batch):
+        """
+        同步版本的批次實體更新（在背景執行緒中執行）
+
+        單一 cursor 完成：
+        1. 一次查詢載入批次內所有既有 entity
+        2. 新 entity 透過 ORM create（少見）
+        3. 既有 entity 以 UPDATE ... FROM (VALUES ...) 一次更新（state_hash 相同者跳過）
+        4. 啟用歷史記錄的 entity 以 ha.entity.history._bulk_insert_history 寫入
+        5. 發送 bus 通知後 commit
+
+        批次寫入失敗時退回逐筆 _sync_update_entity（帶入 transitions，保留中間轉換的歷史記錄），
+        避免單筆錯誤拖垮整批。
+
+        Args:
+            batch: StateIngestionPipeline 合併後的項目列表
+
+        Returns:
+            list: 新建立的 entity_id 列表
+        """
+        new_entity_ids = []
+        try:
+            with db.db_connect(self.db_name).cursor() as cr:
+                env = api.Environment(cr, 1, {})
+
+                cr.execute("""
+                    SELECT entity_id, id, entity_state, enable_record, state_hash
+                    FROM ha_entity
+                    WHERE ha_instance_id = %s AND entity_id = ANY(%s)
+                """, (self.instance_id, [item['entity_id'] for item in batch]))
+                existing = {row[0]: row[1:] for row in cr.fetchall()}
+
+                update_rows = []
+                history_rows = []
+                changed_items = []
+                skipped_count = 0
+
+                for item in batch:
+                    entity_id = item['entity_id']
+                    new_state_data = item['new_state']
+                    attributes = new_state_data.get('attributes') or {}
+                    last_changed = self._get_ha_last_changed(new_state_data, item['received_at'])
+
+                    if entity_id in existing:
+                        record_id, old_state_value, enable_record, stored_hash = existing[entity_id]
+                        changed_transitions = self._changed_transitions(old_state_value, item['transitions'])
+                        state_hash = compute_state_hash(new_state_data.get('state'), attributes)
+                        # 視窗內來回變動（on→off→on）最終指紋相同，但 state 確實變過：仍需更新 last_changed 並通知
+                        if state_hash != stored_hash or changed_transitions:
+                            update_rows.append((
+                                record_id,
+                                new_state_data.get('state'),
+                                last_changed,
+                                json.dumps(attributes),
+                                state_hash,
+                            ))
+                            changed_items.append(item)
+                        else:
+                            # 指紋相同（只有 last_updated 變動）：不寫入 row、不發送通知
+                            skipped_count += 1
+                    else:
+                        entity = env['ha.entity'].create({
+                            'entity_id': entity_id,
+                            'domain': entity_id.split('.')[0],
+                            'name': attributes.get('friendly_name'),
+                            'entity_state': new_state_data.get('state'),
+                            'last_changed': last_changed,
+                            'attributes': attributes,
+                            'ha_instance_id': self.instance_id,
+                        })
+                        record_id, enable_record = entity.id, entity.enable_record
+                        changed_transitions = self._changed_transitions(False, item['transitions'])
+                        new_entity_ids.append(entity_id)
+                        changed_items.append(item)
+                        self._logger.info(f"Created new entity: {entity_id} (instance {self.instance_id})")
+
+                    # 去重：只有當 state 實際變更時才建立歷史記錄（逐一檢查合併前的每次轉換）
+                    if enable_record:
+                        history_rows.extend({
+                            'entity_id': record_id,
+                            'domain': entity_id.split('.')[0],
+                            'entity_state': transition['state'],
+                            'last_changed': transition['last_changed'],
+                            'last_updated': transition['last_updated'],
+                            'attributes': transition['attributes'],
+                        } for transition in changed_transitions)
+
+                if update_rows:
+                    cr.execute("""
+                        UPDATE ha_entity e
+                        SET entity_state = v.entity_state,
+                            last_changed = v.last_changed,
+                            attributes = v.attributes::jsonb,
+                            state_hash = v.state_hash,
+                            write_uid = 1,
+                            write_date = (now() at time zone 'UTC')
+                        FROM (VALUES %s) AS v(id, entity_state, last_changed, attributes, state_hash)
+                        WHERE e.id = v.id
+                    """ % ', '.join(['%s'] * len(update_rows)), update_rows)
+
+                if history_rows:
+                    env['ha.entity.history']._bulk_insert_history(history_rows)
+
+                # 🔔 通知前端：整個批次合併為一則 bus 訊息（每個 entity 只帶最終狀態，略過未變更者）
+                if changed_items:
+                    try:
+                        env['ha.realtime.update'].notify_entity_state_changes(
+                            [(item['entity_id'], item['old_state'], item['new_state']) for item in changed_items],
+                            ha_instance_id=self.instance_id
+                        )
+                        # 新建立的 entity 不會有分享，只推送更新的列
+                        env['ha.realtime.update'].notify_portal_entity_states([row[0] for row in update_rows])
+                    except Exception as notify_error:
+                        self._logger.error(f"Failed to notify state change: {notify_error}")
+
+                cr.commit()
+                record_write_stats(
+                    self.db_name, self.instance_id,
+                    applied=len(changed_items), skipped=skipped_count,
+                )
+                self._logger.debug(
+                    f"Batch flush (instance {self.instance_id}): {len(update_rows)} updated, "
+                    f"{len(new_entity_ids)} created, {skipped_count} unchanged, "
+                    f"{len(history_rows)} history rows"
+                )
+                return new_entity_ids
+
+        except Exception as e:
+            self._logger.error(
+                f"Batch state flush failed for instance {self.instance_id}, "
+                f"falling back to per-entity updates: {e}"
+            )
+
+        new_entity_ids = []
+        for item in batch:
+            if self._sync_update_entity(
+                item['entity_id'], item['new_state'], item['old_state'], transitions=item['transitions']
+            ):
+                new_entity_ids.append(item['entity_id'])
+        return new_entity_ids
+
     def _get_next_id(self) -> int:
         """取得下一個訊息 ID"""
         message_id = self._message_id
@@ -2840,81 +3122,165 @@ class HassWebSocketService:
         """
         處理請求隊列（從資料庫）
         這個方法運行在 WebSocket worker process 中
-        定期檢查是否有來自其他 process 的請求
+
+        以 PostgreSQL LISTEN 等待 controller 建立請求時送出的 NOTIFY，
+        收到通知後立即處理；WS_REQUEST_IDLE_TIMEOUT 只是保底檢查與訂閱清理的週期。
         """
         self._logger.info("Starting request queue processor")
 
-        while self._running:
-            try:
-                # 使用 run_in_executor 在背景執行同步的資料庫操作
-                pending_requests = await self._run_sync(self._get_pending_requests)
+        loop = asyncio.get_event_loop()
+        wakeup = asyncio.Event()
+        listen_cr = None
+        try:
+            listen_cr = await self._run_sync(self._open_request_listener)
+            loop.add_reader(listen_cr._cnx.fileno(), self._on_request_notify, listen_cr._cnx, wakeup)
+        except Exception as e:
+            # 無法 LISTEN 時退回短間隔輪詢，避免請求無人處理
+            self._logger.error(f"Failed to LISTEN for requests, falling back to polling: {e}")
+            if listen_cr:
+                listen_cr.close()
+            listen_cr = None
+        self._request_listener_ok = bool(listen_cr)
+
+        try:
+            while self._running:
+                try:
+                    # 先清除再查詢：查詢期間送達的通知會讓下一次等待立即返回
+                    wakeup.clear()
+
+                    # 使用 run_in_executor 在背景執行同步的資料庫操作
+                    pending_requests = await self._run_sync(self._get_pending_requests)
 
-                if pending_requests:
                     for request_data in pending_requests:
-                        try:
-                            # 標記為處理中
-                            await self._run_sync(
-                                self._mark_request_processing,
-                                request_data['id']
-                            )
-
-                            self._logger.debug(f"Processing request {request_data['request_id']}: {request_data['message_type']}")
-
-                            # 解析 payload
-                            payload = json.loads(request_data['payload']) if request_data['payload'] else {}
-
-                            # 檢查是否為訂閱請求
-                            if request_data.get('is_subscription'):
-                                self._logger.info(f"Detected subscription request: {request_data['request_id']}")
-                                await self._process_subscription_request(request_data, payload)
-                            else:
-                                # 一般請求：發送並等待結果
-                                result = await self.send_request(
-                                    message_type=request_data['message_type'],
-                                    timeout=WS_DEFAULT_TIMEOUT,
-                                    **payload
-                                )
-
-                                # 寫入結果
-                                await self._run_sync(
-                                    self._mark_request_done,
-                                    request_data['id'],
-                                    json.dumps(result)
-                                )
-
-                                self._logger.debug(f"Request {request_data['request_id']} completed successfully")
-
-                        except asyncio.TimeoutError:
-                            await self._run_sync(
-                                self._mark_request_timeout,
-                                request_data['id']
-                            )
-                            self._logger.error(f"Request {request_data['request_id']} timed out")
-
-                        except Exception as e:
-                            error_msg = f"{str(e)}\n{traceback.format_exc()}"
-                            await self._run_sync(
-                                self._mark_request_failed,
-                                request_data['id'],
-                                error_msg
-                            )
-                            self._logger.error(f"Request {request_data['request_id']} failed: {error_msg}")
-
-                # 定期清理過期訂閱（每 30 秒）
-                current_time = time.time()
-                if current_time - self._last_subscription_cleanup > self._subscription_cleanup_interval:
-                    await self._cleanup_stale_subscriptions()
-                    self._last_subscription_cleanup = current_time
-
-                # 等待一段時間後再檢查
-                await asyncio.sleep(WS_POLL_DELAY_STANDARD)
+                        await self._process_queued_request(request_data)
 
-            except Exception as e:
-                self._logger.error(f"Error in request queue processor: {e}")
-                await asyncio.sleep(WS_RETRY_SLEEP)
+                    # 定期清理過期訂閱（每 30 秒）
+                    current_time = time.time()
+                    if current_time - self._last_subscription_cleanup > self._subscription_cleanup_interval:
+                        await self._cleanup_stale_subscriptions()
+                        self._last_subscription_cleanup = current_time
+
+                    # 一次最多取 10 筆，取滿時可能還有待處理的請求
+                    if len(pending_requests) >= 10:
+                        continue
+
+                    idle_timeout = (
+                        WS_REQUEST_IDLE_TIMEOUT if self._request_listener_ok else WS_POLL_DELAY_STANDARD
+                    )
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout=idle_timeout)
+                    except asyncio.TimeoutError:
+                        pass
+
+                except Exception as e:
+                    self._logger.error(f"Error in request queue processor: {e}")
+                    await asyncio.sleep(WS_RETRY_SLEEP)
+        finally:
+            if listen_cr:
+                if self._request_listener_ok:
+                    loop.remove_reader(listen_cr._cnx.fileno())
+                await self._run_sync(self._close_request_listener, listen_cr)
 
         self._logger.info("Request queue processor stopped")
 
+    async def _process_queued_request(self, request_data):
+        """
+        處理單一 queue 請求並寫回結果（寫回時 queue model 會 NOTIFY 等待中的 client）
+
+        Args:
+            request_data: _get_pending_requests() 返回的請求資料
+        """
+        try:
+            # 標記為處理中
+            await self._run_sync(
+                self._mark_request_processing,
+                request_data['id']
+            )
+
+            self._logger.debug(f"Processing request {request_data['request_id']}: {request_data['message_type']}")
+
+            # 解析 payload
+            payload = json.loads(request_data['payload']) if request_data['payload'] else {}
+
+            # 檢查是否為訂閱請求
+            if request_data.get('is_subscription'):
+                self._logger.info(f"Detected subscription request: {request_data['request_id']}")
+                await self._process_subscription_request(request_data, payload)
+            else:
+                # 一般請求：發送並等待結果
+                result = await self.send_request(
+                    message_type=request_data['message_type'],
+                    timeout=WS_DEFAULT_TIMEOUT,
+                    **payload
+                )
+
+                # 寫入結果
+                await self._run_sync(
+                    self._mark_request_done,
+                    request_data['id'],
+                    json.dumps(result)
+                )
+
+                self._logger.debug(f"Request {request_data['request_id']} completed successfully")
+
+        except asyncio.TimeoutError:
+            await self._run_sync(
+                self._mark_request_timeout,
+                request_data['id']
+            )
+            self._logger.error(f"Request {request_data['request_id']} timed out")
+
+        except Exception as e:
+            error_msg = f"{str(e)}\n{traceback.format_exc()}"
+            await self._run_sync(
+                self._mark_request_failed,
+                request_data['id'],
+                error_msg
+            )
+            self._logger.error(f"Request {request_data['request_id']} failed: {error_msg}")
+
+    def _open_request_listener(self):
+        """
+        同步方法：開啟專用連線並 LISTEN 本實例的請求 channel
+
+        Returns:
+            Cursor: 保持開啟的 cursor（由 _close_request_listener 關閉）
+        """
+        cr = db.db_connect(self.db_name).cursor()
+        try:
+            cr.execute(f'LISTEN {request_channel(self.instance_id)}')
+            cr.commit()
+        except Exception:
+            cr.close()
+            raise
+        self._logger.info(f"Listening on '{request_channel(self.instance_id)}' for queued requests")
+        return cr
+
+    def _close_request_listener(self, cr):
+        """同步方法：UNLISTEN 並歸還連線"""
+        try:
+            cr.execute('UNLISTEN *')
+            cr.commit()
+        except Exception as e:
+            self._logger.debug(f"UNLISTEN failed: {e}")
+        finally:
+            cr.close()
+
+    def _on_request_notify(self, conn, wakeup):
+        """Event loop reader callback：讀取 NOTIFY 並喚醒 queue processor"""
+        try:
+            conn.poll()
+        except Exception as e:
+            # 連線中斷：停止監聽並退回短間隔輪詢（下次重新連線時會重建 listener）
+            self._logger.warning(f"Request listener poll failed, falling back to polling: {e}")
+            self._request_listener_ok = False
+            try:
+                asyncio.get_event_loop().remove_reader(conn.fileno())
+            except Exception:
+                pass
+        conn.notifies.clear()
+        wakeup.set()
+
     async def _heartbeat_loop(self):
         """
         心跳循環：定期更新心跳時間戳記
@@ -2928,7 +3294,8 @@ class HassWebSocketService:
         while self._running:
             try:
                 # 每次循環都重新讀取配置的心跳間隔（動態生效）
-                heartbeat_interval = self.get_heartbeat_interval()
+                # 在 executor 中讀取，避免阻塞共用的 event loop
+                heartbeat_interval = await self._run_sync(self.get_heartbeat_interval)
 
                 # 使用 run_in_executor 在背景執行同步的資料庫操作
                 await self._run_sync(self._update_heartbeat)
@@ -3082,23 +3449,15 @@ class HassWebSocketService:
 
     def _update_heartbeat(self):
         """
-        同步方法：更新心跳時間戳記到資料庫
-        Phase 2: 心跳 key 包含 instance_id
+        同步方法：更新心跳時間戳記到 ha_ws_liveness（UPSERT）
+        不使用 ir.config_parameter，避免每次心跳清除所有 worker 的 ormcache
         """
         try:
-            from datetime import datetime, timezone
-
             with db.db_connect(self.db_name).cursor() as cr:
-                env = api.Environment(cr, 1, {})
-
-                # Phase 2: 心跳 key 包含 db_name 和 instance_id
-                heartbeat_key = f'odoo_ha_addon.ws_heartbeat_{self.db_name}_instance_{self.instance_id}'
-                now_utc = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-
-                env['ir.config_parameter'].sudo().set_param(heartbeat_key, now_utc)
+                ws_liveness.beat(cr, self.instance_id)
                 cr.commit()
 
-                self._logger.debug(f"Heartbeat updated for instance {self.instance_id}: {now_utc}")
+            self._logger.debug(f"Heartbeat updated for instance {self.instance_id}")
 
         except Exception as e:
             self._logger.error(f"Failed to update heartbeat for instance {self.instance_id}: {e}")
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+History Partitions (PostgreSQL declarative range partitioning)
+
+ha_entity_history 以 last_changed 做 RANGE partition（每月或每週一個 partition）：
+- ensure_partitioned_table(): 建立 partitioned table（由 init 呼叫）
+- convert_legacy_table(): 把舊版本的一般 table 分批轉換過來（由 18.0.7.1 migration 呼叫）
+- ensure_partitions(): 預先建立目前與未來幾個週期的 partition（由 cron 呼叫）
+- list_partitions() / drop_partition(): 供 retention 直接 DROP 整個 partition
+
+超出所有 partition 範圍的資料落在 default partition；之後建立涵蓋該範圍的 partition 時
+會先把資料從 default partition 搬移過去。
+
+(entity_id, last_updated) 去重：partitioned table 上的 unique 約束必須包含 partition key，
+因此另外在每個 partition 上建立 unique(entity_id, last_updated) 索引（PARTITION_UNIQUE_INDEX），
+讓同時寫入的 ON CONFLICT DO NOTHING 與舊版本的語意相同。last_updated 相同但 last_changed
+落在不同 partition 的記錄無法由索引檢查，只依賴 INSERT 中的 NOT EXISTS。
+
+ha.entity.history 使用 _auto = False，table 結構由本模組維護。
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+
+_logger = logging.getLogger(__name__)
+
+TABLE = 'ha_entity_history'
+DEFAULT_PARTITION = f'{TABLE}_default'
+SEQUENCE = f'{TABLE}_id_seq'
+
+# 與 ha.entity.history 欄位對應的 table 欄位（順序即建立順序）
+COLUMNS = (
+    ('id', f"integer NOT NULL DEFAULT nextval('{SEQUENCE}')"),
+    ('domain', 'varchar NOT NULL'),
+    ('entity_state', 'varchar'),
+    ('last_changed', 'timestamp without time zone NOT NULL'),
+    ('last_updated', 'timestamp without time zone'),
+    ('attributes', 'jsonb'),
+    ('num_state', 'double precision'),
+    ('ha_instance_id', 'integer'),
+    ('entity_id', 'integer NOT NULL'),
+    ('create_uid', 'integer'),
+    ('create_date', 'timestamp without time zone'),
+    ('write_uid', 'integer'),
+    ('write_date', 'timestamp without time zone'),
+)
+
+# (約束名稱, 欄位, 參照 table, ON DELETE)；參照的 table 可能尚未建立，由 ensure_foreign_keys() 補上
+FOREIGN_KEYS = (
+    (f'{TABLE}_ha_instance_id_fkey', 'ha_instance_id', 'ha_instance', 'SET NULL'),
+    (f'{TABLE}_entity_id_fkey', 'entity_id', 'ha_entity', 'CASCADE'),
+    (f'{TABLE}_create_uid_fkey', 'create_uid', 'res_users', 'SET NULL'),
+    (f'{TABLE}_write_uid_fkey', 'write_uid', 'res_users', 'SET NULL'),
+)
+
+# partition key 必須包含在 primary key / unique 約束中
+INDEXES = (
+    f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, last_changed)',
+    f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_entity_last_updated_unique '
+    f'UNIQUE (entity_id, last_updated, last_changed)',
+    f'CREATE INDEX {TABLE}__last_changed_index ON {TABLE} (last_changed)',
+    f'CREATE INDEX {TABLE}__entity_id_index ON {TABLE} (entity_id, last_changed)',
+    f'CREATE INDEX {TABLE}__ha_instance_id_index ON {TABLE} (ha_instance_id)',
+)
+
+# 每個 partition 上的 unique(entity_id, last_updated)；{name} 為 partition 名稱
+PARTITION_UNIQUE_INDEX = (
+    'CREATE UNIQUE INDEX IF NOT EXISTS "{name}_entity_last_updated_uniq" ON "{name}" (entity_id, last_updated)'
+)
+
+# 舊 table 轉換時每批搬移的列數
+LEGACY_TABLE = f'{TABLE}_legacy'
+LEGACY_COPY_BATCH = 50000
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+# ============================================================================
+# Periods
+# ============================================================================
+
+def period_start(dt, interval):
+    """取得 dt 所在週期的起點（'month' 為當月 1 日，'week' 為週一）"""
+    dt = datetime(dt.year, dt.month, dt.day)
+    if interval == 'week':
+        return dt - timedelta(days=dt.weekday())
+    return dt.replace(day=1)
+
+
+def next_period(start, interval):
+    """取得下一個週期的起點"""
+    if interval == 'week':
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(start):
+    return f'{TABLE}_p{start:%Y%m%d}'
+
+
+# ============================================================================
+# Table
+# ============================================================================
+
+def table_kind(cr):
+    """Returns: 'p'（partitioned）、'r'（一般 table）或 None（不存在）"""
+    cr.execute("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = %s AND n.nspname = current_schema
+    """, (TABLE,))
+    row = cr.fetchone()
+    return row[0] if row else None
+
+
+def ensure_foreign_keys(cr):
+    """補上尚未建立的外鍵（參照的 table 不存在時略過，下次 init 再建立）"""
+    for name, column, target, on_delete in FOREIGN_KEYS:
+        cr.execute("""
+            SELECT 1 FROM pg_constraint WHERE conname = %s AND conrelid = %s::regclass
+        """, (name, TABLE))
+        if cr.fetchone():
+            continue
+        cr.execute("SELECT to_regclass(%s)", (target,))
+        if cr.fetchone()[0] is None:
+            continue
+        cr.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} '
+            f'FOREIGN KEY ({column}) REFERENCES {target}(id) ON DELETE {on_delete}'
+        )
+
+
+def ensure_partitioned_table(cr, interval, premake, now=None):
+    """
+    確保 ha_entity_history 是 partitioned table
+
+    - 不存在：建立 partitioned table 與 default partition
+    - 一般 table（舊版本）：不在 init 中轉換，由 18.0.7.1 migration 呼叫 convert_legacy_table()
+    - 已是 partitioned table：補上缺少的外鍵與各 partition 的 unique 索引
+
+    Args:
+        cr: Odoo cursor
+        interval: 'month' 或 'week'
+        premake: 額外預先建立的未來週期數
+        now: 目前時間（測試用）
+    """
+    kind = table_kind(cr)
+    if kind == 'r':
+        _logger.warning(f"{TABLE} is not partitioned yet; it is converted by the 18.0.7.1 migration")
+        return
+    if kind == 'p':
+        ensure_partition_indexes(cr)
+    else:
+        _create_partitioned_table(cr)
+        ensure_partitions(cr, interval, premake, now=now)
+    ensure_foreign_keys(cr)
+
+
+def _create_partitioned_table(cr):
+    """建立 partitioned table、索引與 default partition"""
+    cr.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE}')
+    cr.execute('CREATE TABLE {table} ({columns}) PARTITION BY RANGE (last_changed)'.format(
+        table=TABLE,
+        columns=', '.join(f'{name} {definition}' for name, definition in COLUMNS),
+    ))
+    for statement in INDEXES:
+        cr.execute(statement)
+    cr.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    cr.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+    cr.execute(PARTITION_UNIQUE_INDEX.format(name=DEFAULT_PARTITION))
+
+
+def convert_legacy_table(cr, interval, premake, batch_size=LEGACY_COPY_BATCH, now=None):
+    """
+    把舊版本的一般 table 轉換為 partitioned table（migration 使用）
+
+    1. 一般 table 改名為 *_legacy，建立 partitioned table 與涵蓋資料時間範圍的 partition
+    2. 依 id 分批（每批 batch_size 列）搬移資料，避免單一巨大的 INSERT ... SELECT
+    3. 搬移完成後更新序列並刪除舊 table
+
+    *_legacy 仍存在時（例如前一次轉換中斷）從已搬移的最大 id 之後繼續。
+
+    Returns:
+        int: 搬移的列數
+    """
+    if table_kind(cr) == 'r':
+        _logger.info(f"Converting {TABLE} to a partitioned table")
+        cr.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+        # 約束與索引名稱是全域的，先移除舊 table 上的以便重建；序列保留給新 table 使用
+        cr.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype <> 'n'",
+                   (LEGACY_TABLE,))
+        for (name,) in cr.fetchall():
+            cr.execute(f'ALTER TABLE {LEGACY_TABLE} DROP CONSTRAINT IF EXISTS "{name}" CASCADE')
+        cr.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s AND schemaname = current_schema",
+                   (LEGACY_TABLE,))
+        for (name,) in cr.fetchall():
+            cr.execute(f'DROP INDEX IF EXISTS "{name}"')
+        # 分批搬移依 id 範圍讀取
+        cr.execute(f'CREATE INDEX ON {LEGACY_TABLE} (id)')
+        cr.execute(f'ALTER SEQUENCE IF EXISTS {SEQUENCE} OWNED BY NONE')
+
+        _create_partitioned_table(cr)
+        cr.execute(f'SELECT MIN(COALESCE(last_changed, last_updated, create_date)) FROM {LEGACY_TABLE}')
+        ensure_partitions(cr, interval, premake, now=now, since=cr.fetchone()[0])
+
+    cr.execute("SELECT to_regclass(%s)", (LEGACY_TABLE,))
+    if cr.fetchone()[0] is None:
+        return 0
+
+    names = ', '.join(name for name, _definition in COLUMNS)
+    values = names.replace('last_changed', 'COALESCE(last_changed, last_updated, create_date, now())', 1)
+    cr.execute(f'SELECT COALESCE(MAX(id), 0) FROM {TABLE}')
+    last_id = cr.fetchone()[0]
+    moved = 0
+    while True:
+        cr.execute(f"""
+            SELECT MAX(id) FROM (
+                SELECT id FROM {LEGACY_TABLE} WHERE id > %s ORDER BY id LIMIT %s
+            ) AS batch
+        """, (last_id, batch_size))
+        upper = cr.fetchone()[0]
+        if upper is None:
+            break
+        cr.execute(f"""
+            INSERT INTO {TABLE} ({names})
+            SELECT {values} FROM {LEGACY_TABLE} WHERE id > %s AND id <= %s
+            ON CONFLICT DO NOTHING
+        """, (last_id, upper))
+        moved += cr.rowcount
+        last_id = upper
+        _logger.info(f"Moved {moved} rows into partitioned {TABLE} (up to id {last_id})")
+
+    cr.execute(f"SELECT setval('{SEQUENCE}', GREATEST((SELECT MAX(id) FROM {TABLE}), 1))")
+    cr.execute(f'DROP TABLE {LEGACY_TABLE}')
+    ensure_foreign_keys(cr)
+    return moved
+
+
+def ensure_partition_indexes(cr):
+    """
+    補上各 partition 缺少的 unique(entity_id, last_updated) 索引
+
+    建立索引前先移除該 partition 中的重複記錄（每組保留 id 最小的一筆）。
+    """
+    names = [DEFAULT_PARTITION] + [name for name, _start, _end in list_partitions(cr)]
+    for name in names:
+        cr.execute("SELECT to_regclass(%s)", (f'{name}_entity_last_updated_uniq',))
+        if cr.fetchone()[0] is not None:
+            continue
+        cr.execute(f"""
+            DELETE FROM "{name}" h
+            USING "{name}" d
+            WHERE h.entity_id = d.entity_id AND h.last_updated = d.last_updated AND h.id > d.id
+        """)
+        if cr.rowcount:
+            _logger.info(f"Removed {cr.rowcount} duplicate rows from {name}")
+        cr.execute(PARTITION_UNIQUE_INDEX.format(name=name))
+
+
+# ============================================================================
+# Partitions
+# ============================================================================
+
+def list_partitions(cr):
+    """
+    列出所有 range partition（不含 default partition）
+
+    Returns:
+        list: [(name, start, end), ...] 依 start 排序
+    """
+    cr.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (TABLE,))
+    partitions = []
+    for name, bound in cr.fetchall():
+        match = _BOUND_RE.search(bound or '')
+        if match:
+            partitions.append((
+                name,
+                datetime.fromisoformat(match.group(1)),
+                datetime.fromisoformat(match.group(2)),
+            ))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(cr, start, end):
+    """
+    建立 [start, end) 的 partition
+
+    default partition 中若已有該範圍的資料，先建立獨立 table、搬移資料再 ATTACH，
+    否則直接 CREATE TABLE ... PARTITION OF。
+
+    Returns:
+        str: partition 名稱
+    """
+    name = partition_name(start)
+    cr.execute(
+        f'SELECT 1 FROM {DEFAULT_PARTITION} WHERE last_changed >= %s AND last_changed < %s LIMIT 1',
+        (start, end),
+    )
+    if not cr.fetchone():
+        cr.execute(
+            f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+            (start, end),
+        )
+        cr.execute(PARTITION_UNIQUE_INDEX.format(name=name))
+        return name
+
+    cr.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)')
+    cr.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE last_changed >= %s AND last_changed < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (start, end))
+    _logger.info(f"Moved {cr.rowcount} rows from {DEFAULT_PARTITION} into {name}")
+    cr.execute(PARTITION_UNIQUE_INDEX.format(name=name))
+    cr.execute(
+        f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+        (start, end),
+    )
+    return name
+
+
+def ensure_partitions(cr, interval, premake, now=None, since=None):
+    """
+    確保從 since（預設為目前週期）到目前週期之後 premake 個週期都有 partition
+
+    只補建尚未被任何 partition 覆蓋的週期，因此變更 interval 不會造成範圍重疊。
+
+    table 尚未轉換為 partitioned table 時不做任何事。
+
+    Returns:
+        list: 新建立的 partition 名稱
+    """
+    if table_kind(cr) != 'p':
+        return []
+    now = now or datetime.utcnow()
+    start = period_start(min(since or now, now), interval)
+    last = period_start(now, interval)
+    for _i in range(premake):
+        last = next_period(last, interval)
+
+    existing = [(p_start, p_end) for _name, p_start, p_end in list_partitions(cr)]
+    created = []
+    while start <= last:
+        end = next_period(start, interval)
+        if not any(p_start < end and start < p_end for p_start, p_end in existing):
+            created.append(create_partition(cr, start, end))
+            existing.append((start, end))
+        start = end
+    if created:
+        _logger.info(f"Created {TABLE} partitions: {', '.join(created)}")
+    return created
+
+
+def drop_partition(cr, name):
+    """DROP 整個 partition（retention 使用，不逐筆刪除）"""
+    cr.execute(f'DROP TABLE IF EXISTS "{name}"')
+    _logger.info(f"Dropped history partition {name}")
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+History Rollups (pre-aggregated numeric buckets)
+
+ha_entity_history_rollup 保存 numeric domain 歷史記錄的時間桶統計（5 分鐘 / 1 小時 / 1 天）：
+min / max / sum / count / 最後一筆的值與狀態。
+
+- 寫入歷史時由 ha.entity.history._bulk_insert_history 在同一個語句中增量更新（UPSERT_SQL）
+- rebuild() 從 raw table 重新計算（升級後第一次建立 table 時自動執行）
+- get_downsampled_history 依查詢區間挑選仍能產生 >= max_points 點的最粗解析度
+
+只計入數值狀態（entity_state 符合 NUMERIC_STATE_PATTERN）；unavailable 等狀態的 num_state 為 -1，
+不列入統計。sum / count 可以直接合併，因此平均值 = SUM(sum_value) / SUM(sample_count)，
+與 raw table 上只計入數值狀態的 AVG(num_state) 相同。
+"""
+import logging
+
+from .utils import NUMERIC_STATE_PATTERN
+
+_logger = logging.getLogger(__name__)
+
+TABLE = 'ha_entity_history_rollup'
+
+# {src} 為提供 (entity_id, domain, last_changed, num_state, entity_state) 的 relation；
+# 參數依序為 resolutions (int[]) 與 numeric domains (varchar[])；非數值狀態不列入
+UPSERT_SQL = """
+    INSERT INTO ha_entity_history_rollup AS r (
+        entity_id, resolution, bucket,
+        min_value, max_value, sum_value, sample_count,
+        last_value, last_state, last_changed
+    )
+    SELECT s.entity_id, res.resolution,
+           timestamp 'epoch' + floor(extract(epoch FROM s.last_changed) / res.resolution)
+                               * res.resolution * interval '1 second' AS bucket,
+           MIN(s.num_state), MAX(s.num_state), SUM(s.num_state), COUNT(*),
+           (array_agg(s.num_state ORDER BY s.last_changed DESC))[1],
+           (array_agg(s.entity_state ORDER BY s.last_changed DESC))[1],
+           MAX(s.last_changed)
+    FROM {src} AS s
+    CROSS JOIN unnest(%s::int[]) AS res(resolution)
+    WHERE s.domain = ANY(%s::varchar[]) AND s.num_state IS NOT NULL
+      AND s.entity_state ~ '""" + NUMERIC_STATE_PATTERN + """'
+    GROUP BY s.entity_id, res.resolution, bucket
+    ON CONFLICT (entity_id, resolution, bucket) DO UPDATE SET
+        min_value = LEAST(r.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(r.max_value, EXCLUDED.max_value),
+        sum_value = r.sum_value + EXCLUDED.sum_value,
+        sample_count = r.sample_count + EXCLUDED.sample_count,
+        last_value = CASE WHEN EXCLUDED.last_changed >= r.last_changed
+                          THEN EXCLUDED.last_value ELSE r.last_value END,
+        last_state = CASE WHEN EXCLUDED.last_changed >= r.last_changed
+                          THEN EXCLUDED.last_state ELSE r.last_state END,
+        last_changed = GREATEST(r.last_changed, EXCLUDED.last_changed)
+"""
+
+
+def ensure_rollup_table(cr, resolutions, numeric_domains):
+    """
+    建立 rollup table；第一次建立時從既有歷史記錄重建
+
+    Returns:
+        bool: 是否為新建立
+    """
+    cr.execute("SELECT to_regclass(%s)", (TABLE,))
+    if cr.fetchone()[0] is not None:
+        return False
+
+    cr.execute(f"""
+        CREATE TABLE {TABLE} (
+            entity_id integer NOT NULL REFERENCES ha_entity(id) ON DELETE CASCADE,
+            resolution integer NOT NULL,
+            bucket timestamp without time zone NOT NULL,
+            min_value double precision,
+            max_value double precision,
+            sum_value double precision,
+            sample_count integer NOT NULL,
+            last_value double precision,
+            last_state varchar,
+            last_changed timestamp without time zone,
+            PRIMARY KEY (entity_id, resolution, bucket)
+        )
+    """)
+    rebuild(cr, resolutions, numeric_domains)
+    return True
+
+
+def rebuild(cr, resolutions, numeric_domains, entity_ids=None):
+    """
+    從 ha_entity_history 重新計算 rollup
+
+    Args:
+        entity_ids: 只重建這些 ha.entity record id（None 表示全部）
+
+    Returns:
+        int: 寫入的 rollup 列數
+    """
+    if entity_ids is None:
+        cr.execute(f'DELETE FROM {TABLE}')
+        src = '(SELECT entity_id, domain, last_changed, num_state, entity_state FROM ha_entity_history)'
+        params = [list(resolutions), list(numeric_domains)]
+    else:
+        cr.execute(f'DELETE FROM {TABLE} WHERE entity_id = ANY(%s)', (list(entity_ids),))
+        src = ('(SELECT entity_id, domain, last_changed, num_state, entity_state '
+               'FROM ha_entity_history WHERE entity_id = ANY(%s))')
+        params = [list(entity_ids), list(resolutions), list(numeric_domains)]
+    cr.execute(UPSERT_SQL.format(src=src), params)
+    count = cr.rowcount
+    _logger.info(f"Rebuilt {count} history rollup rows")
+    return count
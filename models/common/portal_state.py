@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Portal State Helpers
+
+Portal 頁面的即時狀態（bus 推送與輪詢回應）共用的資料處理：
+- sanitize_portal_attributes()：移除可能含有網路 / 認證資訊的 HA attributes
+- portal_state_payload()：推送到 portal entity channel 的狀態內容
+- state_version()：輪詢的 since / ETag 版本字串；版本相同時 state 端點只回應 not_modified
+- state_cursor() / read_batch_states()：批次狀態端點（portal / 後端）一次查詢讀取多個實體，
+  只回傳 since 游標之後 commit 的狀態變更
+"""
+from datetime import datetime
+
+# Attribute keys that should be stripped from portal responses
+# These may contain sensitive network/auth info from Home Assistant
+PORTAL_SENSITIVE_ATTRIBUTE_KEYS = {
+    'access_token', 'token', 'api_key', 'password', 'secret',
+    'ip_address', 'mac_address', 'network_key', 'host',
+    'latitude', 'longitude', 'gps_accuracy',
+}
+
+# Fields the batched state endpoints can return (``fields`` projection); ``id`` is always included
+BATCH_STATE_FIELDS = ('entity_id', 'name', 'domain', 'entity_state', 'last_changed', 'attributes')
+
+# Maximum number of entity + group + device ids in one batched state request
+BATCH_STATE_MAX_IDS = 500
+
+# 批次狀態端點的 since 游標：目前時間與進行中交易最早開始時間中較早者（UTC）
+# 寫入端的 write_date 是交易開始時的 now()，交易 commit 前讀不到；進行中交易的 write_date
+# 不會早於其 xact_start，因此游標不超過它們就不會漏掉之後才 commit 的變更。
+# 其他資料庫角色的 xact_start 在 pg_stat_activity 中不可見，寫入端需與 Odoo 使用相同的角色。
+_STATE_CURSOR_QUERY = """
+    SELECT LEAST(clock_timestamp(), MIN(xact_start)) AT TIME ZONE 'UTC'
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL
+"""
+
+
+def sanitize_portal_attributes(attributes):
+    """Strip sensitive keys from HA entity attributes for portal display."""
+    if not attributes or not isinstance(attributes, dict):
+        return attributes or {}
+    return {
+        k: v for k, v in attributes.items()
+        if k.lower() not in PORTAL_SENSITIVE_ATTRIBUTE_KEYS
+    }
+
+
+def portal_state_payload(entity):
+    """
+    推送給 portal 的實體狀態（欄位與 state 端點的 entity_state / last_changed / attributes 一致）
+
+    Args:
+        entity: ha.entity record
+
+    Returns:
+        dict: id / entity_state / last_changed / attributes
+    """
+    return {
+        'id': entity.id,
+        'entity_state': entity.entity_state,
+        'last_changed': entity.last_changed.isoformat() if entity.last_changed else None,
+        'attributes': sanitize_portal_attributes(entity.attributes),
+    }
+
+
+def state_version(cr, entity_ids, *extra_dates):
+    """
+    計算一組實體的狀態版本字串
+
+    由實體數量與最新 write_date 組成，write_date 直接從資料庫讀取（保留微秒），
+    同一秒內的多次更新也會產生不同版本。呼叫端負責先 flush write_date。
+
+    Args:
+        entity_ids: ha.entity record IDs
+        extra_dates: 其他影響內容的時間（例如群組本身的 write_date）
+
+    Returns:
+        str: 版本字串
+    """
+    cr.execute(
+        "SELECT count(*), max(write_date) FROM ha_entity WHERE id = ANY(%s)",
+        (list(entity_ids),)
+    )
+    count, latest = cr.fetchone()
+    stamps = [stamp for stamp in (latest, *extra_dates) if stamp]
+    return f"{count}:{max(stamps).isoformat() if stamps else ''}"
+
+
+def parse_state_cursor(since):
+    """
+    解析批次狀態端點的 since 游標（前一次回應的 cursor，ISO 格式）
+
+    Returns:
+        datetime or None: 無效或未提供時回傳 None（回應全部狀態）
+    """
+    if not since or not isinstance(since, str):
+        return None
+    try:
+        return datetime.fromisoformat(since)
+    except ValueError:
+        return None
+
+
+def _check_name_list(value, param):
+    """確認參數為字串的 list（None 表示未指定）；避免字串被逐字元當成欄位名稱"""
+    if value is None:
+        return
+    if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"'{param}' must be a list of names")
+
+
+def state_cursor(cr):
+    """
+    取得下一次請求的 since 游標（見 _STATE_CURSOR_QUERY）
+
+    必須在讀取狀態的 snapshot 建立之前取得：之後 commit 的交易若在此時已開始，
+    游標會停在它的開始時間；若尚未開始，它的 write_date 會晚於游標。
+
+    Returns:
+        datetime: UTC naive datetime
+    """
+    # pg_stat_activity 在交易內會被快取，先清除以讀取目前的狀態
+    cr.execute("SELECT pg_stat_clear_snapshot()")
+    cr.execute(_STATE_CURSOR_QUERY)
+    return cr.fetchone()[0]
+
+
+def read_batch_states(Entity, entity_ids, since=None, fields=None, attribute_keys=None, sanitize=True):
+    """
+    一次查詢讀取多個實體的狀態，只回傳 since 游標之後變更的實體
+
+    先以 state_cursor() 取得游標，再以新的 cursor（新的交易 snapshot）讀取狀態：
+    請求本身的 snapshot 可能早於游標，期間 commit 的變更會讀不到卻被游標跳過。
+    write_date 等於游標的實體會在下一次請求再回傳一次（重複回傳無害）；
+    長時間的寫入交易進行中時，游標停在其開始時間，之後變更的實體會重複回傳直到它結束。
+
+    Args:
+        Entity: ha.entity model（呼叫端決定 sudo 或套用用戶權限）
+        entity_ids: 已授權的 ha.entity record IDs
+        since: 前一次回應的 cursor（None 表示全部）
+        fields: 要回傳的欄位（BATCH_STATE_FIELDS 的子集合，None 表示全部）
+        attribute_keys: 只保留這些 attributes key（None 表示全部）
+        sanitize: 是否移除敏感 attributes（portal 使用）
+
+    Raises:
+        ValueError: fields 或 attribute_keys 不是字串的 list
+
+    Returns:
+        tuple: (states, cursor)
+            - states: [{'id': int, <fields>}, ...]，依 id 排序
+            - cursor: 下一次請求的 since（沒有任何實體時沿用傳入的 since）
+    """
+    _check_name_list(fields, 'fields')
+    _check_name_list(attribute_keys, 'attributes')
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return [], since
+
+    since_dt = parse_state_cursor(since)
+    fields = [f for f in (fields or BATCH_STATE_FIELDS) if f in BATCH_STATE_FIELDS]
+    domain = [('id', 'in', entity_ids)]
+    if since_dt:
+        domain.append(('write_date', '>=', since_dt))
+
+    cursor = state_cursor(Entity.env.cr)
+    with Entity.env.registry.cursor() as read_cr:
+        rows = Entity.with_env(Entity.env(cr=read_cr)).search_read(domain, fields, order='id')
+    states = []
+    for row in rows:
+        if row.get('last_changed'):
+            row['last_changed'] = row['last_changed'].isoformat()
+        if 'attributes' in row:
+            attributes = row['attributes'] or {}
+            if sanitize:
+                attributes = sanitize_portal_attributes(attributes)
+            if attribute_keys is not None:
+                attributes = {k: attributes[k] for k in attribute_keys if k in attributes}
+            row['attributes'] = attributes
+        states.append(row)
+
+    return states, cursor.isoformat()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Request Dispatch (PostgreSQL LISTEN/NOTIFY)
+
+ha.ws.request.queue 的跨 process 喚醒機制：
+- Controller 建立 queue 記錄時 NOTIFY 'ha_ws_request_<instance_id>'，WebSocket worker 立即處理
+- Worker 更新記錄狀態時 NOTIFY 'ha_ws_result'（payload 為 request_id），等待中的請求只讀取一次結果
+
+NOTIFY 是交易性的：只有在 commit 之後才會送出，因此收到通知時記錄一定已經可見。
+queue table 仍保留作為持久化與稽核用途，通知只負責「喚醒」。
+
+延遲統計（controller → HA → controller）透過 get_request_latency_stats() 提供，
+只包含本 process 發出的請求。
+"""
+import bisect
+import collections
+import logging
+import select
+import threading
+import time
+
+from odoo import sql_db
+
+from odoo.addons.odoo_ha_addon.models.common.ws_config import (
+    WS_RETRY_SLEEP,
+    WS_LISTENER_SELECT_TIMEOUT,
+)
+
+_logger = logging.getLogger(__name__)
+
+# NOTIFY channel 名稱（PostgreSQL 的 NOTIFY 本身就以資料庫為範圍）
+REQUEST_CHANNEL_PREFIX = 'ha_ws_request_'
+RESULT_CHANNEL = 'ha_ws_result'
+
+# 延遲直方圖的 bucket 上限（毫秒），最後一個 bucket 為 +Inf
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# 計算百分位數時保留的最近樣本數
+LATENCY_SAMPLE_SIZE = 1000
+
+
+def request_channel(instance_id):
+    """取得 WebSocket worker 監聽的 per-instance channel 名稱"""
+    return f'{REQUEST_CHANNEL_PREFIX}{int(instance_id)}'
+
+
+def notify(cr, channel, payload=''):
+    """
+    在目前交易中排入 NOTIFY（commit 後才會送出）
+
+    Args:
+        cr: Odoo cursor
+        channel: NOTIFY channel 名稱
+        payload: 字串 payload
+    """
+    cr.execute("SELECT pg_notify(%s, %s)", (channel, payload or ''))
+
+
+# ============================================================================
+# Result Dispatcher：每個 process / 資料庫一個 LISTEN 連線
+# ============================================================================
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_result_dispatcher(db_name):
+    """
+    取得（必要時啟動）資料庫的結果通知 dispatcher
+
+    Args:
+        db_name: 資料庫名稱
+
+    Returns:
+        ResultDispatcher
+    """
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(db_name)
+        if dispatcher is None:
+            dispatcher = _dispatchers[db_name] = ResultDispatcher(db_name)
+    dispatcher.ensure_started()
+    return dispatcher
+
+
+class ResultDispatcher:
+    """
+    監聽 RESULT_CHANNEL 並喚醒等待中的請求
+
+    每個 process 只用一條連線 LISTEN，所有等待中的 controller 請求
+    以 request_id 註冊 threading.Event，收到對應 payload 時被喚醒。
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._waiters = {}  # {request_id: threading.Event}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def ensure_started(self):
+        """啟動 listener thread（若尚未啟動），並等待 LISTEN 生效"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._ready.clear()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f'ha_ws_result_listener_{self.db_name}',
+                    daemon=True,
+                )
+                self._thread.start()
+        # LISTEN 尚未生效前送出的通知會遺失，呼叫端仍有定期重新檢查作為保底
+        self._ready.wait(timeout=1)
+
+    def register(self, request_id):
+        """
+        註冊等待中的請求（必須在建立 queue 記錄並 commit 之前呼叫）
+
+        Returns:
+            threading.Event: 收到結果通知時被 set
+        """
+        event = threading.Event()
+        with self._lock:
+            self._waiters[request_id] = event
+        return event
+
+    def unregister(self, request_id):
+        with self._lock:
+            self._waiters.pop(request_id, None)
+
+    def _wake_all(self):
+        """連線中斷時喚醒所有等待者，讓它們自行重新讀取記錄"""
+        with self._lock:
+            for event in self._waiters.values():
+                event.set()
+
+    def _run(self):
+        while True:
+            try:
+                with sql_db.db_connect(self.db_name).cursor() as cr:
+                    conn = cr._cnx
+                    cr.execute(f'LISTEN {RESULT_CHANNEL}')
+                    cr.commit()
+                    self._ready.set()
+                    _logger.info(f"Listening on '{RESULT_CHANNEL}' for database {self.db_name}")
+                    try:
+                        while True:
+                            if select.select([conn], [], [], WS_LISTENER_SELECT_TIMEOUT) == ([], [], []):
+                                continue
+                            conn.poll()
+                            with self._lock:
+                                while conn.notifies:
+                                    event = self._waiters.get(conn.notifies.pop(0).payload)
+                                    if event:
+                                        event.set()
+                    finally:
+                        cr.execute(f'UNLISTEN {RESULT_CHANNEL}')
+                        cr.commit()
+            except Exception as e:
+                _logger.warning(f"Result listener for {self.db_name} lost its connection: {e}")
+                self._ready.clear()
+                self._wake_all()
+                time.sleep(WS_RETRY_SLEEP)
+
+
+# ============================================================================
+# Latency Histogram
+# ============================================================================
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def record_request_latency(db_name, instance_id, elapsed_ms, success=True):
+    """
+    記錄一次 controller → HA → controller 的往返延遲
+
+    Args:
+        db_name: 資料庫名稱
+        instance_id: HA 實例 ID
+        elapsed_ms: 往返時間（毫秒）
+        success: 請求是否成功
+    """
+    with _histograms_lock:
+        histogram = _histograms.get((db_name, instance_id))
+        if histogram is None:
+            histogram = _histograms[(db_name, instance_id)] = LatencyHistogram()
+        histogram.record(elapsed_ms, success)
+
+
+def get_request_latency_stats(db_name, instance_id=None):
+    """
+    取得本 process 的請求延遲統計
+
+    Args:
+        db_name: 資料庫名稱
+        instance_id: HA 實例 ID（None 表示該資料庫所有實例）
+
+    Returns:
+        dict: {instance_id: stats_dict}
+    """
+    with _histograms_lock:
+        return {
+            inst_id: histogram.get_stats()
+            for (db, inst_id), histogram in _histograms.items()
+            if db == db_name and (instance_id is None or inst_id == instance_id)
+        }
+
+
+class LatencyHistogram:
+    """固定 bucket 的累計直方圖 + 最近樣本（用於 p50/p99）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._samples = collections.deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self._count = 0
+        self._failures = 0
+        self._total_ms = 0.0
+
+    def record(self, elapsed_ms, success=True):
+        with self._lock:
+            self._buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+            self._samples.append(elapsed_ms)
+            self._count += 1
+            self._total_ms += elapsed_ms
+            if not success:
+                self._failures += 1
+
+    @staticmethod
+    def _percentile(ordered, pct):
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+        return ordered[index]
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: count / failures / avg / p50 / p90 / p99 / max（毫秒）與 bucket 分佈
+        """
+        with self._lock:
+            ordered = sorted(self._samples)
+            labels = [f'<={b}ms' for b in LATENCY_BUCKETS_MS] + ['+Inf']
+            return {
+                'count': self._count,
+                'failures': self._failures,
+                'avg_ms': self._total_ms / self._count if self._count else 0.0,
+                'p50_ms': self._percentile(ordered, 50),
+                'p90_ms': self._percentile(ordered, 90),
+                'p99_ms': self._percentile(ordered, 99),
+                'max_ms': ordered[-1] if ordered else 0.0,
+                'buckets': dict(zip(labels, self._buckets)),
+            }
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Share Access Index
+
+ha.entity.share 展開後的存取索引 ha_share_access（由 ha.entity.share.init() 建立）：
+每筆分享對它授權的每個目標一列 (user_id, target, target_id, permission, expires_at)
+- target 'entity' / 'group' / 'device'：分享本身的目標，direct = true
+- 群組分享展開為群組內的每個實體（封存的群組不展開）、裝置分享展開為裝置的每個實體，direct = false
+- 以 share_id 外鍵 ON DELETE CASCADE：刪除分享（含群組 / 裝置 / 用戶刪除造成的連鎖刪除）時一併刪除
+
+索引由寫入端維護（見 ha.entity.share._refresh_share_access）：分享的新增 / 修改、
+群組成員變更、實體的群組或裝置變更時重建相關分享的列。
+expires_at 在查詢時比對，分享到期不需要重建索引。
+
+read_grants_cached() 以 process 內的 LRU 快取單一 (user, target) 的授權列，不使用 ormcache
+（registry.clear_cache() 會讓整個 cluster 的 ormcache 失效）：
+- 每次索引變更（refresh / bump_version）以序列取得新的版本號寫入 ha_share_access_version
+- 每個 transaction 只讀取一次版本號，快取項目的版本號不同時視為失效
+- 版本號隨 transaction 提交才對其他 worker 可見；序列值不會重複使用，rollback 的版本號不會再出現
+
+同一用戶對同一目標的有效權限為所有未到期列中最高的權限（control > view）。
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+_logger = logging.getLogger(__name__)
+
+TABLE = 'ha_share_access'
+VERSION_TABLE = 'ha_share_access_version'
+VERSION_SEQUENCE = f'{VERSION_TABLE}_seq'
+
+# read_grants_cached() 每個 process 最多快取的 (db, user, target, target_id) 數
+GRANTS_CACHE_SIZE = 4096
+
+_grants_cache = OrderedDict()  # (dbname, user_id, target, target_id) -> (version, grants)
+_grants_cache_lock = threading.Lock()
+
+# 各類分享展開為 (share_id, user_id, target, target_id, ha_instance_id, permission, expires_at, direct)
+_EXPAND_QUERY = f"""
+    INSERT INTO {TABLE} (share_id, user_id, target, target_id, ha_instance_id, permission, expires_at, direct)
+    SELECT s.id, s.user_id, 'entity', e.id, e.ha_instance_id, s.permission, s.expiry_date, true
+      FROM ha_entity_share s
+      JOIN ha_entity e ON e.id = s.entity_id
+     WHERE {{share_filter}}
+    UNION ALL
+    SELECT s.id, s.user_id, 'group', g.id, g.ha_instance_id, s.permission, s.expiry_date, true
+      FROM ha_entity_share s
+      JOIN ha_entity_group g ON g.id = s.group_id
+     WHERE {{share_filter}}
+    UNION ALL
+    SELECT s.id, s.user_id, 'entity', e.id, e.ha_instance_id, s.permission, s.expiry_date, false
+      FROM ha_entity_share s
+      JOIN ha_entity_group g ON g.id = s.group_id AND g.active
+      JOIN ha_entity_group_entity_rel r ON r.group_id = g.id
+      JOIN ha_entity e ON e.id = r.entity_id
+     WHERE {{share_filter}}
+    UNION ALL
+    SELECT s.id, s.user_id, 'device', d.id, d.ha_instance_id, s.permission, s.expiry_date, true
+      FROM ha_entity_share s
+      JOIN ha_device d ON d.id = s.device_id
+     WHERE {{share_filter}}
+    UNION ALL
+    SELECT s.id, s.user_id, 'entity', e.id, e.ha_instance_id, s.permission, s.expiry_date, false
+      FROM ha_entity_share s
+      JOIN ha_entity e ON e.device_id = s.device_id
+     WHERE {{share_filter}}
+"""
+
+_NOT_EXPIRED = "(expires_at IS NULL OR expires_at >= now() AT TIME ZONE 'UTC')"
+
+
+def ensure_share_access_table(cr):
+    """
+    建立存取索引 table；第一次建立時從現有分享完整建立索引
+
+    Returns:
+        bool: 是否為新建立
+    """
+    ensure_version_table(cr)
+    cr.execute("SELECT to_regclass(%s)", (TABLE,))
+    if cr.fetchone()[0] is not None:
+        return False
+
+    cr.execute(f"""
+        CREATE TABLE {TABLE} (
+            share_id integer NOT NULL REFERENCES ha_entity_share(id) ON DELETE CASCADE,
+            user_id integer NOT NULL,
+            target varchar NOT NULL,
+            target_id integer NOT NULL,
+            ha_instance_id integer,
+            permission varchar NOT NULL,
+            expires_at timestamp without time zone,
+            direct boolean NOT NULL
+        )
+    """)
+    cr.execute(f"CREATE INDEX {TABLE}_user_target_idx ON {TABLE} (user_id, target, target_id)")
+    cr.execute(f"CREATE INDEX {TABLE}_target_idx ON {TABLE} (target, target_id)")
+    cr.execute(f"CREATE INDEX {TABLE}_share_idx ON {TABLE} (share_id)")
+    count = refresh(cr)
+    _logger.info(f"Built share access index: {count} rows")
+    return True
+
+
+def ensure_version_table(cr):
+    """建立只有一列的版本號 table 與其序列"""
+    cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {VERSION_SEQUENCE}")
+    cr.execute(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version bigint NOT NULL)")
+    cr.execute(f"""
+        INSERT INTO {VERSION_TABLE} (version)
+        SELECT nextval('{VERSION_SEQUENCE}')
+        WHERE NOT EXISTS (SELECT 1 FROM {VERSION_TABLE})
+    """)
+
+
+def bump_version(cr):
+    """
+    索引變更後更新版本號，讓所有 process 快取的授權列失效
+
+    外鍵連鎖刪除（刪除分享、群組等）不經過 refresh()，由呼叫端直接呼叫。
+    """
+    cr.execute(f"UPDATE {VERSION_TABLE} SET version = nextval('{VERSION_SEQUENCE}') RETURNING version")
+    cr.precommit.data[VERSION_TABLE] = cr.fetchone()[0]
+
+
+def current_version(cr):
+    """目前 transaction 看到的版本號（每個 transaction 只查詢一次）"""
+    data = cr.precommit.data
+    if VERSION_TABLE not in data:
+        cr.execute(f"SELECT version FROM {VERSION_TABLE}")
+        data[VERSION_TABLE] = cr.fetchone()[0]
+    return data[VERSION_TABLE]
+
+
+def refresh(cr, share_ids=None):
+    """
+    重建分享的索引列（刪除後重新展開，呼叫端負責先 flush ORM 寫入），並更新版本號
+
+    Args:
+        share_ids: 只重建這些分享（None 表示全部）
+
+    Returns:
+        int: 插入的列數
+    """
+    if share_ids is None:
+        cr.execute(f"DELETE FROM {TABLE}")
+        cr.execute(_EXPAND_QUERY.format(share_filter='true'))
+        count = cr.rowcount
+        bump_version(cr)
+        return count
+
+    share_ids = list(share_ids)
+    if not share_ids:
+        return 0
+    cr.execute(f"DELETE FROM {TABLE} WHERE share_id = ANY(%(ids)s)", {'ids': share_ids})
+    cr.execute(_EXPAND_QUERY.format(share_filter='s.id = ANY(%(ids)s)'), {'ids': share_ids})
+    count = cr.rowcount
+    bump_version(cr)
+    return count
+
+
+def read_grants(cr, user_id, target, target_id):
+    """
+    讀取用戶對單一目標的所有授權列（含已到期，由呼叫端比對 expires_at，結果可快取）
+
+    Returns:
+        tuple: ((permission, expires_at), ...)
+    """
+    cr.execute(f"""
+        SELECT permission, expires_at
+          FROM {TABLE}
+         WHERE user_id = %s AND target = %s AND target_id = %s
+    """, (user_id, target, target_id))
+    return tuple(cr.fetchall())
+
+
+def read_grants_cached(cr, user_id, target, target_id):
+    """
+    read_grants() 的 process 內 LRU 快取版本（依版本號判斷是否失效）
+
+    Returns:
+        tuple: ((permission, expires_at), ...)
+    """
+    version = current_version(cr)
+    key = (cr.dbname, user_id, target, target_id)
+    with _grants_cache_lock:
+        entry = _grants_cache.get(key)
+        if entry and entry[0] == version:
+            _grants_cache.move_to_end(key)
+            return entry[1]
+
+    grants = read_grants(cr, user_id, target, target_id)
+    with _grants_cache_lock:
+        _grants_cache[key] = (version, grants)
+        _grants_cache.move_to_end(key)
+        while len(_grants_cache) > GRANTS_CACHE_SIZE:
+            _grants_cache.popitem(last=False)
+    return grants
+
+
+def read_accessible(cr, user_id, target, target_ids):
+    """
+    一次查詢篩選出用戶目前可存取的目標
+
+    Returns:
+        set: 可存取的 target_id
+    """
+    cr.execute(f"""
+        SELECT DISTINCT target_id
+          FROM {TABLE}
+         WHERE user_id = %s AND target = %s AND target_id = ANY(%s) AND {_NOT_EXPIRED}
+    """, (user_id, target, list(target_ids)))
+    return {row[0] for row in cr.fetchall()}
+
+
+def read_shared(cr, target, target_ids):
+    """
+    篩選出至少有一個未到期分享的目標（不分用戶）
+
+    Returns:
+        list: 有分享的 target_id
+    """
+    cr.execute(f"""
+        SELECT DISTINCT target_id
+          FROM {TABLE}
+         WHERE target = %s AND target_id = ANY(%s) AND {_NOT_EXPIRED}
+    """, (target, list(target_ids)))
+    return [row[0] for row in cr.fetchall()]
+
+
+def read_user_targets(cr, user_id, ha_instance_id=None, direct=True):
+    """
+    一次查詢取得用戶在實例中可存取的所有目標與有效權限
+
+    Args:
+        ha_instance_id: 只列出此實例的目標（None 表示全部）
+        direct: 只列出分享本身的目標（不含群組 / 裝置展開的實體）
+
+    Returns:
+        dict: {'entity': {id: permission}, 'group': {...}, 'device': {...}}
+    """
+    query = f"""
+        SELECT target, target_id, bool_or(permission = 'control')
+          FROM {TABLE}
+         WHERE user_id = %(user_id)s AND {_NOT_EXPIRED}
+    """
+    if ha_instance_id is not None:
+        query += " AND ha_instance_id = %(instance_id)s"
+    if direct:
+        query += " AND direct"
+    query += " GROUP BY target, target_id"
+    cr.execute(query, {'user_id': user_id, 'instance_id': ha_instance_id})
+    targets = {'entity': {}, 'group': {}, 'device': {}}
+    for target, target_id, control in cr.fetchall():
+        targets[target][target_id] = 'control' if control else 'view'
+    return targets
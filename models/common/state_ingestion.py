@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+State Ingestion Pipeline
+
+state_changed 事件的微批次寫入管線：
+- 事件先進入有界佇列（asyncio.Queue(maxsize=queue_depth)）；佇列已滿時 submit 會等待，
+  WebSocket listener 直接 await submit，因此不會再讀取新的訊息（backpressure）
+- 每 flush_interval_ms 或累積 flush_size 個事件時 flush：佇列中的事件依 entity_id 合併，
+  每批最多 flush_size 個 entity、每個 entity 最多 STATE_MAX_TRANSITIONS 次轉換
+- 一次 flush 使用單一 cursor 完成 bulk UPDATE 與多筆 history INSERT
+
+統計數據（events in / coalesced / flush latency）透過 get_ingestion_stats() 提供，
+只在運行 WebSocket thread 的 process 中可取得。
+
+ha.entity 寫入的 applied / skipped（state_hash 相同而跳過）計數透過
+record_write_stats() / get_write_stats() 提供，同樣以 process 為範圍。
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from odoo import fields
+
+from odoo.addons.odoo_ha_addon.models.common.utils import parse_iso_datetime
+from odoo.addons.odoo_ha_addon.models.common.ws_config import (
+    STATE_FLUSH_SIZE,
+    STATE_FLUSH_INTERVAL_MS,
+    STATE_QUEUE_DEPTH,
+    STATE_MAX_TRANSITIONS,
+)
+
+_logger = logging.getLogger(__name__)
+
+# 全域統計註冊表：{(db_name, instance_id): StateIngestionPipeline}
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_ingestion_stats(db_name, instance_id=None):
+    """
+    取得本 process 中 ingestion pipeline 的統計數據
+
+    Args:
+        db_name: 資料庫名稱
+        instance_id: HA 實例 ID（None 表示該資料庫所有實例）
+
+    Returns:
+        dict: {instance_id: stats_dict}
+    """
+    with _pipelines_lock:
+        return {
+            inst_id: pipeline.get_stats()
+            for (db, inst_id), pipeline in _pipelines.items()
+            if db == db_name and (instance_id is None or inst_id == instance_id)
+        }
+
+
+# 實體寫入統計：{(db_name, instance_id): {'writes_applied': int, 'writes_skipped': int}}
+_write_stats = {}
+_write_stats_lock = threading.Lock()
+
+
+def record_write_stats(db_name, instance_id, applied=0, skipped=0):
+    """
+    累計實體狀態寫入的 applied / skipped 次數
+
+    Args:
+        db_name: 資料庫名稱
+        instance_id: HA 實例 ID
+        applied: 實際寫入（新增或更新）的實體數
+        skipped: 指紋相同而跳過寫入的實體數
+    """
+    with _write_stats_lock:
+        stats = _write_stats.setdefault(
+            (db_name, instance_id), {'writes_applied': 0, 'writes_skipped': 0}
+        )
+        stats['writes_applied'] += applied
+        stats['writes_skipped'] += skipped
+
+
+def get_write_stats(db_name, instance_id=None):
+    """
+    取得本 process 的實體寫入統計
+
+    Args:
+        db_name: 資料庫名稱
+        instance_id: HA 實例 ID（None 表示該資料庫所有實例）
+
+    Returns:
+        dict: {instance_id: {'writes_applied', 'writes_skipped'}}
+    """
+    with _write_stats_lock:
+        return {
+            inst_id: dict(stats)
+            for (db, inst_id), stats in _write_stats.items()
+            if db == db_name and (instance_id is None or inst_id == instance_id)
+        }
+
+
+def _parse_ha_time(state_data, key, default):
+    """取得 HA 回報的時間（last_changed / last_updated，UTC naive），缺少或格式錯誤時使用 default"""
+    try:
+        return parse_iso_datetime(state_data[key])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+
+class StateIngestionPipeline:
+    """
+    state_changed 事件的微批次合併緩衝區
+
+    同一 flush window 內同一 entity_id 的多次更新會合併為一筆 entity 更新，
+    但每一次 state 轉換仍保留在 transitions 中，讓歷史記錄不會遺失中間狀態。
+    每次轉換帶有 HA 的 last_changed / last_updated，與全量同步的歷史記錄使用相同時間。
+    """
+
+    def __init__(self, flush_callback, db_name=None, instance_id=None,
+                 flush_size=STATE_FLUSH_SIZE,
+                 flush_interval_ms=STATE_FLUSH_INTERVAL_MS,
+                 queue_depth=STATE_QUEUE_DEPTH):
+        """
+        Args:
+            flush_callback: async callable(list[dict]) -> None，負責把批次寫入資料庫
+            db_name: 資料庫名稱（用於統計註冊）
+            instance_id: HA 實例 ID（用於統計註冊）
+            flush_size: 累積多少個不同 entity 時立即 flush
+            flush_interval_ms: flush window（毫秒）
+            queue_depth: 佇列最大事件數量，佇列已滿時 submit 會等待 flush（backpressure）
+        """
+        self._flush_callback = flush_callback
+        self.db_name = db_name
+        self.instance_id = instance_id
+        self.flush_size = max(1, int(flush_size or STATE_FLUSH_SIZE))
+        self.flush_interval = max(1, int(flush_interval_ms or STATE_FLUSH_INTERVAL_MS)) / 1000.0
+        self.queue_depth = max(self.flush_size, int(queue_depth or STATE_QUEUE_DEPTH))
+
+        self._queue = asyncio.Queue(maxsize=self.queue_depth)
+        self._buffer = {}  # {entity_id: batch item}，只在 flush 期間使用
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._running = False
+
+        self._stats = {
+            'events_in': 0,
+            'events_coalesced': 0,
+            'backpressure_waits': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'entities_flushed': 0,
+            'transitions_flushed': 0,
+            'early_flushes': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+        if db_name:
+            with _pipelines_lock:
+                _pipelines[(db_name, instance_id)] = self
+
+    async def submit(self, entity_id, new_state, old_state=None):
+        """
+        將一個 state_changed 事件放入佇列；佇列已滿時等待 flush 騰出空間
+
+        Args:
+            entity_id: Home Assistant entity ID
+            new_state: 新狀態資料
+            old_state: 舊狀態資料（可選）
+        """
+        self._stats['events_in'] += 1
+        if self._queue.full():
+            # 佇列已滿：要求立即 flush，呼叫端（WebSocket listener）在 put 等待（backpressure）
+            self._stats['backpressure_waits'] += 1
+            self._flush_requested.set()
+        await self._queue.put((entity_id, new_state, old_state, fields.Datetime.now()))
+        if self._queue.qsize() >= self.flush_size:
+            self._flush_requested.set()
+
+    def _collect(self):
+        """
+        把佇列中的事件依 entity_id 合併到緩衝區
+
+        達到 flush_size 個 entity，或某個 entity 達到 STATE_MAX_TRANSITIONS 次轉換時停止，
+        剩餘事件留在佇列中給下一批。
+        """
+        while not self._queue.empty():
+            if len(self._buffer) >= self.flush_size:
+                return
+            entity_id, new_state, old_state, received_at = self._queue.get_nowait()
+            transition = {
+                'state': new_state.get('state'),
+                'attributes': new_state.get('attributes') or {},
+                'last_changed': _parse_ha_time(new_state, 'last_changed', received_at),
+                'last_updated': _parse_ha_time(new_state, 'last_updated', received_at),
+            }
+
+            item = self._buffer.get(entity_id)
+            if item:
+                # 合併：保留第一個 old_state，以最新的 new_state 為準
+                item['new_state'] = new_state
+                item['received_at'] = received_at
+                item['transitions'].append(transition)
+                self._stats['events_coalesced'] += 1
+                if len(item['transitions']) >= STATE_MAX_TRANSITIONS:
+                    self._stats['early_flushes'] += 1
+                    return
+            else:
+                self._buffer[entity_id] = {
+                    'entity_id': entity_id,
+                    'old_state': old_state,
+                    'new_state': new_state,
+                    'received_at': received_at,
+                    'transitions': [transition],
+                }
+
+    async def run(self):
+        """背景 flush 迴圈：每個 flush window 或達到 flush_size 時 flush"""
+        self._running = True
+        _logger.info(
+            f"State ingestion pipeline started (instance {self.instance_id}): "
+            f"flush_size={self.flush_size}, window={self.flush_interval * 1000:.0f}ms, "
+            f"queue_depth={self.queue_depth}"
+        )
+        try:
+            while self._running:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                await self.flush()
+        finally:
+            self._running = False
+
+    async def flush(self):
+        """立即寫入佇列中的所有事件（分批交給 flush_callback，同一時間只會有一個 flush）"""
+        async with self._flush_lock:
+            while True:
+                self._collect()
+                if not self._buffer:
+                    return
+                batch = list(self._buffer.values())
+                self._buffer = {}
+                await self._write_batch(batch)
+
+    async def _write_batch(self, batch):
+        """把一批合併後的項目交給 flush_callback 並更新統計"""
+        start = time.monotonic()
+        try:
+            await self._flush_callback(batch)
+        except Exception as e:
+            self._stats['flush_errors'] += 1
+            _logger.error(f"State ingestion flush failed (instance {self.instance_id}): {e}")
+        elapsed_ms = (time.monotonic() - start) * 1000
+
+        stats = self._stats
+        stats['flushes'] += 1
+        stats['entities_flushed'] += len(batch)
+        stats['transitions_flushed'] += sum(len(item['transitions']) for item in batch)
+        stats['last_flush_ms'] = elapsed_ms
+        stats['max_flush_ms'] = max(stats['max_flush_ms'], elapsed_ms)
+        stats['total_flush_ms'] += elapsed_ms
+        _logger.debug(
+            f"Flushed {len(batch)} entities in {elapsed_ms:.1f}ms (instance {self.instance_id})"
+        )
+
+    async def drain(self):
+        """停止 flush 迴圈並寫入佇列中剩餘的事件"""
+        self._running = False
+        self._flush_requested.set()
+        await self.flush()
+
+    def close(self):
+        """從全域統計註冊表移除"""
+        if self.db_name:
+            with _pipelines_lock:
+                if _pipelines.get((self.db_name, self.instance_id)) is self:
+                    del _pipelines[(self.db_name, self.instance_id)]
+
+    def get_stats(self):
+        """
+        取得統計數據
+
+        Returns:
+            dict: 計數器、目前佇列 / 緩衝區大小與平均 flush latency
+        """
+        stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['buffered'] = len(self._buffer)
+        stats['avg_flush_ms'] = (
+            stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        )
+        stats['flush_size'] = self.flush_size
+        stats['flush_interval_ms'] = int(self.flush_interval * 1000)
+        stats['queue_depth'] = self.queue_depth
+        return stats
@@ -1,6 +1,12 @@
 from datetime import datetime, timedelta, timezone
+import hashlib
+import json
 import pytz
 
+# HA 數值狀態的格式（十進位數字，不含 nan / inf）；history 的 num_state、
+# 降採樣與 rollup 都以此判斷狀態是否為數值（SQL 中以 ~ 比對同一個 pattern）
+NUMERIC_STATE_PATTERN = r'^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+
 def parse_iso_datetime(iso_str):
     # 分離日期時間和時區部分
     date_time_str, tz_str = iso_str.split('T')
@@ -28,6 +34,27 @@ def parse_iso_datetime(iso_str):
 
         return naive_datetime.replace(tzinfo=timezone(offset))
 
+def compute_state_hash(state, attributes):
+    """
+    計算實體狀態的內容指紋（state + 正規化後的 attributes）
+
+    attributes 以 sort_keys 與緊湊分隔符序列化，key 順序不同但內容相同的 dict 得到相同指紋。
+
+    input:
+        state: 'on'
+        attributes: {'friendly_name': 'Kitchen', 'brightness': 255}
+    output:
+        32 字元的十六進位字串
+    """
+    canonical = json.dumps(
+        [state, attributes or {}],
+        sort_keys=True,
+        separators=(',', ':'),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
 def parse_domain_from_entitiy_id(entity_id):
     """
     input:
@@ -4,19 +4,17 @@ import uuid
 import logging
 from odoo import api, models
 
+from odoo.addons.odoo_ha_addon.models.common.request_dispatch import (
+    get_result_dispatcher,
+    record_request_latency,
+)
+from odoo.addons.odoo_ha_addon.models.common.ws_config import WS_RESULT_RECHECK_INTERVAL
+
 # =============================================================================
 # WebSocket Client Configuration Constants
 # =============================================================================
-# These constants control the polling and timeout behavior of the WebSocket client.
-# Adjust these values based on your deployment environment and performance requirements.
-
-# Polling interval for waiting on WebSocket responses (in seconds)
-# Lower values provide faster response but increase database load
-WS_POLL_INTERVAL = 0.3  # 300ms
-
-# Polling interval for subscription operations (in seconds)
-# Subscriptions typically take longer, so we use a longer interval
-WS_SUBSCRIPTION_POLL_INTERVAL = 0.5  # 500ms
+# 請求結果透過 PostgreSQL LISTEN/NOTIFY 喚醒（見 request_dispatch.py），不再輪詢。
+# WS_RESULT_RECHECK_INTERVAL 只是遺失通知時的保底重新檢查間隔。
 
 # Timeout (in seconds) for determining subscription completion when no new events arrive
 # If no new events are received within this time, the subscription is considered complete
@@ -81,13 +79,26 @@ class WebSocketClient:
             # 建立請求
             request_id = str(uuid.uuid4())
             self._logger.debug(f"Generated request ID: {request_id}")
-            
-            ws_request = self._create_request(request_id, message_type, payload)
-            
-            # 等待結果
-            self._logger.debug(f"Waiting for result from request {request_id}...")
-            result = self._wait_for_result(ws_request, request_id, timeout)
-            
+
+            # 必須在 commit 之前註冊，才不會錯過 worker 的完成通知
+            dispatcher = get_result_dispatcher(self.env.cr.dbname)
+            waiter = dispatcher.register(request_id)
+            start_time = time.monotonic()
+            try:
+                ws_request = self._create_request(request_id, message_type, payload)
+
+                # 等待結果
+                self._logger.debug(f"Waiting for result from request {request_id}...")
+                result = self._wait_for_result(ws_request, request_id, timeout, waiter)
+            finally:
+                dispatcher.unregister(request_id)
+
+            record_request_latency(
+                self.env.cr.dbname,
+                self.instance_id,
+                (time.monotonic() - start_time) * 1000,
+                success=result.get('success', False),
+            )
             self._logger.debug(f"WebSocket API call completed: {message_type}, success: {result.get('success')}")
             return result
             
@@ -188,29 +199,32 @@ class WebSocketClient:
             # 生成請求 ID
             request_id = str(uuid.uuid4())
 
-            # 創建訂閱記錄
-            ws_request = self.env['ha.ws.request.queue'].sudo().create({
-                'request_id': request_id,
-                'message_type': message_type,
-                'payload': json.dumps(payload),
-                'state': 'pending',
-                'is_subscription': True,
-                'ha_instance_id': self.instance_id,  # Phase 3: 指定實例 ID
-            })
-
-            # WARNING: Explicit cr.commit() is necessary here for cross-process communication.
-            # The WebSocket thread runs in a separate process and needs to see this record
-            # immediately. Without this commit, the record would only be visible after the
-            # current transaction ends, causing the WebSocket thread to never see the request.
-            # This breaks Odoo's normal transaction management - ensure proper error handling.
-            self.env.cr.commit()
-
-            self._logger.info(f"Created subscription request: {request_id} (type: {message_type}, instance: {self.instance_id})")
-
-            # 等待訂閱完成並收集事件
-            result = self._wait_for_subscription_complete(ws_request, request_id, timeout)
-
-            return result
+            # 必須在 commit 之前註冊，才不會錯過 worker 的狀態通知
+            dispatcher = get_result_dispatcher(self.env.cr.dbname)
+            waiter = dispatcher.register(request_id)
+            try:
+                # 創建訂閱記錄（create() 會 NOTIFY worker）
+                ws_request = self.env['ha.ws.request.queue'].sudo().create({
+                    'request_id': request_id,
+                    'message_type': message_type,
+                    'payload': json.dumps(payload),
+                    'state': 'pending',
+                    'is_subscription': True,
+                    'ha_instance_id': self.instance_id,  # Phase 3: 指定實例 ID
+                })
+
+                # WARNING: Explicit cr.commit() is necessary here for cross-process communication.
+                # The WebSocket thread runs in a separate process and needs to see this record
+                # immediately. The NOTIFY queued by create() is only delivered on commit.
+                # This breaks Odoo's normal transaction management - ensure proper error handling.
+                self.env.cr.commit()
+
+                self._logger.info(f"Created subscription request: {request_id} (type: {message_type}, instance: {self.instance_id})")
+
+                # 等待訂閱完成並收集事件
+                return self._wait_for_subscription_complete(ws_request, request_id, timeout, waiter)
+            finally:
+                dispatcher.unregister(request_id)
 
         except Exception as e:
             self._logger.error(f"Subscription failed ({desc}): {e}", exc_info=True)
@@ -240,23 +254,27 @@ class WebSocketClient:
     #         description="trigger subscription"
     #     )
 
-    def _wait_for_subscription_complete(self, ws_request, request_id, timeout):
+    def _wait_for_subscription_complete(self, ws_request, request_id, timeout, waiter):
         """
         等待訂閱完成並收集所有事件
 
+        Worker 每次更新狀態或加入事件都會 NOTIFY，這裡只在被喚醒
+        （或保底重新檢查 / no-event 期限到達）時讀取記錄。
+
         Args:
             ws_request: ha.ws.request.queue 記錄
             request_id: 請求 ID
             timeout: 超時時間（秒）
+            waiter: ResultDispatcher.register() 返回的 threading.Event
 
         Returns:
             dict: {'success': bool, 'data': list, 'error': str}
         """
         start_time = time.time()
-        poll_interval = WS_SUBSCRIPTION_POLL_INTERVAL
         last_event_time = start_time
         no_event_timeout = WS_NO_EVENT_TIMEOUT
         last_event_count = 0  # 追蹤上一次的事件數量
+        record_id = ws_request.id
 
         self._logger.debug(f"Waiting for subscription {request_id} to complete")
 
@@ -266,7 +284,7 @@ class WebSocketClient:
             # Without this, we would be reading stale data from our transaction snapshot.
             self.env.cr.commit()
             ws_request = self.env['ha.ws.request.queue'].sudo().search([
-                ('id', '=', ws_request.id)
+                ('id', '=', record_id)
             ], limit=1)
 
             if not ws_request:
@@ -316,8 +334,16 @@ class WebSocketClient:
                     self._logger.info(f"No new events for {no_event_timeout}s, completing subscription")
                     ws_request.complete_subscription()
                     # 下一次迴圈會進入 done 狀態
+                    continue
 
-            time.sleep(poll_interval)
+            # 等待 worker 通知；最長等到 no-event 期限或保底重新檢查間隔
+            wait_time = min(
+                WS_RESULT_RECHECK_INTERVAL,
+                max(0.0, timeout - (time.time() - start_time)),
+                max(0.05, no_event_timeout - (time.time() - last_event_time)),
+            )
+            waiter.wait(wait_time)
+            waiter.clear()
 
         # 超時處理
         self._logger.error(f"Subscription {request_id} timed out")
@@ -386,70 +412,73 @@ class WebSocketClient:
         self._logger.info(f"Created WebSocket request: {request_id} (type: {message_type}, instance: {self.instance_id})")
         return ws_request
     
-    def _wait_for_result(self, ws_request, request_id, timeout):
-        """等待並處理請求結果"""
+    def _wait_for_result(self, ws_request, request_id, timeout, waiter):
+        """
+        等待並處理請求結果
+
+        Worker 完成請求時會 NOTIFY（payload 為 request_id），waiter 被喚醒後才讀取記錄；
+        每 WS_RESULT_RECHECK_INTERVAL 秒保底重新檢查一次，以防通知遺失。
+        """
         start_time = time.time()
-        poll_interval = WS_POLL_INTERVAL
-        poll_count = 0
-        
-        self._logger.debug(f"Starting polling for request {request_id}, timeout: {timeout}s")
-        
-        while time.time() - start_time < timeout:
-            poll_count += 1
-            elapsed = time.time() - start_time
-            
-            self._logger.debug(f"Poll #{poll_count} for request {request_id} (elapsed: {elapsed:.1f}s)")
+        wakeups = 0
+        record_id = ws_request.id
 
+        self._logger.debug(f"Waiting for request {request_id}, timeout: {timeout}s")
+
+        while True:
             # WARNING: Explicit cr.commit() is necessary here for cross-process visibility.
             # Each commit gives us a fresh transaction snapshot, allowing us to see updates
             # made by the WebSocket thread running in a separate process. Without this,
             # we would keep reading the same stale data from our original transaction.
             self.env.cr.commit()
             ws_request = self.env['ha.ws.request.queue'].sudo().search([
-                ('id', '=', ws_request.id)
+                ('id', '=', record_id)
             ], limit=1)
-            
+
             if not ws_request:
                 self._logger.debug(f"Request record {request_id} not found (deleted)")
                 return {'success': False, 'error': '請求記錄遺失'}
-            
-            self._logger.debug(f"Request {request_id} current state: {ws_request.state}")
-            
+
             if ws_request.state == 'done':
                 result = json.loads(ws_request.result) if ws_request.result else None
                 self._logger.info(f"Request {request_id} completed successfully")
                 self._logger.debug(f"Request {request_id} result data size: {len(str(result)) if result else 0} chars")
-                
+
                 # 清理請求記錄
                 ws_request.unlink()
-                
+
                 return {
                     'success': True,
                     'data': result
                 }
-            
+
             elif ws_request.state in ('failed', 'timeout'):
                 error = ws_request.error or 'Unknown error'
                 self._logger.error(f"Request {request_id} failed: {error}")
-                self._logger.debug(f"Request {request_id} failed after {poll_count} polls")
-                
+
                 # 清理請求記錄
                 ws_request.unlink()
-                
+
                 return {
                     'success': False,
                     'error': error
                 }
-            
-            # 等待一段時間再檢查
-            self._logger.debug(f"Request {request_id} still {ws_request.state}, waiting {poll_interval}s...")
-            time.sleep(poll_interval)
-        
+
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0:
+                break
+
+            # 等待 worker 的完成通知
+            self._logger.debug(f"Request {request_id} still {ws_request.state}, waiting for notification...")
+            waiter.wait(min(remaining, WS_RESULT_RECHECK_INTERVAL))
+            waiter.clear()
+            wakeups += 1
+
         # 超時處理
         elapsed = time.time() - start_time
-        self._logger.error(f"Request {request_id} timed out after {elapsed:.1f}s ({poll_count} polls)")
+        self._logger.error(f"Request {request_id} timed out after {elapsed:.1f}s ({wakeups} checks)")
         ws_request.write({'state': 'timeout', 'error': 'Client timeout'})
-        
+
         return {
             'success': False,
             'error': '請求超時'
@@ -1,112 +1,126 @@
 """
 WebSocket Thread Manager
 管理在背景執行緒中運行的 WebSocket 服務
+
+所有實例共用 event_loop_pool 中固定數量的 event loop 執行緒，
+每個實例是其所屬 loop 上的一個 asyncio task。
 """
 import threading
 import asyncio
+import concurrent.futures
 import logging
+import time
 from odoo import api, _
 from odoo.addons.odoo_ha_addon.models.common.ws_config import (
     WS_CONNECT_TIMEOUT,
     WS_RETRY_SLEEP,
     WS_THREAD_JOIN_TIMEOUT,
+    WS_HEARTBEAT_MAX_AGE,
+    WS_HEARTBEAT_ANY_MAX_AGE,
+    WS_STATUS_QUERY_TIMEOUT_MS,
+    WS_STATUS_CACHE_TTL,
+)
+from odoo.addons.odoo_ha_addon.models.common import ws_liveness
+from odoo.addons.odoo_ha_addon.models.common.event_loop_pool import (
+    get_loop_pool,
+    shutdown_loop_pool,
 )
 
 _logger = logging.getLogger(__name__)
 
-# 全域變數：儲存多資料庫、多實例的執行緒和停止事件
-# Phase 2 重構：雙層結構 {db_name: {instance_id: {'thread': ..., 'stop_event': ..., 'config': ...}}}
+# 全域變數：儲存多資料庫、多實例的服務 task 和停止事件
+# Phase 2 重構：雙層結構 {db_name: {instance_id: {'loop': ..., 'future': ..., 'stop_event': ..., 'config': ...}}}
 _websocket_connections = {}
 _connections_lock = threading.Lock()  # 保護 _websocket_connections 的執行緒安全
 
 # 重啟冷卻時間（秒）：防止短時間內重複重啟
 _RESTART_COOLDOWN = 5
 
+# 心跳查詢的 per-process 快取：{db_name: (monotonic 取得時間, {instance_id: age_seconds})}
+_heartbeat_cache = {}
+_heartbeat_cache_lock = threading.Lock()
 
-def _run_websocket_in_thread(db_name, instance_id, ha_url, ha_token, stop_event):
-    """
-    在執行緒中運行 WebSocket 服務
-    這個函數會被 threading.Thread 調用
 
-    Phase 2 重構：新增 instance_id 參數
+def _is_connection_alive(conn):
+    """服務 task 仍在執行且所在的 loop 執行緒仍在運行"""
+    return not conn['future'].done() and conn['loop'].is_alive()
 
-    Args:
-        db_name: 資料庫名稱
-        instance_id: HA Instance ID (Phase 2 新增)
-        ha_url: Home Assistant URL
-        ha_token: Home Assistant Token
-        stop_event: 該實例專用的停止事件
+
+def _pop_connection(db_name, instance_id):
     """
-    _logger.info(f"WebSocket thread started for database: {db_name}, instance: {instance_id}")
+    從 _websocket_connections 移除連線記錄（呼叫前需持有 _connections_lock）
 
-    try:
-        # 延遲導入，避免循環依賴
-        from .hass_websocket_service import HassWebSocketService
-
-        # 建立新的 event loop（因為執行緒沒有 event loop）
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        # 建立服務實例（Phase 2: 傳入 instance_id）
-        service = HassWebSocketService(
-            env=None,
-            db_name=db_name,
-            ha_url=ha_url,
-            ha_token=ha_token,
-            instance_id=instance_id  # Phase 2: 新增 instance_id
-        )
+    Returns:
+        dict or None: 被移除的連線記錄
+    """
+    instances_dict = _websocket_connections.get(db_name)
+    if instances_dict is None:
+        return None
+    conn = instances_dict.pop(instance_id, None)
 
-        # 運行服務直到停止事件被設置
-        async def run_until_stopped():
-            try:
-                # 啟動 WebSocket 服務
-                connect_task = asyncio.create_task(service.connect_and_listen())
+    # 如果該資料庫沒有任何實例連接，移除整個資料庫條目
+    if not instances_dict:
+        del _websocket_connections[db_name]
+    return conn
 
-                # 同時監聽該資料庫專用的停止事件
-                while not stop_event.is_set():
-                    await asyncio.sleep(WS_RETRY_SLEEP)
 
-                # 收到停止信號，停止服務
-                _logger.info(f"Stop signal received for {db_name} instance {instance_id}, shutting down WebSocket service...")
-                service.stop()
+async def _run_hosted_service(db_name, instance_id, service, stop_event, loop_thread):
+    """
+    在共用的 event loop 上運行單一實例的 WebSocket 服務，直到 stop_event 被設置
 
-                # 等待連線任務完成
-                try:
-                    await asyncio.wait_for(connect_task, timeout=WS_CONNECT_TIMEOUT)
-                except asyncio.TimeoutError:
-                    _logger.warning(f"WebSocket service shutdown timed out for {db_name} instance {instance_id}")
+    stop_event 是 asyncio.Event，由 _stop_single_connection 透過
+    call_soon_threadsafe 設置，不需要輪詢。
 
-            except Exception as e:
-                _logger.error(f"Error in WebSocket service for {db_name} instance {instance_id}: {e}")
+    Args:
+        db_name: 資料庫名稱
+        instance_id: HA Instance ID
+        service: HassWebSocketService
+        stop_event: 該實例專用的 asyncio.Event
+        loop_thread: 承載此服務的 EventLoopThread
+    """
+    key = (db_name, instance_id)
+    loop_thread.attach(key)
+    _logger.info(
+        f"WebSocket service started for database: {db_name}, instance: {instance_id} "
+        f"(event loop {loop_thread.index})"
+    )
+
+    connect_task = asyncio.create_task(service.connect_and_listen())
+    try:
+        await stop_event.wait()
 
-        # 運行 async 函數
-        loop.run_until_complete(run_until_stopped())
+        # 收到停止信號，停止服務
+        _logger.info(f"Stop signal received for {db_name} instance {instance_id}, shutting down WebSocket service...")
+        service.stop()
 
+        # 等待連線任務完成
+        try:
+            await asyncio.wait_for(connect_task, timeout=WS_CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            _logger.warning(f"WebSocket service shutdown timed out for {db_name} instance {instance_id}")
+
+    except asyncio.CancelledError:
+        # loop 關閉時被取消
+        service.stop()
+        connect_task.cancel()
+        raise
     except Exception as e:
-        _logger.error(f"Fatal error in WebSocket thread for {db_name} instance {instance_id}: {e}", exc_info=True)
+        _logger.error(f"Error in WebSocket service for {db_name} instance {instance_id}: {e}", exc_info=True)
     finally:
-        _logger.info(f"WebSocket thread stopped for database: {db_name}, instance: {instance_id}")
-        try:
-            loop.close()
-        except:
-            pass
+        loop_thread.detach(key)
+        _logger.info(f"WebSocket service stopped for database: {db_name}, instance: {instance_id}")
 
-        # Phase 2: 清理雙層結構的連線記錄
+        # 清理連線記錄（已被重啟取代的記錄不動）
         with _connections_lock:
-            if db_name in _websocket_connections:
-                if instance_id in _websocket_connections[db_name]:
-                    del _websocket_connections[db_name][instance_id]
-                    _logger.info(f"Cleaned up connection record for {db_name} instance {instance_id}")
-
-                # 如果該資料庫沒有任何實例連接，移除整個資料庫條目
-                if not _websocket_connections[db_name]:
-                    del _websocket_connections[db_name]
-                    _logger.info(f"Removed empty database entry for {db_name}")
+            conn = _websocket_connections.get(db_name, {}).get(instance_id)
+            if conn is not None and conn['stop_event'] is stop_event:
+                _pop_connection(db_name, instance_id)
+                _logger.info(f"Cleaned up connection record for {db_name} instance {instance_id}")
 
 
 def start_websocket_service(env, instance_id=None):
     """
-    啟動 WebSocket 服務在背景執行緒中
+    啟動 WebSocket 服務（在共用的 event loop 執行緒上）
     Phase 2 重構：支援多實例
 
     Args:
@@ -117,6 +131,9 @@ def start_websocket_service(env, instance_id=None):
     """
     db_name = env.cr.dbname
 
+    # 延遲導入，避免循環依賴
+    from .hass_websocket_service import HassWebSocketService
+
     # Phase 2: 取得要啟動的實例列表
     if instance_id:
         # 啟動特定實例
@@ -142,7 +159,7 @@ def start_websocket_service(env, instance_id=None):
             # 檢查該實例是否已經有運行的連線
             if instance.id in _websocket_connections[db_name]:
                 conn = _websocket_connections[db_name][instance.id]
-                if conn['thread'].is_alive():
+                if _is_connection_alive(conn):
                     _logger.info(f"WebSocket service already running for {db_name} instance {instance.id} ({instance.name})")
                     continue
 
@@ -157,21 +174,25 @@ def start_websocket_service(env, instance_id=None):
                 )
                 continue
 
-            # 建立該實例專用的停止事件
-            stop_event = threading.Event()
+            # 依一致性雜湊取得承載此實例的 event loop
+            loop_thread = get_loop_pool().get_loop(db_name, instance.id)
+
+            # 建立該實例專用的停止事件（asyncio.Event 在第一次 wait 時才綁定 loop）
+            stop_event = asyncio.Event()
 
-            # 建立並啟動執行緒
-            thread = threading.Thread(
-                target=_run_websocket_in_thread,
-                args=(db_name, instance.id, ha_url, ha_token, stop_event),
-                daemon=True,  # daemon thread 會在主程序結束時自動結束
-                name=f"HomeAssistantWebSocket-{db_name}-Instance-{instance.id}"
+            service = HassWebSocketService(
+                env=None,
+                db_name=db_name,
+                ha_url=ha_url,
+                ha_token=ha_token,
+                instance_id=instance.id
             )
 
             # Phase 2: 儲存到雙層結構
-            _websocket_connections[db_name][instance.id] = {
-                'thread': thread,
+            conn = _websocket_connections[db_name][instance.id] = {
+                'loop': loop_thread,
                 'stop_event': stop_event,
+                'service': service,
                 'config': {
                     'ha_url': ha_url,
                     'ha_token': ha_token
@@ -179,9 +200,11 @@ def start_websocket_service(env, instance_id=None):
                 'instance_name': instance.name  # 額外儲存名稱方便 debug
             }
 
-            thread.start()
+            conn['future'] = loop_thread.submit(
+                _run_hosted_service(db_name, instance.id, service, stop_event, loop_thread)
+            )
             _logger.info(
-                f"WebSocket service thread started for {db_name} "
+                f"WebSocket service scheduled on event loop {loop_thread.index} for {db_name} "
                 f"instance {instance.id} ({instance.name}) with config: {ha_url}"
             )
 
@@ -195,11 +218,14 @@ def stop_websocket_service(db_name=None, instance_id=None):
         db_name: 資料庫名稱（None 表示停止所有資料庫）
         instance_id: 實例 ID（None 表示停止該資料庫的所有實例）
     """
+    # 先在鎖內取出要停止的連線，再於鎖外等待服務結束
+    # （服務結束時會在 event loop 上取得 _connections_lock 清理記錄，持鎖等待會卡住整個 loop）
     with _connections_lock:
         if db_name is None:
             # 停止所有資料庫的所有連線
             if not _websocket_connections:
                 _logger.info("No WebSocket connections to stop")
+                shutdown_loop_pool()
                 return
 
             total_instances = sum(len(instances) for instances in _websocket_connections.values())
@@ -209,9 +235,11 @@ def stop_websocket_service(db_name=None, instance_id=None):
             )
 
             # Phase 2: 遍歷所有資料庫和實例
-            for db, instances_dict in list(_websocket_connections.items()):
-                for inst_id, conn in list(instances_dict.items()):
-                    _stop_single_connection(db, inst_id, conn)
+            targets = [
+                (db, inst_id)
+                for db, instances_dict in _websocket_connections.items()
+                for inst_id in instances_dict
+            ]
 
         elif instance_id is None:
             # 停止特定資料庫的所有實例
@@ -222,8 +250,7 @@ def stop_websocket_service(db_name=None, instance_id=None):
             instances_dict = _websocket_connections[db_name]
             _logger.info(f"Stopping all WebSocket services for database: {db_name} ({len(instances_dict)} instances)...")
 
-            for inst_id, conn in list(instances_dict.items()):
-                _stop_single_connection(db_name, inst_id, conn)
+            targets = [(db_name, inst_id) for inst_id in instances_dict]
 
         else:
             # 停止特定資料庫的特定實例
@@ -236,42 +263,49 @@ def stop_websocket_service(db_name=None, instance_id=None):
                 return
 
             _logger.info(f"Stopping WebSocket service for {db_name} instance {instance_id}...")
-            conn = _websocket_connections[db_name][instance_id]
-            _stop_single_connection(db_name, instance_id, conn)
+            targets = [(db_name, instance_id)]
+
+        stopping = [(db, inst_id, _pop_connection(db, inst_id)) for db, inst_id in targets]
+
+    # 先送出所有停止信號，讓同一批服務並行關閉
+    for db, inst_id, conn in stopping:
+        if not conn['loop'].call_soon(conn['stop_event'].set):
+            conn['future'].cancel()
+    for db, inst_id, conn in stopping:
+        _stop_single_connection(db, inst_id, conn)
+
+    if db_name is None:
+        # 全部停止時一併停止 loop 執行緒（例如模組卸載）
+        shutdown_loop_pool()
 
 
 def _stop_single_connection(db_name, instance_id, conn):
     """
-    停止單一實例的 WebSocket 連線
+    等待單一實例的 WebSocket 服務結束
     Phase 2 重構：支援實例參數
 
+    呼叫前需已將 conn 從 _websocket_connections 移除，並透過 loop 設置 stop_event；
+    不可持有 _connections_lock。
+
     Args:
         db_name: 資料庫名稱
         instance_id: 實例 ID
-        conn: 連線資訊字典 {'thread': Thread, 'stop_event': Event, 'config': dict}
+        conn: 連線資訊字典 {'loop': EventLoopThread, 'future': Future, 'stop_event': asyncio.Event, ...}
     """
-    stop_event = conn['stop_event']
-    thread = conn['thread']
     instance_name = conn.get('instance_name', f'Instance-{instance_id}')
 
-    stop_event.set()
-
-    # 等待執行緒結束
-    thread.join(timeout=WS_THREAD_JOIN_TIMEOUT)
-
-    if thread.is_alive():
-        _logger.warning(f"WebSocket thread for {db_name} instance {instance_id} ({instance_name}) did not stop gracefully")
-    else:
-        _logger.info(f"WebSocket service stopped successfully for {db_name} instance {instance_id} ({instance_name})")
-
-    # Phase 2: 清理雙層結構的連線記錄
-    if db_name in _websocket_connections:
-        if instance_id in _websocket_connections[db_name]:
-            del _websocket_connections[db_name][instance_id]
+    try:
+        conn['future'].result(timeout=WS_THREAD_JOIN_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        _logger.warning(f"WebSocket service for {db_name} instance {instance_id} ({instance_name}) did not stop gracefully")
+        return
+    except concurrent.futures.CancelledError:
+        pass
+    except Exception as e:
+        _logger.error(f"WebSocket service for {db_name} instance {instance_id} ({instance_name}) ended with error: {e}")
+        return
 
-        # 如果該資料庫沒有任何實例，移除整個資料庫條目
-        if not _websocket_connections[db_name]:
-            del _websocket_connections[db_name]
+    _logger.info(f"WebSocket service stopped successfully for {db_name} instance {instance_id} ({instance_name})")
 
 
 def is_websocket_service_running(env=None, instance_id=None):
@@ -297,7 +331,7 @@ def is_websocket_service_running(env=None, instance_id=None):
                 # 檢查特定實例
                 for db_instances in _websocket_connections.values():
                     if instance_id in db_instances:
-                        return db_instances[instance_id]['thread'].is_alive()
+                        return _is_connection_alive(db_instances[instance_id])
                 return False
             else:
                 # 檢查是否有任何實例
@@ -315,10 +349,10 @@ def is_websocket_service_running(env=None, instance_id=None):
             if instance_id:
                 # 檢查特定實例
                 if instance_id in instances_dict:
-                    is_alive = instances_dict[instance_id]['thread'].is_alive()
+                    is_alive = _is_connection_alive(instances_dict[instance_id])
                     _logger.debug(
                         f"[PID {os.getpid()}] Found instance {instance_id} for {db_name}, "
-                        f"thread is_alive={is_alive}"
+                        f"service is_alive={is_alive}"
                     )
                     return is_alive
                 else:
@@ -326,7 +360,7 @@ def is_websocket_service_running(env=None, instance_id=None):
                     return False
             else:
                 # 檢查是否有任何實例在運行
-                running_count = sum(1 for conn in instances_dict.values() if conn['thread'].is_alive())
+                running_count = sum(1 for conn in instances_dict.values() if _is_connection_alive(conn))
                 _logger.debug(
                     f"[PID {os.getpid()}] Found {running_count}/{len(instances_dict)} "
                     f"running instances for {db_name}"
@@ -338,97 +372,146 @@ def is_websocket_service_running(env=None, instance_id=None):
                 f"falling back to heartbeat check (cross-process)"
             )
 
-    # Phase 2: 跨 process 檢查 - 使用心跳機制
-    # Phase 3: 加入 statement_timeout 防止 DB 查詢阻塞
-    from datetime import datetime, timedelta, timezone
-    from odoo.sql_db import db_connect
+    # Phase 2: 跨 process 檢查 - 使用心跳機制（ha_ws_liveness）
+    try:
+        ages = _read_heartbeat_ages(db_name, [instance_id] if instance_id else None)
+    except Exception as e:
+        _logger.warning(
+            f"[PID {os.getpid()}] WebSocket status check failed (returning False): {e}"
+        )
+        return False
 
-    # DB 查詢 timeout（毫秒）
-    DB_QUERY_TIMEOUT_MS = 2000  # 2 seconds
+    if instance_id:
+        age = ages.get(instance_id)
+        # 心跳檢查閾值：heartbeat_interval * 1.5 = 10 * 1.5 = 15 秒
+        is_running = age is not None and age < WS_HEARTBEAT_MAX_AGE
+        _logger.debug(
+            f"[PID {os.getpid()}] Heartbeat Check - Instance {instance_id}: "
+            f"age={age}, threshold={WS_HEARTBEAT_MAX_AGE}s, is_running={is_running}"
+        )
+        return is_running
 
-    try:
-        if instance_id:
-            # 檢查特定實例的心跳
-            heartbeat_key = f'odoo_ha_addon.ws_heartbeat_{db_name}_instance_{instance_id}'
-
-            with db_connect(db_name).cursor() as cr:
-                # 設定 statement timeout 防止長時間阻塞
-                cr.execute(f"SET LOCAL statement_timeout = {DB_QUERY_TIMEOUT_MS}")
-                cr.execute(
-                    "SELECT value FROM ir_config_parameter WHERE key = %s",
-                    (heartbeat_key,)
-                )
-                result = cr.fetchone()
-                last_heartbeat = result[0] if result else None
+    # Phase 2: 檢查是否有任何實例在運行
+    running_count = sum(1 for age in ages.values() if age < WS_HEARTBEAT_ANY_MAX_AGE)
+    _logger.debug(
+        f"[PID {os.getpid()}] Found {running_count}/{len(ages)} "
+        f"running instances for {db_name}"
+    )
+    return running_count > 0
 
-                _logger.debug(
-                    f"[PID {os.getpid()}] Heartbeat check for {db_name} instance {instance_id}: "
-                    f"key={heartbeat_key}, value={last_heartbeat}"
-                )
 
-                if not last_heartbeat:
-                    _logger.debug(f"[PID {os.getpid()}] No heartbeat for instance {instance_id}")
-                    return False
+def _read_heartbeat_ages(db_name, instance_ids=None):
+    """
+    以獨立 cursor 讀取心跳距今秒數（一次查詢）
 
-                # 解析和檢查心跳時間
-                last_heartbeat_dt = datetime.strptime(last_heartbeat, '%Y-%m-%d %H:%M:%S')
-                last_heartbeat_dt = last_heartbeat_dt.replace(tzinfo=timezone.utc)
-                now_utc = datetime.now(timezone.utc)
-                time_diff = (now_utc - last_heartbeat_dt).total_seconds()
+    使用新的連線而非呼叫端的 cursor，避免 transaction snapshot 看到舊的心跳；
+    Phase 3: 加入 statement_timeout 防止 DB 查詢阻塞
 
-                # 心跳檢查閾值：heartbeat_interval * 1.5 = 10 * 1.5 = 15 秒
-                # 給 heartbeat 更新一些緩衝時間，但不要太寬鬆
-                is_running = time_diff < 15
-                _logger.debug(
-                    f"[PID {os.getpid()}] ⏱️  Heartbeat Check - Instance {instance_id}: "
-                    f"time_diff={time_diff:.2f}s, threshold=15s, is_running={is_running}"
-                )
-                return is_running
+    Returns:
+        dict: {instance_id: age_seconds}
+    """
+    from odoo.sql_db import db_connect
+
+    with db_connect(db_name).cursor() as cr:
+        cr.execute(f"SET LOCAL statement_timeout = {WS_STATUS_QUERY_TIMEOUT_MS}")
+        return ws_liveness.read_liveness(cr, instance_ids)
+
+
+def _get_cached_heartbeat_ages(db_name):
+    """
+    取得該資料庫所有實例的心跳距今秒數，WS_STATUS_CACHE_TTL 秒內共用同一次查詢
+
+    快取的是整個資料庫的心跳（一列一個實例），任何實例子集都由同一筆快取回答；
+    回傳時依快取經過的時間調整 age。
 
+    Returns:
+        dict: {instance_id: age_seconds}
+    """
+    now = time.monotonic()
+    with _heartbeat_cache_lock:
+        cached = _heartbeat_cache.get(db_name)
+    if cached is not None and now - cached[0] < WS_STATUS_CACHE_TTL:
+        elapsed = now - cached[0]
+        return {instance_id: age + elapsed for instance_id, age in cached[1].items()}
+
+    ages = _read_heartbeat_ages(db_name)
+    with _heartbeat_cache_lock:
+        _heartbeat_cache[db_name] = (now, ages)
+    return ages
+
+
+def clear_status_cache(db_name=None):
+    """清除心跳查詢快取（db_name 為 None 時清除全部）"""
+    with _heartbeat_cache_lock:
+        if db_name is None:
+            _heartbeat_cache.clear()
         else:
-            # Phase 2: 檢查是否有任何實例在運行（查找所有心跳）
-            heartbeat_pattern = f'odoo_ha_addon.ws_heartbeat_{db_name}_instance_%'
-
-            with db_connect(db_name).cursor() as cr:
-                # 設定 statement timeout 防止長時間阻塞
-                cr.execute(f"SET LOCAL statement_timeout = {DB_QUERY_TIMEOUT_MS}")
-                cr.execute(
-                    "SELECT key, value FROM ir_config_parameter WHERE key LIKE %s",
-                    (heartbeat_pattern,)
-                )
-                heartbeats = cr.fetchall()
+            _heartbeat_cache.pop(db_name, None)
 
-                if not heartbeats:
-                    _logger.debug(f"[PID {os.getpid()}] No heartbeats found for {db_name}")
-                    return False
 
-                # 檢查是否有任何心跳在 25 秒內
-                now_utc = datetime.now(timezone.utc)
-                running_count = 0
+def get_websocket_status_details(env, instance_ids):
+    """
+    一次取得多個實例的 WebSocket 狀態明細
+
+    先查本 process 的連線表，其餘實例由一次（快取的）心跳查詢判斷。
+
+    Args:
+        env: Odoo environment
+        instance_ids: HA Instance ID 列表
+
+    Returns:
+        dict: {instance_id: {
+            'running': bool,
+            'source': 'local' | 'heartbeat',   # 本 process 的連線表 / 心跳
+            'heartbeat_age': float or None,    # 心跳距今秒數（source='heartbeat'）
+            'event_loop': int or None,         # 承載服務的 loop（source='local'）
+        }}
+    """
+    import os
 
-                for key, value in heartbeats:
-                    try:
-                        last_heartbeat_dt = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
-                        last_heartbeat_dt = last_heartbeat_dt.replace(tzinfo=timezone.utc)
-                        time_diff = (now_utc - last_heartbeat_dt).total_seconds()
+    db_name = env.cr.dbname
+    details = {}
+    with _connections_lock:
+        local = _websocket_connections.get(db_name, {})
+        for instance_id in instance_ids:
+            if instance_id in local:
+                conn = local[instance_id]
+                details[instance_id] = {
+                    'running': _is_connection_alive(conn),
+                    'source': 'local',
+                    'heartbeat_age': None,
+                    'event_loop': conn['loop'].index,
+                }
 
-                        if time_diff < 25:
-                            running_count += 1
+    remaining = [instance_id for instance_id in instance_ids if instance_id not in details]
+    if remaining:
+        try:
+            ages = _get_cached_heartbeat_ages(db_name)
+        except Exception as e:
+            _logger.warning(f"[PID {os.getpid()}] WebSocket status check failed (returning False): {e}")
+            ages = {}
+        for instance_id in remaining:
+            age = ages.get(instance_id)
+            details[instance_id] = {
+                'running': age is not None and age < WS_HEARTBEAT_MAX_AGE,
+                'source': 'heartbeat',
+                'heartbeat_age': round(age, 1) if age is not None else None,
+                'event_loop': None,
+            }
+    return details
 
-                    except Exception as e:
-                        _logger.warning(f"Failed to parse heartbeat {key}: {e}")
 
-                _logger.debug(
-                    f"[PID {os.getpid()}] Found {running_count}/{len(heartbeats)} "
-                    f"running instances for {db_name}"
-                )
-                return running_count > 0
+def get_websocket_statuses(env, instance_ids):
+    """
+    一次取得多個實例的 WebSocket 狀態（見 get_websocket_status_details）
 
-    except Exception as e:
-        _logger.warning(
-            f"[PID {os.getpid()}] WebSocket status check failed (returning False): {e}"
-        )
-        return False
+    Returns:
+        dict: {instance_id: bool}
+    """
+    return {
+        instance_id: detail['running']
+        for instance_id, detail in get_websocket_status_details(env, instance_ids).items()
+    }
 
 
 def is_config_changed(env, instance_id, return_details=False):
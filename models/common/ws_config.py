@@ -82,6 +82,54 @@ WS_HISTORY_FETCH_TIMEOUT = 60
 # Batch history futures timeout (seconds)
 WS_HISTORY_BATCH_TIMEOUT = 90
 
+# Per-subscription limits for events buffered in ha.ws.request.event
+WS_SUBSCRIPTION_MAX_EVENTS = 10000
+WS_SUBSCRIPTION_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+
+# Initial history window for entities that have never been synced (hours)
+HISTORY_DEFAULT_WINDOW_HOURS = 24
+
+# Maximum window requested per entity per sync run; larger gaps are caught up in chunks (hours)
+HISTORY_BACKFILL_CHUNK_HOURS = 24
+
+# Overlap re-requested before the watermark to pick up late recorder commits (seconds)
+HISTORY_SYNC_OVERLAP_SECONDS = 60
+
+# Entities requested per history/stream subscription (default for ha_history_sync_chunk_size)
+HISTORY_SYNC_CHUNK_SIZE = 20
+
+# Attribute keys kept in ha.entity.history rows for every domain
+HISTORY_ATTRIBUTE_DEFAULT_KEYS = ('unit_of_measurement', 'device_class', 'state_class')
+
+# Extra attribute keys kept per domain ('*' keeps all attributes);
+# overridable via the odoo_ha_addon.ha_history_attribute_allowlist parameter (JSON)
+HISTORY_ATTRIBUTE_ALLOWLIST = {
+    'climate': ('current_temperature', 'temperature', 'target_temp_high', 'target_temp_low',
+                'current_humidity', 'hvac_action', 'preset_mode'),
+    'cover': ('current_position', 'current_tilt_position'),
+    'fan': ('percentage', 'preset_mode'),
+    'humidifier': ('humidity', 'current_humidity', 'mode'),
+    'light': ('brightness', 'color_mode', 'color_temp_kelvin', 'rgb_color'),
+    'media_player': ('volume_level', 'is_volume_muted', 'source', 'media_title'),
+    'water_heater': ('temperature', 'current_temperature', 'operation_mode'),
+    'weather': ('temperature', 'temperature_unit', 'humidity', 'pressure', 'wind_speed'),
+}
+
+# Rows rewritten per statement by compact_history_attributes()
+HISTORY_COMPACT_BATCH_SIZE = 5000
+
+# ha_entity_history range partition size by last_changed ('month' or 'week')
+HISTORY_PARTITION_INTERVAL = 'month'
+
+# Future partitions created ahead of time by the partition maintenance cron
+HISTORY_PARTITION_PREMAKE = 2
+
+# Domains whose history is charted as numeric series (bucket averages, rollups)
+HISTORY_NUMERIC_DOMAINS = ('sensor', 'input_number', 'number', 'counter')
+
+# Bucket sizes maintained in ha_entity_history_rollup (seconds): 5 minutes, 1 hour, 1 day
+HISTORY_ROLLUP_RESOLUTIONS = (300, 3600, 86400)
+
 
 # ============================================================================
 # Thread/Process Management
@@ -102,6 +150,58 @@ WS_POLL_DELAY_SHORT = 0.3
 # Standard polling delay (seconds)
 WS_POLL_DELAY_STANDARD = 0.5
 
+# Event loop threads shared by all WebSocket services of one Odoo process
+WS_LOOP_POOL_SIZE = 4
+
+# Virtual nodes per loop on the consistent-hash ring (instance -> loop assignment)
+WS_LOOP_HASH_REPLICAS = 64
+
+# Interval of the per-loop lag probe (seconds)
+WS_LOOP_LAG_INTERVAL = 1
+
+# A heartbeat older than this marks the instance as not running (seconds, ~1.5x the default interval)
+WS_HEARTBEAT_MAX_AGE = 15
+
+# Threshold used when checking whether any instance of a database is running (seconds)
+WS_HEARTBEAT_ANY_MAX_AGE = 25
+
+# statement_timeout of cross-process heartbeat queries (milliseconds)
+WS_STATUS_QUERY_TIMEOUT_MS = 2000
+
+# Per-process cache of the heartbeat query used by batched status lookups (seconds)
+WS_STATUS_CACHE_TTL = 2
+
+
+# ============================================================================
+# Request Dispatch (PostgreSQL LISTEN/NOTIFY)
+# ============================================================================
+
+# Worker safety sweep when no NOTIFY arrives (seconds); also drives stale subscription cleanup
+WS_REQUEST_IDLE_TIMEOUT = 10
+
+# Client re-reads its queue record at least this often in case a NOTIFY was missed (seconds)
+WS_RESULT_RECHECK_INTERVAL = 2
+
+# select() timeout of the result listener connection (seconds)
+WS_LISTENER_SELECT_TIMEOUT = 30
+
+
+# ============================================================================
+# State Ingestion Pipeline (defaults, overridable per ha.instance)
+# ============================================================================
+
+# Flush when this many distinct entities are buffered
+STATE_FLUSH_SIZE = 200
+
+# Flush window (milliseconds)
+STATE_FLUSH_INTERVAL_MS = 250
+
+# Maximum queued state_changed events; the WebSocket listener waits on a full queue (backpressure)
+STATE_QUEUE_DEPTH = 2000
+
+# Maximum buffered transitions of one entity; reaching it flushes the batch early
+STATE_MAX_TRANSITIONS = 100
+
 
 # ============================================================================
 # REST API Timeouts (for sync operations via HTTP)
@@ -137,3 +237,18 @@ REST_API_FUTURE_EXTENDED_TIMEOUT = 35
 # 2. History sync is capped at WS_HISTORY_BATCH_TIMEOUT (within limit)
 # 3. Breaking syncs into smaller batches prevents worker timeout
 ODOO_CRON_WORKER_TIMEOUT = 120  # Reference only, cannot change via code
+
+
+# ============================================================================
+# Orphaned Entity Cleanup
+# ============================================================================
+
+# Consecutive full syncs an entity may be missing from HA before it is removed
+# (default for ha_orphan_grace_syncs)
+ENTITY_ORPHAN_GRACE_SYNCS = 3
+
+# History / rollup rows deleted per statement when purging removed entities
+ENTITY_PURGE_BATCH_SIZE = 10000
+
+# Time budget of one purge cron run (seconds); the rest continues in the next run
+ENTITY_PURGE_TIME_BUDGET = 60
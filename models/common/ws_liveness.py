@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+WebSocket Liveness Store
+
+WebSocket 服務的心跳記錄在 UNLOGGED table ha_ws_liveness（每個實例一列，UPSERT）：
+- 不經過 ir.config_parameter：set_param 會清除 registry cache 並通知所有 worker 重新載入，
+  每個實例每個心跳週期都會讓整個 cluster 的 ormcache 失效
+- UNLOGGED：不寫 WAL；資料庫 crash 後內容會被清空，對心跳而言等同「尚未回報」
+- 寫入與讀取都使用資料庫時鐘（now()），不受各 process 時鐘差異影響
+- 刪除 ha.instance 時由外鍵 ON DELETE CASCADE 一併刪除
+
+read_liveness() 一次查詢取得所有（或指定）實例的心跳距今秒數。
+"""
+import logging
+import os
+
+_logger = logging.getLogger(__name__)
+
+TABLE = 'ha_ws_liveness'
+
+# 舊版心跳使用的 ir.config_parameter key
+LEGACY_HEARTBEAT_KEY_PATTERN = 'odoo_ha_addon.ws_heartbeat_%'
+
+
+def ensure_liveness_table(cr):
+    """
+    建立 liveness table；第一次建立時清除舊版的心跳參數
+
+    Returns:
+        bool: 是否為新建立
+    """
+    cr.execute("SELECT to_regclass(%s)", (TABLE,))
+    if cr.fetchone()[0] is not None:
+        return False
+
+    cr.execute(f"""
+        CREATE UNLOGGED TABLE {TABLE} (
+            instance_id integer PRIMARY KEY REFERENCES ha_instance(id) ON DELETE CASCADE,
+            last_beat timestamp without time zone NOT NULL,
+            pid integer
+        )
+    """)
+    cr.execute("DELETE FROM ir_config_parameter WHERE key LIKE %s", (LEGACY_HEARTBEAT_KEY_PATTERN,))
+    if cr.rowcount:
+        _logger.info(f"Removed {cr.rowcount} legacy WebSocket heartbeat parameters")
+    return True
+
+
+def beat(cr, instance_id):
+    """記錄實例的心跳（UPSERT，呼叫端負責 commit）"""
+    cr.execute(f"""
+        INSERT INTO {TABLE} (instance_id, last_beat, pid)
+        VALUES (%s, now() AT TIME ZONE 'UTC', %s)
+        ON CONFLICT (instance_id) DO UPDATE
+        SET last_beat = EXCLUDED.last_beat, pid = EXCLUDED.pid
+    """, (instance_id, os.getpid()))
+
+
+def read_liveness(cr, instance_ids=None):
+    """
+    一次查詢取得實例的心跳距今秒數
+
+    Args:
+        instance_ids: 只查詢這些實例（None 表示全部）
+
+    Returns:
+        dict: {instance_id: age_seconds}；沒有心跳記錄的實例不在結果中
+    """
+    query = f"""
+        SELECT instance_id, EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC') - last_beat)
+        FROM {TABLE}
+    """
+    params = ()
+    if instance_ids is not None:
+        query += " WHERE instance_id = ANY(%s)"
+        params = (list(instance_ids),)
+    cr.execute(query, params)
+    return {instance_id: float(age) for instance_id, age in cr.fetchall()}
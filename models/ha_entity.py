@@ -2,12 +2,20 @@ from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, AccessError
 import logging
 import json
-from psycopg2 import errors as psycopg2_errors
-from .common.utils import parse_iso_datetime, parse_domain_from_entitiy_id
+import time
+from .common.utils import compute_state_hash, parse_iso_datetime, parse_domain_from_entitiy_id
 from .common.hass_rest_api import HassRestApi
+from .common.state_ingestion import record_write_stats
+from .common.ws_config import ENTITY_ORPHAN_GRACE_SYNCS, ENTITY_PURGE_BATCH_SIZE, ENTITY_PURGE_TIME_BUDGET
 
 _logger = logging.getLogger(__name__)
 
+# 由 HA 狀態同步的欄位（_batch_update_entities 比對與更新的欄位）
+ENTITY_STATE_FIELDS = ('name', 'entity_state', 'last_changed', 'attributes')
+
+# 每個 UPDATE ... FROM (VALUES ...) 語句最多帶入的列數
+ENTITY_UPDATE_CHUNK = 1000
+
 
 class HAEntity(models.Model):
     _name = 'ha.entity'
@@ -27,6 +35,15 @@ class HAEntity(models.Model):
     entity_state = fields.Char(string='Entity State')
     last_changed = fields.Datetime(string='Last Changed', copy=False)
     attributes = fields.Json(string='Attributes')
+    state_hash = fields.Char(
+        string='State Fingerprint',
+        compute='_compute_state_hash',
+        store=True,
+        readonly=True,
+        copy=False,
+        help='Hash of the state and canonicalized attributes. Incoming states with the same '
+             'fingerprint are skipped without writing the row.'
+    )
     attributes_str = fields.Text(
         string='Attributes (JSON)',
         compute='_compute_attributes_str',
@@ -38,6 +55,30 @@ class HAEntity(models.Model):
         default=False,
         tracking=True
     )
+    history_synced_until = fields.Datetime(
+        string='History Synced Until',
+        copy=False,
+        readonly=True,
+        help='High-water mark of the incremental history sync: history up to this time has been '
+             'fetched from Home Assistant. The next sync only requests newer history.'
+    )
+    missing_sync_count = fields.Integer(
+        string='Missing Syncs',
+        default=0,
+        copy=False,
+        readonly=True,
+        help='Consecutive full syncs in which Home Assistant did not report this entity. '
+             'The entity is removed once the orphan grace period is reached.'
+    )
+    purge_pending = fields.Boolean(
+        string='Pending Removal',
+        default=False,
+        copy=False,
+        readonly=True,
+        index=True,
+        help='The entity no longer exists in Home Assistant; its history is being deleted '
+             'in the background before the entity itself is removed.'
+    )
 
     # Relational
     ha_instance_id = fields.Many2one(
@@ -231,6 +272,18 @@ class HAEntity(models.Model):
                           )
                     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # 建立在已分享的群組 / 裝置下的實體需要加入存取索引
+        scoped = records.filtered(lambda r: r.device_id or r.group_ids)
+        if scoped:
+            self.env['ha.entity.share']._refresh_share_access_for(
+                groups=scoped.sudo().group_ids,
+                devices=scoped.sudo().device_id,
+            )
+        return records
+
     def write(self, vals):
         """
         覆寫 write 方法，限制一般用戶只能修改特定欄位。
@@ -252,7 +305,18 @@ class HAEntity(models.Model):
         follows_device_area_changed = 'follows_device_area' in vals
         name_changed = 'name' in vals
         label_ids_changed = 'label_ids' in vals
+
+        # 群組或裝置變更會改變分享展開的實體，寫入後重建相關分享的存取索引（含原本的群組 / 裝置）
+        share_scope_changed = 'group_ids' in vals or 'device_id' in vals
+        if share_scope_changed:
+            old_groups = self.sudo().group_ids
+            old_devices = self.sudo().device_id
         result = super().write(vals)
+        if share_scope_changed:
+            self.env['ha.entity.share']._refresh_share_access_for(
+                groups=old_groups | self.sudo().group_ids,
+                devices=old_devices | self.sudo().device_id,
+            )
 
         # 若是從 HA 同步過來的，不再回傳給 HA（防止循環）
         if not self.env.context.get('from_ha_sync'):
@@ -460,6 +524,11 @@ class HAEntity(models.Model):
             _logger.error(f"Failed to update entity labels {effective_entity_id} in HA: {e}", exc_info=True)
             raise
 
+    @api.depends('entity_state', 'attributes')
+    def _compute_state_hash(self):
+        for record in self:
+            record.state_hash = compute_state_hash(record.entity_state, record.attributes)
+
     @api.depends('attributes')
     def _compute_attributes_str(self):
         """將 JSON 物件轉換為格式化的字串供 ACE editor 顯示"""
@@ -554,22 +623,11 @@ class HAEntity(models.Model):
             except Exception as e:
                 _logger.warning(f"Failed to update last_sync_date: {e}")
 
-            # === 清理孤立實體 ===
+            # === 清理孤立實體（寬限期 + 背景分批刪除歷史）===
             try:
-                ha_entity_ids = {e.get('entity_id') for e in entity_states if e.get('entity_id')}
-                odoo_entities = self.env['ha.entity'].sudo().search([
-                    ('ha_instance_id', '=', instance_id)
-                ])
-                orphaned = odoo_entities.filtered(lambda e: e.entity_id not in ha_entity_ids)
-                if orphaned:
-                    orphan_count = len(orphaned)
-                    orphan_ids = orphaned.mapped('entity_id')
-                    _logger.warning(
-                        f"Found {orphan_count} orphaned entities in Odoo "
-                        f"(not in HA instance {instance_id}): {orphan_ids[:10]}..."
-                    )
-                    orphaned.with_context(from_ha_sync=True).unlink()
-                    _logger.info(f"Cleaned up {orphan_count} orphaned entities")
+                self._reconcile_orphaned_entities(
+                    instance_id, [e.get('entity_id') for e in entity_states if e.get('entity_id')]
+                )
             except Exception as e:
                 _logger.error(f"Failed to clean up orphaned entities: {e}")
 
@@ -623,146 +681,353 @@ class HAEntity(models.Model):
 
     def _do_sync_entity_registry_relations(self, env, instance_id, registry_data):
         """
-        Internal method to perform the actual sync using the provided environment.
-        This is called with a fresh cursor to isolate from concurrent updates.
+        以集合運算同步 entity 與 area, labels 和 device 的關聯
+
+        1. load:   一次查詢載入此實例所有實體的 area / device / follows_device_area 與 label ids
+        2. labels: 所有 registry entry 的 label_id 聯集一次解析；缺少的 area 一次批次建立
+        3. diff:   在記憶體中比對，依欄位與目標值分組
+        4. write:  每個欄位的每個目標值一次 ORM write（display_area_id 照常重算）；
+                   label_ids 以單一 SQL 語句更新 ha_entity_label_rel
+
+        所有寫入都帶 from_ha_sync=True，不會同步回 HA。
 
         Args:
             env: The environment with a fresh cursor
             instance_id: HA instance ID
             registry_data: List of entity registry entries from HA
+
+        Returns:
+            dict: area / label / device 更新數量與 timings_ms（各階段耗時）
         """
-        # Phase 3: 建立 area_id -> ha.area record ID 的映射（只包含此實例的 areas）
-        areas = env['ha.area'].sudo().search([
-            ('ha_instance_id', '=', instance_id)
-        ])
-        area_map = {area.area_id: area.id for area in areas}
-
-        # 建立 device_id -> ha.device record ID 的映射（只包含此實例的 devices）
-        devices = env['ha.device'].sudo().search([
-            ('ha_instance_id', '=', instance_id)
-        ])
-        device_map = {device.device_id: device.id for device in devices}
+        cr = env.cr
+        timings = {}
+        started = time.perf_counter()
+
+        # === Phase 1: load ===
+        cr.execute("""
+            SELECT e.id, e.entity_id, e.area_id, e.device_id, e.follows_device_area,
+                   COALESCE(array_agg(r.label_id) FILTER (WHERE r.label_id IS NOT NULL), '{}')
+            FROM ha_entity e
+            LEFT JOIN ha_entity_label_rel r ON r.entity_id = e.id
+            WHERE e.ha_instance_id = %s
+            GROUP BY e.id
+        """, (instance_id,))
+        existing = {row[1]: row for row in cr.fetchall()}
+
+        cr.execute("SELECT area_id, id FROM ha_area WHERE ha_instance_id = %s", (instance_id,))
+        area_map = dict(cr.fetchall())
+        cr.execute("SELECT device_id, id FROM ha_device WHERE ha_instance_id = %s", (instance_id,))
+        device_map = dict(cr.fetchall())
         _logger.info(f"Device map size: {len(device_map)} devices for instance {instance_id}")
-        if device_map:
-            _logger.debug(f"Sample device_ids in map: {list(device_map.keys())[:3]}")
+        timings['load'] = (time.perf_counter() - started) * 1000
 
-        area_updated_count = 0
-        label_updated_count = 0
-        device_updated_count = 0
+        # registry 中有、Odoo 中也有的實體（同一 entity 以最後一筆為準）
+        entries = {}
+        for entry in registry_data:
+            entity_id = entry.get('entity_id')
+            if entity_id and entity_id in existing:
+                entries[entity_id] = entry
+
+        # === Phase 2: labels / areas ===
+        phase_start = time.perf_counter()
+        all_label_ids = set()
+        for entry in entries.values():
+            all_label_ids.update(entry.get('labels') or [])
+        label_map = {}
+        if all_label_ids:
+            labels = env['ha.label'].get_or_create_labels(list(all_label_ids), instance_id)
+            label_map = {label.label_id: label.id for label in labels}
+
+        # Auto-create areas that don't exist yet (names are updated by the next area sync)
+        missing_areas = {
+            entry['area_id'] for entry in entries.values()
+            if entry.get('area_id') and entry['area_id'] not in area_map
+        }
+        if missing_areas:
+            _logger.info(f"Auto-creating {len(missing_areas)} areas: {sorted(missing_areas)[:10]}")
+            created_areas = env['ha.area'].sudo().with_context(from_ha_sync=True).create([{
+                'area_id': ha_area_id,
+                'name': ha_area_id,  # Temporary name, will be updated by area sync
+                'ha_instance_id': instance_id,
+            } for ha_area_id in sorted(missing_areas)])
+            area_map.update({area.area_id: area.id for area in created_areas})
+        timings['labels'] = (time.perf_counter() - phase_start) * 1000
+
+        # === Phase 3: diff ===
+        phase_start = time.perf_counter()
+        # {field: {target value: [record ids]}}
+        writes = {'area_id': {}, 'follows_device_area': {}, 'device_id': {}}
+        label_changes = {}  # record id -> 新的 label record ids
         device_set_count = 0  # Entities where device_id was SET
         device_clear_count = 0  # Entities where device_id was CLEARED
         device_not_in_map_count = 0  # Entities with device_id not in our map
-        for entry in registry_data:
-            try:
-                entity_id = entry.get('entity_id')
-                ha_area_id = entry.get('area_id')  # HA 的 area_id (string)
-                ha_labels = entry.get('labels', [])  # HA 的 labels (label_id array)
-                ha_device_id = entry.get('device_id')  # HA 的 device_id (string)
 
-                if not entity_id:
-                    continue
+        def stage(field, record_id, current, target):
+            if current != target:
+                writes[field].setdefault(target, []).append(record_id)
 
-                # Phase 3: 查找對應的 entity（加上 instance_id 過濾）
-                entity = env['ha.entity'].sudo().search([
-                    ('entity_id', '=', entity_id),
-                    ('ha_instance_id', '=', instance_id)
-                ], limit=1)
+        for entity_id, entry in entries.items():
+            record_id, _entity_id, area_id, device_id, follows, label_ids = existing[entity_id]
+            ha_area_id = entry.get('area_id')  # HA 的 area_id (string)
+            ha_device_id = entry.get('device_id')  # HA 的 device_id (string)
 
-                if not entity:
-                    continue
+            # 當 HA 的 area_id 為 null 且有 device_id 時，表示實體跟隨裝置分區
+            if ha_area_id:
+                stage('area_id', record_id, area_id, area_map[ha_area_id])
+                stage('follows_device_area', record_id, bool(follows), False)
+            else:
+                stage('area_id', record_id, area_id, None)
+                stage('follows_device_area', record_id, bool(follows), bool(ha_device_id))
+
+            new_label_ids = {label_map[label] for label in entry.get('labels') or [] if label in label_map}
+            if new_label_ids != set(label_ids):
+                label_changes[record_id] = new_label_ids
+
+            if ha_device_id and ha_device_id in device_map:
+                if device_id != device_map[ha_device_id]:
+                    stage('device_id', record_id, device_id, device_map[ha_device_id])
+                    device_set_count += 1
+            elif ha_device_id:
+                # Log when device_id is in registry but not in our device_map
+                device_not_in_map_count += 1
+                if device_not_in_map_count <= 5:  # Only log first few
+                    _logger.warning(f"Entity {entity_id} has device_id={ha_device_id} but not in device_map")
+            elif device_id:
+                # HA 中沒有 device，清空 Odoo 的 device_id
+                stage('device_id', record_id, device_id, None)
+                device_clear_count += 1
+        timings['diff'] = (time.perf_counter() - phase_start) * 1000
+
+        # === Phase 4: write ===
+        phase_start = time.perf_counter()
+        # Must use sudo() to bypass _USER_EDITABLE_FIELDS restriction for device_id
+        Entity = env['ha.entity'].sudo().with_context(from_ha_sync=True, tracking_disable=True)
+        write_count = 0
+        for field, groups in writes.items():
+            for target, record_ids in groups.items():
+                try:
+                    with cr.savepoint():
+                        Entity.browse(record_ids).write({field: target or False})
+                    write_count += 1
+                except Exception as write_error:
+                    _logger.error(f"Write {field}={target} failed for {len(record_ids)} entities: {write_error}")
+
+        if label_changes:
+            self._replace_entity_labels(env, label_changes)
+        timings['write'] = (time.perf_counter() - phase_start) * 1000
+        timings['total'] = (time.perf_counter() - started) * 1000
+
+        stats = {
+            'areas_updated': len({rid for ids in writes['area_id'].values() for rid in ids}),
+            'labels_updated': len(label_changes),
+            'devices_updated': device_set_count + device_clear_count,
+            'writes': write_count,
+            'timings_ms': {phase: round(ms, 1) for phase, ms in timings.items()},
+        }
+        _logger.info(
+            f"Entity relations sync completed (instance {instance_id}): "
+            f"{stats['areas_updated']} areas updated, {stats['labels_updated']} labels updated, "
+            f"{stats['devices_updated']} device relations updated "
+            f"(SET: {device_set_count}, CLEARED: {device_clear_count}, NOT_IN_MAP: {device_not_in_map_count}) "
+            f"in {write_count} writes; timings (ms): "
+            + ', '.join(f"{phase}={ms}" for phase, ms in stats['timings_ms'].items())
+        )
+        return stats
 
-                update_vals = {}
+    def _replace_entity_labels(self, env, label_changes):
+        """
+        以單一語句把多個實體的 label_ids 換成新的集合
 
-                # 更新 area_id 和 follows_device_area
-                # 當 HA 的 area_id 為 null 且有 device_id 時，表示實體跟隨裝置分區
-                if ha_area_id:
-                    # 實體有自己的分區
-                    if ha_area_id in area_map:
-                        odoo_area_id = area_map[ha_area_id]
-                    else:
-                        # Auto-create area if it doesn't exist
-                        _logger.info(f"Auto-creating area {ha_area_id} for entity {entity_id}")
-                        area_record = env['ha.area'].sudo().create({
-                            'area_id': ha_area_id,
-                            'name': ha_area_id,  # Temporary name, will be updated by area sync
-                            'ha_instance_id': instance_id,
-                        })
-                        odoo_area_id = area_record.id
-                        area_map[ha_area_id] = odoo_area_id  # Update map for future entities
-
-                    if entity.area_id.id != odoo_area_id:
-                        update_vals['area_id'] = odoo_area_id
-                        area_updated_count += 1
-                        _logger.debug(f"Updated entity {entity_id} -> area {ha_area_id}")
-                    # 有自己的 area_id，不跟隨裝置
-                    if entity.follows_device_area:
-                        update_vals['follows_device_area'] = False
-                elif not ha_area_id and ha_device_id:
-                    # HA 中沒有 area 但有 device，表示跟隨裝置分區
-                    if entity.area_id:
-                        update_vals['area_id'] = False
-                        area_updated_count += 1
-                    if not entity.follows_device_area:
-                        update_vals['follows_device_area'] = True
-                        _logger.debug(f"Entity {entity_id} follows device area")
-                elif not ha_area_id and not ha_device_id:
-                    # HA 中沒有 area 也沒有 device
-                    if entity.area_id:
-                        update_vals['area_id'] = False
-                        area_updated_count += 1
-                    if entity.follows_device_area:
-                        update_vals['follows_device_area'] = False
-
-                # 更新 label_ids
-                if ha_labels:
-                    label_records = env['ha.label'].get_or_create_labels(ha_labels, instance_id)
-                    current_label_ids = set(entity.label_ids.ids)
-                    new_label_ids = set(label_records.ids)
-                    if current_label_ids != new_label_ids:
-                        update_vals['label_ids'] = [(6, 0, label_records.ids)]
-                        label_updated_count += 1
-                        _logger.debug(f"Updated entity {entity_id} labels: {ha_labels}")
-                elif entity.label_ids:
-                    # 清空 labels
-                    update_vals['label_ids'] = [(5, 0, 0)]
-                    label_updated_count += 1
-
-                # 更新 device_id
-                if ha_device_id and ha_device_id in device_map:
-                    odoo_device_id = device_map[ha_device_id]
-                    if entity.device_id.id != odoo_device_id:
-                        update_vals['device_id'] = odoo_device_id
-                        device_updated_count += 1
-                        device_set_count += 1
-                        _logger.debug(f"SET device_id: entity {entity_id} -> device {ha_device_id} (odoo_id={odoo_device_id})")
-                elif ha_device_id and ha_device_id not in device_map:
-                    # Log when device_id is in registry but not in our device_map
-                    device_not_in_map_count += 1
-                    if device_not_in_map_count <= 5:  # Only log first few
-                        _logger.warning(f"Entity {entity_id} has device_id={ha_device_id} but not in device_map")
-                elif not ha_device_id and entity.device_id:
-                    # HA 中沒有 device，清空 Odoo 的 device_id
-                    update_vals['device_id'] = False
-                    device_updated_count += 1
-                    device_clear_count += 1
-
-                if update_vals:
-                    _logger.debug(f"Writing update_vals for {entity_id}: {update_vals}")
-                    try:
-                        # Must use sudo() to bypass _USER_EDITABLE_FIELDS restriction for device_id
-                        entity.sudo().with_context(from_ha_sync=True).write(update_vals)
-                    except Exception as write_error:
-                        _logger.error(f"Write failed for {entity_id}: {write_error}")
+        刪除不在新集合中的關聯列、插入缺少的列（CTE 中的 DELETE 與 INSERT 在同一語句執行），
+        直接寫入關聯表不經過 write()，等同 from_ha_sync=True。
 
-            except Exception as e:
-                _logger.error(f"Error syncing relations for entity: {e}")
+        Args:
+            env: 使用中的 environment
+            label_changes: {ha.entity record id: set of ha.label record ids}
+        """
+        entity_ids = list(label_changes)
+        pairs = [(entity_id, label_id) for entity_id, label_ids in label_changes.items() for label_id in label_ids]
+        env.cr.execute("""
+            WITH desired AS (
+                SELECT unnest(%(pair_entities)s::int[]) AS entity_id,
+                       unnest(%(pair_labels)s::int[]) AS label_id
+            ), removed AS (
+                DELETE FROM ha_entity_label_rel r
+                WHERE r.entity_id = ANY(%(entity_ids)s)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM desired d
+                      WHERE d.entity_id = r.entity_id AND d.label_id = r.label_id
+                  )
+            )
+            INSERT INTO ha_entity_label_rel (entity_id, label_id)
+            SELECT entity_id, label_id FROM desired
+            ON CONFLICT DO NOTHING
+        """, {
+            'entity_ids': entity_ids,
+            'pair_entities': [pair[0] for pair in pairs],
+            'pair_labels': [pair[1] for pair in pairs],
+        })
+        # 直接寫入關聯表，清除兩端的 Many2many cache
+        env['ha.entity'].invalidate_model(['label_ids'])
+        env['ha.label'].invalidate_model()
+
+    @api.model
+    def _get_orphan_grace_syncs(self):
+        """孤立實體的寬限期（連續缺席的完整同步次數，至少 1）"""
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'odoo_ha_addon.ha_orphan_grace_syncs', str(ENTITY_ORPHAN_GRACE_SYNCS)
+        )
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return ENTITY_ORPHAN_GRACE_SYNCS
+
+    @api.model
+    def _reconcile_orphaned_entities(self, instance_id, ha_entity_ids, grace_syncs=None):
+        """
+        以集合運算找出 HA 中已不存在的實體
+
+        HA 回報的 entity_id 寫入暫存表，與 ha_entity 做 anti-join：
+        - 再次出現的實體：missing_sync_count 歸零（並取消待刪除）
+        - 缺席的實體：missing_sync_count + 1；達到寬限期後
+          - 沒有歷史記錄：直接刪除
+          - 有歷史記錄：標記 purge_pending，由 _cron_purge_orphaned_entities 分批刪除歷史後再刪除實體，
+            避免在同步交易中 cascade 大量 ha.entity.history
+
+        Args:
+            instance_id: HA 實例 ID
+            ha_entity_ids: HA get_states 回報的 entity_id 列表
+            grace_syncs: 寬限期（預設讀取 odoo_ha_addon.ha_orphan_grace_syncs）
+
+        Returns:
+            dict: {'missing': int, 'deleted': int, 'purge_pending': int}
+        """
+        grace_syncs = grace_syncs or self._get_orphan_grace_syncs()
+        cr = self.env.cr
+
+        cr.execute("DROP TABLE IF EXISTS _ha_live_entity_ids")
+        cr.execute("CREATE TEMP TABLE _ha_live_entity_ids (entity_id varchar PRIMARY KEY) ON COMMIT DROP")
+        cr.execute(
+            "INSERT INTO _ha_live_entity_ids SELECT DISTINCT unnest(%s::varchar[])",
+            (list(ha_entity_ids),),
+        )
+        cr.execute("ANALYZE _ha_live_entity_ids")
+
+        cr.execute("""
+            UPDATE ha_entity e
+               SET missing_sync_count = 0, purge_pending = false
+             WHERE e.ha_instance_id = %s
+               AND (e.missing_sync_count > 0 OR e.purge_pending)
+               AND EXISTS (SELECT 1 FROM _ha_live_entity_ids l WHERE l.entity_id = e.entity_id)
+        """, (instance_id,))
+        restored = cr.rowcount
+
+        cr.execute("""
+            UPDATE ha_entity e
+               SET missing_sync_count = e.missing_sync_count + 1
+             WHERE e.ha_instance_id = %s
+               AND NOT e.purge_pending
+               AND NOT EXISTS (SELECT 1 FROM _ha_live_entity_ids l WHERE l.entity_id = e.entity_id)
+            RETURNING e.id, e.entity_id, e.missing_sync_count,
+                      EXISTS (SELECT 1 FROM ha_entity_history h WHERE h.entity_id = e.id)
+        """, (instance_id,))
+        missing = cr.fetchall()
+        cr.execute("DROP TABLE _ha_live_entity_ids")
+
+        expired = [row for row in missing if row[2] >= grace_syncs]
+        to_delete = [row[0] for row in expired if not row[3]]
+        to_purge = [row[0] for row in expired if row[3]]
+        if to_purge:
+            cr.execute("UPDATE ha_entity SET purge_pending = true WHERE id = ANY(%s)", (to_purge,))
+        self.env['ha.entity'].invalidate_model(['missing_sync_count', 'purge_pending'])
+
+        if to_delete:
+            self.env['ha.entity'].sudo().browse(to_delete).with_context(from_ha_sync=True).unlink()
+        if to_purge:
+            self._trigger_orphan_purge()
+
+        if missing or restored:
+            _logger.info(
+                f"Orphan reconciliation (instance {instance_id}): {len(missing)} missing "
+                f"(grace {grace_syncs} syncs), {restored} back in HA, {len(to_delete)} deleted, "
+                f"{len(to_purge)} queued for background purge: "
+                f"{[row[1] for row in expired][:10]}"
+            )
+        return {'missing': len(missing), 'deleted': len(to_delete), 'purge_pending': len(to_purge)}
+
+    @api.model
+    def _trigger_orphan_purge(self):
+        """儘快在背景執行 _cron_purge_orphaned_entities"""
+        cron = self.env.ref('odoo_ha_addon.ir_cron_purge_orphaned_entities', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _cron_purge_orphaned_entities(self, batch_size=ENTITY_PURGE_BATCH_SIZE,
+                                      time_budget=ENTITY_PURGE_TIME_BUDGET, auto_commit=True):
+        """
+        Cron：分批刪除待刪除實體的歷史記錄，清空後再刪除實體本身
+
+        每個 DELETE 最多 batch_size 列並各自 commit，單次執行超過 time_budget 秒就停止，
+        並重新觸發 cron 繼續處理，避免單一交易 cascade 數百萬列。
+
+        Args:
+            batch_size: 每個 DELETE 語句最多刪除的列數
+            time_budget: 單次執行的時間上限（秒）
+            auto_commit: 每批之後 commit（測試中關閉）
+
+        Returns:
+            dict: {'deleted_rows': int, 'deleted_entities': int, 'remaining': int}
+        """
+        cr = self.env.cr
+        entities = self.sudo().search([('purge_pending', '=', True)])
+        report = {'deleted_rows': 0, 'deleted_entities': 0, 'remaining': 0}
+        if not entities:
+            return report
+
+        deadline = time.monotonic() + time_budget
+        entity_ids = entities.ids
+        finished = True
+        for table in ('ha_entity_history', 'ha_entity_history_rollup'):
+            cr.execute("SELECT to_regclass(%s)", (table,))
+            if not cr.fetchone()[0]:
+                continue
+            while True:
+                if time.monotonic() > deadline:
+                    finished = False
+                    break
+                # ctid 只在單一 partition 內唯一，需搭配 tableoid
+                cr.execute(f"""
+                    DELETE FROM {table}
+                     WHERE (tableoid, ctid) IN (
+                         SELECT tableoid, ctid FROM {table} WHERE entity_id = ANY(%s) LIMIT %s
+                     )
+                """, (entity_ids, batch_size))
+                deleted = cr.rowcount
+                report['deleted_rows'] += deleted
+                if auto_commit:
+                    cr.commit()
+                if deleted < batch_size:
+                    break
+            if not finished:
+                break
+
+        if finished:
+            # 歷史已清空，cascade 不再有大量資料；期間重新出現在 HA 的實體不刪除
+            entities = self.sudo().search([('id', 'in', entity_ids), ('purge_pending', '=', True)])
+            report['deleted_entities'] = len(entities)
+            entities.with_context(from_ha_sync=True).unlink()
+            if auto_commit:
+                cr.commit()
+        else:
+            report['remaining'] = len(entity_ids)
+            self._trigger_orphan_purge()
 
         _logger.info(
-            f"Entity relations sync completed (instance {instance_id}): "
-            f"{area_updated_count} areas updated, {label_updated_count} labels updated, "
-            f"{device_updated_count} device relations updated "
-            f"(SET: {device_set_count}, CLEARED: {device_clear_count}, NOT_IN_MAP: {device_not_in_map_count})"
+            f"Purged orphaned entities: {report['deleted_rows']} history rows, "
+            f"{report['deleted_entities']} entities deleted, {report['remaining']} remaining"
         )
+        return report
 
     def fetch_states(self):
         """
@@ -787,6 +1052,9 @@ class HAEntity(models.Model):
         Args:
             entity_states: HA 回傳的實體狀態列表
             instance_id: HA 實例 ID (Phase 3)
+
+        Returns:
+            dict: _batch_update_entities() 的統計結果
         """
         _logger.debug(f"=== Processing {len(entity_states)} entity states (instance {instance_id}) ===")
         records = []
@@ -822,96 +1090,235 @@ class HAEntity(models.Model):
         _logger.debug(f"Records ready for batch update: {len(records)}")
 
         # Phase 3: 批次處理記錄（提升性能），傳入 instance_id
-        self._batch_update_entities(records, instance_id)
+        return self._batch_update_entities(records, instance_id)
 
     def _batch_update_entities(self, records, instance_id):
         """
-        批次更新實體記錄（提升性能）
-        使用 savepoint 隔離每個實體的更新，避免序列化衝突
+        以集合運算批次更新實體記錄
+
+        1. load:   一次查詢載入此實例所有實體到 dict（entity_id -> row）
+        2. diff:   在記憶體中分類為 new / changed / unchanged / orphaned
+                   （以 state_hash 比對 state + attributes，不載入 attributes JSON）
+        3. insert: 新實體以一次 ORM create(vals_list) 批次建立
+        4. update: 變更的實體以 UPDATE ... FROM (VALUES ...) 分批更新
+
+        直接以 SQL 更新不會經過 write()，等同 from_ha_sync=True（不會同步回 HA）。
+        若某一批與 WebSocket 即時更新衝突，該批改為逐筆 savepoint 更新。
 
         Args:
             records: 實體記錄列表
             instance_id: HA 實例 ID (Phase 3)
+
+        Returns:
+            dict: created / updated / unchanged / errors 數量，
+                  orphaned ({entity_id: record id}，HA 中已不存在的實體)
+                  與 timings_ms（各階段耗時）
         """
         _logger.debug(f"=== Starting batch update for {len(records)} records (instance {instance_id}) ===")
 
+        timings = {}
+        started = time.perf_counter()
+
+        # === Phase 1: load ===
+        # 只載入指紋而非完整 attributes JSON
+        self.env.cr.execute("""
+            SELECT id, entity_id, name, last_changed, state_hash
+            FROM ha_entity
+            WHERE ha_instance_id = %s
+        """, (instance_id,))
+        existing = {row[1]: row for row in self.env.cr.fetchall()}
+        timings['load'] = (time.perf_counter() - started) * 1000
+
+        # === Phase 2: diff ===
+        phase_start = time.perf_counter()
+        incoming = {record['entity_id']: record for record in records}  # 同一 entity 以最後一筆為準
+        to_create = []
+        to_update = []
+        unchanged_count = 0
+        for entity_id, record in incoming.items():
+            row = existing.get(entity_id)
+            if row is None:
+                to_create.append(record)
+                continue
+            record_hash = compute_state_hash(record['entity_state'], record['attributes'])
+            if (row[2], row[3], row[4]) != (record['name'], record['last_changed'], record_hash):
+                to_update.append((row[0], dict(record, state_hash=record_hash)))
+            else:
+                unchanged_count += 1
+        orphaned = {
+            entity_id: row[0] for entity_id, row in existing.items() if entity_id not in incoming
+        }
+        timings['diff'] = (time.perf_counter() - phase_start) * 1000
+
+        # === Phase 3: insert ===
+        phase_start = time.perf_counter()
+        created_count, create_errors = self._bulk_create_entities(to_create, instance_id)
+        timings['insert'] = (time.perf_counter() - phase_start) * 1000
+
+        # === Phase 4: update ===
+        phase_start = time.perf_counter()
+        updated_count, update_errors = self._bulk_update_entity_states(to_update)
+        timings['update'] = (time.perf_counter() - phase_start) * 1000
+
+        # REST 同步的狀態變更同樣推送給訂閱中的 portal 頁面
+        if updated_count:
+            self.env['ha.realtime.update'].notify_portal_entity_states(
+                [record_id for record_id, _record in to_update]
+            )
+
+        timings['total'] = (time.perf_counter() - started) * 1000
+        record_write_stats(
+            self.env.cr.dbname, instance_id,
+            applied=created_count + updated_count, skipped=unchanged_count,
+        )
+        stats = {
+            'created': created_count,
+            'updated': updated_count,
+            'unchanged': unchanged_count,
+            'errors': create_errors + update_errors,
+            'orphaned': orphaned,
+            'timings_ms': {phase: round(ms, 1) for phase, ms in timings.items()},
+        }
+
+        _logger.info(
+            f"Batch update summary (instance {instance_id}): {created_count} created, "
+            f"{updated_count} updated, {unchanged_count} unchanged, {stats['errors']} errors, "
+            f"{len(orphaned)} orphaned; timings (ms): "
+            + ', '.join(f"{phase}={ms}" for phase, ms in stats['timings_ms'].items())
+        )
+        _logger.debug("=== Batch update completed ===")
+        return stats
+
+    def _bulk_create_entities(self, records, instance_id):
+        """
+        批次建立新實體（單一 create(vals_list)）
+
+        失敗時（例如 WebSocket 同步並發建立同一實體造成 UniqueViolation）
+        改為逐筆 savepoint 建立或更新。
+
+        Returns:
+            tuple: (created_count, error_count)
+        """
+        if not records:
+            return 0, 0
+
+        Entity = self.env[self._name].with_context(
+            from_ha_sync=True,
+            tracking_disable=True,
+            mail_create_nolog=True,
+            mail_create_nosubscribe=True,
+        )
+        try:
+            with self.env.cr.savepoint():
+                Entity.create(records)
+            _logger.info(f"Created {len(records)} entities (instance {instance_id})")
+            return len(records), 0
+        except Exception as e:
+            # 通常是 WebSocket 同步並發建立了同一實體（UniqueViolation）
+            _logger.info(
+                f"Bulk entity create failed (instance {instance_id}), "
+                f"falling back to per-entity create: {e}"
+            )
+
         created_count = 0
-        updated_count = 0
         error_count = 0
-
-        for i, record in enumerate(records):
-            entity_id = record.get('entity_id', 'unknown')
+        for record in records:
+            entity_id = record['entity_id']
             try:
-                # 使用 savepoint 隔離每個實體的更新
-                # 如果與 WebSocket state_changed 並發，只影響此實體
                 with self.env.cr.savepoint():
-                    _logger.debug(f"Batch update {i+1}/{len(records)}: {entity_id}")
-
-                    # Phase 3: 檢查是否已存在（加上 instance_id 過濾）
-                    existing_record = self.env[self._name].search([
+                    existing = Entity.search([
                         ('entity_id', '=', entity_id),
                         ('ha_instance_id', '=', instance_id)
                     ], limit=1)
-
-                    if existing_record:
-                        # 檢查是否需要更新
-                        needs_update = (
-                            existing_record.entity_state != record['entity_state'] or
-                            existing_record.name != record['name'] or
-                            existing_record.last_changed != record['last_changed'] or
-                            existing_record.attributes != record['attributes']
-                        )
-
-                        if needs_update:
-                            # 更新現有記錄（使用 from_ha_sync 防止循環同步）
-                            existing_record.with_context(from_ha_sync=True).write({
-                                'name': record['name'],
-                                'entity_state': record['entity_state'],
-                                'last_changed': record['last_changed'],
-                                'attributes': record['attributes']
-                            })
-                            updated_count += 1
-                            _logger.debug(f"Updated entity: {entity_id} (entity_state: {record['entity_state']})")
-                        else:
-                            _logger.debug(f"Entity {entity_id} unchanged, skipping update")
+                    if existing:
+                        existing.write({field: record[field] for field in ENTITY_STATE_FIELDS})
+                        _logger.info(f"Race condition resolved for entity: {entity_id} (updated instead of create)")
                     else:
-                        # 建立新記錄（record 中已包含 ha_instance_id）
-                        self.env[self._name].create(record)
+                        Entity.create(record)
                         created_count += 1
-                        _logger.info(f"Created entity: {entity_id} (domain: {record['domain']})")
+            except Exception as e:
+                error_count += 1
+                _logger.error(f"Error creating entity {entity_id}: {e}")
+                _logger.debug(f"Problematic record: {record}")
+        return created_count, error_count
+
+    def _bulk_update_entity_states(self, updates):
+        """
+        以 UPDATE ... FROM (VALUES ...) 批次更新實體狀態欄位
+
+        每 ENTITY_UPDATE_CHUNK 筆一個語句，各自在 savepoint 中執行；
+        某一批失敗（例如與即時更新的序列化衝突）時改為逐筆更新，只影響衝突的實體。
+
+        Args:
+            updates: [(ha.entity record id, record dict 含 state_hash), ...]
+
+        Returns:
+            tuple: (updated_count, error_count)
+        """
+        if not updates:
+            return 0, 0
+
+        query_template = """
+            UPDATE ha_entity AS e
+               SET name = v.name,
+                   entity_state = v.entity_state,
+                   last_changed = v.last_changed,
+                   attributes = v.attributes,
+                   state_hash = v.state_hash,
+                   write_uid = %s,
+                   write_date = (now() at time zone 'UTC')
+              FROM (
+                SELECT id::int AS id, name::varchar AS name,
+                       entity_state::varchar AS entity_state,
+                       last_changed::timestamp AS last_changed,
+                       attributes::jsonb AS attributes,
+                       state_hash::varchar AS state_hash
+                FROM (VALUES {values}) AS t(id, name, entity_state, last_changed, attributes, state_hash)
+              ) AS v
+             WHERE e.id = v.id
+        """
+
+        def to_row(record_id, record):
+            return (
+                record_id,
+                record['name'],
+                record['entity_state'],
+                record['last_changed'],
+                json.dumps(record['attributes']) if record['attributes'] is not None else None,
+                record['state_hash'],
+            )
 
-            except psycopg2_errors.UniqueViolation:
-                # Race condition: WebSocket sync created the same entity concurrently
-                # Savepoint already rolled back by context manager; retry as update
+        uid = self.env.uid
+        updated_count = 0
+        error_count = 0
+        for start in range(0, len(updates), ENTITY_UPDATE_CHUNK):
+            chunk = updates[start:start + ENTITY_UPDATE_CHUNK]
+            try:
+                with self.env.cr.savepoint():
+                    self.env.cr.execute(
+                        query_template.format(values=', '.join(['%s'] * len(chunk))),
+                        [uid] + [to_row(record_id, record) for record_id, record in chunk],
+                    )
+                    updated_count += self.env.cr.rowcount
+                continue
+            except Exception as e:
+                _logger.warning(f"Bulk entity update failed, retrying {len(chunk)} rows individually: {e}")
+
+            for record_id, record in chunk:
                 try:
                     with self.env.cr.savepoint():
-                        existing = self.env[self._name].search([
-                            ('entity_id', '=', entity_id),
-                            ('ha_instance_id', '=', instance_id)
-                        ], limit=1)
-                        if existing:
-                            existing.with_context(from_ha_sync=True).write({
-                                'name': record['name'],
-                                'entity_state': record['entity_state'],
-                                'last_changed': record['last_changed'],
-                                'attributes': record['attributes']
-                            })
-                            updated_count += 1
-                            _logger.info(f"Race condition resolved for entity: {entity_id} (updated instead of create)")
-                        else:
-                            _logger.warning(f"Race condition for entity {entity_id}: UniqueViolation but record not found after retry")
-                except Exception as retry_error:
+                        self.env.cr.execute(
+                            query_template.format(values='%s'),
+                            [uid, to_row(record_id, record)],
+                        )
+                        updated_count += self.env.cr.rowcount
+                except Exception as e:
                     error_count += 1
-                    _logger.error(f"Error retrying entity {entity_id} after race condition: {retry_error}")
+                    _logger.error(f"Error updating entity {record['entity_id']}: {e}")
 
-            except Exception as e:
-                # savepoint 會自動 rollback 此次迭代
-                error_count += 1
-                _logger.error(f"Error updating entity {entity_id}: {e}")
-                _logger.debug(f"Problematic record: {record}")
-
-        _logger.info(f"Batch update summary (instance {instance_id}): {created_count} created, {updated_count} updated, {error_count} errors")
-        _logger.debug("=== Batch update completed ===")
+        # 直接寫入 SQL，清除 ORM cache 以免讀到舊資料
+        self.invalidate_model(list(ENTITY_STATE_FIELDS) + ['state_hash', 'write_uid', 'write_date'])
+        return updated_count, error_count
 
     def _fallback_to_rest_api(self, instance_id):
         """
@@ -3,6 +3,8 @@ from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 import logging
 
+from .common import share_access
+
 _logger = logging.getLogger(__name__)
 
 
@@ -166,6 +168,37 @@ class HAEntityGroup(models.Model):
                           )
                     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """授權用戶的可訂閱 instance channels 可能增加，通知其前端重新訂閱"""
+        groups = super().create(vals_list)
+        if groups.user_ids:
+            # ir.rule 的 domain（user.ha_entity_group_ids）以 ormcache 依用戶快取，授權變更後需清除
+            self.env.registry.clear_cache()
+            self.env['ha.realtime.update'].sudo().notify_instance_channels_changed(groups.user_ids)
+        return groups
+
+    def write(self, vals):
+        """成員或封存狀態變更時重建此群組分享的存取索引；授權用戶或實例變更時通知前端重新訂閱"""
+        authorization_changed = any(key in vals for key in ('user_ids', 'ha_instance_id', 'active'))
+        if authorization_changed:
+            old_users = self.user_ids
+        result = super().write(vals)
+        if 'entity_ids' in vals or 'active' in vals:
+            self.env['ha.entity.share']._refresh_share_access_for(groups=self)
+        if authorization_changed and (old_users | self.user_ids):
+            self.env.registry.clear_cache()
+            self.env['ha.realtime.update'].sudo().notify_instance_channels_changed(old_users | self.user_ids)
+        return result
+
+    def unlink(self):
+        """群組分享由外鍵連鎖刪除，需更新存取索引的版本號讓快取的授權失效"""
+        shared = self.env['ha.entity.share'].sudo().search_count([('group_id', 'in', self.ids)], limit=1)
+        result = super().unlink()
+        if shared:
+            share_access.bump_version(self.env.cr)
+        return result
+
     def _compute_access_url(self):
         """Compute the portal access URL for each entity group."""
         for record in self:
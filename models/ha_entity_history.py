@@ -1,24 +1,72 @@
 import odoo
-from odoo import models, fields, api
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL
 from datetime import datetime, timedelta, timezone
+import json
 import logging
+import re
 from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from .common.utils import parse_domain_from_entitiy_id
 from .common.hass_rest_api import HassRestApi
-from .common.utils import parse_iso_datetime
+from .common.utils import parse_iso_datetime, NUMERIC_STATE_PATTERN
 from .common.instance_helper import HAInstanceHelper
+from .common import downsampling, history_partitions, history_rollups
+from .common.ws_config import (
+    HISTORY_ATTRIBUTE_ALLOWLIST,
+    HISTORY_ATTRIBUTE_DEFAULT_KEYS,
+    HISTORY_COMPACT_BATCH_SIZE,
+    HISTORY_DEFAULT_WINDOW_HOURS,
+    HISTORY_NUMERIC_DOMAINS,
+    HISTORY_PARTITION_INTERVAL,
+    HISTORY_PARTITION_PREMAKE,
+    HISTORY_ROLLUP_RESOLUTIONS,
+    HISTORY_BACKFILL_CHUNK_HOURS,
+    HISTORY_SYNC_OVERLAP_SECONDS,
+    HISTORY_SYNC_CHUNK_SIZE,
+    WS_HISTORY_BATCH_TIMEOUT,
+    WS_HISTORY_STREAM_TIMEOUT,
+)
 
 _logger = logging.getLogger(__name__)
 
+# 數值狀態判斷（與 rollup / 降採樣 SQL 的 entity_state ~ NUMERIC_STATE_PATTERN 相同；
+# 平均值只計入數值狀態，欄位式輸出中非數值的原始記錄 v 為 None）
+_NUMBER_RE = re.compile(NUMERIC_STATE_PATTERN)
+
+
+def _is_number(value):
+    return bool(value) and _NUMBER_RE.match(value) is not None
+
+
+def _num_state(value):
+    """
+    entity_state 對應的 num_state（ORM compute 與 _bulk_insert_history 共用，結果一致）
+
+    非數值狀態（含 nan / inf 等 float() 可解析但不符合數值格式者）為 -1；
+    數值依 float() 轉換：超出範圍為 ±inf、過小為 0，subnormal 保持原值。
+    """
+    return float(value) if _is_number(value) else -1
+
+
+# 每個 INSERT 語句最多帶入的列數
+HISTORY_INSERT_CHUNK = 1000
+
 
 class HAEntityHistory(models.Model):
     _name = 'ha.entity.history'
     _inherit = ['ha.current.instance.filter.mixin']
     _description = 'Home Assistant Entity History'
 
+    # Table 為依 last_changed RANGE partition 的 partitioned table，由 init() 建立與維護
+    # （見 common/history_partitions.py）；unique(entity_id, last_updated, last_changed)
+    # 與 primary key (id, last_changed) 都必須包含 partition key，
+    # (entity_id, last_updated) 的去重由各 partition 上的 unique 索引與 NOT EXISTS 負責
+    _auto = False
+
     domain = fields.Char(string='Domain', required=True)
     entity_state = fields.Char(string='Entity State')
-    last_changed = fields.Datetime(string='Last Changed', copy=False, index=True)
+    last_changed = fields.Datetime(string='Last Changed', copy=False, index=True, required=True)
     last_updated = fields.Datetime(string='Last Updated', copy=False)
     attributes = fields.Json(string='Attributes')
 
@@ -39,76 +87,229 @@ class HAEntityHistory(models.Model):
     entity_id_string = fields.Char(string='Entity ID', related='entity_id.entity_id', readonly=True)
     entity_name = fields.Char(string='Entity Name', related='entity_id.name', readonly=True)
 
+    def init(self):
+        history_partitions.ensure_partitioned_table(
+            self.env.cr, HISTORY_PARTITION_INTERVAL, HISTORY_PARTITION_PREMAKE
+        )
+        history_rollups.ensure_rollup_table(
+            self.env.cr, HISTORY_ROLLUP_RESOLUTIONS, HISTORY_NUMERIC_DOMAINS
+        )
+
     @api.depends('entity_state')
     def _compute_num_state(self):
         for record in self:
-            try:
-                # 將 entity_state 轉換為浮點數，如果 entity_state 是可轉換的
-                record.num_state = float(record.entity_state)
-            except (ValueError, TypeError):
-                # 如果 entity_state 不是數字，則設置為 0 或其他默認值
-                record.num_state = -1
+            # 將 entity_state 轉換為浮點數，非數值狀態設置為 -1
+            record.num_state = _num_state(record.entity_state)
 
     @api.model
-    def get_downsampled_history(self, search_domain, supported_domains, max_points=500):
+    def get_downsampled_history(self, search_domain, supported_domains, max_points=500, algorithm='avg',
+                                columnar=False):
         """
         伺服器端降採樣歷史資料，大幅減少傳輸到前端的資料量。
 
-        使用 temp table 避免在每個 SQL 查詢中傳遞數萬個 record ID。
+        search domain（含 record rules）由 ORM 轉成 WHERE 條件後直接嵌入聚合查詢
+        （見 _history_source_sql），不會先把符合的 record ID 取回 Python；
+        last_changed / entity_id 條件因此可以使用索引與 partition pruning。
 
-        - Numeric entities：per-entity 時間桶平均值（每個 entity 最多 max_points 點）
+        - Numeric entities：依 algorithm 降採樣（每個 entity 最多 max_points 點）
+          - 'avg'：per-entity 時間桶平均值；查詢區間夠長時改讀 ha_entity_history_rollup 的預先聚合桶
+          - 'lttb' / 'minmax'：保留形狀的演算法（見 common/downsampling.py），輸出原始記錄中的點，
+            短暫的尖峰不會被平均掉
         - Non-numeric entities：只保留狀態變化點（每個 entity 最多 max_points 點）
 
         Args:
             search_domain: Odoo search domain（來自 Search View 的篩選條件）
             supported_domains: 支援的 domain 列表（如 ['sensor', 'switch', ...]）
             max_points: 每個 entity 的最大資料點數（預設 500）
+            algorithm: numeric entities 的降採樣演算法（'avg'、'lttb'、'minmax'）
+            columnar: 以欄位式格式回傳（見 _history_columnar），hahistory view 使用
 
         Returns:
-            list[dict]: 降採樣後的歷史記錄
+            list[dict]: 降採樣後的歷史記錄；columnar=True 時為 {'format': 'columnar', 'series': [...]}
         """
-        NUMERIC_DOMAINS = {'sensor', 'input_number', 'number', 'counter'}
+        if algorithm not in downsampling.ALGORITHMS:
+            raise UserError(_('Unknown downsampling algorithm: %s') % algorithm)
 
-        # 1. ORM search（尊重 access rules + instance filter mixin）
+        # 1. search domain + record rules（+ instance filter mixin）→ SQL sub-select
         domain_filter = [('domain', 'in', supported_domains)]
         full_domain = search_domain + domain_filter
-        record_ids = self.search(full_domain).ids
+        source = self._history_source_sql(full_domain)
 
-        if not record_ids:
-            return []
+        if not source:
+            return self._history_columnar([]) if columnar else []
 
-        # 2. 建立 temp table 存放符合條件的 record IDs（避免每次傳遞 34K+ IDs）
-        cr = self.env.cr
-        cr.execute("CREATE TEMP TABLE IF NOT EXISTS _ds_ids (id INTEGER PRIMARY KEY)")
-        cr.execute("TRUNCATE _ds_ids")
-        # 批次插入使用 unnest，比逐筆插入快
-        cr.execute("INSERT INTO _ds_ids SELECT unnest(%s::int[])", [record_ids])
+        bounds = self._get_time_bounds(search_domain)
 
-        # 3. 查詢 entity 分佈
+        # 2. 查詢 entity 分佈（semi-join：每個 entity 只需找到一筆符合的記錄）
+        cr = self.env.cr
         cr.execute("""
-            SELECT DISTINCT h.entity_id, h.domain
-            FROM ha_entity_history h
-            INNER JOIN _ds_ids t ON t.id = h.id
-        """)
+            SELECT e.id, e.domain
+            FROM ha_entity e
+            WHERE EXISTS (SELECT 1 FROM {source} h WHERE h.entity_id = e.id)
+        """.format(source=source), {})  # 傳入參數讓 source 中的 %% 還原
         entity_domains = {row[0]: row[1] for row in cr.fetchall()}
 
-        numeric_entity_ids = [eid for eid, d in entity_domains.items() if d in NUMERIC_DOMAINS]
-        non_numeric_entity_ids = [eid for eid, d in entity_domains.items() if d not in NUMERIC_DOMAINS]
+        numeric_entity_ids = [eid for eid, d in entity_domains.items() if d in HISTORY_NUMERIC_DOMAINS]
+        non_numeric_entity_ids = [eid for eid, d in entity_domains.items() if d not in HISTORY_NUMERIC_DOMAINS]
+
+        rows = []
+
+        # 3. Numeric entities：per-entity 時間桶聚合（區間夠長的 entity 使用 rollup）
+        raw_rows = []
+        if numeric_entity_ids and algorithm != 'avg':
+            raw_rows = self._downsample_numeric_shape(numeric_entity_ids, max_points, source, algorithm)
+            rows.extend(raw_rows)
+        elif numeric_entity_ids:
+            plan = {}
+            if self._rollup_eligible(search_domain):
+                plan = self._plan_rollup_resolutions(numeric_entity_ids, max_points, bounds)
+            if plan:
+                rows.extend(self._downsample_numeric_rollup(plan, max_points))
+            raw_entity_ids = [eid for eid in numeric_entity_ids if eid not in plan]
+            if raw_entity_ids:
+                rows.extend(self._downsample_numeric(raw_entity_ids, max_points, source))
+
+        # 4. Non-numeric entities：狀態變化點
+        if non_numeric_entity_ids:
+            rows.extend(self._downsample_non_numeric(non_numeric_entity_ids, max_points, source))
+
+        raw_series = {row[1] for row in raw_rows}
+        if columnar:
+            return self._history_columnar(rows, raw_series=raw_series)
+        # 逐筆格式沒有中斷點的表示方式，略過 LTTB / min-max 的非數值中斷點
+        return [{
+            'entity_name': name or '',
+            'entity_id_string': entity_id_string or '',
+            'domain': domain or '',
+            'last_changed': fields.Datetime.to_string(last_changed) if last_changed else False,
+            'num_state': num_state if num_state is not None else 0,
+            'entity_state': state or '',
+        } for name, entity_id_string, domain, last_changed, num_state, state in rows
+            if num_state is not None or entity_id_string not in raw_series]
+
+    @staticmethod
+    def _history_columnar(rows, raw_series=()):
+        """
+        將降採樣結果轉成欄位式格式：每個 entity 的 metadata 只出現一次，資料為平行陣列
 
-        results = []
+        - t: epoch 毫秒
+        - numeric domain：v 為數值（沒有數值時為 None）
+          - 聚合桶（avg / rollup）：num_state 是桶的平均值，不為 None 就使用，
+            不受桶內最後一筆狀態（例如 unavailable）影響
+          - 原始記錄（raw_series 中的 entity，LTTB / min-max）：num_state 是單筆記錄的值，
+            非數值狀態的中斷點為 None（依狀態判斷，與舊資料的 -1 無關）
+        - 其他 domain：s 為 states 狀態字典的索引
 
-        # 4. Numeric entities：per-entity 時間桶聚合
-        if numeric_entity_ids:
-            results.extend(self._downsample_numeric(numeric_entity_ids, max_points))
+        Args:
+            rows: get_downsampled_history 的 row tuple
+            raw_series: 輸出原始記錄的 entity_id_string 集合
 
-        # 5. Non-numeric entities：狀態變化點
-        if non_numeric_entity_ids:
-            results.extend(self._downsample_non_numeric(non_numeric_entity_ids, max_points))
+        Returns:
+            dict: {'format': 'columnar', 'series': [{'entity_name', 'entity_id_string', 'domain',
+                   't', 'v'} 或 {..., 't', 's', 'states'}]}
+        """
+        series = []
+        current = None
+        state_index = {}
+        for name, entity_id_string, domain, last_changed, num_state, state in rows:
+            if current is None or current['entity_id_string'] != (entity_id_string or ''):
+                current = {
+                    'entity_name': name or '',
+                    'entity_id_string': entity_id_string or '',
+                    'domain': domain or '',
+                    't': [],
+                }
+                if domain in HISTORY_NUMERIC_DOMAINS:
+                    current['v'] = []
+                else:
+                    current['s'] = []
+                    current['states'] = []
+                    state_index = {}
+                series.append(current)
+
+            if last_changed.tzinfo is None:
+                last_changed = last_changed.replace(tzinfo=timezone.utc)
+            current['t'].append(int(last_changed.timestamp() * 1000))
+            if 'v' in current:
+                if entity_id_string in raw_series and not _is_number(state):
+                    num_state = None
+                current['v'].append(num_state)
+            else:
+                state = state or ''
+                if state not in state_index:
+                    state_index[state] = len(current['states'])
+                    current['states'].append(state)
+                current['s'].append(state_index[state])
+        return {'format': 'columnar', 'series': series}
+
+    @api.model
+    def _history_source_sql(self, domain):
+        """
+        將 search domain 轉成可嵌入查詢的 sub-select（FROM {source} h）
+
+        使用 _search()，因此 record rules 與 search 方法（is_current_user_instance、
+        related 欄位）都成為 SQL 條件；PostgreSQL 會把 sub-select 展開，
+        條件直接作用在 ha_entity_history 的索引與 partition 上。
+        參數在此先以 mogrify 轉成字面值，呼叫端仍可使用 %(name)s 參數。
+
+        Returns:
+            str: '(SELECT ... )'；domain 必定沒有結果時為 None
+        """
+        query = self._search(domain)
+        if query.is_empty():
+            return None
+        sql = query.select(SQL('%s.*', SQL.identifier(self._table)))
+        source = self.env.cr.mogrify(sql.code, sql.params).decode()
+        return '(' + source.replace('%', '%%') + ')'
 
-        return results
+    @api.model
+    def _get_time_bounds(self, search_domain):
+        """
+        從 search domain 取出 last_changed 的上下界（只處理純 AND 的 domain）
 
-    def _downsample_numeric(self, entity_ids, max_points):
-        """Numeric entities 的 per-entity 時間桶聚合降採樣（使用 _ds_ids temp table）"""
+        Returns:
+            tuple: (start, end)，沒有對應條件時為 None
+        """
+        start = end = None
+        if any(leaf in ('|', '!') for leaf in search_domain):
+            return start, end
+        for leaf in search_domain:
+            if not isinstance(leaf, (list, tuple)) or len(leaf) != 3 or leaf[0] != 'last_changed':
+                continue
+            try:
+                value = fields.Datetime.to_datetime(leaf[2])
+            except (TypeError, ValueError):
+                continue
+            if not value:
+                continue
+            if leaf[1] in ('>', '>='):
+                start = max(start, value) if start else value
+            elif leaf[1] in ('<', '<='):
+                end = min(end, value) if end else value
+        return start, end
+
+    @staticmethod
+    def _time_bounds_sql(bounds):
+        """將 (start, end) 轉為 SQL 條件片段（含開頭的 AND）與參數"""
+        start, end = bounds
+        clauses = []
+        params = {}
+        if start:
+            clauses.append('AND h.last_changed >= %(t_start)s')
+            params['t_start'] = start
+        if end:
+            clauses.append('AND h.last_changed <= %(t_end)s')
+            params['t_end'] = end
+        return ' '.join(clauses), params
+
+    def _downsample_numeric(self, entity_ids, max_points, source):
+        """
+        Numeric entities 的 per-entity 時間桶聚合降採樣（source 見 _history_source_sql）
+
+        各 _downsample_* 方法都回傳
+        (entity_name, entity_id_string, domain, last_changed, num_state, entity_state) tuple，
+        依 entity、時間排序，由 get_downsampled_history 統一格式化。
+        """
         cr = self.env.cr
 
         # Per-entity 時間桶：每個 entity 獨立計算桶大小，確保每個 entity 最多 max_points 點
@@ -122,8 +323,7 @@ class HAEntityHistory(models.Model):
                         EXTRACT(EPOCH FROM MAX(h.last_changed) - MIN(h.last_changed)) / %(max_pts)s,
                         1
                     ) AS bucket_sec
-                FROM ha_entity_history h
-                INNER JOIN _ds_ids t ON t.id = h.id
+                FROM {source} h
                 WHERE h.entity_id = ANY(%(eids)s)
                 GROUP BY h.entity_id
             )
@@ -134,32 +334,187 @@ class HAEntityHistory(models.Model):
                 to_timestamp(
                     floor(extract(epoch FROM h.last_changed) / er.bucket_sec) * er.bucket_sec
                 ) AS bucket_time,
-                AVG(h.num_state) AS avg_num_state,
+                round((AVG(h.num_state) FILTER (WHERE h.entity_state ~ %(number_re)s))::numeric, 2)::float8
+                    AS avg_num_state,
                 (array_agg(h.entity_state ORDER BY h.last_changed DESC))[1] AS entity_state
-            FROM ha_entity_history h
-            INNER JOIN _ds_ids t ON t.id = h.id
+            FROM {source} h
             INNER JOIN ha_entity e ON e.id = h.entity_id
             INNER JOIN entity_ranges er ON er.entity_id = h.entity_id
             WHERE h.entity_id = ANY(%(eids)s)
             GROUP BY h.entity_id, e.name, e.entity_id, h.domain, er.bucket_sec,
                      floor(extract(epoch FROM h.last_changed) / er.bucket_sec)
             ORDER BY e.entity_id, bucket_time
-        """, {'eids': entity_ids, 'max_pts': max_points})
-
-        results = []
-        for row in cr.fetchall():
-            results.append({
-                'entity_name': row[0] or '',
-                'entity_id_string': row[1] or '',
-                'domain': row[2] or '',
-                'last_changed': fields.Datetime.to_string(row[3]) if row[3] else False,
-                'num_state': round(row[4], 2) if row[4] is not None else 0,
-                'entity_state': row[5] or '',
-            })
-        return results
+        """.format(source=source), {'eids': entity_ids, 'max_pts': max_points, 'number_re': _NUMBER_RE.pattern})
+
+        return cr.fetchall()
+
+    def _downsample_numeric_shape(self, entity_ids, max_points, source, algorithm='lttb'):
+        """
+        Numeric entities 的 LTTB / min-max 降採樣（source 見 _history_source_sql）
+
+        每個 entity 的序列以 array_agg 一次取回（避免逐列建立 Python tuple），
+        由 downsampling 模組以 NumPy 選出要保留的點。
+
+        只有數值狀態參與選點：unavailable 等狀態的 num_state 為 -1，若當成數值會被 min-max
+        選為桶的最小值（蓋掉真正的低點），也會讓 LTTB 把每次中斷當成最大的三角形。
+        每段連續的非數值狀態另外保留第一筆作為中斷點（num_state 為 None，最多 max_points 筆）。
+        """
+        import numpy as np
+
+        cr = self.env.cr
+        cr.execute("""
+            SELECT
+                e.name,
+                e.entity_id,
+                MIN(h.domain),
+                array_agg(EXTRACT(EPOCH FROM h.last_changed)::float8 ORDER BY h.last_changed),
+                array_agg(h.num_state ORDER BY h.last_changed),
+                array_agg(h.entity_state ORDER BY h.last_changed),
+                array_agg(h.last_changed ORDER BY h.last_changed),
+                array_agg(COALESCE(h.entity_state ~ %(number_re)s, false) ORDER BY h.last_changed)
+            FROM {source} h
+            INNER JOIN ha_entity e ON e.id = h.entity_id
+            WHERE h.entity_id = ANY(%(eids)s) AND h.num_state IS NOT NULL
+            GROUP BY h.entity_id, e.name, e.entity_id
+            ORDER BY e.entity_id
+        """.format(source=source), {'eids': entity_ids, 'number_re': _NUMBER_RE.pattern})
+
+        rows = []
+        for name, entity_id_string, domain, epochs, values, states, timestamps, numeric in cr.fetchall():
+            numeric = np.asarray(numeric, dtype=bool)
+            index = np.flatnonzero(numeric)
+            keep = index[downsampling.select(
+                algorithm,
+                np.asarray(epochs, dtype=np.float64)[index],
+                np.asarray(values, dtype=np.float64)[index],
+                max_points,
+            )] if len(index) else index
+            gaps = np.flatnonzero(~numeric & np.concatenate(([True], numeric[:-1])))
+            if len(gaps) > max_points:
+                gaps = gaps[np.unique(np.linspace(0, len(gaps) - 1, max_points).astype(np.int64))]
+            rows.extend(
+                (name, entity_id_string, domain, timestamps[i],
+                 round(float(values[i]), 2) if numeric[i] else None, states[i])
+                for i in np.union1d(keep, gaps)
+            )
+        return rows
+
+    # rollup 只包含 entity 層級的資訊，search domain 只有這些欄位時結果才與 raw table 相同
+    _ROLLUP_DOMAIN_FIELDS = frozenset({
+        'entity_id', 'entity_id_string', 'entity_name', 'domain', 'ha_instance_id',
+        'is_current_user_instance', 'last_changed',
+    })
 
-    def _downsample_non_numeric(self, entity_ids, max_points):
-        """Non-numeric entities：只保留狀態變化點（使用 _ds_ids temp table）"""
+    @api.model
+    def _rollup_eligible(self, search_domain):
+        """search domain 是否可以改用 rollup（只篩選 entity 與 last_changed）"""
+        for leaf in search_domain:
+            if isinstance(leaf, str):
+                if leaf in ('|', '!'):
+                    return False
+                continue
+            if not isinstance(leaf, (list, tuple)) or len(leaf) != 3:
+                return False
+            if leaf[0].split('.', 1)[0] not in self._ROLLUP_DOMAIN_FIELDS:
+                return False
+        return True
+
+    def _plan_rollup_resolutions(self, entity_ids, max_points, bounds=(None, None)):
+        """
+        為每個 numeric entity 挑選 rollup 解析度
+
+        時間範圍取自 raw table 的 MIN / MAX(last_changed)（(entity_id, last_changed) 索引查詢），
+        與 _downsample_numeric 的 bucket_sec 計算方式相同；選擇 bucket_sec 仍 >= 解析度的最粗解析度，
+        範圍太短（需要比最細 rollup 更細的桶）的 entity 不列入，由 raw table 處理。
+
+        Returns:
+            dict: {entity record id: (resolution, bucket_sec, min_t, max_t)}
+        """
+        cr = self.env.cr
+        time_filter, time_params = self._time_bounds_sql(bounds)
+        cr.execute("""
+            SELECT e.id, r.min_t, r.max_t,
+                   EXTRACT(EPOCH FROM r.max_t - r.min_t) / %(max_pts)s AS bucket_sec
+            FROM unnest(%(eids)s::int[]) AS e(id)
+            CROSS JOIN LATERAL (
+                SELECT MIN(h.last_changed) AS min_t, MAX(h.last_changed) AS max_t
+                FROM ha_entity_history h
+                WHERE h.entity_id = e.id {time_filter}
+            ) r
+            WHERE r.min_t IS NOT NULL
+        """.format(time_filter=time_filter), {'eids': entity_ids, 'max_pts': max_points, **time_params})
+
+        resolutions = sorted(HISTORY_ROLLUP_RESOLUTIONS, reverse=True)
+        plan = {}
+        for entity_id, min_t, max_t, bucket_sec in cr.fetchall():
+            bucket_sec = float(bucket_sec or 0)
+            resolution = next((res for res in resolutions if bucket_sec >= res), None)
+            if resolution:
+                plan[entity_id] = (resolution, bucket_sec, min_t, max_t)
+        return plan
+
+    def _downsample_numeric_rollup(self, plan, max_points):
+        """
+        以 rollup 桶重新分桶的 numeric 降採樣，輸出格式與 _downsample_numeric 相同
+
+        平均值為 SUM(sum_value) / SUM(sample_count)；跨越範圍邊界的 rollup 桶整個計入。
+        """
+        cr = self.env.cr
+        entity_ids = list(plan)
+        cr.execute("""
+            WITH plan AS (
+                SELECT * FROM unnest(
+                    %(eids)s::int[], %(res)s::int[], %(secs)s::float8[],
+                    %(starts)s::timestamp[], %(ends)s::timestamp[]
+                ) AS p(entity_id, resolution, bucket_sec, min_t, max_t)
+            )
+            SELECT
+                e.name AS entity_name,
+                e.entity_id AS entity_id_string,
+                e.domain,
+                to_timestamp(
+                    floor(extract(epoch FROM r.bucket) / p.bucket_sec) * p.bucket_sec
+                ) AS bucket_time,
+                round((SUM(r.sum_value) / NULLIF(SUM(r.sample_count), 0))::numeric, 2)::float8 AS avg_num_state,
+                (array_agg(r.last_state ORDER BY r.last_changed DESC))[1] AS entity_state
+            FROM ha_entity_history_rollup r
+            INNER JOIN plan p ON p.entity_id = r.entity_id AND p.resolution = r.resolution
+            INNER JOIN ha_entity e ON e.id = r.entity_id
+            WHERE r.bucket + r.resolution * interval '1 second' > p.min_t
+              AND r.bucket <= p.max_t
+            GROUP BY r.entity_id, e.name, e.entity_id, e.domain, p.bucket_sec,
+                     floor(extract(epoch FROM r.bucket) / p.bucket_sec)
+            ORDER BY e.entity_id, bucket_time
+        """, {
+            'eids': entity_ids,
+            'res': [plan[eid][0] for eid in entity_ids],
+            'secs': [plan[eid][1] for eid in entity_ids],
+            'starts': [plan[eid][2] for eid in entity_ids],
+            'ends': [plan[eid][3] for eid in entity_ids],
+        })
+
+        return cr.fetchall()
+
+    @api.model
+    def rebuild_history_rollups(self, entity_ids=None):
+        """
+        從 raw table 重建 ha_entity_history_rollup
+
+        rollup 只由 _bulk_insert_history 增量維護；以 ORM create 或手動 SQL 寫入的歷史記錄
+        需要執行此方法才會反映在長區間圖表中。
+
+        Args:
+            entity_ids: 只重建這些 ha.entity record id（None 表示全部）
+
+        Returns:
+            int: 寫入的 rollup 列數
+        """
+        return history_rollups.rebuild(
+            self.env.cr, HISTORY_ROLLUP_RESOLUTIONS, HISTORY_NUMERIC_DOMAINS, entity_ids=entity_ids
+        )
+
+    def _downsample_non_numeric(self, entity_ids, max_points, source):
+        """Non-numeric entities：只保留狀態變化點（source 見 _history_source_sql）"""
         cr = self.env.cr
 
         # LAG() 偵測狀態變化 + ROW_NUMBER() 限制每個 entity 最多 max_points
@@ -183,8 +538,7 @@ class HAEntityHistory(models.Model):
                         LAG(h.entity_state) OVER (
                             PARTITION BY h.entity_id ORDER BY h.last_changed
                         ) AS prev_state
-                    FROM ha_entity_history h
-                    INNER JOIN _ds_ids t ON t.id = h.id
+                    FROM {source} h
                     INNER JOIN ha_entity e ON e.id = h.entity_id
                     WHERE h.entity_id = ANY(%(eids)s)
                 ) sub
@@ -192,19 +546,9 @@ class HAEntityHistory(models.Model):
             ) changes
             WHERE change_rn <= %(max_pts)s
             ORDER BY entity_id_string, last_changed
-        """, {'eids': entity_ids, 'max_pts': max_points})
-
-        results = []
-        for row in cr.fetchall():
-            results.append({
-                'entity_name': row[0] or '',
-                'entity_id_string': row[1] or '',
-                'domain': row[2] or '',
-                'last_changed': fields.Datetime.to_string(row[3]) if row[3] else False,
-                'num_state': row[4] if row[4] is not None else 0,
-                'entity_state': row[5] or '',
-            })
-        return results
+        """.format(source=source), {'eids': entity_ids, 'max_pts': max_points})
+
+        return cr.fetchall()
 
     def create_history_records(self, history_data):
         """
@@ -254,15 +598,24 @@ class HAEntityHistory(models.Model):
         """
         return HAInstanceHelper.get_current_instance(self.env, logger=_logger)
 
-    def sync_entity_history_from_ha(self, instance_id=None):
+    def sync_entity_history_from_ha(self, instance_id=None, entity_ids=None):
         """
         從 Home Assistant 同步實體歷史資料
         優先使用 WebSocket API，失敗時退回 REST API
 
+        增量同步：每個實體只請求 history_synced_until（watermark）之後的資料，
+        單次最多 HISTORY_BACKFILL_CHUNK_HOURS，寫入成功後在同一交易中推進 watermark。
+
         Args:
             instance_id: HA 實例 ID（可選，預設使用當前實例）
+            entity_ids: 只同步這些 ha.entity record ID（backfill 使用，可選）
+
+        Returns:
+            dict: {'entities', 'created', 'skipped', 'errors',
+                   'synced_until': {entity record id: 本次推進後的 watermark（失敗為 None）}}
         """
         _logger.info("=== Starting sync_entity_history_from_ha ===")
+        summary = {'entities': 0, 'created': 0, 'skipped': 0, 'errors': 0, 'synced_until': {}}
 
         # 取得當前實例
         if not instance_id:
@@ -270,20 +623,24 @@ class HAEntityHistory(models.Model):
 
         if not instance_id:
             _logger.error("No HA instance available")
-            return
+            return summary
 
         instance = self.env['ha.instance'].browse(instance_id)
         _logger.info(f"Syncing history for instance: {instance.name} (ID: {instance_id})")
 
         # 查詢該實例啟用歷史記錄的實體
-        entities = self.env['ha.entity'].search([
+        domain = [
             ('enable_record', '=', True),
             ('ha_instance_id', '=', instance_id)
-        ])
+        ]
+        if entity_ids is not None:
+            domain.append(('id', 'in', list(entity_ids)))
+        entities = self.env['ha.entity'].search(domain)
 
         if not entities:
             _logger.info(f"No entities with history recording enabled for instance {instance.name}")
-            return
+            return summary
+        summary['entities'] = len(entities)
 
         _logger.info(f"Found {len(entities)} entities with history recording enabled for instance {instance.name}")
 
@@ -296,13 +653,21 @@ class HAEntityHistory(models.Model):
         total_errors = 0
 
         # 使用 ThreadPoolExecutor 並行處理（從系統參數讀取 workers 數量，預設 5）
-        config_max_workers = int(
-            self.env['ir.config_parameter'].sudo().get_param(
-                'odoo_ha_addon.ha_history_sync_max_workers', '5'
-            )
+        ICP = self.env['ir.config_parameter'].sudo()
+        config_max_workers = int(ICP.get_param('odoo_ha_addon.ha_history_sync_max_workers', '5'))
+        chunk_size = max(1, int(ICP.get_param(
+            'odoo_ha_addon.ha_history_sync_chunk_size', str(HISTORY_SYNC_CHUNK_SIZE)
+        )))
+
+        # 依 watermark 排序後分組：同組實體的時間區間相近，一次 history/stream 訂閱取回整組
+        ordered = entities.sorted(lambda e: (e.history_synced_until or datetime.min, e.id))
+        chunks = [ordered[i:i + chunk_size] for i in range(0, len(ordered), chunk_size)]
+
+        max_workers = min(len(chunks), config_max_workers)
+        _logger.info(
+            f"Processing {len(entities)} entities in {len(chunks)} chunks of up to {chunk_size} "
+            f"with {max_workers} parallel workers (config: {config_max_workers})"
         )
-        max_workers = min(len(entities), config_max_workers)
-        _logger.info(f"Processing {len(entities)} entities with {max_workers} parallel workers (config: {config_max_workers})")
 
         # 預先取得線程安全需要的參數
         db_name = self.env.cr.dbname
@@ -310,50 +675,53 @@ class HAEntityHistory(models.Model):
         context = dict(self.env.context)
 
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任務
+            # 提交所有任務（每個 chunk 一個任務）
             futures = {
                 executor.submit(
                     self._fetch_entity_history_threaded,
-                    entity.entity_id,
-                    entity.id,
+                    chunk.ids,
                     entity_map,
                     instance_id,
                     db_name,
                     uid,
                     context
-                ): entity.entity_id
-                for entity in entities
+                ): chunk
+                for chunk in chunks
             }
 
             try:
                 # 等待結果，整體 timeout 90 秒（在 WorkerCron 120 秒限制內）
-                for future in as_completed(futures, timeout=90):
-                    entity_id_str, created, skipped, error = future.result()
+                for future in as_completed(futures, timeout=WS_HISTORY_BATCH_TIMEOUT):
+                    chunk = futures[future]
+                    created, skipped, error, synced_until = future.result()
+                    for entity_record_id in chunk.ids:
+                        summary['synced_until'][entity_record_id] = synced_until
+                    label = f"{len(chunk)} entities ({chunk[0].entity_id}...)"
                     if error:
-                        total_errors += 1
-                        _logger.error(f"Failed to fetch history for {entity_id_str}: {error}")
+                        total_errors += len(chunk)
+                        _logger.error(f"Failed to fetch history for {label}: {error}")
                     else:
                         total_created += created
                         total_skipped += skipped
-                        _logger.info(f"Completed {entity_id_str}: {created} created, {skipped} skipped")
+                        _logger.info(f"Completed {label}: {created} created, {skipped} skipped")
 
             except FuturesTimeoutError:
-                _logger.error("Overall timeout (90s) reached, handling remaining tasks")
+                _logger.error(f"Overall timeout ({WS_HISTORY_BATCH_TIMEOUT}s) reached, handling remaining tasks")
                 # 處理尚未完成的任務
                 cancelled_count = 0
                 running_count = 0
-                for future, entity_id_str in futures.items():
+                for future, chunk in futures.items():
                     if not future.done():
                         # future.cancel() 只能取消尚未開始的任務
                         # 已開始執行的 thread 會繼續運行直到完成（但結果不會被處理）
                         was_cancelled = future.cancel()
-                        total_errors += 1
+                        total_errors += len(chunk)
                         if was_cancelled:
                             cancelled_count += 1
-                            _logger.warning(f"Cancelled pending task for {entity_id_str}")
+                            _logger.warning(f"Cancelled pending task for {len(chunk)} entities")
                         else:
                             running_count += 1
-                            _logger.warning(f"Task for {entity_id_str} still running (will complete in background)")
+                            _logger.warning(f"Task for {len(chunk)} entities still running (will complete in background)")
 
                 if running_count > 0:
                     _logger.warning(
@@ -365,6 +733,105 @@ class HAEntityHistory(models.Model):
         _logger.info(f"Summary: {total_created} created, {total_skipped} skipped, {total_errors} errors")
         _logger.info(f"Instance: {instance.name} (ID: {instance_id})")
 
+        summary.update(created=total_created, skipped=total_skipped, errors=total_errors)
+        return summary
+
+    def backfill_entity_history(self, instance_id=None, since=None, time_budget=WS_HISTORY_BATCH_TIMEOUT):
+        """
+        Backfill 模式：以 HISTORY_BACKFILL_CHUNK_HOURS 為單位補齊停機期間的歷史缺口
+
+        重複執行增量同步，直到所有實體的 watermark 追上開始時間或超過 time_budget。
+        未完成的部分會由下一次 cron 繼續（每次一個 chunk）。
+
+        Args:
+            instance_id: HA 實例 ID（可選，預設使用當前實例）
+            since: 可選，將 watermark 重設為此時間以重新抓取之後的資料（UTC naive datetime）
+            time_budget: 最長執行時間（秒）
+
+        Returns:
+            dict: 累計的 {'passes', 'created', 'skipped', 'errors', 'remaining'}
+        """
+        import time
+
+        if not instance_id:
+            instance_id = self._get_current_instance()
+        if not instance_id:
+            _logger.error("No HA instance available")
+            return {'passes': 0, 'created': 0, 'skipped': 0, 'errors': 0, 'remaining': 0}
+
+        entities = self.env['ha.entity'].search([
+            ('enable_record', '=', True),
+            ('ha_instance_id', '=', instance_id),
+        ])
+        if since:
+            entities.write({'history_synced_until': since})
+            # WARNING: Explicit cr.commit() is necessary here: the sync threads use their own
+            # cursors and must see the reset watermark (and not block on our row locks).
+            self.env.cr.commit()
+
+        started_at = fields.Datetime.now()
+        deadline = time.monotonic() + time_budget
+        totals = {'passes': 0, 'created': 0, 'skipped': 0, 'errors': 0}
+
+        # 各 thread 在自己的 cursor 中推進 watermark，這裡依回傳的 synced_until
+        # 追蹤仍落後的實體（目前交易的 snapshot 看不到 threads 的 commit）；
+        # 逾時（不在 synced_until 中）或失敗（None）的 chunk 仍視為落後，下一輪重試
+        lagging_ids = set(entities.ids)
+        while lagging_ids and time.monotonic() < deadline:
+            result = self.sync_entity_history_from_ha(instance_id=instance_id, entity_ids=lagging_ids)
+            if not result['entities']:
+                break
+            totals['passes'] += 1
+            for key in ('created', 'skipped', 'errors'):
+                totals[key] += result[key]
+            if result['errors'] >= result['entities']:
+                # 全部失敗（例如 HA 無法連線），不要在 budget 內空轉
+                break
+            synced = result['synced_until']
+            lagging_ids = {
+                entity_id for entity_id in lagging_ids
+                if not synced.get(entity_id) or synced[entity_id] < started_at
+            }
+
+        totals['remaining'] = len(lagging_ids)
+        _logger.info(f"History backfill for instance {instance_id}: {totals}")
+        return totals
+
+    def _get_history_window(self, entities, now=None):
+        """
+        計算實體（或同一 chunk 的多個實體）本次要請求的歷史時間區間（UTC naive datetime）
+
+        - 已同步過：從 watermark 往前 HISTORY_SYNC_OVERLAP_SECONDS 開始（重疊部分由去重處理）
+        - 未同步過：從 now - HISTORY_DEFAULT_WINDOW_HOURS 開始
+        - 多個實體時取最早的開始時間
+        - 單次最多 HISTORY_BACKFILL_CHUNK_HOURS，較大的缺口分多次補齊
+
+        Returns:
+            tuple: (start, end)
+        """
+        now = now or fields.Datetime.now()
+        start = min(
+            entity.history_synced_until - timedelta(seconds=HISTORY_SYNC_OVERLAP_SECONDS)
+            if entity.history_synced_until
+            else now - timedelta(hours=HISTORY_DEFAULT_WINDOW_HOURS)
+            for entity in entities
+        )
+        end = min(now, start + timedelta(hours=HISTORY_BACKFILL_CHUNK_HOURS))
+        return start, end
+
+    def _advance_history_watermark(self, entities, synced_until):
+        """
+        推進實體的歷史同步 watermark（與歷史寫入同一交易，commit 後才生效）
+
+        只會往前推進，避免並行同步把 watermark 往回寫。
+        """
+        self.env.cr.execute("""
+            UPDATE ha_entity
+            SET history_synced_until = %s
+            WHERE id = ANY(%s) AND (history_synced_until IS NULL OR history_synced_until < %s)
+        """, (synced_until, entities.ids, synced_until))
+        entities.invalidate_recordset(['history_synced_until'])
+
     def fetch_and_store_history(self, instance_id=None):
         """
         從 Home Assistant 取得並儲存歷史資料
@@ -380,43 +847,50 @@ class HAEntityHistory(models.Model):
         # sudo: 系統層級同步，需要寫入所有用戶可見的歷史記錄
         self.env['ha.entity.history'].sudo().sync_entity_history_from_ha(instance_id=instance_id)
 
-    def _fetch_entity_history(self, entity, entity_map, instance_id):
+    def _fetch_entity_history(self, entities, entity_map, instance_id):
         """
-        取得單一實體的歷史資料
+        取得一組實體的歷史資料（一次請求），在同一交易中寫入並推進 watermark
 
         Args:
-            entity: ha.entity record
+            entities: ha.entity recordset（同一個 chunk）
             entity_map: entity_id -> record_id 映射字典
             instance_id: HA 實例 ID
 
         Returns:
-            tuple: (created_count, skipped_count)
+            tuple: (created_count, skipped_count, synced_until)
         """
-        _logger.info(f"Fetching history for entity: {entity.entity_id} (instance: {instance_id})")
+        entity_ids = entities.mapped('entity_id')
+        start_time, end_time = self._get_history_window(entities)
+        _logger.info(
+            f"Fetching history for {len(entity_ids)} entities (instance: {instance_id}) "
+            f"from {start_time} to {end_time}"
+        )
 
         # 優先嘗試 WebSocket API
-        history_data = self._fetch_history_via_websocket(entity.entity_id, instance_id)
+        history_data = self._fetch_history_via_websocket(entity_ids, instance_id, start_time, end_time)
 
-        # 若 WebSocket 失敗，退回 REST API
+        # 若 WebSocket 失敗，退回 REST API（失敗時拋出例外，watermark 不會推進）
         if history_data is None:
-            _logger.info(f"WebSocket failed for {entity.entity_id}, falling back to REST API")
-            history_data = self._fetch_history_via_rest(entity.entity_id, instance_id)
+            _logger.info(f"WebSocket failed for {entity_ids}, falling back to REST API")
+            history_data = self._fetch_history_via_rest(entity_ids, instance_id, start_time, end_time)
 
-        if not history_data:
-            _logger.info(f"{entity.entity_id} has no history data")
-            return 0, 0
+        if history_data:
+            # 處理歷史資料並儲存（單一 bulk insert）
+            created, skipped = self._process_and_store_history(history_data, entity_map)
+        else:
+            _logger.info(f"{entity_ids} has no history data")
+            created, skipped = 0, 0
 
-        # 處理歷史資料並儲存
-        return self._process_and_store_history(history_data, entity_map)
+        self._advance_history_watermark(entities, end_time)
+        return created, skipped, end_time
 
-    def _fetch_entity_history_threaded(self, entity_id_str, entity_record_id, entity_map, instance_id, db_name, uid, context):
+    def _fetch_entity_history_threaded(self, entity_record_ids, entity_map, instance_id, db_name, uid, context):
         """
         Thread-safe 版本的 _fetch_entity_history
         使用 odoo.registry() 在獨立的 cursor 中執行，確保線程安全
 
         Args:
-            entity_id_str: 實體 ID 字串 (如 "sensor.temperature")
-            entity_record_id: ha.entity record ID
+            entity_record_ids: 同一個 chunk 的 ha.entity record ID 列表
             entity_map: entity_id -> record_id 映射字典
             instance_id: HA 實例 ID
             db_name: 資料庫名稱（線程安全需要傳入）
@@ -424,7 +898,7 @@ class HAEntityHistory(models.Model):
             context: 環境 context
 
         Returns:
-            tuple: (entity_id_str, created_count, skipped_count, error_message)
+            tuple: (created_count, skipped_count, error_message, synced_until)
         """
         try:
             # Odoo 18: Use Registry directly (odoo.registry() is deprecated)
@@ -432,44 +906,48 @@ class HAEntityHistory(models.Model):
             with registry.cursor() as new_cr:
                 new_env = api.Environment(new_cr, uid, context)
                 history_model = new_env['ha.entity.history']
-                entity = new_env['ha.entity'].browse(entity_record_id)
+                entities = new_env['ha.entity'].browse(entity_record_ids)
 
-                created, skipped = history_model._fetch_entity_history(entity, entity_map, instance_id)
+                created, skipped, synced_until = history_model._fetch_entity_history(entities, entity_map, instance_id)
                 new_cr.commit()
-                return (entity_id_str, created, skipped, None)
+                return (created, skipped, None, synced_until)
         except Exception as e:
-            _logger.error(f"Thread error for {entity_id_str}: {e}", exc_info=True)
-            return (entity_id_str, 0, 0, str(e))
+            _logger.error(f"Thread error for entities {entity_record_ids}: {e}", exc_info=True)
+            return (0, 0, str(e), None)
 
-    def _fetch_history_via_websocket(self, entity_id, instance_id):
+    def _fetch_history_via_websocket(self, entity_ids, instance_id, start_time=None, end_time=None):
         """
         使用 WebSocket API 取得歷史資料
-        使用 history/stream 訂閱機制
+        使用 history/stream 訂閱機制，一次訂閱可包含多個實體
 
         Args:
-            entity_id: 實體 ID
+            entity_ids: 實體 ID 或實體 ID 列表
             instance_id: HA 實例 ID
+            start_time: 開始時間（UTC naive datetime，預設為 end_time 前一天）
+            end_time: 結束時間（UTC naive datetime，預設為現在）
 
         Returns:
-            list or None: 歷史資料，失敗時返回 None
+            list or None: 歷史資料（每個實體一個子列表），失敗時返回 None
         """
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
         try:
             from odoo.addons.odoo_ha_addon.models.common.websocket_client import get_websocket_client
 
             client = get_websocket_client(self.env, instance_id=instance_id)
 
             # 使用 history/stream 訂閱API
-            today = datetime.now()
-            yesterday = today - timedelta(days=1)
+            end_time = end_time or fields.Datetime.now()
+            start_time = start_time or end_time - timedelta(days=1)
 
-            _logger.info(f"Subscribing to history/stream for {entity_id}")
+            _logger.info(f"Subscribing to history/stream for {entity_ids}")
 
             # 使用訂閱方法（會自動收集事件並取消訂閱）
             result = client.subscribe_history_stream(
-                entity_ids=[entity_id],
-                start_time=yesterday.isoformat(),
-                end_time=today.isoformat(),
-                timeout=60  # 60 秒 timeout
+                entity_ids=entity_ids,
+                start_time=start_time.replace(tzinfo=timezone.utc).isoformat(),
+                end_time=end_time.replace(tzinfo=timezone.utc).isoformat(),
+                timeout=WS_HISTORY_STREAM_TIMEOUT
             )
 
             if result['success']:
@@ -477,19 +955,19 @@ class HAEntityHistory(models.Model):
 
                 # 處理空事件列表
                 if not events:
-                    _logger.info(f"WebSocket history stream successful for {entity_id}, but received 0 events")
+                    _logger.info(f"WebSocket history stream successful for {entity_ids}, but received 0 events")
                     return None
 
-                _logger.info(f"WebSocket history stream successful for {entity_id}, received {len(events)} events")
+                _logger.info(f"WebSocket history stream successful for {entity_ids}, received {len(events)} events")
 
-                # 轉換事件格式為歷史資料格式
-                return self._convert_stream_events_to_history(events, entity_id)
+                # 轉換事件格式為歷史資料格式（依實體拆分）
+                return self._convert_stream_events_to_history(events, entity_ids)
             else:
-                _logger.warning(f"WebSocket history stream failed for {entity_id}: {result.get('error')}")
+                _logger.warning(f"WebSocket history stream failed for {entity_ids}: {result.get('error')}")
                 return None
 
         except Exception as e:
-            _logger.warning(f"WebSocket history query failed for {entity_id}: {e}")
+            _logger.warning(f"WebSocket history query failed for {entity_ids}: {e}")
             return None
 
     def _normalize_state_format(self, state_item, entity_id):
@@ -554,9 +1032,9 @@ class HAEntityHistory(models.Model):
             # 無法識別的格式
             return None
 
-    def _convert_stream_events_to_history(self, events, entity_id):
+    def _convert_stream_events_to_history(self, events, entity_ids):
         """
-        將 history/stream 事件轉換為歷史資料格式
+        將 history/stream 事件轉換為歷史資料格式，並依實體拆分
 
         根據文件，每個事件格式：
         {
@@ -574,76 +1052,83 @@ class HAEntityHistory(models.Model):
 
         Args:
             events: history/stream 返回的事件列表
-            entity_id: 實體 ID
+            entity_ids: 實體 ID 或實體 ID 列表
 
         Returns:
-            list: 轉換後的歷史資料（與 REST API 格式相同）[[...]]
+            list: 轉換後的歷史資料（與 REST API 格式相同，每個實體一個子列表）[[...], [...]]
         """
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+
         if not events:
-            _logger.debug(f"No events received for {entity_id}")
+            _logger.debug(f"No events received for {entity_ids}")
             return None
 
-        history_records = []
+        history_by_entity = {entity_id: [] for entity_id in entity_ids}
 
         for event in events:
             states = event.get('states', {})
 
             # 檢查 states 是否為空（該時段內無狀態變化）
             if not states:
-                _logger.debug(f"Empty states in event for {entity_id}")
+                _logger.debug(f"Empty states in event for {entity_ids}")
                 continue
 
             # states 是一個字典，key 是 entity_id
-            if entity_id in states:
-                state_list = states[entity_id]
+            for entity_id, state_list in states.items():
+                if entity_id not in history_by_entity:
+                    _logger.debug(f"Ignoring unexpected entity {entity_id} in history stream")
+                    continue
 
                 # state_list 是該實體的狀態列表
-                if isinstance(state_list, list):
-                    for state_item in state_list:
-                        # 確保 state_item 包含必要欄位
-                        if isinstance(state_item, dict):
-                            # 處理縮寫格式（HA WebSocket API 返回）或完整格式（REST API）
-                            normalized_item = self._normalize_state_format(state_item, entity_id)
-                            if normalized_item:
-                                history_records.append(normalized_item)
-                            else:
-                                _logger.warning(f"Invalid state item format: {state_item}")
-                else:
+                if not isinstance(state_list, list):
                     _logger.warning(f"state_list is not a list: {type(state_list)}")
-            else:
-                # entity_id 不在 states 中，記錄警告
-                available_entities = list(states.keys())
-                _logger.debug(
-                    f"Entity {entity_id} not found in states. "
-                    f"Available entities: {available_entities}"
-                )
+                    continue
 
-        if not history_records:
+                for state_item in state_list:
+                    # 處理縮寫格式（HA WebSocket API 返回）或完整格式（REST API）
+                    normalized_item = self._normalize_state_format(state_item, entity_id)
+                    if normalized_item:
+                        history_by_entity[entity_id].append(normalized_item)
+                    else:
+                        _logger.warning(f"Invalid state item format: {state_item}")
+
+        history_data = [records for records in history_by_entity.values() if records]
+        if not history_data:
             _logger.warning(
-                f"No valid history records extracted from {len(events)} events for {entity_id}"
+                f"No valid history records extracted from {len(events)} events for {entity_ids}"
             )
             return None
 
-        _logger.info(f"Converted {len(history_records)} history records for {entity_id}")
+        _logger.info(
+            f"Converted {sum(len(records) for records in history_data)} history records "
+            f"for {len(history_data)} entities"
+        )
 
-        # 返回與 REST API 相同的格式：[[...]]
-        return [history_records]
+        # 返回與 REST API 相同的格式：[[...], [...]]
+        return history_data
 
-    def _fetch_history_via_rest(self, entity_id, instance_id):
+    def _fetch_history_via_rest(self, entity_ids, instance_id, start_time=None, end_time=None):
         """
-        使用 REST API 取得歷史資料
+        使用 REST API 取得歷史資料（filter_entity_id 可包含多個實體）
 
         Args:
-            entity_id: 實體 ID
+            entity_ids: 實體 ID 或實體 ID 列表
             instance_id: HA 實例 ID
+            start_time: 開始時間（UTC naive datetime，未指定時由 HA 預設為近一天）
+            end_time: 結束時間（UTC naive datetime）
 
         Returns:
             list: 歷史資料
         """
+        entity_id = entity_ids if isinstance(entity_ids, str) else ','.join(entity_ids)
         try:
             api = HassRestApi(self.env, instance_id=instance_id)
-            # 預設取得近一天的歷史資料
-            history_data = api.get_ha_history(entity_id)
+            history_data = api.get_ha_history(
+                entity_id,
+                timestamp=start_time.replace(tzinfo=timezone.utc) if start_time else None,
+                end_timestamp=end_time.replace(tzinfo=timezone.utc) if end_time else None,
+            )
 
             if history_data:
                 _logger.info(f"REST API history query successful for {entity_id}")
@@ -656,10 +1141,10 @@ class HAEntityHistory(models.Model):
 
     def _process_and_store_history(self, history_data, entity_map):
         """
-        處理並儲存歷史資料
+        處理並儲存歷史資料（所有實體合併為一次 bulk insert）
 
         Args:
-            history_data: 從 API 取得的歷史資料
+            history_data: 從 API 取得的歷史資料（每個實體一個子列表）
             entity_map: entity_id -> record_id 映射字典
 
         Returns:
@@ -668,43 +1153,37 @@ class HAEntityHistory(models.Model):
         if not history_data or not isinstance(history_data, list) or len(history_data) == 0:
             return 0, 0
 
-        # 歷史資料的第一層是實體陣列
-        first_entity_history = history_data[0]
-
-        if not first_entity_history:
-            return 0, 0
-
         # 準備要建立的記錄
         records_to_create = []
 
-        for history_item in first_entity_history:
-            entity_id_str = history_item.get('entity_id')
-
-            # 使用預先建立的映射查詢 entity record id
-            entity_record_id = entity_map.get(entity_id_str)
-
-            if not entity_record_id:
-                _logger.warning(f"Entity {entity_id_str} not found in entity map, skipping")
-                continue
+        # 歷史資料的第一層是實體陣列
+        for entity_history in history_data:
+            for history_item in entity_history or []:
+                entity_id_str = history_item.get('entity_id')
 
-            # 解析時間戳
-            try:
-                last_changed = parse_iso_datetime(history_item.get('last_changed'))
-                last_updated = parse_iso_datetime(history_item.get('last_updated'))
-            except Exception as e:
-                _logger.error(f"Failed to parse timestamp for {entity_id_str}: {e}")
-                continue
+                # 使用預先建立的映射查詢 entity record id
+                entity_record_id = entity_map.get(entity_id_str)
 
-            record_data = {
-                'domain': parse_domain_from_entitiy_id(entity_id_str),
-                'entity_id': entity_record_id,
-                'entity_state': history_item.get('state'),
-                'last_changed': last_changed,
-                'last_updated': last_updated,
-                'attributes': history_item.get('attributes', {}),
-            }
+                if not entity_record_id:
+                    _logger.warning(f"Entity {entity_id_str} not found in entity map, skipping")
+                    continue
 
-            records_to_create.append(record_data)
+                # 解析時間戳
+                try:
+                    last_changed = parse_iso_datetime(history_item.get('last_changed'))
+                    last_updated = parse_iso_datetime(history_item.get('last_updated'))
+                except Exception as e:
+                    _logger.error(f"Failed to parse timestamp for {entity_id_str}: {e}")
+                    continue
+
+                records_to_create.append({
+                    'domain': parse_domain_from_entitiy_id(entity_id_str),
+                    'entity_id': entity_record_id,
+                    'entity_state': history_item.get('state'),
+                    'last_changed': last_changed,
+                    'last_updated': last_updated,
+                    'attributes': history_item.get('attributes', {}),
+                })
 
         # 批次去重並建立記錄
         return self._batch_create_deduplicated(records_to_create)
@@ -716,44 +1195,351 @@ class HAEntityHistory(models.Model):
         Args:
             records: 要建立的記錄列表
 
+        Returns:
+            tuple: (created_count, skipped_count)
+        """
+        created_count, skipped_count = self._bulk_insert_history(records)
+        _logger.info(f"Batch create completed: {created_count} created, {skipped_count} skipped")
+        return created_count, skipped_count
+
+    @api.model
+    def _bulk_insert_history(self, records):
+        """
+        以集合運算批次寫入歷史記錄，依 (entity_id, last_updated) 去重
+
+        每 HISTORY_INSERT_CHUNK 筆只執行一個 INSERT ... SELECT ... ON CONFLICT DO NOTHING：
+        - 批次內重複以 DISTINCT ON 去除
+        - 已存在的記錄以 NOT EXISTS 與各 partition 的 unique(entity_id, last_updated) 索引跳過
+          （last_changed 落在不同 partition 的同一組 (entity_id, last_updated) 只依賴 NOT EXISTS）
+        - num_state 與 ha_instance_id 在同一語句中計算（不經過 ORM compute）
+        - attributes 依 _get_attribute_allowlist() 只保留各 domain 允許的 key
+        - numeric domain 的新記錄同時 UPSERT 到 ha_entity_history_rollup
+
+        Args:
+            records: [{'entity_id': ha.entity record id, 'domain', 'entity_state',
+                       'last_changed', 'last_updated', 'attributes'}, ...]
+
         Returns:
             tuple: (created_count, skipped_count)
         """
         if not records:
             return 0, 0
 
+        query_template = """
+            INSERT INTO ha_entity_history (
+                entity_id, ha_instance_id, domain, entity_state, num_state,
+                last_changed, last_updated, attributes,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT DISTINCT ON (v.entity_id, v.last_updated)
+                   v.entity_id, e.ha_instance_id, v.domain, v.entity_state, v.num_state,
+                   COALESCE(v.last_changed, v.last_updated), v.last_updated, v.attributes,
+                   %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC')
+            FROM (
+                SELECT entity_id::int AS entity_id, domain::varchar AS domain,
+                       entity_state::varchar AS entity_state, num_state::float AS num_state,
+                       last_changed::timestamp AS last_changed,
+                       last_updated::timestamp AS last_updated,
+                       attributes::jsonb AS attributes
+                FROM (VALUES {values}) AS t(entity_id, domain, entity_state, num_state,
+                                             last_changed, last_updated, attributes)
+            ) AS v
+            JOIN ha_entity e ON e.id = v.entity_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM ha_entity_history h
+                WHERE h.entity_id = v.entity_id AND h.last_updated = v.last_updated
+            )
+            ON CONFLICT DO NOTHING
+            RETURNING entity_id, domain, last_changed, num_state, entity_state
+        """
+        # 同一語句內以新寫入的記錄增量更新 numeric rollup
+        query_template = (
+            'WITH inserted AS (' + query_template + '), '
+            'rollup AS (' + history_rollups.UPSERT_SQL.replace('{src}', 'inserted') + ') '
+            'SELECT COUNT(*) FROM inserted'
+        )
+        rollup_params = [list(HISTORY_ROLLUP_RESOLUTIONS), list(HISTORY_NUMERIC_DOMAINS)]
+
         created_count = 0
-        skipped_count = 0
+        uid = self.env.uid
+        allowlist = self._get_attribute_allowlist()
+        for start in range(0, len(records), HISTORY_INSERT_CHUNK):
+            chunk = records[start:start + HISTORY_INSERT_CHUNK]
+            rows = [(
+                r['entity_id'],
+                r['domain'],
+                r.get('entity_state'),
+                _num_state(r.get('entity_state')),
+                r.get('last_changed'),
+                r.get('last_updated') or r.get('last_changed'),
+                json.dumps(self._project_attributes(r['domain'], r.get('attributes'), allowlist)),
+            ) for r in chunk]
+            query = query_template.format(values=', '.join(['%s'] * len(rows)))
+            self.env.cr.execute(query, [uid, uid] + rows + rollup_params)
+            created_count += self.env.cr.fetchone()[0]
+
+        # 直接寫入 SQL，清除 ORM cache 以免讀到舊資料
+        self.invalidate_model()
+
+        skipped_count = len(records) - created_count
+        _logger.debug(f"Bulk history insert: {created_count} created, {skipped_count} skipped")
+        return created_count, skipped_count
 
-        # 收集所有需要檢查的 (entity_id, last_updated) 組合
-        check_pairs = [(r['entity_id'], r['last_updated']) for r in records]
+    # ========================================================================
+    # Attribute allow-list
+    # ========================================================================
 
-        # 批次查詢已存在的記錄（提升效能）
-        existing_records = set()
-        for entity_id, last_updated in check_pairs:
-            exists = self.env[self._name].search([
-                ('entity_id', '=', entity_id),
-                ('last_updated', '=', last_updated)
-            ], limit=1)
+    @api.model
+    def _get_attribute_allowlist(self):
+        """
+        取得歷史記錄的 per-domain attribute allow-list
 
-            if exists:
-                existing_records.add((entity_id, last_updated))
+        預設值為 ws_config.HISTORY_ATTRIBUTE_ALLOWLIST，可用系統參數
+        odoo_ha_addon.ha_history_attribute_allowlist（JSON 物件）逐 domain 覆寫：
+        {"sensor": ["unit_of_measurement", "friendly_name"], "weather": "*"}
 
-        # 批次建立不存在的記錄
-        for record in records:
-            pair = (record['entity_id'], record['last_updated'])
+        Returns:
+            dict: {domain: frozenset(keys) 或 None（None 表示保留全部）}，
+                  '' 為未列出 domain 的預設值
+        """
+        overrides = {}
+        raw = self.env['ir.config_parameter'].sudo().get_param(
+            'odoo_ha_addon.ha_history_attribute_allowlist'
+        )
+        if raw:
+            try:
+                overrides = json.loads(raw)
+                if not isinstance(overrides, dict):
+                    raise ValueError('allow-list must be a JSON object')
+            except ValueError as e:
+                _logger.warning(f"Invalid history attribute allow-list, using defaults: {e}")
+                overrides = {}
+
+        default_keys = frozenset(HISTORY_ATTRIBUTE_DEFAULT_KEYS)
+        allowlist = {'': default_keys}
+        for domain, keys in {**HISTORY_ATTRIBUTE_ALLOWLIST, **overrides}.items():
+            allowlist[domain] = None if keys == '*' else default_keys | frozenset(keys or ())
+        return allowlist
+
+    @staticmethod
+    def _project_attributes(domain, attributes, allowlist):
+        """依 allow-list 只保留允許的 attribute key"""
+        if not attributes or not isinstance(attributes, dict):
+            return {}
+        keys = allowlist.get(domain, allowlist[''])
+        if keys is None:
+            return attributes
+        return {key: value for key, value in attributes.items() if key in keys}
 
-            if pair in existing_records:
-                skipped_count += 1
-                _logger.debug(f"Record already exists, skipping: entity={record['entity_id']}, updated={record['last_updated']}")
-            else:
-                try:
-                    self.env[self._name].create(record)
-                    created_count += 1
-                    _logger.debug(f"Record created: entity={record['entity_id']}, updated={record['last_updated']}")
-                except Exception as e:
-                    _logger.error(f"Failed to create record: {e}")
-                    skipped_count += 1
+    @api.model
+    def compact_history_attributes(self, domains=None, batch_size=HISTORY_COMPACT_BATCH_SIZE):
+        """
+        依目前的 allow-list 壓縮既有歷史記錄的 attributes
 
-        _logger.info(f"Batch create completed: {created_count} created, {skipped_count} skipped")
-        return created_count, skipped_count
+        每個 domain 以 id 遞增分批執行單一 UPDATE ... FROM（CTE），
+        只改寫含有非允許 key 的記錄。
+
+        Args:
+            domains: 要壓縮的 domain 列表（None 表示所有有限制的 domain）
+            batch_size: 每個 UPDATE 語句處理的記錄數
+
+        Returns:
+            dict: {domain: {'rows': 改寫筆數, 'bytes_saved': attributes JSON 減少的位元組數}}
+        """
+        allowlist = self._get_attribute_allowlist()
+        if domains is None:
+            self.env.cr.execute("SELECT DISTINCT domain FROM ha_entity_history")
+            domains = [row[0] for row in self.env.cr.fetchall()]
+
+        report = {}
+        for domain in domains:
+            keys = allowlist.get(domain, allowlist[''])
+            if keys is None:
+                continue
+            keys = sorted(keys)
+            rows = bytes_saved = 0
+            last_id = 0
+            while True:
+                self.env.cr.execute("""
+                    WITH target AS (
+                        SELECT h.id,
+                               h.attributes AS old_attributes,
+                               COALESCE(
+                                   (SELECT jsonb_object_agg(a.key, a.value)
+                                    FROM jsonb_each(h.attributes) AS a
+                                    WHERE a.key = ANY(%(keys)s)),
+                                   '{}'::jsonb
+                               ) AS new_attributes
+                        FROM ha_entity_history h
+                        WHERE h.domain = %(domain)s
+                          AND h.id > %(last_id)s
+                          AND jsonb_typeof(h.attributes) = 'object'
+                          AND EXISTS (
+                              SELECT 1 FROM jsonb_object_keys(h.attributes) AS k
+                              WHERE k <> ALL(%(keys)s)
+                          )
+                        ORDER BY h.id
+                        LIMIT %(limit)s
+                    ), updated AS (
+                        UPDATE ha_entity_history h
+                        SET attributes = t.new_attributes
+                        FROM target t
+                        WHERE h.id = t.id
+                        RETURNING h.id
+                    )
+                    SELECT COUNT(*),
+                           COALESCE(SUM(octet_length(old_attributes::text)
+                                        - octet_length(new_attributes::text)), 0),
+                           MAX(id)
+                    FROM target
+                """, {'keys': keys, 'domain': domain, 'last_id': last_id, 'limit': batch_size})
+                count, saved, max_id = self.env.cr.fetchone()
+                rows += count
+                bytes_saved += saved
+                if count < batch_size:
+                    break
+                last_id = max_id
+
+            if rows:
+                report[domain] = {'rows': rows, 'bytes_saved': int(bytes_saved)}
+                _logger.info(
+                    f"Compacted history attributes for domain '{domain}': "
+                    f"{rows} rows, {int(bytes_saved)} bytes saved"
+                )
+
+        # 直接寫入 SQL，清除 ORM cache 以免讀到舊資料
+        self.invalidate_model(['attributes'])
+        return report
+
+    # ========================================================================
+    # Partitions & Retention
+    # ========================================================================
+
+    @api.model
+    def _cron_manage_history_partitions(self):
+        """
+        Cron：預先建立未來的 partition，並套用保留政策
+
+        Returns:
+            dict: {'created': [...], 'dropped': [...], 'deleted_rows': int, 'deleted_rollups': int}
+        """
+        created = history_partitions.ensure_partitions(
+            self.env.cr, HISTORY_PARTITION_INTERVAL, HISTORY_PARTITION_PREMAKE
+        )
+        report = self._apply_history_retention()
+        report['created'] = created
+        return report
+
+    @api.model
+    def _get_history_retention_policies(self):
+        """
+        取得保留政策（天數，0 表示永久保留）
+
+        - 每個實例：ha.instance.history_retention_days
+        - 每個 domain：系統參數 odoo_ha_addon.ha_history_retention_domains（JSON，例如 {"sensor": 30}），
+          優先於實例設定
+
+        Returns:
+            tuple: ({instance_id: days}, {domain: days})
+        """
+        instance_days = {
+            instance.id: instance.history_retention_days
+            for instance in self.env['ha.instance'].sudo().with_context(active_test=False).search([])
+        }
+        domain_days = {}
+        raw = self.env['ir.config_parameter'].sudo().get_param('odoo_ha_addon.ha_history_retention_domains')
+        if raw:
+            try:
+                domain_days = {str(domain): int(days) for domain, days in json.loads(raw).items()}
+            except (ValueError, TypeError, AttributeError) as e:
+                _logger.warning(f"Invalid history retention per domain, ignoring: {e}")
+        return instance_days, domain_days
+
+    @api.model
+    def _apply_history_retention(self, now=None):
+        """
+        套用保留政策
+
+        1. partition 中沒有任何資料仍在其政策期限內時直接 DROP（不逐筆刪除）：
+           只看 partition 中實際出現的實例 / domain，永久保留（0）或期限仍涵蓋
+           partition 結束時間的政策才會讓 partition 保留
+        2. 其餘 partition 中過期的資料以集合式 DELETE 處理
+           （last_changed 條件讓 DELETE 只掃描相關的 partition）
+        3. ha_entity_history_rollup 中整個時間桶都早於同一期限的 bucket 依相同的
+           實例 / domain 期限刪除
+
+        Returns:
+            dict: {'dropped': [partition 名稱], 'deleted_rows': int, 'deleted_rollups': int}
+        """
+        cr = self.env.cr
+        now = now or fields.Datetime.now()
+        instance_days, domain_days = self._get_history_retention_policies()
+        report = {'dropped': [], 'deleted_rows': 0, 'deleted_rollups': 0}
+        if not instance_days:
+            return report
+
+        overridden = list(domain_days)
+        for name, _start, end in history_partitions.list_partitions(cr):
+            if end > now:
+                continue
+            # 期限仍涵蓋此 partition 的政策；partition 中有任一筆資料屬於這些政策就保留
+            keep_instances = [
+                instance_id for instance_id, days in instance_days.items()
+                if days <= 0 or end > now - timedelta(days=days)
+            ]
+            keep_domains = [
+                domain for domain, days in domain_days.items()
+                if days <= 0 or end > now - timedelta(days=days)
+            ]
+            cr.execute(f"""
+                SELECT 1 FROM "{name}"
+                WHERE domain = ANY(%s::varchar[])
+                   OR (domain <> ALL(%s::varchar[])
+                       AND (ha_instance_id IS NULL OR ha_instance_id = ANY(%s::int[])))
+                LIMIT 1
+            """, (keep_domains, overridden, keep_instances))
+            if not cr.fetchone():
+                history_partitions.drop_partition(cr, name)
+                report['dropped'].append(name)
+
+        for instance_id, days in instance_days.items():
+            if days > 0:
+                cr.execute("""
+                    DELETE FROM ha_entity_history
+                    WHERE ha_instance_id = %s AND last_changed < %s
+                      AND domain <> ALL(%s::varchar[])
+                """, (instance_id, now - timedelta(days=days), overridden))
+                report['deleted_rows'] += cr.rowcount
+                cr.execute(f"""
+                    DELETE FROM {history_rollups.TABLE} r
+                    USING ha_entity e
+                    WHERE e.id = r.entity_id AND e.ha_instance_id = %s
+                      AND e.domain <> ALL(%s::varchar[])
+                      AND r.bucket + r.resolution * interval '1 second' <= %s
+                """, (instance_id, overridden, now - timedelta(days=days)))
+                report['deleted_rollups'] += cr.rowcount
+        for domain, days in domain_days.items():
+            if days > 0:
+                cr.execute("""
+                    DELETE FROM ha_entity_history
+                    WHERE domain = %s AND last_changed < %s
+                """, (domain, now - timedelta(days=days)))
+                report['deleted_rows'] += cr.rowcount
+                cr.execute(f"""
+                    DELETE FROM {history_rollups.TABLE} r
+                    USING ha_entity e
+                    WHERE e.id = r.entity_id AND e.domain = %s
+                      AND r.bucket + r.resolution * interval '1 second' <= %s
+                """, (domain, now - timedelta(days=days)))
+                report['deleted_rollups'] += cr.rowcount
+
+        if report['dropped'] or report['deleted_rows']:
+            # 直接以 SQL 刪除，清除 ORM cache
+            self.invalidate_model()
+            _logger.info(
+                f"History retention: dropped {len(report['dropped'])} partitions, "
+                f"deleted {report['deleted_rows']} rows"
+            )
+        if report['deleted_rollups']:
+            _logger.info(f"History retention: deleted {report['deleted_rollups']} rollup buckets")
+        return report
@@ -11,6 +11,9 @@ between entities/groups and users. It supports:
 - Permission levels: view-only or control
 - Optional expiration dates
 - Notification tracking for expiry alerts
+- A materialized access index (ha_share_access, see common/share_access.py)
+  used for portal authorization, with an in-process LRU per (user, target)
+  invalidated by the index version
 """
 
 from odoo import models, fields, api, _
@@ -18,6 +21,8 @@ from odoo.exceptions import ValidationError
 from datetime import timedelta
 import logging
 
+from .common import share_access
+
 _logger = logging.getLogger(__name__)
 
 
@@ -237,6 +242,95 @@ class HAEntityShare(models.Model):
                 #     _('Cannot share with the owner of the entity/group/device.')
                 # )
 
+    # Fields that change what a share grants; writing them refreshes the access index
+    _ACCESS_FIELDS = {'entity_id', 'group_id', 'device_id', 'user_id', 'permission', 'expiry_date'}
+
+    def init(self):
+        share_access.ensure_share_access_table(self.env.cr)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._refresh_share_access()
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        if self._ACCESS_FIELDS.intersection(vals):
+            self._refresh_share_access()
+        return result
+
+    def unlink(self):
+        # Index rows are removed by ON DELETE CASCADE; only the version needs bumping
+        result = super().unlink()
+        share_access.bump_version(self.env.cr)
+        return result
+
+    # ========================================
+    # Access Index
+    # ========================================
+
+    def _refresh_share_access(self):
+        """Rebuild the access index rows of these shares (bumps the index version)."""
+        if not self:
+            return
+        self.env.flush_all()
+        share_access.refresh(self.env.cr, self.ids)
+
+    @api.model
+    def _refresh_share_access_for(self, groups=None, devices=None):
+        """
+        Rebuild the access index for shares of groups / devices whose entities changed.
+
+        Called when group membership or an entity's device changes. Nothing is
+        rebuilt (and the index version is left unchanged) when none of them is shared.
+
+        Args:
+            groups: ha.entity.group recordset
+            devices: ha.device recordset
+        """
+        group_ids = groups.ids if groups else []
+        device_ids = devices.ids if devices else []
+        if not group_ids and not device_ids:
+            return
+        shares = self.sudo().search([
+            '|',
+            ('group_id', 'in', group_ids),
+            ('device_id', 'in', device_ids),
+        ])
+        shares._refresh_share_access()
+
+    @api.model
+    def _get_share_access_grants(self, user_id, target, target_id):
+        """Cached index rows ((permission, expires_at), ...) of a user for one target."""
+        return share_access.read_grants_cached(self.env.cr, user_id, target, target_id)
+
+    @api.model
+    def _get_effective_permission(self, target, target_id, user_id=None):
+        """
+        Get a user's effective permission on an entity, group or device.
+
+        Single cached index lookup. Expiry is compared on every call, so cached
+        grants stay correct when a share expires.
+
+        Args:
+            target: 'entity', 'group' or 'device'
+            target_id: Record ID of the target
+            user_id: User ID (default: current user)
+
+        Returns:
+            'control', 'view', or False if the user has no valid share
+        """
+        now = fields.Datetime.now()
+        permissions = {
+            permission
+            for permission, expires_at in self._get_share_access_grants(user_id or self.env.uid, target, target_id)
+            if not expires_at or expires_at >= now
+        }
+        if 'control' in permissions:
+            return 'control'
+        return 'view' if permissions else False
+
     def action_extend_expiry(self, days=30):
         """
         Extend the expiry date by the specified number of days.
@@ -342,6 +436,43 @@ class HAEntityShare(models.Model):
         shares = self.search(domain)
         return shares.mapped('device_id').filtered(lambda d: d)
 
+    @api.model
+    def _get_accessible_entity_ids(self, entity_ids, user_id=None):
+        """
+        Filter entity IDs down to those a user can view through any share.
+
+        An entity is accessible through a direct share, a share of a group
+        containing it, or a share of its device. Used to authorize portal
+        bus channels once at subscription time.
+
+        Args:
+            entity_ids: ha.entity record IDs to check
+            user_id: User ID (default: current user)
+
+        Returns:
+            set of accessible ha.entity record IDs
+        """
+        if not entity_ids:
+            return set()
+        return share_access.read_accessible(self.env.cr, user_id or self.env.uid, 'entity', entity_ids)
+
+    @api.model
+    def _get_shared_entity_ids(self, entity_ids):
+        """
+        Filter entity IDs down to those shared with at least one user.
+
+        Used to skip portal state pushes for entities nobody can subscribe to.
+
+        Args:
+            entity_ids: ha.entity record IDs
+
+        Returns:
+            list of shared ha.entity record IDs
+        """
+        if not entity_ids:
+            return []
+        return share_access.read_shared(self.env.cr, 'entity', entity_ids)
+
     @api.model
     def cleanup_expired_shares(self, delete=False, notify=True):
         """
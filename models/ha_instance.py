@@ -4,9 +4,13 @@ from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, AccessError
 import logging
 from odoo.addons.odoo_ha_addon.models.common.hass_rest_api import HassRestApi
+from odoo.addons.odoo_ha_addon.models.common import ws_liveness
 from odoo.addons.odoo_ha_addon.models.common.ws_config import (
     WS_CLOSE_TIMEOUT,
     WS_AUTH_TIMEOUT,
+    STATE_FLUSH_SIZE,
+    STATE_FLUSH_INTERVAL_MS,
+    STATE_QUEUE_DEPTH,
 )
 
 _logger = logging.getLogger(__name__)
@@ -123,6 +127,33 @@ class HAInstance(models.Model):
         help='Define custom properties available for all devices in this instance'
     )
 
+    # ==================== 狀態寫入管線設定 ====================
+    # state_changed 事件的微批次寫入參數（WebSocket 服務重啟後生效）
+
+    state_flush_size = fields.Integer(
+        string='State Flush Size',
+        default=STATE_FLUSH_SIZE,
+        help='累積多少個不同 entity 的狀態變更時立即寫入資料庫'
+    )
+
+    state_flush_interval_ms = fields.Integer(
+        string='State Flush Window (ms)',
+        default=STATE_FLUSH_INTERVAL_MS,
+        help='狀態變更的合併時間窗口（毫秒），窗口內同一 entity 的多次更新只寫入一次'
+    )
+
+    state_queue_depth = fields.Integer(
+        string='State Queue Depth',
+        default=STATE_QUEUE_DEPTH,
+        help='佇列最多可暫存的狀態變更事件數量，佇列已滿時會立即寫入，WebSocket 監聽等待寫入完成後才讀取下一則訊息'
+    )
+
+    history_retention_days = fields.Integer(
+        string='History Retention (days)',
+        default=0,
+        help='歷史記錄保留天數（0 表示永久保留）。可在設定中針對個別 domain 覆寫。'
+    )
+
     # ==================== 實例識別欄位 ====================
 
     ha_instance_uuid = fields.Char(
@@ -140,6 +171,9 @@ class HAInstance(models.Model):
         copy=False
     )
 
+    def init(self):
+        ws_liveness.ensure_liveness_table(self.env.cr)
+
     # ==================== Compute Methods ====================
 
     @api.depends('api_url')
@@ -175,63 +209,26 @@ class HAInstance(models.Model):
         計算 WebSocket 連接狀態
         Phase 2: 透過心跳機制檢查特定實例的 WebSocket 狀態
 
-        修復: 直接信任 is_websocket_service_running() 的結果
-        該方法已經檢查了 heartbeat（15秒閾值），避免 transaction isolation 問題
-
-        Phase 3: 加入 timeout 防止 API 阻塞
-        - 使用 threading 實現 timeout
-        - 預設 3 秒 timeout，避免阻塞整個 get_instances API
+        所有 record 一次判斷：本 process 的連線表 + 一次 ha_ws_liveness 查詢
+        （查詢使用獨立 cursor 與 statement_timeout，不會阻塞 get_instances API）
         """
-        from .common.websocket_thread_manager import is_websocket_service_running
+        from .common.websocket_thread_manager import get_websocket_statuses
         import os
-        import threading
 
-        # Timeout 設定（秒）
-        WS_STATUS_CHECK_TIMEOUT = 3
+        instance_ids = [record.id for record in self if isinstance(record.id, int)]
+        try:
+            statuses = get_websocket_statuses(self.env, instance_ids) if instance_ids else {}
+        except Exception as e:
+            _logger.error(f"Failed to compute WebSocket status for instances {instance_ids}: {e}")
+            for record in self:
+                record.websocket_status = 'error'
+            return
 
         for record in self:
-            try:
-                # 使用 threading 實現 timeout
-                result = {'status': 'disconnected'}
-
-                def check_status():
-                    try:
-                        is_running = is_websocket_service_running(
-                            env=self.env,
-                            instance_id=record.id
-                        )
-                        result['status'] = 'connected' if is_running else 'disconnected'
-                    except Exception as e:
-                        _logger.warning(f"WebSocket status check failed for instance {record.id}: {e}")
-                        result['status'] = 'disconnected'
-
-                # 在獨立線程中執行檢查
-                check_thread = threading.Thread(target=check_status)
-                check_thread.start()
-                check_thread.join(timeout=WS_STATUS_CHECK_TIMEOUT)
-
-                if check_thread.is_alive():
-                    # Timeout - 線程仍在運行，返回 disconnected 並記錄警告
-                    _logger.warning(
-                        f"[PID {os.getpid()}] ⏱️ WebSocket status check timed out for instance {record.id} "
-                        f"({record.name}) after {WS_STATUS_CHECK_TIMEOUT}s"
-                    )
-                    record.websocket_status = 'disconnected'
-                else:
-                    # 正常完成
-                    record.websocket_status = result['status']
-                    if result['status'] == 'connected':
-                        _logger.debug(
-                            f"[PID {os.getpid()}] ✅ Instance {record.id} ({record.name}): Connected"
-                        )
-                    else:
-                        _logger.debug(
-                            f"[PID {os.getpid()}] ❌ Instance {record.id} ({record.name}): Disconnected"
-                        )
-
-            except Exception as e:
-                _logger.error(f"Failed to compute WebSocket status for instance {record.id}: {e}")
-                record.websocket_status = 'error'
+            record.websocket_status = 'connected' if statuses.get(record.id) else 'disconnected'
+            _logger.debug(
+                f"[PID {os.getpid()}] Instance {record.id} ({record.name}): {record.websocket_status}"
+            )
 
     # ==================== Constraints ====================
 
@@ -247,6 +244,21 @@ class HAInstance(models.Model):
                           "URL must start with http:// or https://") % url
                     )
 
+    @api.constrains('state_flush_size', 'state_flush_interval_ms', 'state_queue_depth')
+    def _check_state_ingestion_settings(self):
+        """檢查狀態寫入管線設定"""
+        for record in self:
+            if record.state_flush_size < 1 or record.state_flush_interval_ms < 1:
+                raise ValidationError(_("State flush size and window must be positive."))
+            if record.state_queue_depth < record.state_flush_size:
+                raise ValidationError(_("State queue depth must be greater than or equal to the flush size."))
+
+    @api.constrains('history_retention_days')
+    def _check_history_retention_days(self):
+        for record in self:
+            if record.history_retention_days < 0:
+                raise ValidationError(_("History retention must be zero (keep forever) or a positive number of days."))
+
     # ==================== CRUD Overrides ====================
 
     @api.model_create_multi
@@ -268,6 +280,8 @@ class HAInstance(models.Model):
 
             _logger.info(f"Created HA instance: {instance.name} (ID: {instance.id})")
 
+        # 已開啟的頁面重新取得 bus channels，訂閱新實例的即時通知
+        self.env['ha.realtime.update'].sudo().notify_instance_channels_changed()
         return instances
 
     def write(self, vals):
@@ -295,13 +309,13 @@ class HAInstance(models.Model):
                 # TODO: 觸發 WebSocket 重新連接
                 # record.restart_websocket_connection()
 
+        if 'active' in vals:
+            self.env['ha.realtime.update'].sudo().notify_instance_channels_changed()
+
         return result
 
     def unlink(self):
-        """刪除實例前的檢查"""
-        db_name = self.env.cr.dbname
-        instance_ids_to_delete = []
-
+        """刪除實例前的檢查（心跳記錄由 ha_ws_liveness 的外鍵一併刪除）"""
         for record in self:
             # 檢查是否有關聯的實體
             entity_count = self.env['ha.entity'].search_count([
@@ -313,20 +327,9 @@ class HAInstance(models.Model):
                       "Please delete all associated entities first.") % (record.name, entity_count)
                 )
 
-            instance_ids_to_delete.append(record.id)
             _logger.info(f"Deleting HA instance: {record.name} (ID: {record.id})")
 
-        result = super(HAInstance, self).unlink()
-
-        # 清除已刪除實例的心跳參數
-        for instance_id in instance_ids_to_delete:
-            heartbeat_key = f'odoo_ha_addon.ws_heartbeat_{db_name}_instance_{instance_id}'
-            self.env['ir.config_parameter'].sudo().search([
-                ('key', '=', heartbeat_key)
-            ]).unlink()
-            _logger.info(f"Cleared heartbeat parameter: {heartbeat_key}")
-
-        return result
+        return super(HAInstance, self).unlink()
 
     # ==================== Business Methods ====================
 
@@ -763,9 +766,10 @@ class HAInstance(models.Model):
     def action_sync_history(self):
         """
         按鈕動作：同步歷史數據
-        從 Home Assistant 同步已啟用實體的歷史數據（近 1 天）
+        從 Home Assistant 同步已啟用實體的歷史數據
 
-        只同步 enable_record=True 的實體
+        只同步 enable_record=True 的實體。使用 backfill 模式：從各實體的 watermark 開始，
+        以 chunk 為單位補齊缺口（首次同步為近 1 天），未補齊的部分由 cron 繼續。
         """
         self.ensure_one()
 
@@ -796,7 +800,7 @@ class HAInstance(models.Model):
             # Phase 4 完成：已支援 instance_id 參數，只同步該實例的實體
             # Note: 不使用 cr.commit()，讓 Odoo ORM 自動管理 transaction
             # sudo: 系統層級同步，需要寫入所有用戶可見的歷史記錄
-            self.env['ha.entity.history'].sudo().sync_entity_history_from_ha(instance_id=self.id)
+            self.env['ha.entity.history'].sudo().backfill_entity_history(instance_id=self.id)
 
             # 讀取此實例的歷史記錄數量
             # sudo: 統計所有歷史記錄，不受用戶權限限制
@@ -907,6 +911,66 @@ class HAInstance(models.Model):
             }
         }
 
+    def get_ingestion_stats(self):
+        """
+        取得此實例 state ingestion 管線的統計數據
+
+        只有運行 WebSocket thread 的 process 才有數據，其他 process 返回空字典。
+
+        另外合併 ha.entity 寫入統計（writes_applied / writes_skipped），
+        writes_skipped 為 state_hash 相同而未寫入的次數。
+
+        Returns:
+            dict: {instance_id: {events_in, events_coalesced, last_flush_ms,
+                                 writes_applied, writes_skipped, ...}}
+        """
+        from .common.state_ingestion import get_ingestion_stats, get_write_stats
+
+        db_name = self.env.cr.dbname
+        stats = {}
+        for record in self:
+            stats.update(get_ingestion_stats(db_name, record.id))
+            for inst_id, write_stats in get_write_stats(db_name, record.id).items():
+                stats.setdefault(inst_id, {}).update(write_stats)
+        return stats
+
+    def get_request_latency_stats(self):
+        """
+        取得此實例 WebSocket 請求（controller → HA → controller）的延遲統計
+
+        只包含目前 process 發出的請求。
+
+        Returns:
+            dict: {instance_id: {count, p50_ms, p90_ms, p99_ms, max_ms, buckets, ...}}
+        """
+        from .common.request_dispatch import get_request_latency_stats
+
+        db_name = self.env.cr.dbname
+        stats = {}
+        for record in self:
+            stats.update(get_request_latency_stats(db_name, record.id))
+        return stats
+
+    def get_event_loop_stats(self):
+        """
+        取得承載此實例 WebSocket 服務的 event loop 統計數據
+
+        只有運行 WebSocket 服務的 process 才有數據，其他 process 返回空字典。
+        同一個 loop 上的實例共用 lag 數據：lag 偏高表示該 loop 上有實例佔用過多時間。
+
+        Returns:
+            dict: {instance_id: {index, thread, service_count, instance_ids,
+                                 lag_ms, lag_avg_ms, lag_max_ms, tasks, ...}}
+        """
+        from .common.event_loop_pool import get_loop_pool_stats
+
+        stats = {}
+        for loop_stats in get_loop_pool_stats(self.env.cr.dbname):
+            for inst_id in loop_stats['instance_ids']:
+                if inst_id in self.ids:
+                    stats[inst_id] = loop_stats
+        return stats
+
     def get_websocket_config(self):
         """
         取得此實例的 WebSocket 配置
@@ -967,13 +1031,14 @@ class HAInstance(models.Model):
         }
 
         try:
-            # 1. 清除歷史記錄
-            history_records = self.env['ha.entity.history'].with_context(**ctx).sudo().search([
-                ('entity_id.ha_instance_id', '=', self.id)
-            ])
-            history_count = len(history_records)
-            if history_count > 0:
-                history_records.unlink()
+            # 1. 清除歷史記錄（集合式 DELETE，不載入所有記錄 ID）
+            self.env.cr.execute("""
+                DELETE FROM ha_entity_history h
+                USING ha_entity e
+                WHERE e.id = h.entity_id AND e.ha_instance_id = %s
+            """, (self.id,))
+            history_count = self.env.cr.rowcount
+            self.env['ha.entity.history'].invalidate_model()
             _logger.info(f"✓ 已刪除 {history_count} 筆歷史記錄")
 
             # 2. 清除 Entity Group Tags
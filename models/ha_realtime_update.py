@@ -1,8 +1,21 @@
 from odoo import models, api, fields
 import logging
 
+from .common.portal_state import portal_state_payload
+
 _logger = logging.getLogger(__name__)
 
+# Instance channel 的 subchannel 名稱與前端訂閱用的字串 channel 前綴
+# 前端訂閱 'odoo_ha_addon.instance_<id>'，ir.websocket 在訂閱時檢查權限後
+# 轉換為 (ha.instance record, 'ha_realtime') channel
+INSTANCE_SUBCHANNEL = 'ha_realtime'
+INSTANCE_CHANNEL_PREFIX = 'odoo_ha_addon.instance_'
+
+# Portal entity channel：portal 頁面訂閱 'odoo_ha_addon.portal_entity_<id>'，
+# ir.websocket 在訂閱時檢查分享權限後轉換為 (ha.entity record, 'ha_portal_state') channel
+PORTAL_STATE_SUBCHANNEL = 'ha_portal_state'
+PORTAL_ENTITY_CHANNEL_PREFIX = 'odoo_ha_addon.portal_entity_'
+
 
 class HaRealtimeUpdate(models.Model):
     """
@@ -22,6 +35,37 @@ class HaRealtimeUpdate(models.Model):
         """
         return self.env.user.partner_id
 
+    @api.model
+    def _get_fanout_mode(self):
+        """
+        取得 bus fan-out 模式
+
+        - 'instance'（預設）：每則通知只寫一筆 bus.bus 到 instance channel
+        - 'user'：舊模式，逐一發送到每個用戶的 partner channel
+        """
+        mode = self.env['ir.config_parameter'].sudo().get_param(
+            'odoo_ha_addon.ha_bus_fanout_mode', 'instance'
+        )
+        return mode if mode in ('instance', 'user') else 'instance'
+
+    @api.model
+    def _broadcast_to_instance(self, ha_instance_id, notification_type, message):
+        """
+        發送通知到 HA 實例的 channel（一則通知 = 一筆 bus.bus）
+
+        權限在訂閱時檢查（見 ir.websocket._build_bus_channel_list），
+        因此這裡不需要逐一用戶過濾。未指定實例或使用舊模式時退回 _broadcast_to_users。
+
+        :param ha_instance_id: HA 實例 ID
+        :param notification_type: 通知類型
+        :param message: 通知內容
+        """
+        if not ha_instance_id or self._get_fanout_mode() != 'instance':
+            self._broadcast_to_users(notification_type, message)
+            return
+        instance = self.env['ha.instance'].sudo().browse(ha_instance_id)
+        self.env['bus.bus']._sendone((instance, INSTANCE_SUBCHANNEL), notification_type, message)
+
     @api.model
     def _broadcast_to_users(self, notification_type, message):
         """
@@ -56,11 +100,37 @@ class HaRealtimeUpdate(models.Model):
                 'timestamp': new_state.get('last_changed') if new_state else None,
                 'ha_instance_id': ha_instance_id  # 新增：實例 ID
             }
-            self._broadcast_to_users('ha_state_changed', message)
+            self._broadcast_to_instance(ha_instance_id, 'ha_state_changed', message)
             _logger.debug(f"Broadcast state change: {entity_id} (instance: {ha_instance_id})")
         except Exception as e:
             _logger.error(f"Failed to broadcast state change: {e}")
 
+    @api.model
+    def notify_entity_state_changes(self, changes, ha_instance_id=None):
+        """
+        批次通知前端多個實體狀態變更（一次 flush 只發送一則 bus 訊息）
+
+        :param changes: list of (entity_id, old_state, new_state)
+        :param ha_instance_id: HA 實例 ID
+        """
+        if not changes:
+            return
+        try:
+            message = {
+                'ha_instance_id': ha_instance_id,
+                'changes': [{
+                    'entity_id': entity_id,
+                    'old_state': old_state,
+                    'new_state': new_state,
+                    'timestamp': new_state.get('last_changed') if new_state else None,
+                    'ha_instance_id': ha_instance_id,
+                } for entity_id, old_state, new_state in changes],
+            }
+            self._broadcast_to_instance(ha_instance_id, 'ha_state_changed_batch', message)
+            _logger.debug(f"Broadcast {len(changes)} state changes (instance: {ha_instance_id})")
+        except Exception as e:
+            _logger.error(f"Failed to broadcast state change batch: {e}")
+
     @api.model
     def notify_ha_websocket_status(self, status, message, ha_instance_id=None, instance_name=None):
         """
@@ -80,7 +150,7 @@ class HaRealtimeUpdate(models.Model):
                 'ha_instance_id': ha_instance_id,  # 新增：實例 ID
                 'instance_name': instance_name      # 新增：實例名稱
             }
-            self._broadcast_to_users('ha_websocket_status', payload)
+            self._broadcast_to_instance(ha_instance_id, 'ha_websocket_status', payload)
             instance_info = f" ({instance_name or ha_instance_id})" if ha_instance_id else ""
             _logger.info(f"Broadcast WebSocket status{instance_info}: {status} - {message}")
         except Exception as e:
@@ -163,6 +233,28 @@ class HaRealtimeUpdate(models.Model):
         except Exception as e:
             _logger.error(f"Failed to broadcast instance_switched: {e}")
 
+    @api.model
+    def notify_instance_channels_changed(self, users=None):
+        """
+        通知前端可訂閱的 HA instance channels 已變更
+
+        實例新增 / 啟用狀態變更，或 entity group 授權變更時呼叫；前端收到後重新取得
+        /odoo_ha_addon/bus_channels 並以 busService.addChannel() 訂閱新的 channel，不需重新載入頁面。
+
+        :param users: 受影響的 res.users（可選，預設廣播給所有用戶）
+        """
+        try:
+            from datetime import datetime
+            payload = {'timestamp': datetime.now().isoformat()}
+            if users is None:
+                self._broadcast_to_users('ha_instance_channels_changed', payload)
+            else:
+                for user in users:
+                    user.partner_id._bus_send('ha_instance_channels_changed', payload)
+            _logger.debug("Broadcast instance channels changed")
+        except Exception as e:
+            _logger.error(f"Failed to broadcast ha_instance_channels_changed: {e}")
+
     @api.model
     def notify_device_registry_update(self, action, device_id, ha_instance_id=None):
         """
@@ -182,7 +274,7 @@ class HaRealtimeUpdate(models.Model):
                 'ha_instance_id': ha_instance_id,
                 'timestamp': datetime.now().isoformat(),
             }
-            self._broadcast_to_users('ha_device_registry_updated', payload)
+            self._broadcast_to_instance(ha_instance_id, 'ha_device_registry_updated', payload)
             _logger.info(
                 f"Broadcast device registry update: {action} - {device_id} "
                 f"(instance: {ha_instance_id})"
@@ -209,10 +301,37 @@ class HaRealtimeUpdate(models.Model):
                 'ha_instance_id': ha_instance_id,
                 'timestamp': datetime.now().isoformat(),
             }
-            self._broadcast_to_users('ha_area_registry_updated', payload)
+            self._broadcast_to_instance(ha_instance_id, 'ha_area_registry_updated', payload)
             _logger.info(
                 f"Broadcast area registry update: {action} - {area_id} "
                 f"(instance: {ha_instance_id})"
             )
         except Exception as e:
-            _logger.error(f"Failed to broadcast area_registry_update: {e}")
\ No newline at end of file
+            _logger.error(f"Failed to broadcast area_registry_update: {e}")
+
+    @api.model
+    def notify_portal_entity_states(self, entity_ids):
+        """
+        推送實體最新狀態到 portal entity channel（每個實體一則 ha_portal_state 通知）
+
+        只推送有分享（直接、群組或裝置分享）的實體，沒有 portal 觀看者的實體不寫入 bus.bus。
+        訂閱權限在 ir.websocket._build_bus_channel_list 檢查，這裡不需要逐一用戶過濾。
+
+        :param entity_ids: ha.entity record IDs
+        """
+        if not entity_ids:
+            return
+        try:
+            shared_ids = self.env['ha.entity.share']._get_shared_entity_ids(entity_ids)
+            if not shared_ids:
+                return
+            entities = self.env['ha.entity'].sudo().browse(shared_ids)
+            # 呼叫端可能以 SQL 直接更新狀態，重新讀取
+            entities.invalidate_recordset(['entity_state', 'last_changed', 'attributes'])
+            for entity in entities:
+                self.env['bus.bus']._sendone(
+                    (entity, PORTAL_STATE_SUBCHANNEL), 'ha_portal_state', portal_state_payload(entity)
+                )
+            _logger.debug(f"Pushed {len(shared_ids)} portal entity states")
+        except Exception as e:
+            _logger.error(f"Failed to push portal entity states: {e}")
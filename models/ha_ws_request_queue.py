@@ -2,6 +2,9 @@ from odoo import models, fields, api
 import logging
 import json
 
+from .common.request_dispatch import RESULT_CHANNEL, notify, request_channel
+from .common.ws_config import WS_SUBSCRIPTION_MAX_BYTES, WS_SUBSCRIPTION_MAX_EVENTS
+
 _logger = logging.getLogger(__name__)
 
 
@@ -29,8 +32,9 @@ class HAWebSocketRequestQueue(models.Model):
     # 訂閱相關欄位
     is_subscription = fields.Boolean(string='Is Subscription', default=False)
     subscription_id = fields.Integer(string='Subscription ID', copy=False, help='Home Assistant 返回的訂閱 ID')
-    events = fields.Text(string='Events', help='收集的事件（JSON 陣列）')
+    event_ids = fields.One2many('ha.ws.request.event', 'request_queue_id', string='Events')
     event_count = fields.Integer(string='Event Count', default=0)
+    event_bytes = fields.Integer(string='Event Bytes', default=0, help='已收集事件的 JSON 總大小')
 
     state = fields.Selection([
         ('pending', 'Pending'),
@@ -48,10 +52,34 @@ class HAWebSocketRequestQueue(models.Model):
     create_date = fields.Datetime(string='Created At', readonly=True)
     write_date = fields.Datetime(string='Updated At', readonly=True)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """建立請求後 NOTIFY 對應實例的 worker（commit 後送出）"""
+        records = super().create(vals_list)
+        for instance_id in set(records.filtered(lambda r: r.state == 'pending').ha_instance_id.ids):
+            notify(self.env.cr, request_channel(instance_id))
+        return records
+
+    def write(self, vals):
+        """
+        狀態或事件數變更時 NOTIFY 等待中的 client（payload 為 request_id）
+
+        'processing' 只是 worker 內部的過渡狀態，client 不需要被喚醒。
+        """
+        res = super().write(vals)
+        if ('state' in vals and vals['state'] != 'processing') or 'event_count' in vals:
+            for record in self:
+                notify(self.env.cr, RESULT_CHANNEL, record.request_id)
+        return res
+
     def add_event(self, event_data):
         """
         添加事件到訂閱請求
 
+        事件以 append-only 方式寫入 ha.ws.request.event（每個事件一列），
+        不再重寫整個 JSON 欄位；超過 WS_SUBSCRIPTION_MAX_EVENTS / WS_SUBSCRIPTION_MAX_BYTES
+        時將訂閱標記為失敗，避免無上限的記憶體與儲存使用。
+
         Args:
             event_data: 事件數據（dict）
         """
@@ -61,24 +89,46 @@ class HAWebSocketRequestQueue(models.Model):
             _logger.warning(f"Request {self.request_id} is not a subscription, cannot add event")
             return
 
-        # 解析現有事件
-        events = json.loads(self.events) if self.events else []
+        if self.state in ('done', 'failed', 'timeout'):
+            _logger.debug(f"Subscription {self.request_id} already {self.state}, dropping event")
+            return
+
+        payload = json.dumps(event_data)
+        event_count = self.event_count + 1
+        event_bytes = self.event_bytes + len(payload)
+
+        if event_count > WS_SUBSCRIPTION_MAX_EVENTS or event_bytes > WS_SUBSCRIPTION_MAX_BYTES:
+            _logger.error(
+                f"Subscription {self.request_id} exceeded limits "
+                f"({event_count} events, {event_bytes} bytes), marking as failed"
+            )
+            self.write({
+                'state': 'failed',
+                'error': f'Subscription exceeded limit of {WS_SUBSCRIPTION_MAX_EVENTS} events '
+                         f'or {WS_SUBSCRIPTION_MAX_BYTES} bytes',
+            })
+            self.event_ids.unlink()
+            return
 
-        # 添加新事件
-        events.append(event_data)
+        self.env['ha.ws.request.event'].create({
+            'request_queue_id': self.id,
+            'payload': payload,
+        })
 
         # 更新記錄
         self.write({
-            'events': json.dumps(events),
-            'event_count': len(events),
+            'event_count': event_count,
+            'event_bytes': event_bytes,
             'state': 'collecting'
         })
 
-        _logger.debug(f"Added event to subscription {self.request_id}, total events: {len(events)}")
+        _logger.debug(f"Added event to subscription {self.request_id}, total events: {event_count}")
 
     def complete_subscription(self):
         """
-        完成訂閱，將收集的事件作為結果
+        完成訂閱，將收集的事件組合為結果
+
+        事件 payload 已經是 JSON 字串，這裡只做一次字串串接，不需要逐一解析。
         """
         self.ensure_one()
 
@@ -86,15 +136,20 @@ class HAWebSocketRequestQueue(models.Model):
             _logger.warning(f"Request {self.request_id} is not a subscription")
             return
 
-        # 將收集的事件設為結果
-        events = json.loads(self.events) if self.events else []
+        self.env.cr.execute("""
+            SELECT payload FROM ha_ws_request_event
+            WHERE request_queue_id = %s
+            ORDER BY id
+        """, (self.id,))
+        payloads = [row[0] for row in self.env.cr.fetchall()]
 
         self.write({
-            'result': json.dumps(events),
+            'result': '[' + ','.join(payloads) + ']',
             'state': 'done'
         })
+        self.event_ids.unlink()
 
-        _logger.info(f"Subscription {self.request_id} completed with {len(events)} events")
+        _logger.info(f"Subscription {self.request_id} completed with {len(payloads)} events")
 
     @api.model
     def cleanup_old_requests(self):
@@ -112,3 +167,24 @@ class HAWebSocketRequestQueue(models.Model):
             count = len(old_requests)
             old_requests.unlink()
             _logger.info(f"Cleaned up {count} old WebSocket requests")
+
+
+class HAWebSocketRequestEvent(models.Model):
+    """
+    訂閱請求收集的事件（append-only）
+
+    每個事件一列，complete_subscription() 時依 id 順序組合為結果後刪除。
+    """
+    _name = 'ha.ws.request.event'
+    _description = 'Home Assistant WebSocket Subscription Event'
+    _order = 'id'
+    _log_access = False
+
+    request_queue_id = fields.Many2one(
+        'ha.ws.request.queue',
+        string='Request',
+        required=True,
+        index=True,
+        ondelete='cascade',
+    )
+    payload = fields.Text(string='Payload', required=True)  # JSON string
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models
+
+from .ha_realtime_update import (
+    INSTANCE_CHANNEL_PREFIX,
+    INSTANCE_SUBCHANNEL,
+    PORTAL_ENTITY_CHANNEL_PREFIX,
+    PORTAL_STATE_SUBCHANNEL,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+class IrWebsocket(models.AbstractModel):
+    """
+    擴展 ir.websocket：將 HA instance channel 的訂閱請求轉換為授權後的 record channel
+
+    前端以字串 'odoo_ha_addon.instance_<id>' 訂閱，這裡在「訂閱時」透過 ir.rule
+    過濾用戶可讀取的 ha.instance，只有通過權限檢查的實例才會加入 channel 列表。
+    因此 ha.realtime.update 發送通知時不需要再逐一用戶過濾。
+
+    Portal 頁面以 'odoo_ha_addon.portal_entity_<id>' 訂閱實體狀態，同樣在訂閱時
+    一次檢查分享權限（直接、群組或裝置分享），轉換為 (ha.entity record, 'ha_portal_state') channel。
+    """
+
+    _inherit = 'ir.websocket'
+
+    def _build_bus_channel_list(self, channels):
+        channels = list(channels)
+        requested_ids = set()
+        requested_entity_ids = set()
+        for channel in list(channels):
+            if isinstance(channel, str) and channel.startswith(INSTANCE_CHANNEL_PREFIX):
+                channels.remove(channel)
+                instance_id = channel[len(INSTANCE_CHANNEL_PREFIX):]
+                if instance_id.isdigit():
+                    requested_ids.add(int(instance_id))
+            elif isinstance(channel, str) and channel.startswith(PORTAL_ENTITY_CHANNEL_PREFIX):
+                channels.remove(channel)
+                entity_id = channel[len(PORTAL_ENTITY_CHANNEL_PREFIX):]
+                if entity_id.isdigit():
+                    requested_entity_ids.add(int(entity_id))
+
+        if requested_ids and self.env.uid:
+            Instance = self.env['ha.instance']
+            if Instance.has_access('read'):
+                # search() 套用 ir.rule（HA User 只會取得授權 entity groups 所屬的實例）
+                instances = Instance.search([('id', 'in', list(requested_ids))])
+                channels.extend((instance, INSTANCE_SUBCHANNEL) for instance in instances)
+            else:
+                _logger.debug(f"User {self.env.uid} has no access to HA instance channels")
+
+        if requested_entity_ids and self.env.uid:
+            # 分享記錄以 sudo 查詢；只有可透過分享觀看的實體才加入 channel
+            entity_ids = self.env['ha.entity.share']._get_accessible_entity_ids(requested_entity_ids)
+            entities = self.env['ha.entity'].sudo().browse(sorted(entity_ids))
+            channels.extend((entity, PORTAL_STATE_SUBCHANNEL) for entity in entities)
+
+        return super()._build_bus_channel_list(channels)
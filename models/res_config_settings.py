@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from odoo import fields, models, api
 from odoo.exceptions import ValidationError
+import json
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -103,6 +104,50 @@ class ResConfigSettings(models.TransientModel):
         help='Maximum number of parallel workers for history sync. Higher values may improve speed but increase system load.'
     )
 
+    ha_history_sync_chunk_size = fields.Integer(
+        string='History Sync Chunk Size',
+        config_parameter='odoo_ha_addon.ha_history_sync_chunk_size',
+        default=20,
+        help='Number of entities requested in one history/stream subscription. '
+             'Each parallel worker processes one chunk at a time.'
+    )
+
+    ha_orphan_grace_syncs = fields.Integer(
+        string='Orphan Grace Period (syncs)',
+        config_parameter='odoo_ha_addon.ha_orphan_grace_syncs',
+        default=3,
+        help='Number of consecutive full state syncs an entity may be missing from Home Assistant '
+             'before it is removed. Its history is then deleted in the background.'
+    )
+
+    ha_history_attribute_allowlist = fields.Char(
+        string='History Attribute Allow-list',
+        config_parameter='odoo_ha_addon.ha_history_attribute_allowlist',
+        help='JSON object overriding the attribute keys kept in history rows per domain, '
+             'e.g. {"sensor": ["friendly_name"], "weather": "*"}. '
+             'unit_of_measurement, device_class and state_class are always kept; "*" keeps all attributes.'
+    )
+
+    ha_history_retention_domains = fields.Char(
+        string='History Retention per Domain',
+        config_parameter='odoo_ha_addon.ha_history_retention_domains',
+        help='JSON object of history retention days per domain, e.g. {"sensor": 30, "binary_sensor": 7}. '
+             'Overrides the retention of each instance; 0 keeps the domain forever.'
+    )
+
+    ha_bus_fanout_mode = fields.Selection(
+        [
+            ('instance', 'Instance Channel'),
+            ('user', 'Per User (Legacy)'),
+        ],
+        string='Realtime Fan-out Mode',
+        config_parameter='odoo_ha_addon.ha_bus_fanout_mode',
+        default='instance',
+        help='Instance Channel: each notification is written once to the HA instance channel; '
+             'access is checked when the browser subscribes. '
+             'Per User: one bus message per user for every notification.'
+    )
+
     # ==================== 注意 ====================
     # 使用 related 欄位 + readonly=False 後，Odoo 會自動處理欄位的讀取和寫入
     # 不需要額外的 compute, inverse, create, write 方法
@@ -184,6 +229,45 @@ class ResConfigSettings(models.TransientModel):
         # 該方法已經包含了完整的錯誤處理和通知邏輯
         return self.ha_instance_id.action_restart_websocket()
 
+    def action_compact_history_attributes(self):
+        """依目前的 allow-list 壓縮既有歷史記錄的 attributes"""
+        self.ensure_one()
+        report = self.env['ha.entity.history'].sudo().compact_history_attributes()
+        if report:
+            lines = [
+                f"• {domain}: {stats['rows']} rows, {stats['bytes_saved'] / 1024:.1f} KB"
+                for domain, stats in sorted(report.items(), key=lambda item: -item[1]['bytes_saved'])
+            ]
+            total = sum(stats['bytes_saved'] for stats in report.values())
+            message = f"Saved {total / 1024 / 1024:.2f} MB of attribute data:\n" + "\n".join(lines)
+        else:
+            message = 'History attributes are already compact.'
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'History Attributes Compacted',
+                'message': message,
+                'type': 'success',
+                'sticky': bool(report),
+            }
+        }
+
+    def action_rebuild_history_rollups(self):
+        """從歷史記錄重建圖表使用的 numeric rollup"""
+        self.ensure_one()
+        count = self.env['ha.entity.history'].sudo().rebuild_history_rollups()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'History Rollups Rebuilt',
+                'message': f'{count} rollup buckets rebuilt from history.',
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
     # ==================== Constraints ====================
 
     @api.constrains('ha_name', 'ha_api_url', 'ha_api_token')
@@ -198,6 +282,51 @@ class ResConfigSettings(models.TransientModel):
                 if not record.ha_api_token:
                     raise ValidationError('Access token is required')
 
+    @api.constrains('ha_history_sync_chunk_size')
+    def _check_history_sync_chunk_size(self):
+        for record in self:
+            if record.ha_history_sync_chunk_size and (record.ha_history_sync_chunk_size < 1 or record.ha_history_sync_chunk_size > 500):
+                raise ValidationError('History sync chunk size must be between 1 and 500 entities.')
+
+    @api.constrains('ha_orphan_grace_syncs')
+    def _check_orphan_grace_syncs(self):
+        for record in self:
+            if record.ha_orphan_grace_syncs and (record.ha_orphan_grace_syncs < 1 or record.ha_orphan_grace_syncs > 1000):
+                raise ValidationError('Orphan grace period must be between 1 and 1000 syncs.')
+
+    @api.constrains('ha_history_attribute_allowlist')
+    def _check_history_attribute_allowlist(self):
+        for record in self:
+            if not record.ha_history_attribute_allowlist:
+                continue
+            try:
+                allowlist = json.loads(record.ha_history_attribute_allowlist)
+            except ValueError:
+                raise ValidationError('History attribute allow-list must be valid JSON.')
+            if not isinstance(allowlist, dict) or not all(
+                keys == '*' or (isinstance(keys, list) and all(isinstance(key, str) for key in keys))
+                for keys in allowlist.values()
+            ):
+                raise ValidationError(
+                    'History attribute allow-list must map each domain to a list of attribute keys or "*".'
+                )
+
+    @api.constrains('ha_history_retention_domains')
+    def _check_history_retention_domains(self):
+        for record in self:
+            if not record.ha_history_retention_domains:
+                continue
+            try:
+                retention = json.loads(record.ha_history_retention_domains)
+            except ValueError:
+                raise ValidationError('History retention per domain must be valid JSON.')
+            if not isinstance(retention, dict) or not all(
+                isinstance(days, int) and days >= 0 for days in retention.values()
+            ):
+                raise ValidationError(
+                    'History retention per domain must map each domain to a number of days (0 keeps forever).'
+                )
+
     @api.constrains('ha_ws_heartbeat_interval')
     def _check_heartbeat_interval(self):
         for record in self:
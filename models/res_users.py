@@ -23,3 +23,13 @@ class ResUsers(models.Model):
         string='Authorized Entity Groups',
         help='Entity groups accessible by this user. Users can only view entities within their authorized groups.'
     )
+
+    def write(self, vals):
+        """Entity group 授權變更時通知用戶前端重新取得可訂閱的 HA instance channels"""
+        result = super().write(vals)
+        if 'ha_entity_group_ids' in vals:
+            # ir.rule 的 domain 以 ormcache 依用戶快取，授權變更後需清除（與 groups_id 變更相同）
+            self.env.registry.clear_cache()
+            self.env['ha.realtime.update'].sudo().notify_instance_channels_changed(self)
+        return result
+
@@ -1,6 +1,6 @@
 /** @odoo-module **/
 
-import { Component, useState, onWillStart } from "@odoo/owl";
+import { Component, useState, onWillStart, onWillUnmount } from "@odoo/owl";
 import { registry } from "@web/core/registry";
 import { useService } from "@web/core/utils/hooks";
 import { user } from "@web/core/user";
@@ -43,6 +43,14 @@ export class HaInstanceDashboard extends Component {
 
             await this.loadInstances();
         });
+
+        // WebSocket 狀態變化時以一次 RPC 更新所有卡片的狀態
+        this.wsStatusHandler = () => this.refreshStatuses();
+        this.haDataService.onGlobalState('websocket_status', this.wsStatusHandler);
+
+        onWillUnmount(() => {
+            this.haDataService.offGlobalState('websocket_status', this.wsStatusHandler);
+        });
     }
 
     /**
@@ -70,6 +78,19 @@ export class HaInstanceDashboard extends Component {
         }
     }
 
+    /**
+     * 只更新各實例的 WebSocket 狀態（/odoo_ha_addon/websocket_statuses）
+     */
+    async refreshStatuses() {
+        const statuses = await this.haDataService.getWebsocketStatuses();
+        for (const instance of this.state.instances) {
+            const status = statuses[instance.id];
+            if (status) {
+                instance.websocket_status = status.status;
+            }
+        }
+    }
+
     /**
      * 跳轉到 HA Info 頁面（指定 instance）
      *
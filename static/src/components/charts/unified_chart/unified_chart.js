@@ -1,7 +1,7 @@
 /** @odoo-module */
 
 import { Component, useRef, onMounted, onWillUpdateProps, onPatched, onWillUnmount } from "@odoo/owl";
-import { useService } from "@web/core/utils/hooks";
+import { useBus, useService } from "@web/core/utils/hooks";
 import { debug } from "../../../util/debug";
 import { isLightColor } from "../../../util/color";
 import { TIMELINE_LABEL_FONT_SIZE, MIN_BAR_WIDTH_FOR_LABEL } from "../../../constants";
@@ -73,6 +73,9 @@ export class UnifiedChart extends Component {
     type: String,
     data: Object,
     options: Object,
+    // 即時追加：liveBus 上的 "live-patch" 事件（detail.key === liveKey）直接修改圖表資料
+    liveBus: { type: Object, optional: true },
+    liveKey: { type: String, optional: true },
   };
 
   setup() {
@@ -80,6 +83,14 @@ export class UnifiedChart extends Component {
     this.chartService = useService("chart");
     this.chartInstance = null;
 
+    if (this.props.liveBus) {
+      useBus(this.props.liveBus, "live-patch", (ev) => {
+        if (ev.detail.key === this.props.liveKey) {
+          this.applyLivePatch(ev.detail);
+        }
+      });
+    }
+
     onMounted(() => {
       debug("UnifiedChart mounted, attempting to render chart...");
       this.tryRenderChart();
@@ -188,6 +199,32 @@ export class UnifiedChart extends Component {
     }
   }
 
+  /**
+   * 追加即時資料點：移除末端 removeTail 點（重算中的時間桶）、追加新點，
+   * 再從開頭丟棄 dropHead 點（滑動視窗），只更新第一個 dataset，不重建圖表
+   * @param {{removeTail: number, dropHead: number, labels: Array, values: Array}} patch
+   */
+  applyLivePatch({ removeTail, dropHead, labels, values }) {
+    const chart = this.chartInstance;
+    if (!chart || !chart.data.labels || !chart.data.datasets.length) {
+      return;
+    }
+    const chartLabels = chart.data.labels;
+    const data = chart.data.datasets[0].data;
+    if (removeTail) {
+      chartLabels.splice(chartLabels.length - removeTail, removeTail);
+      data.splice(data.length - removeTail, removeTail);
+    }
+    chartLabels.push(...labels);
+    data.push(...values);
+    if (dropHead) {
+      chartLabels.splice(0, dropHead);
+      data.splice(0, dropHead);
+    }
+    // 'none'：不播放動畫，避免每個事件都重畫過場
+    chart.update("none");
+  }
+
   updateChart(nextProps) {
     // 檢查 chartInstance 是否有效（有 update 方法）
     if (this.chartInstance && typeof this.chartInstance.update === 'function' && nextProps.data) {
@@ -57,3 +57,13 @@ export const TIMELINE_LABEL_FONT_SIZE = 10;
 
 /** 無效狀態的虛線樣式 [dash, gap] */
 export const UNAVAILABLE_DASH_PATTERN = [5, 5];
+
+// ============================================
+// HaHistory 即時更新
+// ============================================
+
+/** 即時狀態變更後重新準備 Timeline / 合併圖表的最短間隔 (毫秒) */
+export const HISTORY_LIVE_REDRAW_MS = 2000; // 2 秒
+
+/** Numeric 即時時間桶的最小寬度 (毫秒)，與伺服器端 1 秒的最小桶一致 */
+export const HISTORY_LIVE_MIN_BUCKET_MS = 1000;
@@ -3,6 +3,7 @@
 import { useState } from "@odoo/owl";
 import { callService as portalCallService, fetchState } from "../portal_entity_service";
 import { createActionExecutor, buildActionsFromConfig } from "../../hooks/entity_control";
+import { usePortalLiveState } from "./usePortalLiveState";
 
 /**
  * Portal-specific Entity Control Hook
@@ -14,9 +15,10 @@ import { createActionExecutor, buildActionsFromConfig } from "../../hooks/entity
  * - actions: { toggle, turnOn, turnOff, ..., callService }
  * - entityId, domain: metadata
  * - refresh: Portal-specific manual refresh method
+ * - live updates (bus, batched polling fallback) when urls.statesUrl is given
  *
  * @param {Object} entityData - Entity initial data { id, domain, entity_state, ... }
- * @param {Object} urls - API endpoint URLs { stateUrl, serviceUrl }
+ * @param {Object} urls - API endpoint URLs { stateUrl, serviceUrl, statesUrl }
  * @returns {Object} { state, actions, entityId, domain, refresh }
  *   - state: Reactive state with entityState, attributes, isLoading, error
  *   - actions: Domain-specific actions plus generic callService(service, additionalData)
@@ -31,6 +33,7 @@ export function usePortalEntityControl(entityData, urls = {}) {
     const domain = entityData.domain;
     const stateUrl = urls.stateUrl;
     const serviceUrl = urls.serviceUrl;
+    const statesUrl = urls.statesUrl;
 
     const state = useState({
         entityState: entityData.entity_state || "unknown",
@@ -39,6 +42,18 @@ export function usePortalEntityControl(entityData, urls = {}) {
         error: null,
     });
 
+    // Live updates: pushed over the bus, batched page-wide polling as the fallback
+    if (statesUrl) {
+        usePortalLiveState({
+            statesUrl,
+            onEntityState: (payload) => {
+                state.entityState = payload.entity_state;
+                state.attributes = payload.attributes || {};
+            },
+            getEntityIds: () => [odooId],
+        });
+    }
+
     // Create service caller using portal service (no token needed)
     const serviceCaller = async (serviceDomain, service, serviceData) => {
         const result = await portalCallService(serviceUrl, serviceDomain, service, serviceData);
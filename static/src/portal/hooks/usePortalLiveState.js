@@ -0,0 +1,242 @@
+/** @odoo-module **/
+
+import { onMounted, onWillUnmount, useEnv } from "@odoo/owl";
+import { fetchStates } from "../portal_entity_service";
+
+export const PORTAL_STATE_NOTIFICATION = "ha_portal_state";
+export const PORTAL_ENTITY_CHANNEL_PREFIX = "odoo_ha_addon.portal_entity_";
+
+// Fallback polling interval when the bus is unavailable or disconnected
+const FALLBACK_POLL_INTERVAL = 5000;
+
+// Fields requested from the batched state endpoint (same shape as the bus payload)
+const BATCH_STATE_FIELDS = ["entity_state", "last_changed", "attributes"];
+
+// One batch poller per batched state endpoint, shared by every component on the page
+const batchPollers = new Map();
+
+/**
+ * Page-wide poller for the batched state endpoint (/my/ha/<instance_id>/states)
+ * All followed entities are fetched in one request per interval, and only
+ * entities changed since the previous response's `cursor` are returned.
+ *
+ * @param {string} statesUrl - Batched state endpoint URL
+ * @returns {Object} { add, remove, schedule, startPolling, stopPolling }
+ */
+function getBatchPoller(statesUrl) {
+    if (batchPollers.has(statesUrl)) {
+        return batchPollers.get(statesUrl);
+    }
+
+    const listeners = new Map(); // entity id -> Set of callbacks
+    const pollingClients = new Set();
+    let cursor = null;
+    let generation = 0; // Bumped when entities are added: the next poll must return full state
+    let pollTimer = null;
+    let scheduled = null;
+
+    async function poll() {
+        scheduled = null;
+        const entityIds = [...listeners.keys()];
+        if (!entityIds.length) return;
+
+        const requestGeneration = generation;
+        try {
+            const result = await fetchStates(statesUrl, {
+                entityIds,
+                since: cursor,
+                fields: BATCH_STATE_FIELDS,
+            });
+            if (!result.success) return;
+
+            if (requestGeneration === generation) {
+                cursor = result.data.cursor || null;
+            }
+            for (const payload of result.data.entities) {
+                for (const callback of listeners.get(payload.id) || []) {
+                    callback(payload);
+                }
+            }
+        } catch (error) {
+            console.warn("[usePortalLiveState] Batched polling error:", error);
+            // Continue polling even on error
+        }
+    }
+
+    const poller = {
+        add(ids, callback) {
+            for (const id of ids) {
+                if (!listeners.has(id)) {
+                    listeners.set(id, new Set());
+                    cursor = null;
+                    generation++;
+                }
+                listeners.get(id).add(callback);
+            }
+        },
+        remove(ids, callback) {
+            for (const id of ids) {
+                const callbacks = listeners.get(id);
+                if (!callbacks) continue;
+                callbacks.delete(callback);
+                if (!callbacks.size) {
+                    listeners.delete(id);
+                }
+            }
+        },
+        // Poll once soon; components mounting together share a single request
+        schedule() {
+            if (!scheduled) {
+                scheduled = setTimeout(poll, 0);
+            }
+        },
+        startPolling(client) {
+            pollingClients.add(client);
+            if (!pollTimer) {
+                pollTimer = setInterval(poll, FALLBACK_POLL_INTERVAL);
+            }
+        },
+        stopPolling(client) {
+            pollingClients.delete(client);
+            if (!pollingClients.size && pollTimer) {
+                clearInterval(pollTimer);
+                pollTimer = null;
+            }
+        },
+    };
+    batchPollers.set(statesUrl, poller);
+    return poller;
+}
+
+/**
+ * Portal Live State Hook
+ * Pushes entity state updates over the Odoo bus, polling only as a fallback
+ *
+ * - Bus available: subscribes one channel per entity ('odoo_ha_addon.portal_entity_<id>');
+ *   the server checks share access once when the channel is added, then every
+ *   state change arrives as a 'ha_portal_state' notification
+ * - Bus unavailable or disconnected: polls every 5 seconds (paused while the tab is hidden)
+ *   - with `statesUrl`: every component on the page shares one batched request per
+ *     interval, and only entities changed since the last response are returned
+ *   - otherwise: poll() should send the last `version` as `since` so unchanged polls return no data
+ * - The state is also synced once on mount and after a reconnect to catch up on missed changes
+ *
+ * @param {Object} options
+ * @param {Function} [options.poll] - Async function fetching state from the state endpoint (unused with statesUrl)
+ * @param {Function} options.onEntityState - Called with each pushed or polled payload { id, entity_state, last_changed, attributes }
+ * @param {Function} [options.getEntityIds] - Returns the Odoo entity record IDs to follow on mount
+ * @param {string} [options.statesUrl] - Batched state endpoint URL (/my/ha/<instance_id>/states)
+ * @returns {Object} { follow }
+ *   - follow: Function(ids) to follow entities discovered later (e.g. group members)
+ */
+export function usePortalLiveState({ poll, onEntityState, getEntityIds = () => [], statesUrl = null }) {
+    const env = useEnv();
+    const busService = env.services?.bus_service;
+    const batchPoller = statesUrl ? getBatchPoller(statesUrl) : null;
+    const client = {}; // Identity of this component in the shared batch poller
+    const followed = new Set();
+    let busConnected = Boolean(busService);
+    let polling = false;
+    let pollTimer = null;
+
+    function onNotification(payload) {
+        if (payload && followed.has(payload.id)) {
+            onEntityState(payload);
+        }
+    }
+
+    function follow(ids) {
+        const added = ids.filter((id) => id && !followed.has(id));
+        for (const id of added) {
+            followed.add(id);
+            busService?.addChannel(`${PORTAL_ENTITY_CHANNEL_PREFIX}${id}`);
+        }
+        batchPoller?.add(added, onEntityState);
+    }
+
+    function sync() {
+        if (batchPoller) {
+            batchPoller.schedule();
+        } else {
+            poll();
+        }
+    }
+
+    function startPolling() {
+        if (polling) return; // Avoid duplicate timers
+        polling = true;
+
+        // Fetch immediately on start
+        sync();
+
+        if (batchPoller) {
+            batchPoller.startPolling(client);
+        } else {
+            pollTimer = setInterval(() => {
+                poll();
+            }, FALLBACK_POLL_INTERVAL);
+        }
+    }
+
+    function stopPolling() {
+        if (!polling) return;
+        polling = false;
+
+        if (batchPoller) {
+            batchPoller.stopPolling(client);
+        } else {
+            clearInterval(pollTimer);
+            pollTimer = null;
+        }
+    }
+
+    function updatePolling() {
+        if (busConnected || document.hidden) {
+            stopPolling();
+        } else {
+            startPolling();
+        }
+    }
+
+    function onDisconnect() {
+        busConnected = false;
+        updatePolling();
+    }
+
+    function onReconnect() {
+        busConnected = true;
+        stopPolling();
+        // Catch up on changes pushed while the connection was down
+        sync();
+    }
+
+    onMounted(() => {
+        follow(getEntityIds());
+        if (busService) {
+            busService.subscribe(PORTAL_STATE_NOTIFICATION, onNotification);
+            busService.addEventListener?.("disconnect", onDisconnect);
+            busService.addEventListener?.("reconnect", onReconnect);
+            busService.start();
+            // Initial sync: state may have changed between page render and subscription
+            sync();
+        }
+        updatePolling();
+        document.addEventListener("visibilitychange", updatePolling);
+    });
+
+    onWillUnmount(() => {
+        stopPolling();
+        document.removeEventListener("visibilitychange", updatePolling);
+        batchPoller?.remove([...followed], onEntityState);
+        if (busService) {
+            busService.unsubscribe?.(PORTAL_STATE_NOTIFICATION, onNotification);
+            busService.removeEventListener?.("disconnect", onDisconnect);
+            busService.removeEventListener?.("reconnect", onReconnect);
+            for (const id of followed) {
+                busService.deleteChannel(`${PORTAL_ENTITY_CHANNEL_PREFIX}${id}`);
+            }
+        }
+    });
+
+    return { follow };
+}
@@ -32,12 +32,14 @@ export class PortalEntityController extends Component {
         permission: { type: String, optional: true },
         stateUrl: { type: String, optional: true },
         serviceUrl: { type: String, optional: true },
+        statesUrl: { type: String, optional: true },
     };
 
     setup() {
         const urls = {
             stateUrl: this.props.stateUrl,
             serviceUrl: this.props.serviceUrl,
+            statesUrl: this.props.statesUrl,
         };
 
         // Use Portal-specific hook for control logic
@@ -1,21 +1,22 @@
 /** @odoo-module **/
 
-import { Component, useState, onMounted, onWillUnmount } from "@odoo/owl";
+import { Component, useState } from "@odoo/owl";
 import { registry } from "@web/core/registry";
 import { fetchState } from "./portal_entity_service";
+import { usePortalLiveState } from "./hooks/usePortalLiveState";
 
 /**
  * PortalEntityInfo - Entity information display component for Portal pages
  *
  * This component displays entity information with real-time state updates.
- * It handles polling internally and provides reactive state updates.
+ * Updates are pushed over the Odoo bus (usePortalLiveState); polling is the fallback.
  * Authentication is handled via Odoo session cookie (no token needed).
  *
  * Features:
  * - Entity Info Card (ID, state, domain, area)
  * - Live Status Card (large state display)
  * - Attributes Card (dynamic attributes table)
- * - Auto-polling with visibility control
+ * - Live updates over the bus, fallback polling with visibility control
  *
  * Mount point pattern (server-rendered):
  *   <div class="o_portal_entity_info"
@@ -27,6 +28,7 @@ export class PortalEntityInfo extends Component {
     static props = {
         entity: { type: Object },
         stateUrl: { type: String, optional: true },
+        statesUrl: { type: String, optional: true },
     };
 
     setup() {
@@ -38,26 +40,16 @@ export class PortalEntityInfo extends Component {
             stateChanged: false,
         });
 
-        // Store state URL for polling
+        // Store state URL for polling; version is sent as `since` on the next poll
         this.stateUrl = this.props.stateUrl;
-
-        // Polling configuration
-        this.pollTimer = null;
-        this.pollInterval = 5000; // 5 seconds
-
-        // IMPORTANT: Bind visibility handler BEFORE registering event listeners
-        // This ensures the same function reference is used for both add and remove
-        this.onVisibilityChange = this.onVisibilityChange.bind(this);
-
-        // Lifecycle hooks
-        onMounted(() => {
-            this.startPolling();
-            document.addEventListener("visibilitychange", this.onVisibilityChange);
-        });
-
-        onWillUnmount(() => {
-            this.stopPolling();
-            document.removeEventListener("visibilitychange", this.onVisibilityChange);
+        this.version = null;
+
+        usePortalLiveState({
+            poll: () => this.fetchAndUpdate(),
+            onEntityState: (payload) => this.applyState(payload),
+            getEntityIds: () => [this.props.entity.id],
+            // Shares one batched fallback poll with the other live components on the page
+            statesUrl: this.props.statesUrl,
         });
     }
 
@@ -99,61 +91,45 @@ export class PortalEntityInfo extends Component {
     }
 
     // ========================================
-    // Polling Methods
+    // Live State Methods
     // ========================================
 
+    /**
+     * Apply entity state from a poll response or a bus notification
+     * @param {Object} data - { entity_state, last_changed, attributes }
+     */
+    applyState(data) {
+        const newState = data.entity_state;
+
+        // Trigger animation on state change
+        if (this.state.entityState !== newState) {
+            this.state.stateChanged = true;
+            setTimeout(() => {
+                this.state.stateChanged = false;
+            }, 1000);
+        }
+
+        // Update reactive state
+        this.state.entityState = newState;
+        this.state.lastChanged = data.last_changed;
+        this.state.attributes = data.attributes || {};
+    }
+
     async fetchAndUpdate() {
         try {
-            const result = await fetchState(this.stateUrl);
+            const result = await fetchState(this.stateUrl, this.version);
 
-            if (result.success && result.data) {
-                const newState = result.data.entity_state;
-
-                // Trigger animation on state change
-                if (this.state.entityState !== newState) {
-                    this.state.stateChanged = true;
-                    setTimeout(() => {
-                        this.state.stateChanged = false;
-                    }, 1000);
+            if (result.success) {
+                this.version = result.version || null;
+                if (result.data) {
+                    this.applyState(result.data);
                 }
-
-                // Update reactive state
-                this.state.entityState = newState;
-                this.state.lastChanged = result.data.last_changed;
-                this.state.attributes = result.data.attributes || {};
             }
         } catch (error) {
             console.warn("[PortalEntityInfo] Polling error:", error);
             // Continue polling even on error
         }
     }
-
-    startPolling() {
-        if (this.pollTimer) return; // Avoid duplicate timers
-
-        // Fetch immediately on start
-        this.fetchAndUpdate();
-
-        // Set up interval
-        this.pollTimer = setInterval(() => {
-            this.fetchAndUpdate();
-        }, this.pollInterval);
-    }
-
-    stopPolling() {
-        if (this.pollTimer) {
-            clearInterval(this.pollTimer);
-            this.pollTimer = null;
-        }
-    }
-
-    onVisibilityChange() {
-        if (document.hidden) {
-            this.stopPolling();
-        } else {
-            this.startPolling();
-        }
-    }
 }
 
 // Register component for <owl-component> tag usage in portal pages
@@ -70,16 +70,17 @@ export async function callService(serviceUrl, domain, service, serviceData) {
 /**
  * Get Entity state
  * @param {string} stateUrl - State endpoint URL (from data-state-url attribute)
- * @returns {Promise<Object>} { success, data: { entity_state, last_changed, attributes }, error }
+ * @param {string} [since] - `version` of the previous response; unchanged state returns `not_modified`
+ * @returns {Promise<Object>} { success, data: { entity_state, last_changed, attributes }, version, not_modified, error }
  */
-export async function fetchState(stateUrl) {
+export async function fetchState(stateUrl, since = null) {
     return _fetch(stateUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
             jsonrpc: '2.0',
             method: 'call',
-            params: {},
+            params: since ? { since } : {},
             id: Date.now()
         })
     }, true);  // isJsonRpc = true
@@ -88,16 +89,50 @@ export async function fetchState(stateUrl) {
 /**
  * Get Entity Group state
  * @param {string} stateUrl - Group state endpoint URL (from data-state-url attribute)
- * @returns {Promise<Object>} { success, data: { name, description, entities: [...] }, error }
+ * @param {string} [since] - `version` of the previous response; unchanged state returns `not_modified`
+ * @returns {Promise<Object>} { success, data: { name, description, entities: [...] }, version, not_modified, error }
  */
-export async function fetchGroupState(stateUrl) {
+export async function fetchGroupState(stateUrl, since = null) {
     return _fetch(stateUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
             jsonrpc: '2.0',
             method: 'call',
-            params: {},
+            params: since ? { since } : {},
+            id: Date.now()
+        })
+    }, true);  // isJsonRpc = true
+}
+
+/**
+ * Get the state of several entities in one request (batched state endpoint)
+ * @param {string} statesUrl - Batched state endpoint URL (/my/ha/<instance_id>/states)
+ * @param {Object} query
+ * @param {number[]} [query.entityIds] - Entity Odoo record IDs
+ * @param {number[]} [query.groupIds] - Entity group IDs (expanded to their entities)
+ * @param {number[]} [query.deviceIds] - Device IDs (expanded to their entities)
+ * @param {string} [query.since] - `cursor` of the previous response; only entities changed since are returned
+ * @param {string[]} [query.fields] - Entity fields to return (`id` is always returned)
+ * @param {string[]} [query.attributes] - Attribute keys to keep
+ * @returns {Promise<Object>} { success, data: { entities, entity_ids, groups, devices, cursor }, error }
+ */
+export async function fetchStates(statesUrl, { entityIds, groupIds, deviceIds, since, fields, attributes } = {}) {
+    const params = {
+        entity_ids: entityIds || [],
+        group_ids: groupIds || [],
+        device_ids: deviceIds || [],
+    };
+    if (since) params.since = since;
+    if (fields) params.fields = fields;
+    if (attributes) params.attributes = attributes;
+    return _fetch(statesUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            jsonrpc: '2.0',
+            method: 'call',
+            params,
             id: Date.now()
         })
     }, true);  // isJsonRpc = true
@@ -111,4 +146,5 @@ export const portalEntityService = {
     callService,
     fetchState,
     fetchGroupState,
+    fetchStates,
 };
@@ -1,8 +1,9 @@
 /** @odoo-module **/
 
-import { Component, useState, onMounted, onWillUnmount } from "@odoo/owl";
+import { Component, useState } from "@odoo/owl";
 import { registry } from "@web/core/registry";
 import { fetchGroupState } from "./portal_entity_service";
+import { usePortalLiveState } from "./hooks/usePortalLiveState";
 import { PortalEntityController } from "./portal_entity_controller";
 
 /**
@@ -15,7 +16,7 @@ import { PortalEntityController } from "./portal_entity_controller";
  * - Group Header Card (name, description, entity count)
  * - Entities Table (with per-entity state updates)
  * - Statistics Cards (total, online, offline counts)
- * - Auto-polling with visibility control
+ * - Live updates over the bus per member entity, fallback polling with visibility control
  * - Permission-based control display
  *
  * Mount point pattern (server-rendered):
@@ -51,27 +52,16 @@ export class PortalGroupInfo extends Component {
             lastStates: {}, // Track previous states for change detection
         });
 
-        // Store URLs for polling and service calls
+        // Store URLs for polling and service calls; version is sent as `since` on the next poll
         this.stateUrl = this.props.stateUrl;
         this.serviceUrl = this.props.serviceUrl;
+        this.version = null;
 
-        // Polling configuration
-        this.pollTimer = null;
-        this.pollInterval = 5000; // 5 seconds
-
-        // IMPORTANT: Bind visibility handler BEFORE registering event listeners
-        // This ensures the same function reference is used for both add and remove
-        this.onVisibilityChange = this.onVisibilityChange.bind(this);
-
-        // Lifecycle hooks
-        onMounted(() => {
-            this.startPolling();
-            document.addEventListener("visibilitychange", this.onVisibilityChange);
-        });
-
-        onWillUnmount(() => {
-            this.stopPolling();
-            document.removeEventListener("visibilitychange", this.onVisibilityChange);
+        // Member entities are followed once the first poll returns them
+        this.liveState = usePortalLiveState({
+            poll: () => this.fetchAndUpdate(),
+            onEntityState: (payload) => this.applyEntityState(payload),
+            getEntityIds: () => this.state.entities.map(e => e.id),
         });
     }
 
@@ -153,12 +143,36 @@ export class PortalGroupInfo extends Component {
     }
 
     // ========================================
-    // Polling Methods
+    // Live State Methods
     // ========================================
 
+    /**
+     * Apply a pushed entity state to the matching member entity
+     * @param {Object} payload - { id, entity_state, last_changed, attributes }
+     */
+    applyEntityState(payload) {
+        const entity = this.state.entities.find(e => e.id === payload.id);
+        if (!entity) return;
+
+        entity.stateChanged = entity.entity_state !== payload.entity_state;
+        entity.entity_state = payload.entity_state;
+        entity.last_changed = payload.last_changed;
+        entity.attributes = payload.attributes || {};
+        this.state.lastStates[payload.id] = payload.entity_state;
+
+        if (entity.stateChanged) {
+            setTimeout(() => {
+                entity.stateChanged = false;
+            }, 1000);
+        }
+    }
+
     async fetchAndUpdate() {
         try {
-            const result = await fetchGroupState(this.stateUrl);
+            const result = await fetchGroupState(this.stateUrl, this.version);
+            if (result.success) {
+                this.version = result.version || null;
+            }
 
             if (result.success && result.data) {
                 const newEntities = result.data.entities || [];
@@ -177,8 +191,9 @@ export class PortalGroupInfo extends Component {
                     };
                 });
 
-                // Update entities array
+                // Update entities array and follow (new) members over the bus
                 this.state.entities = updatedEntities;
+                this.liveState.follow(updatedEntities.map(e => e.id));
 
                 // Clear stateChanged flags after animation
                 setTimeout(() => {
@@ -193,33 +208,6 @@ export class PortalGroupInfo extends Component {
             // Continue polling even on error
         }
     }
-
-    startPolling() {
-        if (this.pollTimer) return; // Avoid duplicate timers
-
-        // Fetch immediately on start
-        this.fetchAndUpdate();
-
-        // Set up interval
-        this.pollTimer = setInterval(() => {
-            this.fetchAndUpdate();
-        }, this.pollInterval);
-    }
-
-    stopPolling() {
-        if (this.pollTimer) {
-            clearInterval(this.pollTimer);
-            this.pollTimer = null;
-        }
-    }
-
-    onVisibilityChange() {
-        if (document.hidden) {
-            this.stopPolling();
-        } else {
-            this.startPolling();
-        }
-    }
 }
 
 // Register component for <owl-component> tag usage in portal pages
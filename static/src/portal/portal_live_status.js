@@ -1,20 +1,21 @@
 /** @odoo-module **/
 
-import { Component, useState, onMounted, onWillUnmount } from "@odoo/owl";
+import { Component, useState } from "@odoo/owl";
 import { registry } from "@web/core/registry";
 import { fetchState } from "./portal_entity_service";
+import { usePortalLiveState } from "./hooks/usePortalLiveState";
 
 /**
  * PortalLiveStatus - Real-time entity state display for Portal sidebar
  *
- * This component displays the current entity state with auto-polling.
+ * This component displays the current entity state with live updates.
  * It's designed for the sidebar Live Status card on portal entity pages.
  *
  * Features:
  * - Large state display
- * - Auto-polling every 5 seconds
+ * - Live updates pushed over the Odoo bus (usePortalLiveState)
  * - Visual feedback on state changes
- * - Visibility-aware polling (pauses when tab is hidden)
+ * - Fallback polling every 5 seconds when the bus is unavailable (pauses when tab is hidden)
  *
  * Props:
  *   entityId: {Number} - Entity Odoo record ID
@@ -36,83 +37,49 @@ export class PortalLiveStatus extends Component {
             stateChanged: false,
         });
 
-        // Store state URL for polling
+        // Store state URL for polling; version is sent as `since` on the next poll
         this.stateUrl = this.props.stateUrl;
+        this.version = null;
 
-        // Polling configuration
-        this.pollTimer = null;
-        this.pollInterval = 5000; // 5 seconds
-
-        // IMPORTANT: Bind visibility handler BEFORE registering event listeners
-        // This ensures the same function reference is used for both add and remove
-        this.onVisibilityChange = this.onVisibilityChange.bind(this);
-
-        // Lifecycle hooks
-        onMounted(() => {
-            this.startPolling();
-            document.addEventListener("visibilitychange", this.onVisibilityChange);
-        });
-
-        onWillUnmount(() => {
-            this.stopPolling();
-            document.removeEventListener("visibilitychange", this.onVisibilityChange);
+        usePortalLiveState({
+            poll: () => this.fetchAndUpdate(),
+            onEntityState: (payload) => this.applyState(payload.entity_state),
+            getEntityIds: () => [this.props.entityId],
         });
     }
 
     // ========================================
-    // Polling Methods
+    // Live State Methods
     // ========================================
 
+    applyState(newState) {
+        // Trigger animation on state change
+        if (this.state.entityState !== newState) {
+            this.state.stateChanged = true;
+            setTimeout(() => {
+                this.state.stateChanged = false;
+            }, 1000);
+        }
+
+        // Update reactive state
+        this.state.entityState = newState;
+    }
+
     async fetchAndUpdate() {
         try {
-            const result = await fetchState(this.stateUrl);
+            const result = await fetchState(this.stateUrl, this.version);
 
-            if (result.success && result.data) {
-                const newState = result.data.entity_state;
-
-                // Trigger animation on state change
-                if (this.state.entityState !== newState) {
-                    this.state.stateChanged = true;
-                    setTimeout(() => {
-                        this.state.stateChanged = false;
-                    }, 1000);
+            if (result.success) {
+                this.version = result.version || null;
+                if (result.data) {
+                    this.applyState(result.data.entity_state);
                 }
-
-                // Update reactive state
-                this.state.entityState = newState;
             }
         } catch (error) {
             console.error("[PortalLiveStatus] Polling error:", error);
             // Continue polling even on error
         }
     }
-
-    startPolling() {
-        if (this.pollTimer) return; // Avoid duplicate timers
-
-        // Fetch immediately on start
-        this.fetchAndUpdate();
-
-        // Set up interval
-        this.pollTimer = setInterval(() => {
-            this.fetchAndUpdate();
-        }, this.pollInterval);
-    }
-
-    stopPolling() {
-        if (this.pollTimer) {
-            clearInterval(this.pollTimer);
-            this.pollTimer = null;
-        }
-    }
-
-    onVisibilityChange() {
-        if (document.hidden) {
-            this.stopPolling();
-        } else {
-            this.startPolling();
-        }
-    }
 }
 
 // Register component for <owl-component> tag usage in portal pages
@@ -38,6 +38,12 @@ export class HaBusBridge extends Component {
       haDataService.handleStateChanged(payload);
     });
 
+    // 批次狀態變更：後端每次 flush 合併為一則訊息
+    busService.subscribe('ha_state_changed_batch', (payload) => {
+      debug('[HaBusBridge] Received ha_state_changed_batch:', payload);
+      haDataService.handleStateChangedBatch(payload);
+    });
+
     busService.subscribe('ha_websocket_status', (payload) => {
       debug('[HaBusBridge] Received ha_websocket_status:', payload);
       haDataService.handleServiceStatus(payload);
@@ -78,6 +84,37 @@ export class HaBusBridge extends Component {
       haDataService.handleAreaRegistryUpdated(payload);
     });
 
+    // 訂閱 HA instance channels（instance-scoped fan-out，權限在訂閱時由後端檢查）
+    // 實例新增 / 啟用變更或授權變更時後端送出 ha_instance_channels_changed，重新取得並同步 channels
+    const instanceChannels = new Set();
+    const refreshInstanceChannels = async () => {
+      const result = await haDataService.getBusChannels();
+      if (!result) {
+        return;
+      }
+      const channels = new Set(result);
+      for (const channel of channels) {
+        if (!instanceChannels.has(channel)) {
+          instanceChannels.add(channel);
+          busService.addChannel(channel);
+        }
+      }
+      for (const channel of [...instanceChannels]) {
+        if (!channels.has(channel)) {
+          instanceChannels.delete(channel);
+          busService.deleteChannel(channel);
+        }
+      }
+      debug('[HaBusBridge] Subscribed instance channels:', [...instanceChannels]);
+    };
+
+    busService.subscribe('ha_instance_channels_changed', (payload) => {
+      debug('[HaBusBridge] Received ha_instance_channels_changed:', payload);
+      refreshInstanceChannels();
+    });
+
+    refreshInstanceChannels();
+
     // 啟動 bus service
     busService.start();
 
@@ -809,7 +809,78 @@ export class HaDataService {
     this.clearCacheForEntity(entity_id);
 
     // 觸發狀態變更回調
-    this.triggerStateChangeCallbacks(entity_id, old_state, new_state);
+    this.triggerStateChangeCallbacks(entity_id, old_state, new_state, data.ha_instance_id);
+  }
+
+  /**
+   * 處理批次狀態變更事件
+   * 後端每次 flush 只發送一則 ha_state_changed_batch，內含多個 entity 的最終狀態
+   * @param {Object} data - { ha_instance_id, changes: [{entity_id, old_state, new_state, ...}] }
+   */
+  handleStateChangedBatch(data) {
+    const changes = (data && data.changes) || [];
+
+    debug(`HA State Changed Batch: ${changes.length} entities`, data);
+
+    for (const change of changes) {
+      this.handleStateChanged(change);
+    }
+  }
+
+  /**
+   * 一次取得所有可用實例的 WebSocket 狀態
+   * @returns {Promise<Object>} {instance_id: {status, is_running, source, heartbeat_age}}
+   */
+  async getWebsocketStatuses() {
+    try {
+      const result = await rpc("/odoo_ha_addon/websocket_statuses");
+      return result.success ? result.data.statuses : {};
+    } catch (error) {
+      console.error("Failed to get WebSocket statuses:", error);
+      return {};
+    }
+  }
+
+  /**
+   * 批次取得多個實體的狀態（一次請求、一次授權）
+   * @param {Object} query - { entityIds, groupIds, deviceIds, since, fields, attributes }
+   *   - since: 前一次回應的 cursor，只回傳之後變更的實體
+   *   - fields / attributes: 只回傳指定的欄位 / attributes key
+   * @returns {Promise<Object|null>} { entities, entity_ids, cursor }，失敗時為 null
+   */
+  async getEntityStates({ entityIds, groupIds, deviceIds, since, fields, attributes } = {}) {
+    try {
+      const result = await rpc("/odoo_ha_addon/entity_states", {
+        entity_ids: entityIds || [],
+        group_ids: groupIds || [],
+        device_ids: deviceIds || [],
+        since: since || null,
+        fields: fields || null,
+        attributes: attributes || null,
+      });
+      if (!result.success) {
+        console.error("Failed to get entity states:", result.error);
+        return null;
+      }
+      return result.data;
+    } catch (error) {
+      console.error("Failed to get entity states:", error);
+      return null;
+    }
+  }
+
+  /**
+   * 取得目前用戶可訂閱的 HA instance bus channels
+   * @returns {Promise<string[]|null>} channel 名稱列表，失敗時為 null（保留目前的訂閱）
+   */
+  async getBusChannels() {
+    try {
+      const result = await rpc("/odoo_ha_addon/bus_channels");
+      return result.success ? result.data.channels : null;
+    } catch (error) {
+      console.error("Failed to get HA bus channels:", error);
+      return null;
+    }
   }
 
   /**
@@ -1110,12 +1181,15 @@ export class HaDataService {
    * @param {string} entity_id - 實體 ID
    * @param {any} oldState - 舊狀態
    * @param {any} newState - 新狀態
+   * @param {number} [haInstanceId] - 來源 HA 實例 ID
    */
-  triggerStateChangeCallbacks(entity_id, oldState, newState) {
+  triggerStateChangeCallbacks(entity_id, oldState, newState, haInstanceId = null) {
     // 可以為狀態變更添加特殊的回調處理
     this.triggerUpdateCallbacks(entity_id, {
+      entity_id,
       old_state: oldState,
       new_state: newState,
+      ha_instance_id: haInstanceId,
     });
   }
 
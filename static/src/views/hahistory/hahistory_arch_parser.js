@@ -1,21 +1,26 @@
 /** @odoo-module */
 
 /**
- * <hahistory domain="sensor,switch,..." limit="5000" max_points_per_entity="500"/> 的 props parser
+ * <hahistory domain="sensor,switch,..." limit="5000" max_points_per_entity="500" downsample="avg"/> 的 props parser
  *
  * limit: fallback 上限（用於非降採樣模式）
  * max_points_per_entity: 每個 entity 伺服器端降採樣最大點數（預設 500）
+ * downsample: numeric entities 的預設降採樣演算法（avg / lttb / minmax，使用者可在工具列切換）
  */
+export const DOWNSAMPLE_ALGORITHMS = ["avg", "lttb", "minmax"];
+
 export class HaHistoryArchParser {
   parse(xmlDoc) {
     const domains = (xmlDoc.getAttribute("domain") || "").split(",");
     const limit = parseInt(xmlDoc.getAttribute("limit"), 10) || 5000;
     const maxPointsPerEntity =
       parseInt(xmlDoc.getAttribute("max_points_per_entity"), 10) || 500;
+    const downsample = xmlDoc.getAttribute("downsample");
     return {
       domains,
       limit,
       maxPointsPerEntity,
+      downsample: DOWNSAMPLE_ALGORITHMS.includes(downsample) ? downsample : "avg",
     };
   }
 }
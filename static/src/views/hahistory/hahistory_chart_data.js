@@ -0,0 +1,556 @@
+/** @odoo-module */
+
+/**
+ * HaHistory 圖表資料準備（純資料，不含任何 Chart.js callback）
+ *
+ * 本檔案同時被兩種方式載入：
+ * - web.assets_backend bundle：worker 無法使用時由 renderer 在主執行緒直接呼叫
+ * - hahistory_chart_worker.js（module worker）以原始 ES module 匯入
+ *
+ * 因此不可 import 其他模組，輸出也必須可被 structured clone（不含函式）。
+ * Chart.js 的 options / callbacks 由 renderer 在主執行緒依 spec.kind 組裝。
+ */
+
+// ============================================================================
+// Domain 分類常數
+// ============================================================================
+
+export const NUMERIC_DOMAINS = new Set([
+  "sensor",
+  "input_number",
+  "number",
+  "counter",
+]);
+
+export const BINARY_DOMAINS = new Set([
+  "binary_sensor",
+  "switch",
+  "light",
+  "input_boolean",
+  "automation",
+  "script",
+]);
+
+export const CATEGORICAL_DOMAINS = new Set([
+  "climate",
+  "fan",
+  "cover",
+  "lock",
+  "media_player",
+  "vacuum",
+]);
+
+// 二元狀態：返回 1 的狀態值
+export const BINARY_ON_STATES = new Set([
+  "on",
+  "home",
+  "true",
+  "open",
+  "locked",
+  "playing",
+  "cleaning",
+]);
+
+// 無效狀態集合（設備離線或狀態未知）
+export const UNAVAILABLE_STATES = new Set([
+  "unavailable",
+  "unknown",
+]);
+
+// Unavailable 狀態視覺化配置
+export const UNAVAILABLE_COLOR = "#bdbdbd";  // 灰色
+export const UNAVAILABLE_VALUE = -999;  // 特殊標記值（用於 binary/categorical 圖表）
+
+// 分類狀態映射表
+export const CATEGORICAL_STATE_MAPS = {
+  climate: {
+    off: 0,
+    cool: 1,
+    heat: 2,
+    auto: 3,
+    dry: 4,
+    fan_only: 5,
+    heat_cool: 6,
+  },
+  fan: { off: 0, low: 1, medium: 2, high: 3, auto: 4 },
+  cover: { closed: 0, closing: 1, opening: 2, open: 3 },
+  lock: { unlocked: 0, unlocking: 1, locking: 2, locked: 3 },
+  media_player: { off: 0, idle: 1, paused: 2, playing: 3, standby: 4, on: 5 },
+  vacuum: { docked: 0, idle: 1, returning: 2, cleaning: 3, error: 4, paused: 5 },
+};
+
+// 分類狀態顏色映射 (Material Design 風格)
+export const CATEGORICAL_COLOR_MAPS = {
+  climate: {
+    0: "#9E9E9E", // off - 灰色
+    1: "#2196F3", // cool - 藍色
+    2: "#FF9800", // heat - 橙色
+    3: "#4CAF50", // auto - 綠色
+    4: "#FFC107", // dry - 黃色
+    5: "#00BCD4", // fan_only - 青色
+    6: "#4CAF50", // heat_cool - 綠色
+  },
+  fan: {
+    0: "#9E9E9E", // off - 灰色
+    1: "#81C784", // low - 淺綠
+    2: "#4CAF50", // medium - 綠色
+    3: "#2E7D32", // high - 深綠
+    4: "#9C27B0", // auto - 紫色
+  },
+  cover: {
+    0: "#9E9E9E", // closed - 灰色
+    1: "#BDBDBD", // closing - 淺灰
+    2: "#81C784", // opening - 淺綠
+    3: "#4CAF50", // open - 綠色
+  },
+  lock: {
+    0: "#F44336", // unlocked - 紅色
+    1: "#FF9800", // unlocking - 橙色
+    2: "#2196F3", // locking - 藍色
+    3: "#4CAF50", // locked - 綠色
+  },
+  media_player: {
+    0: "#9E9E9E", // off - 灰色
+    1: "#BDBDBD", // idle - 淺灰
+    2: "#FF9800", // paused - 橙色
+    3: "#4CAF50", // playing - 綠色
+    4: "#2196F3", // standby - 藍色
+    5: "#9C27B0", // on - 紫色
+  },
+  vacuum: {
+    0: "#4CAF50", // docked - 綠色
+    1: "#9E9E9E", // idle - 灰色
+    2: "#2196F3", // returning - 藍色
+    3: "#F44336", // cleaning - 紅色
+    4: "#D32F2F", // error - 深紅
+    5: "#FF9800", // paused - 橙色
+  },
+};
+
+/**
+ * Binary 狀態顏色
+ */
+export const BINARY_COLORS = {
+  on: '#4CAF50',   // 綠色 (Material Design)
+  off: '#9E9E9E',  // 灰色 (Material Design)
+  unavailable: UNAVAILABLE_COLOR,
+};
+
+/**
+ * Domain 的顯示標題
+ */
+export const DOMAIN_TITLES = {
+  sensor: "Sensors",
+  input_number: "Input Numbers",
+  number: "Numbers",
+  counter: "Counters",
+  binary_sensor: "Binary Sensors",
+  switch: "Switches",
+  light: "Lights",
+  input_boolean: "Input Booleans",
+  climate: "Climate",
+  fan: "Fans",
+  cover: "Covers",
+  lock: "Locks",
+  media_player: "Media Players",
+  vacuum: "Vacuums",
+  automation: "Automations",
+  script: "Scripts",
+  scene: "Scenes",
+};
+
+// ============================================================================
+// 輔助函數
+// ============================================================================
+
+/**
+ * 根據 domain 判斷狀態類型
+ * @param {string} domain
+ * @returns {'numeric'|'binary'|'categorical'|'text'}
+ */
+export function getStateType(domain) {
+  if (NUMERIC_DOMAINS.has(domain)) return "numeric";
+  if (BINARY_DOMAINS.has(domain)) return "binary";
+  if (CATEGORICAL_DOMAINS.has(domain)) return "categorical";
+  return "text";
+}
+
+/**
+ * 檢查狀態是否為無效狀態（unavailable/unknown）
+ * @param {string} state
+ * @returns {boolean}
+ */
+export function isUnavailableState(state) {
+  const normalizedState = state?.toLowerCase?.() || state;
+  return UNAVAILABLE_STATES.has(normalizedState);
+}
+
+/**
+ * 將 entity_state 轉換為數值
+ * @param {string} state
+ * @param {string} domain
+ * @param {'numeric'|'binary'|'categorical'|'text'} stateType
+ * @returns {number}
+ */
+export function stateToValue(state, domain, stateType) {
+  // 先檢查是否為無效狀態
+  if (isUnavailableState(state)) {
+    // Numeric 使用 null（斷開線條），Binary/Categorical 使用特殊標記值
+    return stateType === "numeric" ? null : UNAVAILABLE_VALUE;
+  }
+
+  if (stateType === "numeric") {
+    const num = parseFloat(state);
+    return isNaN(num) ? null : num;
+  }
+  if (stateType === "binary") {
+    return BINARY_ON_STATES.has(state?.toLowerCase?.() || state) ? 1 : 0;
+  }
+  if (stateType === "categorical") {
+    const map = CATEGORICAL_STATE_MAPS[domain] || {};
+    return map[state] ?? -1;
+  }
+  return null;
+}
+
+/**
+ * 取得分類狀態的標籤映射 (value -> label)
+ * @param {string} domain
+ * @returns {Record<number, string>}
+ */
+export function getStateLabels(domain) {
+  const map = CATEGORICAL_STATE_MAPS[domain] || {};
+  const reversed = {};
+  for (const [label, value] of Object.entries(map)) {
+    reversed[value] = label;
+  }
+  return reversed;
+}
+
+/**
+ * 根據字串生成穩定的顏色（用於文字狀態）
+ * @param {string} str - 狀態文字
+ * @returns {string} HSL 顏色字串
+ */
+export function stringToColor(str) {
+  if (!str) return '#9E9E9E';
+  let hash = 0;
+  for (let i = 0; i < str.length; i++) {
+    hash = str.charCodeAt(i) + ((hash << 5) - hash);
+  }
+  const hue = Math.abs(hash % 360);
+  return `hsl(${hue}, 70%, 50%)`;
+}
+
+/**
+ * Series 的圖表標籤（與舊版 records 分組的 key 相同）
+ * @param {{entity_name: string, entity_id_string: string}} series
+ * @returns {string}
+ */
+export function seriesLabel(series) {
+  return `${series.entity_name || "unknown"}(${series.entity_id_string})`;
+}
+
+/**
+ * 取得 series 每一點的 Y 值
+ * numeric series 使用 v（typed array 中以 NaN 表示 null）；
+ * 狀態型 series 只對狀態字典中的每個狀態計算一次
+ * @param {object} series
+ * @param {'numeric'|'binary'|'categorical'|'text'} stateType
+ * @returns {Array<number|null>}
+ */
+export function seriesValues(series, stateType) {
+  if (series.v) {
+    return Array.from(series.v, (value) => (Number.isNaN(value) ? null : value));
+  }
+  const dictValues = series.states.map((state) => stateToValue(state, series.domain, stateType));
+  return Array.from(series.s, (index) => dictValues[index]);
+}
+
+/**
+ * 將 series 轉為 {x, y} 數據點（各 entity 時間點不同的合併圖表使用）
+ * @param {object} series
+ * @param {'numeric'|'binary'|'categorical'|'text'} stateType
+ * @returns {Array<{x: number, y: number|null}>}
+ */
+export function seriesToDataPoints(series, stateType) {
+  const values = seriesValues(series, stateType);
+  return Array.from(series.t, (x, i) => ({ x, y: values[i] }));
+}
+
+/**
+ * 將狀態 series 轉換為時間區段
+ * @param {object} series - 欄位式 series（t: epoch ms, s: 狀態索引, states: 狀態字典）
+ * @param {number} endTime - 結束時間（預設為現在）
+ * @returns {Array} 時間區段 [{state, stateIndex, start, end}]
+ */
+export function seriesToTimelineSegments(series, endTime = Date.now()) {
+  const { t, s, states } = series;
+  const segments = [];
+  for (let i = 0; i < t.length; i++) {
+    segments.push({
+      state: states[s[i]],
+      stateIndex: s[i],
+      start: t[i],
+      end: i + 1 < t.length ? t[i + 1] : endTime,
+    });
+  }
+  return segments;
+}
+
+/**
+ * 將 series 按 domain 分組
+ * @param {object[]} seriesList
+ * @returns {Record<string, object[]>}
+ */
+export function groupSeriesByDomain(seriesList) {
+  return seriesList.reduce((acc, series) => {
+    const domain = series.domain;
+    if (!acc[domain]) {
+      acc[domain] = [];
+    }
+    acc[domain].push(series);
+    return acc;
+  }, {});
+}
+
+// ============================================================================
+// Typed array 傳輸
+// ============================================================================
+
+/**
+ * 將欄位式 series 轉為 typed arrays，並回傳可 transfer 的 buffers
+ * t → Float64Array、v → Float64Array（null 以 NaN 表示）、s → Int32Array
+ * @param {object[]} seriesList
+ * @returns {{series: object[], transfer: ArrayBuffer[], points: number}}
+ */
+export function packSeries(seriesList) {
+  const transfer = [];
+  let points = 0;
+  const series = seriesList.map((item) => {
+    const packed = {
+      entity_name: item.entity_name,
+      entity_id_string: item.entity_id_string,
+      domain: item.domain,
+      t: Float64Array.from(item.t),
+    };
+    transfer.push(packed.t.buffer);
+    if (item.v) {
+      packed.v = Float64Array.from(item.v, (value) => (value === null ? NaN : value));
+      transfer.push(packed.v.buffer);
+    } else {
+      packed.s = Int32Array.from(item.s);
+      packed.states = item.states;
+      transfer.push(packed.s.buffer);
+    }
+    points += item.t.length;
+    return packed;
+  });
+  return { series, transfer, points };
+}
+
+// ============================================================================
+// Timeline 區塊風格
+// ============================================================================
+
+/**
+ * 狀態區段的顏色與標籤
+ * @param {string} state
+ * @param {string} domain
+ * @param {'binary'|'categorical'|'text'} stateType
+ * @returns {{color: string, label: string}}
+ */
+function segmentStyle(state, domain, stateType) {
+  const normalizedState = state?.toLowerCase?.() || state;
+  if (isUnavailableState(normalizedState)) {
+    return { color: UNAVAILABLE_COLOR, label: stateType === "text" ? "N/A" : "Unavailable" };
+  }
+  if (stateType === "binary") {
+    return BINARY_ON_STATES.has(normalizedState)
+      ? { color: BINARY_COLORS.on, label: "On" }
+      : { color: BINARY_COLORS.off, label: "Off" };
+  }
+  if (stateType === "categorical") {
+    const stateValue = (CATEGORICAL_STATE_MAPS[domain] || {})[state];
+    return {
+      color: (CATEGORICAL_COLOR_MAPS[domain] || {})[stateValue] || "#95a5a6",
+      label: getStateLabels(domain)[stateValue] || state,
+    };
+  }
+  // 文字狀態：使用狀態文字生成顏色
+  return { color: stringToColor(state), label: state || "" };
+}
+
+/**
+ * 狀態字典中每個狀態的顏色與標籤（每個狀態只計算一次）
+ * @param {object} series
+ * @param {'binary'|'categorical'|'text'} stateType
+ * @returns {Array<{color: string, label: string}>}
+ */
+function seriesStyles(series, stateType) {
+  return series.states.map((state) => segmentStyle(state, series.domain, stateType));
+}
+
+/**
+ * 將單一 entity 的狀態 series 轉為 Timeline 圖表 spec
+ * 使用多 datasets 方式（每個 segment 一個 dataset），透過 stacking 合併到同一行
+ * @param {object} series
+ * @param {string} entityLabel
+ * @param {'binary'|'categorical'|'text'} stateType
+ * @returns {object}
+ */
+function prepareTimeline(series, entityLabel, stateType) {
+  // series 已依時間排序
+  const segments = seriesToTimelineSegments(series);
+  const styles = seriesStyles(series, stateType);
+
+  let minTime = Infinity;
+  let maxTime = -Infinity;
+  const datasets = segments.map((seg) => {
+    if (seg.start < minTime) minTime = seg.start;
+    if (seg.end > maxTime) maxTime = seg.end;
+    const { color, label } = styles[seg.stateIndex];
+    return {
+      label: label,
+      data: [[seg.start, seg.end]],
+      backgroundColor: color,
+    };
+  });
+
+  return {
+    kind: "timeline",
+    labels: [entityLabel],
+    datasets,
+    minTime,
+    maxTime,
+    segmentCount: segments.length,
+  };
+}
+
+/**
+ * 將單一 entity 的 series 轉為數值型 Line Chart spec
+ * t 直接作為 Time Scale 的 labels，v 作為資料，不建立逐點物件；
+ * unavailable 狀態的 v 為 null，造成線條斷開
+ * @param {object} series
+ * @param {string} entityLabel
+ * @returns {object}
+ */
+function prepareNumeric(series, entityLabel) {
+  return {
+    kind: "numeric",
+    labels: Array.from(series.t),
+    datasets: [
+      {
+        label: entityLabel,
+        data: seriesValues(series, "numeric"),
+        spanGaps: false,  // 不連接 null 值，讓 unavailable 區間顯示為斷開
+      },
+    ],
+  };
+}
+
+/**
+ * 根據 domain 自動選擇圖表類型
+ * @param {object} series
+ * @param {string} entityLabel
+ * @returns {object|null}
+ */
+function prepareSingleChart(series, entityLabel) {
+  if (!series || series.t.length === 0) {
+    return null;
+  }
+  const stateType = getStateType(series.domain);
+  if (stateType === "numeric") {
+    return prepareNumeric(series, entityLabel);  // 保持 Line Chart
+  }
+  // binary / categorical / text 使用 Timeline 區塊風格
+  return prepareTimeline(series, entityLabel, stateType);
+}
+
+/**
+ * 將同一 stateType 的 Binary/Categorical series 合併為 Timeline 圖表 spec
+ * 每個 entity 一行，狀態用顏色區分
+ * @param {object[]} seriesList
+ * @param {'binary'|'categorical'} stateType
+ * @returns {object}
+ */
+function prepareCombinedTimeline(seriesList, stateType) {
+  const labels = seriesList.map(seriesLabel);
+  let minTime = Infinity;
+  let maxTime = -Infinity;
+
+  // 每個 segment 一個 dataset；data 陣列中只有所屬 entity 的位置有值，讓 bar 在同一 Y 位置重疊
+  const datasets = [];
+  for (const [entityIndex, series] of seriesList.entries()) {
+    const styles = seriesStyles(series, stateType);
+    for (const seg of seriesToTimelineSegments(series)) {
+      if (seg.start < minTime) minTime = seg.start;
+      if (seg.end > maxTime) maxTime = seg.end;
+      const { color, label } = styles[seg.stateIndex];
+      const data = new Array(labels.length).fill(null);
+      data[entityIndex] = [seg.start, seg.end];
+      datasets.push({ label, data, backgroundColor: color });
+    }
+  }
+
+  return {
+    kind: "combinedTimeline",
+    labels,
+    datasets,
+    minTime,
+    maxTime,
+    entityCount: labels.length,
+  };
+}
+
+/**
+ * 將同一 domain 的 series 合併為單一圖表 spec（多條線在同一圖表）
+ * @param {object[]} seriesList
+ * @param {'numeric'|'binary'|'categorical'|'text'} stateType
+ * @returns {object}
+ */
+function prepareCombinedChart(seriesList, stateType) {
+  // Binary/Categorical 使用 Timeline 風格
+  if (stateType === "binary" || stateType === "categorical") {
+    return prepareCombinedTimeline(seriesList, stateType);
+  }
+  // 各 entity 的時間點不同，需使用 {x, y} 格式支援 Time Scale
+  return {
+    kind: "combinedLine",
+    stateType,
+    datasets: seriesList.map((series) => ({
+      label: seriesLabel(series),
+      data: seriesToDataPoints(series, stateType),
+      spanGaps: stateType !== "numeric",  // numeric 不連接 null
+    })),
+  };
+}
+
+/**
+ * 準備整個 view 的圖表 spec
+ * @param {object[]} seriesList
+ * @param {'combined'|'separate'} displayMode
+ * @returns {{combinedCharts: object}|{lineCharts: object}}
+ *   combined: { domain: { title, spec } }；separate: { entityLabel: spec | null }
+ */
+export function prepareCharts(seriesList, displayMode) {
+  if (displayMode === "combined") {
+    // 合併模式：按 domain 分組，同 domain 的 entity 合併到同一個圖表
+    const combinedCharts = {};
+    for (const [domain, domainSeries] of Object.entries(groupSeriesByDomain(seriesList))) {
+      if (domainSeries.length === 0) continue;
+      combinedCharts[domain] = {
+        title: DOMAIN_TITLES[domain] || domain,
+        spec: prepareCombinedChart(domainSeries, getStateType(domain)),
+      };
+    }
+    return { combinedCharts };
+  }
+  // 分開模式：每個 entity 一個圖表
+  const lineCharts = {};
+  for (const series of seriesList) {
+    const entityLabel = seriesLabel(series);
+    lineCharts[entityLabel] = prepareSingleChart(series, entityLabel);
+  }
+  return { lineCharts };
+}
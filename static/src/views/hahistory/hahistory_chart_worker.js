@@ -0,0 +1,18 @@
+/**
+ * HaHistory chart worker（module worker）
+ *
+ * 不列入 assets bundle：由 ChartDataWorker 以
+ * new Worker(url, { type: "module" }) 載入，並以原始 ES module 匯入 hahistory_chart_data.js。
+ *
+ * 訊息格式：
+ * - in:  { id, displayMode, series }（series 的 t / v / s 為 transfer 進來的 typed arrays）
+ * - out: { id, charts, elapsed }（charts 為 prepareCharts() 的結果，不含函式）
+ */
+import { prepareCharts } from "./hahistory_chart_data.js";
+
+self.onmessage = (ev) => {
+  const { id, displayMode, series } = ev.data;
+  const started = performance.now();
+  const charts = prepareCharts(series, displayMode);
+  self.postMessage({ id, charts, elapsed: performance.now() - started });
+};
@@ -37,15 +37,18 @@ export class HaHistoryController extends Component {
     // updateKey 用於強制 renderer 更新（當 model.records 變化時）
     this.state = useState({
       displayMode: this.props.context?.hahistory_displayMode || "separate",
+      algorithm: this.props.context?.hahistory_algorithm || this.props.archInfo.downsample || "avg",
       updateKey: 0,
     });
 
     this.model = new this.props.Model(this.orm, this.props.resModel, this.props.archInfo, this.haDataService);
+    this.model.algorithm = this.state.algorithm;
 
     // 整合 Odoo action 系統，讓 Dashboard 能保存/恢復狀態
     useSetupAction({
       getContext: () => ({
         hahistory_displayMode: this.state.displayMode,
+        hahistory_algorithm: this.state.algorithm,
       }),
     });
 
@@ -113,6 +116,7 @@ export class HaHistoryController extends Component {
         "instance_switched",
         this.instanceSwitchedHandler
       );
+      this.model.destroy();
       debug("HaHistory: Cleanup complete");
     });
   }
@@ -123,4 +127,17 @@ export class HaHistoryController extends Component {
   setDisplayMode(mode) {
     this.state.displayMode = mode;
   }
+
+  /**
+   * 切換 numeric entities 的降採樣演算法並重新載入（由 Renderer 調用）
+   */
+  async setAlgorithm(algorithm) {
+    if (algorithm === this.state.algorithm) {
+      return;
+    }
+    this.state.algorithm = algorithm;
+    this.model.algorithm = algorithm;
+    await this.model.loadHistory(this.props.domain);
+    this.state.updateKey++; // 強制 renderer 更新
+  }
 }
@@ -0,0 +1,282 @@
+/** @odoo-module */
+
+import { HISTORY_LIVE_MIN_BUCKET_MS } from "../../constants";
+import { isUnavailableState, seriesLabel } from "./hahistory_chart_data";
+
+/**
+ * HaHistory 即時追加（不經伺服器）
+ *
+ * ha_state_changed(_batch) 已帶有 entity 的最新狀態，直接追加到已載入的欄位式 series：
+ * - numeric：只重算最後一個時間桶（avg 為平均值、minmax 為桶內最小 / 最大點、
+ *   lttb 為與前一點落差最大的點），超出桶寬才開新桶
+ * - 其他 domain：狀態改變時追加一個狀態變化點（與伺服器端相同的去重規則）
+ * - 滑動視窗：丟棄早於可見範圍的點，讓畫面維持載入時的時間跨度
+ *
+ * 每次追加回傳一個 patch，可套用到任何平行陣列（series 的 t/v、Chart.js 的 labels/data）：
+ * {entityId, label, numeric, removeTail, t, v | s, dropHead}
+ */
+
+/**
+ * 解析 Odoo 的 UTC datetime 字串（"YYYY-MM-DD HH:MM:SS"）
+ * @param {string} value
+ * @returns {number|null} epoch ms
+ */
+function parseServerDatetime(value) {
+  if (typeof value !== "string") {
+    return null;
+  }
+  const parsed = Date.parse(value.includes("T") ? value : `${value.replace(" ", "T")}Z`);
+  return Number.isNaN(parsed) ? null : parsed;
+}
+
+/**
+ * 從 search domain 與已載入的 series 推算可見時間範圍
+ * （與伺服器端 _get_time_bounds 相同，只處理純 AND 的 domain）
+ *
+ * @param {Array} domain - search domain
+ * @param {object[]} seriesList
+ * @param {number} now - epoch ms
+ * @returns {{live: boolean, windowMs: number|null}}
+ *   live=false 表示範圍結束於過去，不追加；windowMs=null 表示不裁切
+ */
+export function getLiveWindow(domain, seriesList, now = Date.now()) {
+  let start = null;
+  let end = null;
+  if (!domain.some((leaf) => leaf === "|" || leaf === "!")) {
+    for (const leaf of domain) {
+      if (!Array.isArray(leaf) || leaf.length !== 3 || leaf[0] !== "last_changed") {
+        continue;
+      }
+      const value = parseServerDatetime(leaf[2]);
+      if (value === null) {
+        continue;
+      }
+      if (leaf[1] === ">" || leaf[1] === ">=") {
+        start = start === null ? value : Math.max(start, value);
+      } else if (leaf[1] === "<" || leaf[1] === "<=") {
+        end = end === null ? value : Math.min(end, value);
+      }
+    }
+  }
+  if (end !== null && end < now) {
+    return { live: false, windowMs: null };
+  }
+  if (start === null) {
+    for (const series of seriesList) {
+      if (series.t.length && (start === null || series.t[0] < start)) {
+        start = series.t[0];
+      }
+    }
+  }
+  return { live: true, windowMs: start === null ? null : Math.max(now - start, 0) };
+}
+
+/**
+ * 將 patch 套用到一組平行陣列（in place）
+ * @param {object} patch
+ * @param {Array} labels - 時間陣列（series.t 或 Chart.js labels）
+ * @param {Array} values - 值陣列（series.v / series.s 或 Chart.js dataset data）
+ * @param {Array} newValues - patch 中對應 values 的新值
+ */
+function applyPatch(patch, labels, values, newValues) {
+  if (patch.removeTail) {
+    labels.splice(labels.length - patch.removeTail, patch.removeTail);
+    values.splice(values.length - patch.removeTail, patch.removeTail);
+  }
+  labels.push(...patch.t);
+  values.push(...newValues);
+  if (patch.dropHead) {
+    labels.splice(0, patch.dropHead);
+    values.splice(0, patch.dropHead);
+  }
+}
+
+export class LiveHistoryBuffer {
+  constructor() {
+    this.entries = new Map();
+    this.windowMs = null;
+    this.live = false;
+  }
+
+  /**
+   * 以新載入的 series 重設即時狀態
+   * @param {object[]} seriesList - get_downsampled_history 的欄位式 series（會被 in place 修改）
+   * @param {Array} domain - 本次載入使用的 search domain
+   * @param {string} algorithm - numeric 降採樣演算法（avg / lttb / minmax）
+   * @param {number} maxPoints - 每個 entity 的最大點數
+   */
+  reset(seriesList, domain, algorithm, maxPoints) {
+    const { live, windowMs } = getLiveWindow(domain, seriesList);
+    this.live = live;
+    this.windowMs = windowMs;
+    this.algorithm = algorithm;
+    this.entries = new Map();
+    if (!live) {
+      return;
+    }
+    for (const series of seriesList) {
+      const { t } = series;
+      const numeric = Boolean(series.v);
+      // 與伺服器端相同的 per-entity 桶寬：資料跨度 / max_points
+      const span = t.length > 1 ? t[t.length - 1] - t[0] : windowMs || 0;
+      const entry = {
+        series,
+        label: seriesLabel(series),
+        numeric,
+        bucketMs: Math.max(span / maxPoints, HISTORY_LIVE_MIN_BUCKET_MS),
+        bucket: null,
+        stateIndex: null,
+      };
+      if (numeric && algorithm === "avg" && t.length && series.v[t.length - 1] !== null) {
+        // 伺服器的最後一個桶：點的時間即桶起點，平均值視為一個樣本
+        const last = t.length - 1;
+        entry.bucket = { start: t[last], count: 1, sum: series.v[last], points: [], size: 1 };
+      }
+      if (!numeric) {
+        entry.stateIndex = new Map(series.states.map((state, index) => [state, index]));
+      }
+      this.entries.set(series.entity_id_string, entry);
+    }
+  }
+
+  /**
+   * 目前追蹤中的 entity_id 字串
+   * @returns {string[]}
+   */
+  get entityIds() {
+    return this.live ? [...this.entries.keys()] : [];
+  }
+
+  /**
+   * 追加一個 HA 狀態到對應的 series
+   * @param {string} entityId - HA entity_id（如 sensor.temperature）
+   * @param {object} newState - HA state object（state, last_changed, ...）
+   * @param {number} now - epoch ms（滑動視窗基準）
+   * @returns {object|null} patch；沒有可見變化時為 null
+   */
+  apply(entityId, newState, now = Date.now()) {
+    const entry = this.entries.get(entityId);
+    if (!this.live || !entry || !newState) {
+      return null;
+    }
+    const { series } = entry;
+    const state = newState.state ?? "";
+    const t = Date.parse(newState.last_changed) || now;
+    // 只接受比最後一點新的狀態（重送或亂序的事件略過）
+    if (series.t.length && t < series.t[series.t.length - 1]) {
+      return null;
+    }
+
+    const patch = entry.numeric
+      ? this._numericTail(entry, t, state)
+      : this._stateTail(entry, t, state);
+    if (!patch) {
+      return null;
+    }
+
+    const newValues = entry.numeric ? patch.v : patch.s;
+    if (this.windowMs !== null) {
+      const cutoff = now - this.windowMs;
+      // 保留目前的即時桶，只丟棄更早的點
+      const keep = entry.numeric && entry.bucket ? entry.bucket.size : 1;
+      const total = series.t.length - patch.removeTail + patch.t.length;
+      let dropHead = 0;
+      while (dropHead < total - keep) {
+        const time = dropHead < series.t.length - patch.removeTail
+          ? series.t[dropHead]
+          : patch.t[dropHead - (series.t.length - patch.removeTail)];
+        if (time >= cutoff) {
+          break;
+        }
+        dropHead++;
+      }
+      patch.dropHead = dropHead;
+    }
+    applyPatch(patch, series.t, entry.numeric ? series.v : series.s, newValues);
+    return patch;
+  }
+
+  /**
+   * Numeric：重算最後一個時間桶
+   */
+  _numericTail(entry, t, state) {
+    const value = isUnavailableState(state) ? null : parseFloat(state);
+    const point = { t, v: Number.isFinite(value) ? value : null };
+    const patch = { entityId: entry.series.entity_id_string, label: entry.label, numeric: true, dropHead: 0 };
+
+    if (point.v === null) {
+      // unavailable：追加 null 讓線條斷開，並結束目前的桶
+      entry.bucket = null;
+      return { ...patch, removeTail: 0, t: [t], v: [null] };
+    }
+
+    let bucket = entry.bucket;
+    if (!bucket || t >= bucket.start + entry.bucketMs) {
+      bucket = entry.bucket = { start: t, count: 0, sum: 0, points: [], size: 0 };
+    }
+    bucket.count++;
+    bucket.sum += point.v;
+    bucket.points.push(point);
+
+    const tail = this._bucketPoints(entry, bucket);
+    const removeTail = bucket.size;
+    bucket.size = tail.length;
+    return { ...patch, removeTail, t: tail.map((p) => p.t), v: tail.map((p) => p.v) };
+  }
+
+  /**
+   * 即時桶要顯示的點（依 algorithm）
+   */
+  _bucketPoints(entry, bucket) {
+    if (this.algorithm === "avg") {
+      return [{ t: bucket.start, v: Math.round((bucket.sum / bucket.count) * 100) / 100 }];
+    }
+    if (this.algorithm === "minmax") {
+      let min = bucket.points[0];
+      let max = bucket.points[0];
+      for (const p of bucket.points) {
+        if (p.v < min.v) min = p;
+        if (p.v > max.v) max = p;
+      }
+      return min === max ? [min] : [min, max].sort((a, b) => a.t - b.t);
+    }
+    // lttb：下一個桶尚未出現，三角形面積以前一個保留點為底，等同取與其落差最大的點
+    const { v } = entry.series;
+    const anchorIndex = v.length - bucket.size - 1;
+    const anchor = anchorIndex >= 0 ? v[anchorIndex] : null;
+    if (anchor === null) {
+      return [bucket.points[bucket.points.length - 1]];
+    }
+    let pick = bucket.points[0];
+    for (const p of bucket.points) {
+      if (Math.abs(p.v - anchor) > Math.abs(pick.v - anchor)) pick = p;
+    }
+    return [pick];
+  }
+
+  /**
+   * 狀態型 series：狀態改變時追加狀態變化點
+   */
+  _stateTail(entry, t, state) {
+    const { series } = entry;
+    const { s, states } = series;
+    if (s.length && states[s[s.length - 1]] === state) {
+      return null;
+    }
+    let index = entry.stateIndex.get(state);
+    if (index === undefined) {
+      index = states.length;
+      states.push(state);
+      entry.stateIndex.set(state, index);
+    }
+    return {
+      entityId: series.entity_id_string,
+      label: entry.label,
+      numeric: false,
+      removeTail: 0,
+      t: [t],
+      s: [index],
+      dropHead: 0,
+    };
+  }
+}
@@ -1,22 +1,39 @@
 /** @odoo-module */
 
+import { EventBus } from "@odoo/owl";
 import { KeepLast } from "@web/core/utils/concurrency";
 import { debug } from "../../util/debug";
+import { LiveHistoryBuffer } from "./hahistory_live";
 
-export class HaHistoryModel {
+/**
+ * 載入降採樣後的欄位式 series，並以 ha_state_changed 即時追加到已載入的 series
+ *
+ * 每次追加觸發 "live-patch" 事件（detail 為 hahistory_live.js 的 patch），
+ * 不需要重新呼叫 get_downsampled_history。
+ */
+export class HaHistoryModel extends EventBus {
   constructor(orm, resModel, archInfo, haDataService) {
+    super();
     this.orm = orm;
     this.resModel = resModel;
     this.haDataService = haDataService;
 
-    const { domains, limit, maxPointsPerEntity } = archInfo;
+    const { domains, limit, maxPointsPerEntity, downsample } = archInfo;
     this.domains = domains;
     this.limit = limit;
     this.maxPointsPerEntity = maxPointsPerEntity || 500;
+    // numeric entities 的降採樣演算法（avg / lttb / minmax）
+    this.algorithm = downsample || "avg";
 
     this.keepLast = new KeepLast();
 
-    this.records = [];
+    // 欄位式 series：每個 entity 一筆 {entity_name, entity_id_string, domain, t, v | s + states}
+    this.series = [];
+
+    // 即時追加：只訂閱目前顯示中的 entity
+    this.liveBuffer = new LiveHistoryBuffer();
+    this.liveEntityIds = [];
+    this.onStateChanged = this.onStateChanged.bind(this);
   }
 
   /**
@@ -29,16 +46,61 @@ export class HaHistoryModel {
         domain: domain,
         supported_domains: this.domains,
         max_points: this.maxPointsPerEntity,
+        algorithm: this.algorithm,
       });
 
-      const records = await this.orm.call(
+      const result = await this.orm.call(
         this.resModel,
         "get_downsampled_history",
-        [domain, this.domains, this.maxPointsPerEntity]
+        [domain, this.domains, this.maxPointsPerEntity, this.algorithm],
+        { columnar: true }
       );
 
-      this.records = records;
+      return result.series;
     };
-    return this.keepLast.add(taskFun());
+    const series = await this.keepLast.add(taskFun());
+    this.series = series;
+    this.liveBuffer.reset(series, domain, this.algorithm, this.maxPointsPerEntity);
+    this._subscribeLive(this.liveBuffer.entityIds);
+  }
+
+  /**
+   * 更新 ha_data 的 entity 訂閱（只訂閱新增的、取消已不顯示的）
+   * @param {string[]} entityIds
+   */
+  _subscribeLive(entityIds) {
+    const next = new Set(entityIds);
+    for (const entityId of this.liveEntityIds) {
+      if (!next.has(entityId)) {
+        this.haDataService.offEntityUpdate(entityId, this.onStateChanged);
+      }
+    }
+    const previous = new Set(this.liveEntityIds);
+    for (const entityId of next) {
+      if (!previous.has(entityId)) {
+        this.haDataService.onEntityUpdate(entityId, this.onStateChanged);
+      }
+    }
+    this.liveEntityIds = [...next];
+  }
+
+  /**
+   * ha_data 的 entity 更新回調（ha_state_changed / ha_state_changed_batch）
+   * @param {{entity_id: string, new_state: object, ha_instance_id: number}} data
+   */
+  onStateChanged({ entity_id, new_state, ha_instance_id }) {
+    // 不同 HA 實例可能有相同的 entity_id
+    const currentInstanceId = this.haDataService.currentInstanceId;
+    if (ha_instance_id && currentInstanceId && ha_instance_id !== currentInstanceId) {
+      return;
+    }
+    const patch = this.liveBuffer.apply(entity_id, new_state);
+    if (patch) {
+      this.trigger("live-patch", patch);
+    }
+  }
+
+  destroy() {
+    this._subscribeLive([]);
   }
 }
@@ -0,0 +1,102 @@
+/** @odoo-module */
+
+import { packSeries, prepareCharts } from "./hahistory_chart_data";
+
+const WORKER_URL = "/odoo_ha_addon/static/src/views/hahistory/hahistory_chart_worker.js";
+
+/**
+ * hahistory 圖表資料準備的 Web Worker client
+ *
+ * - series 轉為 typed arrays 後 transfer 給 worker（不經 structured clone 複製）
+ * - 新的 prepare() 會 terminate 仍在計算的 worker（篩選條件改變時直接中止舊的解析），
+ *   被取代的 prepare() resolve 為 null
+ * - 瀏覽器不支援 module worker 或 worker 載入失敗時，改在主執行緒執行 prepareCharts()
+ */
+export class ChartDataWorker {
+  constructor(url = WORKER_URL) {
+    this.url = url;
+    this.enabled = typeof Worker !== "undefined";
+    this.worker = null;
+    this.pending = null;
+    this.sequence = 0;
+  }
+
+  /**
+   * @param {object[]} seriesList - 欄位式 series
+   * @param {'combined'|'separate'} displayMode
+   * @returns {Promise<{charts: object, elapsed: number, packTime: number, points: number, inWorker: boolean}|null>}
+   */
+  prepare(seriesList, displayMode) {
+    this.cancel();
+    if (!this.enabled) {
+      return Promise.resolve(this._prepareInline(seriesList, displayMode));
+    }
+
+    const id = ++this.sequence;
+    const packStarted = performance.now();
+    const { series, transfer, points } = packSeries(seriesList);
+    const packTime = performance.now() - packStarted;
+
+    return new Promise((resolve) => {
+      this.pending = {
+        id,
+        resolve: (reply) => resolve(reply && { ...reply, packTime, points, inWorker: true }),
+        // worker 無法使用：停用並改在主執行緒計算同一個請求
+        fallback: () => resolve(this._prepareInline(seriesList, displayMode)),
+      };
+      this._ensureWorker().postMessage({ id, displayMode, series }, transfer);
+    });
+  }
+
+  /**
+   * 中止仍在計算的請求（terminate worker，下次 prepare() 重新建立）
+   */
+  cancel() {
+    if (!this.pending) {
+      return;
+    }
+    const { resolve } = this.pending;
+    this.pending = null;
+    this.worker?.terminate();
+    this.worker = null;
+    resolve(null);
+  }
+
+  destroy() {
+    this.cancel();
+    this.worker?.terminate();
+    this.worker = null;
+  }
+
+  _ensureWorker() {
+    if (!this.worker) {
+      this.worker = new Worker(this.url, { type: "module" });
+      this.worker.onmessage = (ev) => {
+        // 只接受目前請求的回覆（已被取代的 id 直接忽略）
+        if (this.pending && ev.data.id === this.pending.id) {
+          const { resolve } = this.pending;
+          this.pending = null;
+          resolve({ charts: ev.data.charts, elapsed: ev.data.elapsed });
+        }
+      };
+      this.worker.onerror = (ev) => {
+        ev.preventDefault?.();
+        console.warn("HaHistory chart worker unavailable, preparing charts on the main thread", ev.message);
+        this.enabled = false;
+        this.worker?.terminate();
+        this.worker = null;
+        const pending = this.pending;
+        this.pending = null;
+        pending?.fallback();
+      };
+    }
+    return this.worker;
+  }
+
+  _prepareInline(seriesList, displayMode) {
+    const started = performance.now();
+    const charts = prepareCharts(seriesList, displayMode);
+    const points = seriesList.reduce((total, series) => total + series.t.length, 0);
+    return { charts, elapsed: performance.now() - started, packTime: 0, points, inWorker: false };
+  }
+}
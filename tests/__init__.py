@@ -7,3 +7,21 @@ from . import test_share_permissions
 from . import test_entity_share
 from . import test_share_wizard
 from . import test_security
+from . import test_state_ingestion
+from . import test_bus_fanout
+from . import test_request_dispatch
+from . import test_history_bulk_insert
+from . import test_history_watermark
+from . import test_entity_bulk_upsert
+from . import test_history_attributes
+from . import test_history_partitions
+from . import test_history_rollups
+from . import test_history_downsampling
+from . import test_history_source_sql
+from . import test_entity_registry_relations
+from . import test_entity_orphans
+from . import test_event_loop_pool
+from . import test_ws_liveness
+from . import test_portal_live_state
+from . import test_share_access_index
+from . import test_portal_batch_states
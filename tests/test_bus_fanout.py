@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for instance-scoped bus fan-out of realtime notifications.
+"""
+
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestBusFanout(TransactionCase):
+    """Test cases for instance channel fan-out and subscription-time access checks"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Fanout Test HA Instance',
+            'api_url': 'http://fanout-test.local:8123',
+            'api_token': 'fanout_test_token_12345',
+            'active': True,
+        })
+
+        cls.ha_manager_user = cls.env['res.users'].sudo().create({
+            'name': 'Fanout Test Manager',
+            'login': 'fanout_test_manager',
+            'email': 'fanout_manager@test.local',
+            'groups_id': [(6, 0, [
+                cls.env.ref('base.group_user').id,
+                cls.env.ref('odoo_ha_addon.group_ha_manager').id
+            ])]
+        })
+
+        cls.ha_user = cls.env['res.users'].sudo().create({
+            'name': 'Fanout Test HA User',
+            'login': 'fanout_test_ha_user',
+            'email': 'fanout_ha_user@test.local',
+            'groups_id': [(6, 0, [
+                cls.env.ref('base.group_user').id,
+                cls.env.ref('odoo_ha_addon.group_ha_user').id
+            ])]
+        })
+
+        cls.channel_name = f'odoo_ha_addon.instance_{cls.ha_instance.id}'
+
+    def _instance_channels(self, user):
+        channels = self.env['ir.websocket'].with_user(user)._build_bus_channel_list([self.channel_name])
+        return [c for c in channels if isinstance(c, tuple) and c[0]._name == 'ha.instance']
+
+    def test_manager_subscribes_to_instance_channel(self):
+        """Manager 訂閱字串 channel 時應被轉換為 instance record channel"""
+        channels = self._instance_channels(self.ha_manager_user)
+        self.assertEqual(len(channels), 1)
+        self.assertEqual(channels[0][0].id, self.ha_instance.id)
+
+    def test_unauthorized_user_does_not_get_instance_channel(self):
+        """沒有 entity group 權限的 ha_user 不應取得 instance channel"""
+        self.assertEqual(self._instance_channels(self.ha_user), [])
+
+    def test_batch_notification_writes_single_bus_message(self):
+        """Instance 模式下一批狀態變更只寫入一筆 bus.bus"""
+        self.env['ir.config_parameter'].sudo().set_param('odoo_ha_addon.ha_bus_fanout_mode', 'instance')
+        before = self.env['bus.bus'].sudo().search_count([])
+
+        self.env['ha.realtime.update'].notify_entity_state_changes([
+            ('sensor.a', {'state': '1'}, {'state': '2'}),
+            ('sensor.b', {'state': 'on'}, {'state': 'off'}),
+        ], ha_instance_id=self.ha_instance.id)
+
+        self.assertEqual(self.env['bus.bus'].sudo().search_count([]) - before, 1)
+
+    def _channels_changed_targets(self, sendone):
+        return [
+            call.args[1] for call in sendone.call_args_list
+            if call.args[2] == 'ha_instance_channels_changed'
+        ]
+
+    def test_new_instance_notifies_channel_refresh(self):
+        """新增實例時通知前端重新取得 bus channels"""
+        BusBus = self.registry['bus.bus']
+        with patch.object(BusBus, '_sendone', autospec=True) as sendone:
+            self.env['ha.instance'].sudo().create({
+                'name': 'Fanout Test HA Instance 2',
+                'api_url': 'http://fanout-test-2.local:8123',
+                'api_token': 'fanout_test_token_67890',
+            })
+
+        targets = self._channels_changed_targets(sendone)
+        self.assertIn(self.ha_manager_user.partner_id, targets)
+        self.assertIn(self.ha_user.partner_id, targets)
+
+    def test_group_grant_notifies_user_and_adds_channel(self):
+        """授權 entity group 後通知該用戶重新訂閱，且訂閱時可取得 instance channel"""
+        BusBus = self.registry['bus.bus']
+        with patch.object(BusBus, '_sendone', autospec=True) as sendone:
+            self.env['ha.entity.group'].sudo().create({
+                'name': 'Fanout Test Group',
+                'ha_instance_id': self.ha_instance.id,
+                'user_ids': [(6, 0, [self.ha_user.id])],
+            })
+
+        self.assertEqual(self._channels_changed_targets(sendone), [self.ha_user.partner_id])
+        channels = self._instance_channels(self.ha_user)
+        self.assertEqual([channel[0].id for channel in channels], [self.ha_instance.id])
+
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the set-based entity state reconciliation in _batch_update_entities.
+"""
+
+from datetime import datetime
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common.state_ingestion import get_write_stats
+from odoo.addons.odoo_ha_addon.models.common.utils import compute_state_hash
+
+
+@tagged('post_install', '-at_install')
+class TestEntityBulkUpsert(TransactionCase):
+    """Test cases for the load / diff / insert / update phases"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Bulk Upsert Test HA Instance',
+            'api_url': 'http://bulk-upsert-test.local:8123',
+            'api_token': 'bulk_upsert_test_token_12345',
+            'active': True,
+        })
+        cls.Entity = cls.env['ha.entity'].sudo()
+        cls.last_changed = datetime(2026, 3, 1, 12, 0, 0)
+        cls.unchanged = cls.Entity.create({
+            'name': 'Unchanged',
+            'entity_id': 'sensor.unchanged',
+            'domain': 'sensor',
+            'entity_state': '1',
+            'last_changed': cls.last_changed,
+            'attributes': {'unit_of_measurement': 'W'},
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.changed = cls.Entity.create({
+            'name': 'Changed',
+            'entity_id': 'sensor.changed',
+            'domain': 'sensor',
+            'entity_state': '1',
+            'last_changed': cls.last_changed,
+            'attributes': {},
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.orphan = cls.Entity.create({
+            'name': 'Orphan',
+            'entity_id': 'sensor.orphan',
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        })
+
+    def _record(self, entity_id, state, name, attributes):
+        return {
+            'domain': 'sensor',
+            'entity_id': entity_id,
+            'name': name,
+            'entity_state': state,
+            'last_changed': self.last_changed,
+            'attributes': attributes,
+            'ha_instance_id': self.ha_instance.id,
+        }
+
+    def test_diff_and_apply(self):
+        """新增、變更、未變更與孤立實體分別處理"""
+        stats = self.Entity._batch_update_entities([
+            self._record('sensor.unchanged', '1', 'Unchanged', {'unit_of_measurement': 'W'}),
+            self._record('sensor.changed', '2', 'Changed', {'unit_of_measurement': 'kWh'}),
+            self._record('sensor.new', '3', 'New', {}),
+        ], self.ha_instance.id)
+
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['unchanged'], 1)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(stats['orphaned'], {'sensor.orphan': self.orphan.id})
+        self.assertTrue({'load', 'diff', 'insert', 'update', 'total'} <= set(stats['timings_ms']))
+
+        self.assertEqual(self.changed.entity_state, '2')
+        self.assertEqual(self.changed.attributes, {'unit_of_measurement': 'kWh'})
+        new = self.Entity.search([
+            ('entity_id', '=', 'sensor.new'),
+            ('ha_instance_id', '=', self.ha_instance.id),
+        ])
+        self.assertEqual(new.entity_state, '3')
+        self.assertTrue(self.orphan.exists(), "Orphans are reported, not deleted here")
+
+    def test_update_does_not_sync_back_to_ha(self):
+        """SQL 更新不經過 write()，不會觸發同步回 HA"""
+        with self.assertNoLogs('odoo.addons.odoo_ha_addon.models.ha_entity', level='ERROR'):
+            stats = self.Entity._batch_update_entities([
+                self._record('sensor.changed', '5', 'Renamed In HA', {}),
+            ], self.ha_instance.id)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(self.changed.name, 'Renamed In HA')
+
+    def test_state_hash_ignores_attribute_order(self):
+        """指紋以正規化 attributes 計算，key 順序不影響結果"""
+        self.assertEqual(
+            compute_state_hash('on', {'a': 1, 'b': [1, 2]}),
+            compute_state_hash('on', {'b': [1, 2], 'a': 1}),
+        )
+        self.assertNotEqual(compute_state_hash('on', {}), compute_state_hash('off', {}))
+        self.assertEqual(
+            self.unchanged.state_hash,
+            compute_state_hash('1', {'unit_of_measurement': 'W'}),
+        )
+
+    def test_same_fingerprint_is_skipped_and_counted(self):
+        """指紋相同的實體不寫入，並計入 writes_skipped"""
+        db_name = self.env.cr.dbname
+        before = get_write_stats(db_name, self.ha_instance.id).get(
+            self.ha_instance.id, {'writes_applied': 0, 'writes_skipped': 0}
+        )
+        write_date = self.unchanged.write_date
+
+        stats = self.Entity._batch_update_entities([
+            self._record('sensor.unchanged', '1', 'Unchanged', {'unit_of_measurement': 'W'}),
+            self._record('sensor.changed', '1', 'Changed', {'new': True}),
+        ], self.ha_instance.id)
+
+        self.assertEqual(stats['unchanged'], 1)
+        self.assertEqual(stats['updated'], 1)
+        self.unchanged.invalidate_recordset()
+        self.assertEqual(self.unchanged.write_date, write_date)
+        self.assertEqual(self.changed.state_hash, compute_state_hash('1', {'new': True}))
+
+        after = get_write_stats(db_name, self.ha_instance.id)[self.ha_instance.id]
+        self.assertEqual(after['writes_skipped'] - before['writes_skipped'], 1)
+        self.assertEqual(after['writes_applied'] - before['writes_applied'], 1)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the orphaned entity reconciliation and background purge.
+"""
+
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestEntityOrphans(TransactionCase):
+    """Test cases for _reconcile_orphaned_entities and _cron_purge_orphaned_entities"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Orphan Test HA Instance',
+            'api_url': 'http://orphan-test.local:8123',
+            'api_token': 'orphan_test_token_12345',
+            'active': True,
+        })
+        cls.Entity = cls.env['ha.entity'].sudo()
+        cls.live, cls.gone, cls.recorded = cls.Entity.create([{
+            'name': name,
+            'entity_id': entity_id,
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        } for name, entity_id in (
+            ('Live', 'sensor.orphan_live'),
+            ('Gone', 'sensor.orphan_gone'),
+            ('Recorded', 'sensor.orphan_recorded'),
+        )])
+        now = fields.Datetime.now()
+        cls.env['ha.entity.history'].sudo()._bulk_insert_history([{
+            'entity_id': cls.recorded.id,
+            'domain': 'sensor',
+            'entity_state': str(i),
+            'last_changed': now - timedelta(minutes=i),
+            'last_updated': now - timedelta(minutes=i),
+            'attributes': {},
+        } for i in range(25)])
+
+    def _reconcile(self, ha_entity_ids):
+        return self.Entity._reconcile_orphaned_entities(self.ha_instance.id, ha_entity_ids, grace_syncs=2)
+
+    def _history_count(self, entity):
+        return self.env['ha.entity.history'].sudo().search_count([('entity_id', '=', entity.id)])
+
+    def test_grace_period(self):
+        """缺席未達寬限期時只累計次數"""
+        report = self._reconcile(['sensor.orphan_live'])
+        self.assertEqual(report, {'missing': 2, 'deleted': 0, 'purge_pending': 0})
+        self.assertEqual(self.gone.missing_sync_count, 1)
+        self.assertEqual(self.live.missing_sync_count, 0)
+        self.assertTrue(self.gone.exists())
+
+    def test_reappearing_entity_resets(self):
+        """再次出現的實體歸零"""
+        self._reconcile(['sensor.orphan_live'])
+        self._reconcile(['sensor.orphan_live', 'sensor.orphan_gone', 'sensor.orphan_recorded'])
+        self.assertEqual(self.gone.missing_sync_count, 0)
+        self.assertEqual(self.recorded.missing_sync_count, 0)
+
+    def test_expired_entities(self):
+        """達到寬限期：無歷史直接刪除，有歷史標記待刪除"""
+        self._reconcile(['sensor.orphan_live'])
+        report = self._reconcile(['sensor.orphan_live'])
+        self.assertEqual(report['deleted'], 1)
+        self.assertEqual(report['purge_pending'], 1)
+        self.assertFalse(self.gone.exists())
+        self.assertTrue(self.recorded.purge_pending)
+        self.assertEqual(self._history_count(self.recorded), 25)
+
+        # 待刪除的實體不再累計
+        self._reconcile(['sensor.orphan_live'])
+        self.assertEqual(self.recorded.missing_sync_count, 2)
+
+    def test_background_purge(self):
+        """分批刪除歷史後刪除實體"""
+        self._reconcile(['sensor.orphan_live'])
+        self._reconcile(['sensor.orphan_live'])
+
+        report = self.Entity._cron_purge_orphaned_entities(batch_size=10, auto_commit=False)
+        # 25 筆歷史 + 同一語句維護的 rollup 列
+        self.assertGreaterEqual(report['deleted_rows'], 25)
+        self.assertEqual(self._history_count(self.recorded), 0)
+        self.assertEqual(report['deleted_entities'], 1)
+        self.assertFalse(self.recorded.exists())
+        self.assertTrue(self.live.exists())
+
+    def test_purge_time_budget(self):
+        """超過時間上限時保留實體，下次繼續"""
+        self._reconcile(['sensor.orphan_live'])
+        self._reconcile(['sensor.orphan_live'])
+
+        report = self.Entity._cron_purge_orphaned_entities(batch_size=10, time_budget=-1, auto_commit=False)
+        self.assertEqual(report['remaining'], 1)
+        self.assertTrue(self.recorded.exists())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the set-based entity registry relation reconciliation.
+"""
+
+import logging
+
+from odoo.tests import TransactionCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged('post_install', '-at_install')
+class TestEntityRegistryRelations(TransactionCase):
+    """Test cases for _do_sync_entity_registry_relations"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Registry Relations Test HA Instance',
+            'api_url': 'http://registry-relations-test.local:8123',
+            'api_token': 'registry_relations_test_token_12345',
+            'active': True,
+        })
+        instance_id = cls.ha_instance.id
+        cls.kitchen = cls.env['ha.area'].sudo().with_context(from_ha_sync=True).create({
+            'area_id': 'kitchen', 'name': 'Kitchen', 'ha_instance_id': instance_id,
+        })
+        cls.device = cls.env['ha.device'].sudo().create({
+            'device_id': 'device_1', 'name': 'Device 1', 'ha_instance_id': instance_id,
+        })
+        cls.label_a, cls.label_b = cls.env['ha.label'].sudo().with_context(from_ha_sync=True).create([
+            {'label_id': 'label_a', 'name': 'A', 'ha_instance_id': instance_id},
+            {'label_id': 'label_b', 'name': 'B', 'ha_instance_id': instance_id},
+        ])
+        cls.Entity = cls.env['ha.entity'].sudo().with_context(from_ha_sync=True, tracking_disable=True)
+
+    def _create_entities(self, count, **values):
+        return self.Entity.create([dict({
+            'name': f'Sensor {i}',
+            'entity_id': f'sensor.relations_{i}',
+            'domain': 'sensor',
+            'ha_instance_id': self.ha_instance.id,
+        }, **values) for i in range(count)])
+
+    def _sync(self, registry_data):
+        return self.env['ha.entity']._do_sync_entity_registry_relations(
+            self.env, self.ha_instance.id, registry_data
+        )
+
+    def test_diff_and_apply(self):
+        """area / follows_device_area / device / labels 的設定與清除"""
+        own_area, follows, cleared = self._create_entities(3)
+        cleared.write({'area_id': self.kitchen.id, 'device_id': self.device.id, 'label_ids': [(6, 0, self.label_a.ids)]})
+
+        stats = self._sync([
+            {'entity_id': own_area.entity_id, 'area_id': 'kitchen', 'device_id': 'device_1',
+             'labels': ['label_a', 'label_b', 'label_unknown']},
+            {'entity_id': follows.entity_id, 'area_id': None, 'device_id': 'device_1', 'labels': ['label_b']},
+            {'entity_id': cleared.entity_id, 'area_id': None, 'device_id': None, 'labels': []},
+            {'entity_id': 'sensor.not_in_odoo', 'area_id': 'garage', 'labels': []},
+        ])
+
+        self.assertEqual(own_area.area_id, self.kitchen)
+        self.assertFalse(own_area.follows_device_area)
+        self.assertEqual(own_area.device_id, self.device)
+        self.assertEqual(own_area.label_ids, self.label_a | self.label_b)
+
+        self.assertFalse(follows.area_id)
+        self.assertTrue(follows.follows_device_area)
+        self.assertEqual(follows.label_ids, self.label_b)
+
+        self.assertFalse(cleared.area_id)
+        self.assertFalse(cleared.device_id)
+        self.assertFalse(cleared.label_ids)
+
+        # 不在 Odoo 的實體不會觸發 area 自動建立
+        self.assertFalse(self.env['ha.area'].search([('area_id', '=', 'garage')]))
+        self.assertEqual(stats['labels_updated'], 3)
+        self.assertTrue({'load', 'labels', 'diff', 'write', 'total'} <= set(stats['timings_ms']))
+
+    def test_auto_create_missing_area(self):
+        """registry 中未同步的 area 一次建立"""
+        entity = self._create_entities(1)
+        self._sync([{'entity_id': entity.entity_id, 'area_id': 'attic', 'labels': []}])
+        self.assertEqual(entity.area_id.area_id, 'attic')
+        self.assertEqual(entity.area_id.ha_instance_id, self.ha_instance)
+
+    def test_no_changes_no_writes(self):
+        """第二次同步沒有變更時不寫入"""
+        entity = self._create_entities(1)
+        registry = [{'entity_id': entity.entity_id, 'area_id': 'kitchen', 'device_id': 'device_1',
+                     'labels': ['label_a']}]
+        self._sync(registry)
+        stats = self._sync(registry)
+        self.assertEqual(stats['writes'], 0)
+        self.assertEqual(stats['labels_updated'], 0)
+
+    def test_synthetic_registry_10k(self):
+        """10k registry entries：寫入次數依目標值分組，不隨實體數量成長"""
+        instance_id = self.ha_instance.id
+        areas = self.env['ha.area'].sudo().with_context(from_ha_sync=True).create([
+            {'area_id': f'area_{i}', 'name': f'Area {i}', 'ha_instance_id': instance_id} for i in range(20)
+        ])
+        devices = self.env['ha.device'].sudo().create([
+            {'device_id': f'dev_{i}', 'name': f'Device {i}', 'ha_instance_id': instance_id} for i in range(50)
+        ])
+        entities = self._create_entities(10000)
+        registry = [{
+            'entity_id': entity.entity_id,
+            'area_id': f'area_{i % 20}' if i % 3 else None,
+            'device_id': f'dev_{i % 50}',
+            'labels': ['label_a'] if i % 2 else ['label_a', 'label_b'],
+        } for i, entity in enumerate(entities)]
+
+        queries_before = self.env.cr.sql_log_count
+        stats = self._sync(registry)
+        query_count = self.env.cr.sql_log_count - queries_before
+        _logger.info(
+            f"Registry relations 10k: {query_count} queries, {stats['writes']} writes, "
+            f"timings (ms): {stats['timings_ms']}"
+        )
+
+        # 20 個 area + False、follows True/False、50 個 device 各一次 write
+        self.assertLessEqual(stats['writes'], 20 + 1 + 2 + 50)
+        self.assertLess(query_count, 2000)
+        self.assertEqual(stats['labels_updated'], 10000)
+
+        entities.invalidate_recordset()
+        self.assertEqual(entities[1].area_id, areas[1])
+        self.assertTrue(entities[0].follows_device_area)
+        self.assertEqual(entities[0].display_area_id, devices[0].area_id)
+        self.assertEqual(entities[49].device_id, devices[49])
+        self.assertEqual(entities[0].label_ids, self.label_a | self.label_b)
+        self.assertEqual(entities[1].label_ids, self.label_a)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the shared WebSocket event loop pool.
+"""
+
+import asyncio
+import threading
+import time
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common.event_loop_pool import (
+    ConsistentHashRing,
+    EventLoopPool,
+    EventLoopThread,
+)
+
+
+@tagged('post_install', '-at_install')
+class TestEventLoopPool(TransactionCase):
+    """Test cases for ConsistentHashRing and EventLoopPool"""
+
+    def setUp(self):
+        super().setUp()
+        self.pool = EventLoopPool(size=2)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_consistent_hash_assignment(self):
+        """同一個 key 永遠分配到同一個節點；增加節點時只有少數 key 搬移"""
+        keys = [f'db:{i}' for i in range(400)]
+        ring = ConsistentHashRing(range(4))
+        assignment = {key: ring.get_node(key) for key in keys}
+
+        self.assertEqual(assignment, {key: ConsistentHashRing(range(4)).get_node(key) for key in keys})
+        self.assertEqual(set(assignment.values()), {0, 1, 2, 3})
+
+        grown = ConsistentHashRing(range(5))
+        moved = [key for key in keys if grown.get_node(key) != assignment[key]]
+        # 理想值為 1/5；只有搬到新節點的 key 會改變
+        self.assertLess(len(moved), len(keys) * 0.35)
+        self.assertTrue(all(grown.get_node(key) == 4 for key in moved))
+
+    def test_services_share_loop_threads(self):
+        """多個實例共用固定數量的 loop 執行緒"""
+        threads = set()
+        for instance_id in range(10):
+            loop_thread = self.pool.get_loop('db', instance_id)
+            self.assertIs(loop_thread, self.pool.get_loop('db', instance_id))
+            threads.add(loop_thread.submit(self._current_thread()).result(timeout=5))
+        self.assertLessEqual(len(threads), 2)
+
+    async def _current_thread(self):
+        return threading.current_thread().name
+
+    def test_stop_with_asyncio_event(self):
+        """服務以 asyncio.Event 停止，不需要輪詢"""
+        loop_thread = self.pool.get_loop('db', 1)
+        stop_event = asyncio.Event()
+
+        async def hosted():
+            loop_thread.attach(('db', 1))
+            try:
+                await stop_event.wait()
+                return 'stopped'
+            finally:
+                loop_thread.detach(('db', 1))
+
+        future = loop_thread.submit(hosted())
+        time.sleep(0.1)
+        self.assertEqual(loop_thread.get_stats('db')['instance_ids'], [1])
+        self.assertFalse(future.done())
+
+        self.assertTrue(loop_thread.call_soon(stop_event.set))
+        self.assertEqual(future.result(timeout=5), 'stopped')
+        self.assertEqual(loop_thread.get_stats()['service_count'], 0)
+
+    def test_lag_metrics(self):
+        """阻塞 loop 的 callback 會反映在 lag 統計中"""
+        loop_thread = EventLoopThread(0, lag_interval=0.05)
+        loop_thread.start()
+        self.addCleanup(loop_thread.stop)
+
+        async def block():
+            time.sleep(0.3)
+
+        loop_thread.submit(block()).result(timeout=5)
+        time.sleep(0.2)
+
+        stats = loop_thread.get_stats()
+        self.assertTrue(stats['alive'])
+        self.assertGreater(stats['lag_samples'], 0)
+        self.assertGreaterEqual(stats['lag_max_ms'], 100)
+
+    def test_shutdown(self):
+        """shutdown 停止所有 loop 並取消其上的 task"""
+        loop_thread = self.pool.get_loop('db', 1)
+        future = loop_thread.submit(asyncio.sleep(60))
+        self.pool.shutdown()
+        self.assertFalse(loop_thread.is_alive())
+        self.assertTrue(future.cancelled())
+        self.assertEqual(self.pool.get_stats(), [])
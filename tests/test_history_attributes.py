@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the per-domain history attribute allow-list and compaction.
+"""
+
+import json
+from datetime import datetime, timedelta
+
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestHistoryAttributes(TransactionCase):
+    """Test cases for attribute projection in history rows"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Attribute Test HA Instance',
+            'api_url': 'http://attribute-test.local:8123',
+            'api_token': 'attribute_test_token_12345',
+            'active': True,
+        })
+        cls.entity = cls.env['ha.entity'].sudo().create({
+            'name': 'Attribute Weather',
+            'entity_id': 'weather.attribute_test',
+            'domain': 'weather',
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.History = cls.env['ha.entity.history'].sudo()
+        cls.attributes = {
+            'temperature': 21.5,
+            'friendly_name': 'Home',
+            'entity_picture': '/api/weather.png',
+            'forecast': [{'temperature': 20 + i} for i in range(24)],
+        }
+
+    def test_insert_keeps_only_allowed_keys(self):
+        """寫入歷史時只保留 allow-list 中的 key"""
+        t0 = datetime(2026, 2, 1, 0, 0, 0)
+        self.History._bulk_insert_history([{
+            'entity_id': self.entity.id,
+            'domain': 'weather',
+            'entity_state': 'sunny',
+            'last_changed': t0,
+            'last_updated': t0,
+            'attributes': self.attributes,
+        }])
+        record = self.History.search([('entity_id', '=', self.entity.id)])
+        self.assertEqual(record.attributes, {'temperature': 21.5})
+
+    def test_parameter_override(self):
+        """系統參數可逐 domain 覆寫 allow-list，'*' 保留全部"""
+        self.env['ir.config_parameter'].sudo().set_param(
+            'odoo_ha_addon.ha_history_attribute_allowlist',
+            json.dumps({'weather': '*', 'sensor': ['friendly_name']}),
+        )
+        allowlist = self.History._get_attribute_allowlist()
+        self.assertIsNone(allowlist['weather'])
+        self.assertEqual(
+            self.History._project_attributes(
+                'sensor', {'friendly_name': 'A', 'unit_of_measurement': 'W', 'icon': 'mdi:x'}, allowlist
+            ),
+            {'friendly_name': 'A', 'unit_of_measurement': 'W'},
+        )
+
+    def test_compaction_reports_bytes_saved(self):
+        """壓縮既有記錄並回報每個 domain 節省的位元組"""
+        t0 = datetime(2026, 2, 2, 0, 0, 0)
+        for i in range(3):
+            self.env.cr.execute("""
+                INSERT INTO ha_entity_history (entity_id, ha_instance_id, domain, entity_state,
+                                               last_changed, last_updated, attributes)
+                VALUES (%s, %s, 'weather', 'sunny', %s, %s, %s::jsonb)
+            """, (self.entity.id, self.ha_instance.id, t0 + timedelta(minutes=i),
+                  t0 + timedelta(minutes=i), json.dumps(self.attributes)))
+
+        report = self.History.compact_history_attributes(domains=['weather'], batch_size=2)
+
+        self.assertEqual(report['weather']['rows'], 3)
+        self.assertGreater(report['weather']['bytes_saved'], 0)
+        records = self.History.search([('entity_id', '=', self.entity.id)])
+        self.assertEqual(set(records.mapped(lambda r: json.dumps(r.attributes))), {'{"temperature": 21.5}'})
+
+        self.assertEqual(self.History.compact_history_attributes(domains=['weather']), {})
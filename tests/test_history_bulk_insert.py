@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the set-based deduplicating history insert.
+"""
+
+from datetime import datetime, timedelta
+
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestHistoryBulkInsert(TransactionCase):
+    """Test cases for ha.entity.history._bulk_insert_history"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Bulk Insert Test HA Instance',
+            'api_url': 'http://bulk-insert-test.local:8123',
+            'api_token': 'bulk_insert_test_token_12345',
+            'active': True,
+        })
+        cls.entity = cls.env['ha.entity'].sudo().create({
+            'name': 'Bulk Insert Sensor',
+            'entity_id': 'sensor.bulk_insert',
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.History = cls.env['ha.entity.history'].sudo()
+
+    def _row(self, ts, state):
+        return {
+            'entity_id': self.entity.id,
+            'domain': 'sensor',
+            'entity_state': state,
+            'last_changed': ts,
+            'last_updated': ts,
+            'attributes': {'unit_of_measurement': 'W'},
+        }
+
+    def test_duplicates_are_skipped(self):
+        """批次內與資料庫中已存在的 (entity_id, last_updated) 都應被跳過"""
+        t0 = datetime(2026, 1, 1, 0, 0, 0)
+        rows = [self._row(t0 + timedelta(seconds=i), str(i)) for i in range(5)]
+
+        created, skipped = self.History._bulk_insert_history(rows + [rows[0]])
+        self.assertEqual((created, skipped), (5, 1))
+
+        created, skipped = self.History._bulk_insert_history(rows)
+        self.assertEqual((created, skipped), (0, 5))
+
+        self.assertEqual(self.History.search_count([('entity_id', '=', self.entity.id)]), 5)
+
+    def test_num_state_and_instance_computed_in_sql(self):
+        """num_state 與 ha_instance_id 由 INSERT 語句計算"""
+        t0 = datetime(2026, 1, 2, 0, 0, 0)
+        self.History._bulk_insert_history([
+            self._row(t0, '21.5'),
+            self._row(t0 + timedelta(seconds=1), 'unavailable'),
+        ])
+
+        records = self.History.search([('entity_id', '=', self.entity.id)], order='last_updated')
+        self.assertEqual(records.mapped('num_state'), [21.5, -1])
+        self.assertEqual(records.ha_instance_id, self.ha_instance)
+        self.assertEqual(records[0].attributes, {'unit_of_measurement': 'W'})
+
+    def test_num_state_out_of_float_range(self):
+        """超出 float 範圍的數值不會中斷整批 INSERT，結果與 ORM 的 _compute_num_state 一致"""
+        t0 = datetime(2026, 1, 3, 0, 0, 0)
+        states = ['1e999', '-1e999', '1e-999', '1e99999', '0e99999', '5e-324', 'nan', 'inf', '42']
+        created, skipped = self.History._bulk_insert_history([
+            self._row(t0 + timedelta(seconds=i), state) for i, state in enumerate(states)
+        ])
+        self.assertEqual((created, skipped), (len(states), 0))
+
+        expected = [float('inf'), float('-inf'), 0.0, float('inf'), 0.0, 5e-324, -1, -1, 42.0]
+        records = self.History.search([('entity_id', '=', self.entity.id)], order='last_updated')
+        self.assertEqual(records.mapped('num_state'), expected)
+        # 同一筆記錄經 ORM 重新計算（例如修改 entity_state）得到相同的值
+        records._compute_num_state()
+        self.assertEqual(records.mapped('num_state'), expected)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the shape-preserving (LTTB / min-max) history downsampling modes.
+
+The benchmark class is excluded from the standard run; execute it with
+--test-tags /odoo_ha_addon:TestDownsamplingBenchmark
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+
+from odoo.exceptions import UserError
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common import downsampling
+
+_logger = logging.getLogger(__name__)
+
+
+def _synthetic_series(n, spike_at=None):
+    """鋸齒波 + 單一尖峰"""
+    import numpy as np
+
+    x = np.arange(n, dtype=np.float64) * 10
+    y = (np.arange(n) % 500).astype(np.float64) / 10
+    if spike_at is not None:
+        y[spike_at] = 3000
+    return x, y
+
+
+@tagged('post_install', '-at_install')
+class TestDownsamplingAlgorithms(TransactionCase):
+    """Test cases for the NumPy LTTB and min-max selectors"""
+
+    def test_short_series_unchanged(self):
+        """點數不超過 threshold 時回傳全部 index"""
+        x, y = _synthetic_series(50)
+        for algorithm in ('lttb', 'minmax'):
+            self.assertEqual(list(downsampling.select(algorithm, x, y, 100)), list(range(50)))
+
+    def test_lttb_keeps_spike_and_endpoints(self):
+        """LTTB 輸出 threshold 點、保留首尾與尖峰"""
+        x, y = _synthetic_series(100000, spike_at=43210)
+        selected = downsampling.lttb(x, y, 200)
+        self.assertEqual(len(selected), 200)
+        self.assertEqual(selected[0], 0)
+        self.assertEqual(selected[-1], 99999)
+        self.assertIn(43210, selected)
+        self.assertTrue(all(a < b for a, b in zip(selected, selected[1:])))
+
+    def test_minmax_keeps_bucket_extremes(self):
+        """Min/max 保留每個桶的極值，輸出不超過 threshold + 2 點"""
+        x, y = _synthetic_series(100000, spike_at=43210)
+        selected = downsampling.minmax(x, y, 200)
+        self.assertLessEqual(len(selected), 202)
+        self.assertIn(43210, selected)
+        self.assertEqual(y[selected].min(), y.min())
+        self.assertTrue(all(a < b for a, b in zip(selected, selected[1:])))
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            downsampling.select('median', [0, 1], [0, 1], 10)
+
+
+@tagged('post_install', '-at_install')
+class TestDownsampledHistoryAlgorithms(TransactionCase):
+    """Test cases for the algorithm parameter of get_downsampled_history"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Downsampling Test HA Instance',
+            'api_url': 'http://downsampling-test.local:8123',
+            'api_token': 'downsampling_test_token_12345',
+            'active': True,
+        })
+        cls.entity = cls.env['ha.entity'].sudo().create({
+            'name': 'Kettle Power',
+            'entity_id': 'sensor.kettle_power',
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.History = cls.env['ha.entity.history'].sudo()
+        start = datetime(2026, 4, 1)
+        # 2000 筆 10 W 的讀數，中間一筆 3000 W 的尖峰
+        cls.History._bulk_insert_history([{
+            'entity_id': cls.entity.id,
+            'domain': 'sensor',
+            'entity_state': '3000' if i == 1234 else '10',
+            'last_changed': start + timedelta(minutes=i),
+            'last_updated': start + timedelta(minutes=i),
+            'attributes': {},
+        } for i in range(2000)])
+        cls.domain = [('entity_id', '=', cls.entity.id)]
+
+    def _values(self, algorithm):
+        rows = self.History.get_downsampled_history(self.domain, ['sensor'], 50, algorithm)
+        return [row['num_state'] for row in rows]
+
+    def test_average_smooths_spike(self):
+        self.assertLess(max(self._values('avg')), 3000)
+
+    def test_shape_algorithms_keep_spike(self):
+        for algorithm in ('lttb', 'minmax'):
+            values = self._values(algorithm)
+            self.assertIn(3000, values, algorithm)
+            self.assertLessEqual(len(values), 52, algorithm)
+
+    def test_shape_algorithms_skip_non_numeric(self):
+        """unavailable 不當成 -1 參與選點：桶內真正的低點保留，unavailable 只作為中斷點"""
+        entity = self.env['ha.entity'].sudo().create({
+            'name': 'Kettle Temperature',
+            'entity_id': 'sensor.kettle_temperature',
+            'domain': 'sensor',
+            'ha_instance_id': self.ha_instance.id,
+        })
+        start = datetime(2026, 5, 1)
+        states = {500: '2', 505: 'unavailable'}
+        self.History._bulk_insert_history([{
+            'entity_id': entity.id,
+            'domain': 'sensor',
+            'entity_state': states.get(i, '10'),
+            'last_changed': start + timedelta(minutes=i),
+            'last_updated': start + timedelta(minutes=i),
+            'attributes': {},
+        } for i in range(2000)])
+        domain = [('entity_id', '=', entity.id)]
+
+        for algorithm in ('lttb', 'minmax'):
+            rows = self.History.get_downsampled_history(domain, ['sensor'], 50, algorithm)
+            values = [row['num_state'] for row in rows]
+            self.assertIn(2, values, algorithm)
+            self.assertNotIn(-1, values, algorithm)
+            self.assertNotIn('unavailable', [row['entity_state'] for row in rows], algorithm)
+
+            result = self.History.get_downsampled_history(domain, ['sensor'], 50, algorithm, columnar=True)
+            series = result['series'][0]
+            self.assertIn(2, series['v'], algorithm)
+            self.assertNotIn(-1, series['v'], algorithm)
+            gap = series['v'].index(None)
+            epoch_ms = int((start + timedelta(minutes=505) - datetime(1970, 1, 1)).total_seconds() * 1000)
+            self.assertEqual(series['t'][gap], epoch_ms, algorithm)
+
+    def test_invalid_algorithm(self):
+        with self.assertRaises(UserError):
+            self.History.get_downsampled_history(self.domain, ['sensor'], 50, 'median')
+
+
+@tagged('post_install', '-at_install', '-standard', 'ha_benchmark')
+class TestDownsamplingBenchmark(TransactionCase):
+    """Benchmark over a synthetic 1M-point series"""
+
+    def test_benchmark_one_million_points(self):
+        x, y = _synthetic_series(1_000_000, spike_at=654321)
+        for algorithm in ('lttb', 'minmax'):
+            started = time.perf_counter()
+            selected = downsampling.select(algorithm, x, y, 500)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            _logger.info(f"Downsampling benchmark: {algorithm} 1M -> {len(selected)} points in {elapsed_ms:.1f} ms")
+            self.assertIn(654321, selected)
+            self.assertLess(elapsed_ms, 2000)
+
+
+@tagged('post_install', '-at_install')
+class TestColumnarHistory(TransactionCase):
+    """Test cases for the columnar get_downsampled_history payload"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Columnar Test HA Instance',
+            'api_url': 'http://columnar-test.local:8123',
+            'api_token': 'columnar_test_token_12345',
+            'active': True,
+        })
+        cls.sensor, cls.switch = cls.env['ha.entity'].sudo().create([{
+            'name': 'Columnar Sensor',
+            'entity_id': 'sensor.columnar',
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        }, {
+            'name': 'Columnar Switch',
+            'entity_id': 'switch.columnar',
+            'domain': 'switch',
+            'ha_instance_id': cls.ha_instance.id,
+        }])
+        cls.History = cls.env['ha.entity.history'].sudo()
+        cls.start = datetime(2026, 4, 1)
+        sensor_states = ['21.5', '22', 'unavailable', '23.25']
+        switch_states = ['on', 'off', 'on', 'unavailable']
+        cls.History._bulk_insert_history([{
+            'entity_id': entity.id,
+            'domain': entity.domain,
+            'entity_state': states[i],
+            'last_changed': cls.start + timedelta(minutes=i),
+            'last_updated': cls.start + timedelta(minutes=i),
+            'attributes': {},
+        } for entity, states in ((cls.sensor, sensor_states), (cls.switch, switch_states)) for i in range(4)])
+        cls.domain = [('entity_id', 'in', [cls.sensor.id, cls.switch.id])]
+
+    def test_columnar_series(self):
+        """每個 entity 一個 series；numeric 為 v 陣列，其他為狀態字典索引"""
+        result = self.History.get_downsampled_history(self.domain, ['sensor', 'switch'], 500, columnar=True)
+        self.assertEqual(result['format'], 'columnar')
+        series = {item['entity_id_string']: item for item in result['series']}
+        self.assertEqual(set(series), {'sensor.columnar', 'switch.columnar'})
+
+        epoch_ms = int((self.start - datetime(1970, 1, 1)).total_seconds() * 1000)
+        sensor = series['sensor.columnar']
+        self.assertEqual(sensor['t'], [epoch_ms + i * 60000 for i in range(4)])
+        self.assertEqual(sensor['v'], [21.5, 22.0, None, 23.25])
+        self.assertNotIn('s', sensor)
+
+        switch = series['switch.columnar']
+        self.assertEqual(switch['states'], ['on', 'off', 'unavailable'])
+        self.assertEqual(switch['s'], [0, 1, 0, 2])
+        self.assertNotIn('v', switch)
+
+    def test_columnar_bucket_average_with_trailing_non_numeric(self):
+        """桶內最後一筆為 unavailable 時仍使用數值狀態的平均值"""
+        domain = [('entity_id', '=', self.sensor.id)]
+        result = self.History.get_downsampled_history(domain, ['sensor'], 1, columnar=True)
+        self.assertEqual(result['series'][0]['v'], [21.75, 23.25])
+
+    def test_columnar_matches_records(self):
+        """欄位式與逐筆格式包含相同的點"""
+        records = self.History.get_downsampled_history(self.domain, ['sensor', 'switch'], 500)
+        result = self.History.get_downsampled_history(self.domain, ['sensor', 'switch'], 500, columnar=True)
+        self.assertEqual(len(records), sum(len(item['t']) for item in result['series']))
+
+    def test_columnar_empty(self):
+        result = self.History.get_downsampled_history([('entity_id', 'in', [])], ['sensor'], columnar=True)
+        self.assertEqual(result, {'format': 'columnar', 'series': []})
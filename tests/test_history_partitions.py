@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for ha_entity_history range partitioning and the retention policy.
+"""
+
+from datetime import datetime, timedelta
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common import history_partitions
+
+
+@tagged('post_install', '-at_install')
+class TestHistoryPartitions(TransactionCase):
+    """Test cases for partition maintenance, retention and set-based clearing"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Partition Test HA Instance',
+            'api_url': 'http://partition-test.local:8123',
+            'api_token': 'partition_test_token_12345',
+            'active': True,
+        })
+        cls.entity = cls.env['ha.entity'].sudo().create({
+            'name': 'Partition Sensor',
+            'entity_id': 'sensor.partition',
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.History = cls.env['ha.entity.history'].sudo()
+
+    def _insert(self, ts, state='1', domain='sensor'):
+        self.History._bulk_insert_history([{
+            'entity_id': self.entity.id,
+            'domain': domain,
+            'entity_state': state,
+            'last_changed': ts,
+            'last_updated': ts,
+            'attributes': {},
+        }])
+
+    def _count(self):
+        return self.History.search_count([('entity_id', '=', self.entity.id)])
+
+    def test_table_is_partitioned(self):
+        """安裝後 ha_entity_history 為 partitioned table，且目前週期已有 partition"""
+        cr = self.env.cr
+        self.assertEqual(history_partitions.table_kind(cr), 'p')
+        now = datetime.utcnow()
+        self.assertTrue(any(
+            start <= now < end for _name, start, end in history_partitions.list_partitions(cr)
+        ))
+
+    def test_partition_created_from_default(self):
+        """default partition 中的資料在建立涵蓋的 partition 時被搬移過去"""
+        cr = self.env.cr
+        future = datetime(2099, 5, 17, 12, 0, 0)
+        self._insert(future)
+        cr.execute(f"SELECT COUNT(*) FROM {history_partitions.DEFAULT_PARTITION} WHERE entity_id = %s",
+                   (self.entity.id,))
+        self.assertEqual(cr.fetchone()[0], 1)
+
+        created = history_partitions.ensure_partitions(cr, 'month', 0, now=future)
+
+        self.assertIn('ha_entity_history_p20990501', created)
+        cr.execute("SELECT COUNT(*) FROM ha_entity_history_p20990501 WHERE entity_id = %s",
+                   (self.entity.id,))
+        self.assertEqual(cr.fetchone()[0], 1)
+        self.assertEqual(self._count(), 1)
+
+    def test_partition_unique_index(self):
+        """每個 partition 都有 unique(entity_id, last_updated) 索引"""
+        cr = self.env.cr
+        names = [history_partitions.DEFAULT_PARTITION] + [
+            name for name, _start, _end in history_partitions.list_partitions(cr)
+        ]
+        for name in names:
+            cr.execute("SELECT to_regclass(%s)", (f'{name}_entity_last_updated_uniq',))
+            self.assertIsNotNone(cr.fetchone()[0], name)
+
+    def test_period_boundaries(self):
+        """月與週的週期計算"""
+        dt = datetime(2026, 12, 31, 23, 0, 0)
+        self.assertEqual(history_partitions.period_start(dt, 'month'), datetime(2026, 12, 1))
+        self.assertEqual(history_partitions.next_period(datetime(2026, 12, 1), 'month'), datetime(2027, 1, 1))
+        self.assertEqual(history_partitions.period_start(dt, 'week'), datetime(2026, 12, 28))
+
+    def test_instance_retention_deletes_old_rows(self):
+        """實例保留天數外的資料被刪除，期限內的保留"""
+        now = datetime(2026, 6, 15, 0, 0, 0)
+        self._insert(now - timedelta(days=40), '1')
+        self._insert(now - timedelta(days=5), '2')
+        self.ha_instance.history_retention_days = 30
+
+        report = self.History._apply_history_retention(now=now)
+
+        self.assertGreaterEqual(report['deleted_rows'], 1)
+        remaining = self.History.search([('entity_id', '=', self.entity.id)])
+        self.assertEqual(remaining.mapped('entity_state'), ['2'])
+
+    def test_domain_retention_overrides_instance(self):
+        """domain 保留天數優先於實例設定"""
+        now = datetime(2026, 6, 15, 0, 0, 0)
+        self._insert(now - timedelta(days=10))
+        self.env['ir.config_parameter'].sudo().set_param(
+            'odoo_ha_addon.ha_history_retention_domains', '{"sensor": 7}'
+        )
+
+        self.History._apply_history_retention(now=now)
+
+        self.assertEqual(self._count(), 0)
+
+    def test_clear_instance_data_deletes_history(self):
+        """_clear_instance_data 以集合式 DELETE 清除歷史記錄"""
+        self._insert(datetime(2026, 6, 1, 0, 0, 0))
+        self.ha_instance._clear_instance_data()
+        self.assertEqual(
+            self.History.search_count([('ha_instance_id', '=', self.ha_instance.id)]), 0
+        )
+
+    def _make_old_partition(self):
+        ts = datetime(2000, 1, 15, 0, 0, 0)
+        self._insert(ts)
+        history_partitions.ensure_partitions(self.env.cr, 'month', 0, now=ts)
+        return 'ha_entity_history_p20000101'
+
+    def test_partition_dropped_despite_unlimited_policy_elsewhere(self):
+        """其他實例永久保留時，只含過期資料的 partition 仍被 DROP"""
+        name = self._make_old_partition()
+        self.ha_instance.history_retention_days = 30
+        self.env['ha.instance'].sudo().create({
+            'name': 'Partition Keep Forever Instance',
+            'api_url': 'http://partition-keep.local:8123',
+            'api_token': 'partition_keep_token_12345',
+            'history_retention_days': 0,
+        })
+
+        report = self.History._apply_history_retention(now=datetime(2026, 6, 15, 0, 0, 0))
+
+        self.assertIn(name, report['dropped'])
+        self.assertEqual(self._count(), 0)
+
+    def test_partition_kept_for_unlimited_rows(self):
+        """partition 中有仍在期限內的資料時保留，只 DELETE 過期的資料"""
+        name = self._make_old_partition()
+        self.ha_instance.history_retention_days = 30
+        other_instance = self.env['ha.instance'].sudo().create({
+            'name': 'Partition Keep Forever Instance',
+            'api_url': 'http://partition-keep.local:8123',
+            'api_token': 'partition_keep_token_12345',
+            'history_retention_days': 0,
+        })
+        other_entity = self.env['ha.entity'].sudo().create({
+            'name': 'Partition Keep Sensor',
+            'entity_id': 'sensor.partition_keep',
+            'domain': 'sensor',
+            'ha_instance_id': other_instance.id,
+        })
+        self.History._bulk_insert_history([{
+            'entity_id': other_entity.id,
+            'domain': 'sensor',
+            'entity_state': '1',
+            'last_changed': datetime(2000, 1, 20, 0, 0, 0),
+            'last_updated': datetime(2000, 1, 20, 0, 0, 0),
+            'attributes': {},
+        }])
+
+        report = self.History._apply_history_retention(now=datetime(2026, 6, 15, 0, 0, 0))
+
+        self.assertNotIn(name, report['dropped'])
+        self.assertEqual(self._count(), 0)
+        self.assertEqual(self.History.search_count([('entity_id', '=', other_entity.id)]), 1)
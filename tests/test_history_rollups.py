@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the pre-aggregated numeric history rollups used by get_downsampled_history.
+"""
+
+from datetime import datetime, timedelta
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common import history_rollups
+from odoo.addons.odoo_ha_addon.models.common.utils import NUMERIC_STATE_PATTERN
+from odoo.addons.odoo_ha_addon.models.common.ws_config import HISTORY_ROLLUP_RESOLUTIONS
+
+
+@tagged('post_install', '-at_install')
+class TestHistoryRollups(TransactionCase):
+    """Test cases for rollup maintenance, rebuild and the resolution picker"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Rollup Test HA Instance',
+            'api_url': 'http://rollup-test.local:8123',
+            'api_token': 'rollup_test_token_12345',
+            'active': True,
+        })
+        cls.entity = cls.env['ha.entity'].sudo().create({
+            'name': 'Rollup Sensor',
+            'entity_id': 'sensor.rollup',
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.History = cls.env['ha.entity.history'].sudo()
+        cls.start = datetime(2026, 3, 1)
+
+    def _insert(self, points):
+        return self.History._bulk_insert_history([{
+            'entity_id': self.entity.id,
+            'domain': 'sensor',
+            'entity_state': 'unavailable' if value is None else str(value),
+            'last_changed': ts,
+            'last_updated': ts,
+            'attributes': {},
+        } for ts, value in points])
+
+    def _series(self, hours, step_minutes=1):
+        return [
+            (self.start + timedelta(minutes=i), float(i % 97))
+            for i in range(0, hours * 60, step_minutes)
+        ]
+
+    def _rollup_rows(self, resolution):
+        self.env.cr.execute(f"""
+            SELECT bucket, min_value, max_value, sum_value, sample_count, last_state
+            FROM {history_rollups.TABLE}
+            WHERE entity_id = %s AND resolution = %s
+            ORDER BY bucket
+        """, (self.entity.id, resolution))
+        return self.env.cr.fetchall()
+
+    def _raw_rows(self, resolution):
+        self.env.cr.execute("""
+            SELECT timestamp 'epoch' + floor(extract(epoch FROM last_changed) / %(res)s)
+                                       * %(res)s * interval '1 second' AS bucket,
+                   MIN(num_state), MAX(num_state), SUM(num_state), COUNT(*),
+                   (array_agg(entity_state ORDER BY last_changed DESC))[1]
+            FROM ha_entity_history
+            WHERE entity_id = %(eid)s AND entity_state ~ %(number_re)s
+            GROUP BY bucket
+            ORDER BY bucket
+        """, {'eid': self.entity.id, 'res': resolution, 'number_re': NUMERIC_STATE_PATTERN})
+        return self.env.cr.fetchall()
+
+    def test_rollups_match_raw_aggregates(self):
+        """每個解析度的 rollup 與 raw table 的 GROUP BY 結果相同"""
+        self._insert(self._series(hours=26))
+        for resolution in HISTORY_ROLLUP_RESOLUTIONS:
+            self.assertEqual(self._rollup_rows(resolution), self._raw_rows(resolution))
+
+    def test_rollups_skip_non_numeric_states(self):
+        """unavailable 等非數值狀態不計入 rollup，與 raw table 只計入數值狀態的結果相同"""
+        points = [(ts, None if i % 7 == 3 else value) for i, (ts, value) in enumerate(self._series(hours=26))]
+        self._insert(points)
+        for resolution in HISTORY_ROLLUP_RESOLUTIONS:
+            self.assertEqual(self._rollup_rows(resolution), self._raw_rows(resolution))
+
+        day = self.start + timedelta(days=3)
+        self._insert([(day, 21.5), (day + timedelta(minutes=1), None)])
+        self.env.cr.execute(f"""
+            SELECT sum_value / sample_count, min_value
+            FROM {history_rollups.TABLE}
+            WHERE entity_id = %s AND resolution = %s AND bucket = %s
+        """, (self.entity.id, 300, day))
+        self.assertEqual(self.env.cr.fetchone(), (21.5, 21.5))
+
+        self.History.rebuild_history_rollups(entity_ids=[self.entity.id])
+        for resolution in HISTORY_ROLLUP_RESOLUTIONS:
+            self.assertEqual(self._rollup_rows(resolution), self._raw_rows(resolution))
+
+    def test_incremental_merge(self):
+        """分兩次寫入同一個桶時合併 min / max / sum / count 與最後狀態"""
+        points = self._series(hours=2)
+        self._insert(points[1::2])
+        self._insert(points[::2])
+        for resolution in HISTORY_ROLLUP_RESOLUTIONS:
+            self.assertEqual(self._rollup_rows(resolution), self._raw_rows(resolution))
+
+    def test_rebuild_matches_incremental(self):
+        """rebuild 的結果與增量維護相同"""
+        self._insert(self._series(hours=3))
+        before = {res: self._rollup_rows(res) for res in HISTORY_ROLLUP_RESOLUTIONS}
+        self.History.rebuild_history_rollups(entity_ids=[self.entity.id])
+        for resolution in HISTORY_ROLLUP_RESOLUTIONS:
+            self.assertEqual(self._rollup_rows(resolution), before[resolution])
+
+    def test_non_numeric_domains_skipped(self):
+        """非 numeric domain 不寫入 rollup"""
+        switch = self.env['ha.entity'].sudo().create({
+            'name': 'Rollup Switch',
+            'entity_id': 'switch.rollup',
+            'domain': 'switch',
+            'ha_instance_id': self.ha_instance.id,
+        })
+        self.History._bulk_insert_history([{
+            'entity_id': switch.id,
+            'domain': 'switch',
+            'entity_state': 'on',
+            'last_changed': self.start,
+            'last_updated': self.start,
+            'attributes': {},
+        }])
+        self.env.cr.execute(f"SELECT COUNT(*) FROM {history_rollups.TABLE} WHERE entity_id = %s", (switch.id,))
+        self.assertEqual(self.env.cr.fetchone()[0], 0)
+
+    def test_picker_uses_rollup_for_long_ranges(self):
+        """長區間使用 rollup，短區間使用 raw table"""
+        self._insert(self._series(hours=24 * 10, step_minutes=10))
+        end = self.start + timedelta(days=10)
+
+        plan = self.History._plan_rollup_resolutions([self.entity.id], 500, (self.start, end))
+        self.assertEqual(plan[self.entity.id][0], 300)
+        plan = self.History._plan_rollup_resolutions([self.entity.id], 100, (self.start, end))
+        self.assertEqual(plan[self.entity.id][0], 3600)
+        plan = self.History._plan_rollup_resolutions(
+            [self.entity.id], 500, (self.start, self.start + timedelta(hours=6))
+        )
+        self.assertNotIn(self.entity.id, plan)
+
+    def test_downsampled_history_from_rollup(self):
+        """使用 rollup 的降採樣結果與 raw table 的平均值一致"""
+        self._insert(self._series(hours=24 * 10, step_minutes=10))
+        search_domain = [
+            ('entity_id', '=', self.entity.id),
+            ('last_changed', '>=', self.start),
+            ('last_changed', '<=', self.start + timedelta(days=10)),
+        ]
+        self.assertTrue(self.History._rollup_eligible(search_domain))
+        self.assertFalse(self.History._rollup_eligible(search_domain + [('entity_state', '=', '5')]))
+
+        bounds = self.History._get_time_bounds(search_domain)
+        plan = self.History._plan_rollup_resolutions([self.entity.id], 100, bounds)
+        rollup = self.History._downsample_numeric_rollup(plan, 100)
+
+        source = self.History._history_source_sql(search_domain)
+        raw = self.History._downsample_numeric([self.entity.id], 100, source)
+
+        self.assertTrue(rollup)
+        self.assertLessEqual(len(rollup), 101)
+        raw_avg = sum(row[4] for row in raw) / len(raw)
+        rollup_avg = sum(row[4] for row in rollup) / len(rollup)
+        self.assertAlmostEqual(raw_avg, rollup_avg, delta=1)
+
+    def test_retention_deletes_expired_buckets(self):
+        """保留政策刪除整個時間桶都已過期的 rollup，期限內的保留"""
+        self._insert(self._series(hours=24 * 3, step_minutes=10))
+        now = self.start + timedelta(days=3)
+        cutoff = now - timedelta(days=1)
+        self.ha_instance.history_retention_days = 1
+
+        report = self.History._apply_history_retention(now=now)
+
+        self.assertGreater(report['deleted_rollups'], 0)
+        for resolution in HISTORY_ROLLUP_RESOLUTIONS:
+            buckets = [row[0] for row in self._rollup_rows(resolution)]
+            self.assertTrue(buckets)
+            self.assertTrue(all(
+                bucket + timedelta(seconds=resolution) > cutoff for bucket in buckets
+            ))
+
+    def test_domain_retention_deletes_buckets(self):
+        """domain 保留天數同樣套用到 rollup"""
+        self._insert(self._series(hours=24 * 3, step_minutes=10))
+        self.env['ir.config_parameter'].sudo().set_param(
+            'odoo_ha_addon.ha_history_retention_domains', '{"sensor": 1}'
+        )
+
+        self.History._apply_history_retention(now=self.start + timedelta(days=30))
+
+        for resolution in HISTORY_ROLLUP_RESOLUTIONS:
+            self.assertEqual(self._rollup_rows(resolution), [])
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for pushing search-view filters and record rules into the history downsampling SQL.
+"""
+
+import json
+from datetime import datetime, timedelta
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common import history_partitions
+
+
+def _relations(plan):
+    """遞迴收集 EXPLAIN (FORMAT JSON) 中掃描的 table"""
+    names = set()
+    if 'Relation Name' in plan:
+        names.add(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        names |= _relations(child)
+    return names
+
+
+@tagged('post_install', '-at_install')
+class TestHistorySourceSql(TransactionCase):
+    """Test cases for _history_source_sql and get_downsampled_history filtering"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Source SQL Test HA Instance',
+            'api_url': 'http://source-sql-test.local:8123',
+            'api_token': 'source_sql_test_token_12345',
+            'active': True,
+        })
+        cls.sensor_a, cls.sensor_b = cls.env['ha.entity'].sudo().create([{
+            'name': f'Source Sensor {suffix}',
+            'entity_id': f'sensor.source_{suffix}',
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        } for suffix in ('a', 'b')])
+        cls.History = cls.env['ha.entity.history'].sudo()
+
+        history_partitions.ensure_partitions(
+            cls.env.cr, 'month', 0, now=datetime(2026, 6, 15), since=datetime(2026, 1, 1)
+        )
+        cls.start = datetime(2026, 5, 1)
+        cls.History._bulk_insert_history([{
+            'entity_id': entity.id,
+            'domain': 'sensor',
+            'entity_state': str(i),
+            'last_changed': cls.start + timedelta(hours=i),
+            'last_updated': cls.start + timedelta(hours=i),
+            'attributes': {},
+        } for entity in (cls.sensor_a, cls.sensor_b) for i in range(24 * 30)])
+
+        cls.entity_group = cls.env['ha.entity.group'].sudo().create({
+            'name': 'Source SQL Test Group',
+            'ha_instance_id': cls.ha_instance.id,
+            'entity_ids': [(6, 0, [cls.sensor_a.id])],
+        })
+        cls.ha_user = cls.env['res.users'].sudo().create({
+            'name': 'Source SQL Test HA User',
+            'login': 'source_sql_test_ha_user',
+            'email': 'source_sql_ha_user@test.local',
+            'groups_id': [(6, 0, [
+                cls.env.ref('base.group_user').id,
+                cls.env.ref('odoo_ha_addon.group_ha_user').id,
+            ])],
+            'ha_entity_group_ids': [(6, 0, [cls.entity_group.id])],
+        })
+
+    def _month_domain(self):
+        return [
+            ('entity_id', 'in', [self.sensor_a.id, self.sensor_b.id]),
+            ('last_changed', '>=', self.start),
+            ('last_changed', '<', datetime(2026, 6, 1)),
+        ]
+
+    def test_source_matches_search(self):
+        """sub-select 與 ORM search 回傳相同的記錄"""
+        domain = self._month_domain() + [('entity_state', '!=', '5')]
+        source = self.History._history_source_sql(domain)
+        self.env.cr.execute(f"SELECT h.id FROM {source} h", {})
+        self.assertEqual(
+            sorted(row[0] for row in self.env.cr.fetchall()),
+            sorted(self.History.search(domain).ids),
+        )
+
+    def test_empty_domain(self):
+        self.assertIsNone(self.History._history_source_sql([('entity_id', 'in', [])]))
+        self.assertEqual(self.History.get_downsampled_history([('entity_id', 'in', [])], ['sensor']), [])
+
+    def test_query_plan_prunes_partitions(self):
+        """30 天區間只掃描該月份的 partition（與 default partition），不需要 id 清單"""
+        source = self.History._history_source_sql(self._month_domain())
+        self.env.cr.execute(f"EXPLAIN (FORMAT JSON) SELECT COUNT(*) FROM {source} h", {})
+        plan = self.env.cr.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        relations = _relations(plan[0]['Plan'])
+
+        self.assertIn('ha_entity_history_p20260501', relations)
+        for month in (1, 2, 3, 4, 6):
+            self.assertNotIn(f'ha_entity_history_p2026{month:02d}01', relations)
+        self.assertFalse([name for name in relations if name.startswith('_ds_')])
+
+    def test_record_rules_applied_in_sql(self):
+        """HA User 只看到授權 group 中 entity 的歷史"""
+        History = self.env['ha.entity.history'].with_user(self.ha_user)
+        rows = History.get_downsampled_history(self._month_domain(), ['sensor'], 50)
+        self.assertTrue(rows)
+        self.assertEqual({row['entity_id_string'] for row in rows}, {'sensor.source_a'})
+
+        rows = self.History.get_downsampled_history(self._month_domain(), ['sensor'], 50)
+        self.assertEqual({row['entity_id_string'] for row in rows}, {'sensor.source_a', 'sensor.source_b'})
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the per-entity incremental history sync watermark.
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common.ws_config import (
+    HISTORY_BACKFILL_CHUNK_HOURS,
+    HISTORY_DEFAULT_WINDOW_HOURS,
+    HISTORY_SYNC_OVERLAP_SECONDS,
+)
+
+
+@tagged('post_install', '-at_install')
+class TestHistoryWatermark(TransactionCase):
+    """Test cases for history window calculation and watermark advancement"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Watermark Test HA Instance',
+            'api_url': 'http://watermark-test.local:8123',
+            'api_token': 'watermark_test_token_12345',
+            'active': True,
+        })
+        cls.entity = cls.env['ha.entity'].sudo().create({
+            'name': 'Watermark Sensor',
+            'entity_id': 'sensor.watermark',
+            'domain': 'sensor',
+            'enable_record': True,
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.History = cls.env['ha.entity.history'].sudo()
+        cls.now = datetime(2026, 3, 1, 12, 0, 0)
+
+    def test_window_without_watermark_uses_default(self):
+        """未同步過的實體請求預設區間"""
+        start, end = self.History._get_history_window(self.entity, now=self.now)
+        self.assertEqual(start, self.now - timedelta(hours=HISTORY_DEFAULT_WINDOW_HOURS))
+        self.assertEqual(end, self.now)
+
+    def test_window_starts_at_watermark(self):
+        """已同步的實體只請求 watermark 之後（含重疊）的資料"""
+        self.entity.history_synced_until = self.now - timedelta(minutes=1)
+        start, end = self.History._get_history_window(self.entity, now=self.now)
+        self.assertEqual(start, self.now - timedelta(minutes=1, seconds=HISTORY_SYNC_OVERLAP_SECONDS))
+        self.assertEqual(end, self.now)
+
+    def test_large_gap_is_chunked(self):
+        """停機造成的大缺口一次只補一個 chunk"""
+        self.entity.history_synced_until = self.now - timedelta(days=5)
+        start, end = self.History._get_history_window(self.entity, now=self.now)
+        self.assertEqual(end - start, timedelta(hours=HISTORY_BACKFILL_CHUNK_HOURS))
+        self.assertLess(end, self.now)
+
+    def test_watermark_only_moves_forward(self):
+        """watermark 只會往前推進"""
+        self.History._advance_history_watermark(self.entity, self.now)
+        self.History._advance_history_watermark(self.entity, self.now - timedelta(hours=1))
+        self.assertEqual(self.entity.history_synced_until, self.now)
+
+    def test_window_for_chunk_uses_earliest_watermark(self):
+        """同一 chunk 的實體以最早的 watermark 作為開始時間"""
+        other = self.env['ha.entity'].sudo().create({
+            'name': 'Watermark Sensor 2',
+            'entity_id': 'sensor.watermark_2',
+            'domain': 'sensor',
+            'enable_record': True,
+            'ha_instance_id': self.ha_instance.id,
+            'history_synced_until': self.now - timedelta(hours=2),
+        })
+        self.entity.history_synced_until = self.now - timedelta(minutes=5)
+
+        start, end = self.History._get_history_window(self.entity | other, now=self.now)
+        self.assertEqual(start, self.now - timedelta(hours=2, seconds=HISTORY_SYNC_OVERLAP_SECONDS))
+        self.assertEqual(end, self.now)
+
+    def test_stream_events_are_demultiplexed_by_entity(self):
+        """history/stream 事件依實體拆分為子列表"""
+        events = [{
+            'states': {
+                'sensor.a': [{'s': '1', 'a': {}, 'lu': 1767225600.0}],
+                'sensor.b': [{'s': 'on', 'a': {}, 'lu': 1767225600.0},
+                             {'s': 'off', 'a': {}, 'lu': 1767225660.0}],
+                'sensor.unrequested': [{'s': 'x', 'a': {}, 'lu': 1767225600.0}],
+            }
+        }]
+
+        history = self.History._convert_stream_events_to_history(events, ['sensor.a', 'sensor.b'])
+
+        self.assertEqual(len(history), 2)
+        by_entity = {records[0]['entity_id']: [r['state'] for r in records] for records in history}
+        self.assertEqual(by_entity, {'sensor.a': ['1'], 'sensor.b': ['on', 'off']})
+
+    def test_backfill_retries_timed_out_and_failed_chunks(self):
+        """逾時（未回傳）或失敗的 chunk 仍留在落後清單，下一輪重試並計入 remaining"""
+        timed_out, failed = self.env['ha.entity'].sudo().create([{
+            'name': f'Watermark Sensor {name}',
+            'entity_id': f'sensor.watermark_{name}',
+            'domain': 'sensor',
+            'enable_record': True,
+            'ha_instance_id': self.ha_instance.id,
+        } for name in ('timed_out', 'failed')])
+        caught_up = fields.Datetime.now() + timedelta(hours=1)
+        results = [
+            {'entities': 3, 'created': 5, 'skipped': 0, 'errors': 1,
+             'synced_until': {self.entity.id: caught_up, failed.id: None}},
+            {'entities': 2, 'created': 0, 'skipped': 0, 'errors': 2,
+             'synced_until': {failed.id: None}},
+        ]
+        requested = []
+
+        def fake_sync(instance_id=None, entity_ids=None):
+            requested.append(set(entity_ids))
+            return results[len(requested) - 1]
+
+        with patch.object(type(self.History), 'sync_entity_history_from_ha', side_effect=fake_sync):
+            totals = self.History.backfill_entity_history(instance_id=self.ha_instance.id)
+
+        self.assertEqual(requested[0], {self.entity.id, timed_out.id, failed.id})
+        self.assertEqual(requested[1], {timed_out.id, failed.id})
+        self.assertEqual(totals['passes'], 2)
+        self.assertEqual(totals['remaining'], 2)
+
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the batched multi-entity state endpoints
+(/my/ha/<instance_id>/states and /odoo_ha_addon/entity_states).
+"""
+
+import json
+from datetime import datetime
+
+from odoo.sql_db import db_connect
+from odoo.tests import HttpCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common.portal_state import BATCH_STATE_MAX_IDS, read_batch_states
+from odoo.addons.odoo_ha_addon.tests.test_portal_live_state import _create_portal_fixture
+
+
+@tagged('post_install', '-at_install')
+class TestPortalBatchStates(HttpCase):
+    """Test cases for batched state authorization, since cursor and projection"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        _create_portal_fixture(cls)
+        cls.url = f'/my/ha/{cls.ha_instance.id}/states'
+        cls.all_entities = cls.direct | cls.grouped | cls.on_device | cls.expired | cls.private
+
+    def _post(self, url, params):
+        response = self.url_open(
+            url,
+            data=json.dumps({'jsonrpc': '2.0', 'method': 'call', 'id': 1, 'params': params}),
+            headers={'Content-Type': 'application/json'},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['result']
+
+    def _set_write_date(self, entities, interval):
+        self.env.cr.execute(
+            "UPDATE ha_entity SET write_date = clock_timestamp() AT TIME ZONE 'UTC' + %s::interval "
+            "WHERE id = ANY(%s)",
+            (interval, entities.ids)
+        )
+        self.env.invalidate_all()
+
+    def test_authorized_in_one_pass(self):
+        """只回傳可透過分享存取的實體，群組與裝置展開為其實體"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        result = self._post(self.url, {
+            'entity_ids': self.all_entities.ids,
+            'group_ids': self.group.ids,
+            'device_ids': self.device.ids,
+        })
+        self.assertTrue(result['success'])
+        data = result['data']
+        expected = {self.direct.id, self.grouped.id, self.on_device.id}
+        self.assertEqual(set(data['entity_ids']), expected)
+        self.assertEqual({state['id'] for state in data['entities']}, expected)
+        self.assertEqual(data['groups'], {str(self.group.id): self.grouped.ids})
+        self.assertEqual(data['devices'], {str(self.device.id): self.on_device.ids})
+        for state in data['entities']:
+            self.assertNotIn('access_token', state['attributes'])
+
+    def test_access_denied(self):
+        """請求的 id 都無權限時回應 access_denied"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        result = self._post(self.url, {'entity_ids': (self.private | self.expired).ids})
+        self.assertEqual(result['error_code'], 'access_denied')
+
+    def test_too_many_ids(self):
+        """超過上限的請求被拒絕"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        result = self._post(self.url, {'entity_ids': list(range(1, BATCH_STATE_MAX_IDS + 2))})
+        self.assertEqual(result['error_code'], 'too_many_ids')
+
+    def test_since_returns_changed_only(self):
+        """帶 cursor 的請求只回傳之後變更的實體"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        self._set_write_date(self.all_entities, '-1 hour')
+        params = {'entity_ids': (self.direct | self.grouped).ids}
+
+        first = self._post(self.url, params)
+        self.assertEqual(len(first['data']['entities']), 2)
+        self.assertTrue(first['data']['cursor'])
+
+        unchanged = self._post(self.url, {**params, 'since': first['data']['cursor']})
+        self.assertEqual(unchanged['data']['entities'], [])
+        self.assertEqual(len(unchanged['data']['entity_ids']), 2)
+
+        self._set_write_date(self.direct, '0 seconds')
+        changed = self._post(self.url, {**params, 'since': first['data']['cursor']})
+        self.assertEqual([state['id'] for state in changed['data']['entities']], self.direct.ids)
+
+    def test_cursor_waits_for_running_writer(self):
+        """進行中的長交易 commit 的變更（write_date 為其開始時間）仍會在下一次請求回傳"""
+        self._set_write_date(self.all_entities, '-1 hour')
+        Entity = self.env['ha.entity'].sudo()
+        with db_connect(self.env.cr.dbname).cursor() as writer:
+            writer.execute("SELECT now() AT TIME ZONE 'UTC'")
+            writer_start = writer.fetchone()[0]
+
+            states, cursor = read_batch_states(Entity, self.direct.ids)
+            self.assertEqual(len(states), 1)
+            self.assertLessEqual(datetime.fromisoformat(cursor), writer_start)
+
+            # 寫入端 commit：write_date 為其交易開始時間，早於讀取端當時的時間
+            self.env.cr.execute(
+                "UPDATE ha_entity SET write_date = %s WHERE id = ANY(%s)", (writer_start, self.direct.ids)
+            )
+            self.env.invalidate_all()
+            states, _cursor = read_batch_states(Entity, self.direct.ids, since=cursor)
+            self.assertEqual([state['id'] for state in states], self.direct.ids)
+            writer.rollback()
+
+    def test_field_and_attribute_projection(self):
+        """fields 與 attributes 只回傳指定的內容"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        result = self._post(self.url, {
+            'entity_ids': self.direct.ids,
+            'fields': ['entity_state', 'attributes', 'api_token'],
+            'attributes': ['unit_of_measurement', 'access_token'],
+        })
+        self.assertEqual(result['data']['entities'], [{
+            'id': self.direct.id,
+            'entity_state': '1',
+            'attributes': {'unit_of_measurement': 'W'},
+        }])
+
+    def test_projection_must_be_lists(self):
+        """fields / attributes 不是 list 時回應 invalid_params，不逐字元解讀字串"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        for params in ({'fields': 'entity_state'}, {'attributes': 'unit_of_measurement'}):
+            result = self._post(self.url, {'entity_ids': self.direct.ids, **params})
+            self.assertEqual(result['error_code'], 'invalid_params')
+
+        self.authenticate('admin', 'admin')
+        result = self._post('/odoo_ha_addon/entity_states', {
+            'entity_ids': self.direct.ids, 'fields': 'entity_state',
+        })
+        self.assertFalse(result['success'])
+
+    def test_backend_endpoint(self):
+        """後端批次端點以 ir.rule 授權並回傳完整 attributes"""
+        self.authenticate('admin', 'admin')
+        result = self._post('/odoo_ha_addon/entity_states', {
+            'entity_ids': self.direct.ids,
+            'group_ids': self.group.ids,
+            'fields': ['entity_state', 'attributes'],
+        })
+        self.assertTrue(result['success'])
+        data = result['data']
+        self.assertEqual(data['entity_ids'], sorted((self.direct | self.grouped).ids))
+        self.assertEqual(data['entities'][0]['attributes']['access_token'], 'secret')
+        self.assertTrue(data['cursor'])
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for push-based portal live state (bus channels) and the polling fallback.
+"""
+
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import HttpCase, TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.ha_realtime_update import PORTAL_ENTITY_CHANNEL_PREFIX
+
+
+def _create_portal_fixture(cls):
+    cls.ha_instance = cls.env['ha.instance'].sudo().create({
+        'name': 'Portal Live Test HA Instance',
+        'api_url': 'http://portal-live-test.local:8123',
+        'api_token': 'portal_live_test_token_12345',
+        'active': True,
+    })
+    cls.portal_user = cls.env['res.users'].sudo().create({
+        'name': 'Portal Live Test User',
+        'login': 'portal_live_test_user',
+        'password': 'portal_live_test_password',
+        'groups_id': [(6, 0, [cls.env.ref('base.group_portal').id])],
+    })
+    cls.device = cls.env['ha.device'].sudo().create({
+        'device_id': 'portal_live_device',
+        'name': 'Portal Live Device',
+        'ha_instance_id': cls.ha_instance.id,
+    })
+    Entity = cls.env['ha.entity'].sudo().with_context(from_ha_sync=True)
+    cls.direct, cls.grouped, cls.on_device, cls.expired, cls.private = Entity.create([{
+        'name': name,
+        'entity_id': f'sensor.portal_live_{name.lower()}',
+        'domain': 'sensor',
+        'entity_state': '1',
+        'attributes': {'unit_of_measurement': 'W', 'access_token': 'secret'},
+        'ha_instance_id': cls.ha_instance.id,
+        'device_id': cls.device.id if name == 'Device' else False,
+    } for name in ('Direct', 'Grouped', 'Device', 'Expired', 'Private')])
+    group = cls.env['ha.entity.group'].sudo().create({
+        'name': 'Portal Live Group',
+        'ha_instance_id': cls.ha_instance.id,
+        'entity_ids': [(6, 0, cls.grouped.ids)],
+    })
+    cls.group = group
+    cls.env['ha.entity.share'].sudo().create([
+        {'entity_id': cls.direct.id, 'user_id': cls.portal_user.id, 'permission': 'view'},
+        {'group_id': group.id, 'user_id': cls.portal_user.id, 'permission': 'view'},
+        {'device_id': cls.device.id, 'user_id': cls.portal_user.id, 'permission': 'view'},
+        {
+            'entity_id': cls.expired.id,
+            'user_id': cls.portal_user.id,
+            'permission': 'view',
+            'expiry_date': fields.Datetime.now() - timedelta(days=1),
+        },
+    ])
+
+
+@tagged('post_install', '-at_install')
+class TestPortalLiveState(TransactionCase):
+    """Test cases for portal entity channels and ha_portal_state pushes"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        _create_portal_fixture(cls)
+        cls.all_entities = cls.direct | cls.grouped | cls.on_device | cls.expired | cls.private
+
+    def _portal_channels(self, user, entities):
+        channels = self.env['ir.websocket'].with_user(user)._build_bus_channel_list(
+            [f'{PORTAL_ENTITY_CHANNEL_PREFIX}{entity.id}' for entity in entities]
+        )
+        return {c[0].id for c in channels if isinstance(c, tuple) and c[0]._name == 'ha.entity'}
+
+    def test_channel_authorized_at_subscribe(self):
+        """只有可透過分享觀看的實體會轉換為 channel"""
+        channels = self._portal_channels(self.portal_user, self.all_entities)
+        self.assertEqual(channels, {self.direct.id, self.grouped.id, self.on_device.id})
+
+    def test_channel_requires_share(self):
+        """沒有分享的用戶取得不到任何 portal channel"""
+        other = self.env['res.users'].sudo().create({
+            'name': 'Portal Live Other User',
+            'login': 'portal_live_other_user',
+            'groups_id': [(6, 0, [self.env.ref('base.group_portal').id])],
+        })
+        self.assertEqual(self._portal_channels(other, self.all_entities), set())
+
+    def test_push_only_shared_entities(self):
+        """只推送有有效分享的實體，且 attributes 經過過濾"""
+        BusBus = self.registry['bus.bus']
+        with patch.object(BusBus, '_sendone', autospec=True) as sendone:
+            self.env['ha.realtime.update'].notify_portal_entity_states(self.all_entities.ids)
+
+        pushed = {call.args[1][0].id: call.args[3] for call in sendone.call_args_list}
+        self.assertEqual(set(pushed), {self.direct.id, self.grouped.id, self.on_device.id})
+        for call in sendone.call_args_list:
+            self.assertEqual(call.args[1][1], 'ha_portal_state')
+            self.assertEqual(call.args[2], 'ha_portal_state')
+        payload = pushed[self.direct.id]
+        self.assertEqual(payload['entity_state'], '1')
+        self.assertEqual(payload['attributes'], {'unit_of_measurement': 'W'})
+
+    def test_no_push_without_shares(self):
+        """沒有分享的實體不寫入 bus"""
+        BusBus = self.registry['bus.bus']
+        with patch.object(BusBus, '_sendone', autospec=True) as sendone:
+            self.env['ha.realtime.update'].notify_portal_entity_states(self.private.ids)
+        sendone.assert_not_called()
+
+
+@tagged('post_install', '-at_install')
+class TestPortalStateSince(HttpCase):
+    """Test cases for the since/version handling of the portal state endpoints"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        _create_portal_fixture(cls)
+
+    def _post(self, url, params):
+        response = self.url_open(
+            url,
+            data=json.dumps({'jsonrpc': '2.0', 'method': 'call', 'id': 1, 'params': params}),
+            headers={'Content-Type': 'application/json'},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['result']
+
+    def _touch(self, entity):
+        self.env.cr.execute(
+            "UPDATE ha_entity SET write_date = write_date + interval '1 second' WHERE id = %s",
+            (entity.id,)
+        )
+
+    def test_entity_state_not_modified(self):
+        """version 未變時回應 not_modified 且不含資料"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        url = f'/my/ha/{self.ha_instance.id}/entity/{self.direct.id}/state'
+
+        first = self._post(url, {})
+        self.assertTrue(first['success'])
+        self.assertEqual(first['data']['entity_state'], '1')
+        self.assertTrue(first['version'])
+
+        unchanged = self._post(url, {'since': first['version']})
+        self.assertTrue(unchanged['success'])
+        self.assertTrue(unchanged['not_modified'])
+        self.assertIsNone(unchanged['data'])
+        self.assertEqual(unchanged['version'], first['version'])
+
+        self._touch(self.direct)
+        changed = self._post(url, {'since': first['version']})
+        self.assertFalse(changed.get('not_modified'))
+        self.assertEqual(changed['data']['entity_state'], '1')
+        self.assertNotEqual(changed['version'], first['version'])
+
+    def test_group_state_not_modified(self):
+        """群組成員狀態改變時 version 改變"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        url = f'/my/ha/{self.ha_instance.id}/group/{self.group.id}/state'
+
+        first = self._post(url, {})
+        self.assertEqual([e['id'] for e in first['data']['entities']], self.grouped.ids)
+        self.assertTrue(self._post(url, {'since': first['version']})['not_modified'])
+
+        self._touch(self.grouped)
+        changed = self._post(url, {'since': first['version']})
+        self.assertEqual(len(changed['data']['entities']), 1)
+
+    def test_since_requires_access(self):
+        """帶 since 的請求同樣檢查分享權限"""
+        self.authenticate('portal_live_test_user', 'portal_live_test_password')
+        url = f'/my/ha/{self.ha_instance.id}/entity/{self.private.id}/state'
+        result = self._post(url, {'since': 'anything'})
+        self.assertEqual(result['error_code'], 'access_denied')
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for LISTEN/NOTIFY request dispatch and the request latency histogram.
+"""
+
+import json
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common.request_dispatch import (
+    LatencyHistogram,
+    get_request_latency_stats,
+    record_request_latency,
+)
+
+
+@tagged('post_install', '-at_install')
+class TestRequestDispatch(TransactionCase):
+    """Test cases for queue NOTIFY hooks and latency statistics"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Dispatch Test HA Instance',
+            'api_url': 'http://dispatch-test.local:8123',
+            'api_token': 'dispatch_test_token_12345',
+            'active': True,
+        })
+
+    def test_create_and_complete_emit_notifications(self):
+        """建立請求通知 worker channel，完成時通知 result channel（processing 不通知）"""
+        with patch('odoo.addons.odoo_ha_addon.models.ha_ws_request_queue.notify') as notify:
+            request = self.env['ha.ws.request.queue'].sudo().create({
+                'request_id': 'dispatch-test-1',
+                'message_type': 'get_states',
+                'ha_instance_id': self.ha_instance.id,
+            })
+            request.write({'state': 'processing'})
+            request.write({'state': 'done', 'result': '[]'})
+
+        self.assertEqual(
+            [c.args[1:] for c in notify.call_args_list],
+            [(f'ha_ws_request_{self.ha_instance.id}',), ('ha_ws_result', 'dispatch-test-1')],
+        )
+
+    def test_latency_histogram_percentiles(self):
+        """百分位數與 bucket 分佈"""
+        histogram = LatencyHistogram()
+        for ms in range(1, 101):
+            histogram.record(ms, success=ms != 100)
+
+        stats = histogram.get_stats()
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['failures'], 1)
+        self.assertEqual(stats['p50_ms'], 50)
+        self.assertEqual(stats['p99_ms'], 99)
+        self.assertEqual(stats['max_ms'], 100)
+        self.assertEqual(stats['buckets']['<=5ms'], 5)
+        self.assertEqual(sum(stats['buckets'].values()), 100)
+
+    def test_latency_registry_by_instance(self):
+        """record_request_latency 依 (db, instance) 分別統計"""
+        record_request_latency('test_dispatch_db', 7, 12.5)
+        stats = get_request_latency_stats('test_dispatch_db')
+        self.assertIn(7, stats)
+        self.assertEqual(get_request_latency_stats('test_dispatch_db', 8), {})
+
+    def test_subscription_events_assembled_on_completion(self):
+        """訂閱事件寫入子表，complete_subscription 時依序組合"""
+        request = self.env['ha.ws.request.queue'].sudo().create({
+            'request_id': 'dispatch-test-sub',
+            'message_type': 'history/stream',
+            'is_subscription': True,
+            'ha_instance_id': self.ha_instance.id,
+        })
+        request.add_event({'n': 1})
+        request.add_event({'n': 2})
+        self.assertEqual(request.event_count, 2)
+        self.assertEqual(len(request.event_ids), 2)
+
+        request.complete_subscription()
+
+        self.assertEqual(request.state, 'done')
+        self.assertEqual(json.loads(request.result), [{'n': 1}, {'n': 2}])
+        self.assertFalse(request.event_ids)
+
+    def test_subscription_event_limit_fails_request(self):
+        """超過事件數上限時訂閱標記為失敗"""
+        request = self.env['ha.ws.request.queue'].sudo().create({
+            'request_id': 'dispatch-test-limit',
+            'message_type': 'history/stream',
+            'is_subscription': True,
+            'ha_instance_id': self.ha_instance.id,
+        })
+        with patch('odoo.addons.odoo_ha_addon.models.ha_ws_request_queue.WS_SUBSCRIPTION_MAX_EVENTS', 1):
+            request.add_event({'n': 1})
+            request.add_event({'n': 2})
+
+        self.assertEqual(request.state, 'failed')
+        self.assertFalse(request.event_ids)
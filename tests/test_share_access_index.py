@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the materialized share access index (ha_share_access) and the
+cached effective permission lookup used by portal authorization.
+"""
+
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common import share_access
+
+
+@tagged('post_install', '-at_install')
+class TestShareAccessIndex(TransactionCase):
+    """Test cases for ha_share_access maintenance and permission lookups"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Share Index Test HA Instance',
+            'api_url': 'http://share-index-test.local:8123',
+            'api_token': 'share_index_test_token_12345',
+            'active': True,
+        })
+        cls.user = cls.env['res.users'].sudo().create({
+            'name': 'Share Index Test User',
+            'login': 'share_index_test_user',
+            'groups_id': [(6, 0, [cls.env.ref('base.group_portal').id])],
+        })
+        cls.device = cls.env['ha.device'].sudo().create({
+            'device_id': 'share_index_device',
+            'name': 'Share Index Device',
+            'ha_instance_id': cls.ha_instance.id,
+        })
+        cls.Entity = cls.env['ha.entity'].sudo().with_context(from_ha_sync=True)
+        cls.entity_a, cls.entity_b = cls.Entity.create([{
+            'name': f'Share Index {name}',
+            'entity_id': f'sensor.share_index_{name.lower()}',
+            'domain': 'sensor',
+            'ha_instance_id': cls.ha_instance.id,
+        } for name in ('A', 'B')])
+        cls.group = cls.env['ha.entity.group'].sudo().with_context(from_ha_sync=True).create({
+            'name': 'Share Index Group',
+            'ha_instance_id': cls.ha_instance.id,
+            'entity_ids': [(6, 0, cls.entity_a.ids)],
+        })
+        cls.Share = cls.env['ha.entity.share'].sudo()
+
+    def _permission(self, target, record):
+        return self.Share._get_effective_permission(target, record.id, self.user.id)
+
+    def test_direct_share(self):
+        """直接分享建立索引列，刪除分享後失去存取"""
+        self.assertFalse(self._permission('entity', self.entity_b))
+        share = self.Share.create({
+            'entity_id': self.entity_b.id, 'user_id': self.user.id, 'permission': 'control',
+        })
+        self.assertEqual(self._permission('entity', self.entity_b), 'control')
+
+        share.write({'permission': 'view'})
+        self.assertEqual(self._permission('entity', self.entity_b), 'view')
+
+        share.unlink()
+        self.assertFalse(self._permission('entity', self.entity_b))
+
+    def test_group_share_follows_membership(self):
+        """群組分享展開為成員實體，成員變更時更新"""
+        self.Share.create({'group_id': self.group.id, 'user_id': self.user.id, 'permission': 'view'})
+        self.assertEqual(self._permission('group', self.group), 'view')
+        self.assertEqual(self._permission('entity', self.entity_a), 'view')
+        self.assertFalse(self._permission('entity', self.entity_b))
+
+        self.group.write({'entity_ids': [(6, 0, self.entity_b.ids)]})
+        self.assertFalse(self._permission('entity', self.entity_a))
+        self.assertEqual(self._permission('entity', self.entity_b), 'view')
+
+        # Membership changed from the entity side
+        self.entity_a.write({'group_ids': [(4, self.group.id)]})
+        self.assertEqual(self._permission('entity', self.entity_a), 'view')
+
+        self.group.write({'active': False})
+        self.assertFalse(self._permission('entity', self.entity_a))
+
+    def test_device_share_grants_entities(self):
+        """裝置分享授權裝置的實體，包含之後建立的實體"""
+        self.Share.create({'device_id': self.device.id, 'user_id': self.user.id, 'permission': 'control'})
+        self.assertEqual(self._permission('device', self.device), 'control')
+        self.assertFalse(self._permission('entity', self.entity_a))
+
+        self.entity_a.write({'device_id': self.device.id})
+        self.assertEqual(self._permission('entity', self.entity_a), 'control')
+
+        new_entity = self.Entity.create({
+            'name': 'Share Index New',
+            'entity_id': 'sensor.share_index_new',
+            'domain': 'sensor',
+            'ha_instance_id': self.ha_instance.id,
+            'device_id': self.device.id,
+        })
+        self.assertEqual(self._permission('entity', new_entity), 'control')
+
+        self.entity_a.write({'device_id': False})
+        self.assertFalse(self._permission('entity', self.entity_a))
+
+    def test_effective_permission_and_expiry(self):
+        """有效權限取未到期分享中最高的權限"""
+        now = fields.Datetime.now()
+        self.Share.create([
+            {'entity_id': self.entity_a.id, 'user_id': self.user.id, 'permission': 'view'},
+            {
+                'group_id': self.group.id,
+                'user_id': self.user.id,
+                'permission': 'control',
+                'expiry_date': now + timedelta(days=1),
+            },
+        ])
+        self.assertEqual(self._permission('entity', self.entity_a), 'control')
+
+        group_share = self.Share.search([('group_id', '=', self.group.id)])
+        group_share.write({'expiry_date': now - timedelta(days=1)})
+        self.assertEqual(self._permission('entity', self.entity_a), 'view')
+        self.assertFalse(self._permission('group', self.group))
+
+    def test_bulk_lookups(self):
+        """批次查詢與實例目標列表使用同一份索引"""
+        self.Share.create([
+            {'entity_id': self.entity_b.id, 'user_id': self.user.id, 'permission': 'control'},
+            {'group_id': self.group.id, 'user_id': self.user.id, 'permission': 'view'},
+        ])
+        entity_ids = (self.entity_a | self.entity_b).ids
+        self.assertEqual(
+            self.Share._get_accessible_entity_ids(entity_ids, self.user.id),
+            set(entity_ids),
+        )
+        self.assertEqual(sorted(self.Share._get_shared_entity_ids(entity_ids)), sorted(entity_ids))
+
+        targets = share_access.read_user_targets(self.env.cr, self.user.id, self.ha_instance.id)
+        self.assertEqual(targets['entity'], {self.entity_b.id: 'control'})
+        self.assertEqual(targets['group'], {self.group.id: 'view'})
+        self.assertEqual(targets['device'], {})
+
+    def test_cached_grants_follow_version(self):
+        """快取的授權列在版本號更新前沿用，更新後重新讀取"""
+        share = self.Share.create({'entity_id': self.entity_b.id, 'user_id': self.user.id, 'permission': 'view'})
+        self.assertEqual(self._permission('entity', self.entity_b), 'view')
+
+        # 繞過 refresh() 直接修改索引：版本號未變，仍使用快取
+        self.env.cr.execute(
+            f"UPDATE {share_access.TABLE} SET permission = 'control' WHERE share_id = %s", (share.id,)
+        )
+        self.assertEqual(self._permission('entity', self.entity_b), 'view')
+
+        share_access.bump_version(self.env.cr)
+        self.assertEqual(self._permission('entity', self.entity_b), 'control')
+
+    def test_group_unlink_invalidates_cache(self):
+        """刪除群組時連鎖刪除的分享不再授權"""
+        group = self.env['ha.entity.group'].sudo().with_context(from_ha_sync=True).create({
+            'name': 'Share Index Removed Group',
+            'ha_instance_id': self.ha_instance.id,
+            'entity_ids': [(6, 0, self.entity_b.ids)],
+        })
+        self.Share.create({'group_id': group.id, 'user_id': self.user.id, 'permission': 'view'})
+        self.assertEqual(self._permission('entity', self.entity_b), 'view')
+
+        group.unlink()
+        self.assertFalse(self._permission('entity', self.entity_b))
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the micro-batched state_changed ingestion pipeline.
+"""
+
+import asyncio
+from contextlib import nullcontext
+from datetime import datetime
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.odoo_ha_addon.models.common import hass_websocket_service
+from odoo.addons.odoo_ha_addon.models.common.hass_websocket_service import HassWebSocketService
+from odoo.addons.odoo_ha_addon.models.common.state_ingestion import (
+    StateIngestionPipeline,
+    get_ingestion_stats,
+)
+from odoo.addons.odoo_ha_addon.models.common.ws_config import STATE_MAX_TRANSITIONS
+
+
+@tagged('post_install', '-at_install')
+class TestStateIngestionPipeline(TransactionCase):
+    """Test cases for StateIngestionPipeline buffering and coalescing"""
+
+    def _run(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_updates_for_same_entity_are_coalesced(self):
+        """Multiple updates within one window produce one item with all transitions"""
+        flushed = []
+
+        async def flush_callback(batch):
+            flushed.append(batch)
+
+        async def scenario():
+            pipeline = StateIngestionPipeline(flush_callback, flush_size=10, flush_interval_ms=1000)
+            await pipeline.submit('sensor.power', {'state': '10'}, {'state': '5'})
+            await pipeline.submit('sensor.power', {'state': '12'}, {'state': '10'})
+            await pipeline.submit('light.kitchen', {'state': 'on'}, {'state': 'off'})
+            await pipeline.flush()
+            return pipeline.get_stats()
+
+        stats = self._run(scenario())
+
+        self.assertEqual(len(flushed), 1)
+        batch = {item['entity_id']: item for item in flushed[0]}
+        self.assertEqual(len(batch), 2)
+        power = batch['sensor.power']
+        self.assertEqual(power['old_state'], {'state': '5'}, "First old_state must be kept")
+        self.assertEqual(power['new_state'], {'state': '12'}, "Latest new_state must win")
+        self.assertEqual([t['state'] for t in power['transitions']], ['10', '12'])
+        self.assertEqual(stats['events_in'], 3)
+        self.assertEqual(stats['events_coalesced'], 1)
+        self.assertEqual(stats['entities_flushed'], 2)
+        self.assertEqual(stats['transitions_flushed'], 3)
+
+    def test_queue_depth_applies_backpressure(self):
+        """A full queue blocks submit until the running flush loop makes room"""
+        flushed = []
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def flush_callback(batch):
+                flushed.append(sum(len(item['transitions']) for item in batch))
+                await release.wait()
+
+            pipeline = StateIngestionPipeline(
+                flush_callback, flush_size=2, flush_interval_ms=10, queue_depth=3
+            )
+            runner = asyncio.create_task(pipeline.run())
+
+            async def produce():
+                for i in range(10):
+                    await pipeline.submit(f'sensor.s{i}', {'state': str(i)})
+
+            producer = asyncio.create_task(produce())
+            await asyncio.sleep(0.1)
+            blocked_stats = pipeline.get_stats()
+            producer_blocked = not producer.done()
+
+            release.set()
+            await producer
+            await pipeline.drain()
+            runner.cancel()
+            try:
+                await runner
+            except asyncio.CancelledError:
+                pass
+            return producer_blocked, blocked_stats, pipeline.get_stats()
+
+        producer_blocked, blocked_stats, stats = self._run(scenario())
+
+        self.assertTrue(producer_blocked, "submit must wait while the queue is full")
+        self.assertLessEqual(blocked_stats['queued'], 3)
+        self.assertGreater(stats['backpressure_waits'], 0)
+        self.assertEqual(sum(flushed), 10)
+        self.assertTrue(all(size <= 2 for size in flushed), "Batches are capped at flush_size entities")
+        self.assertEqual(stats['queued'], 0)
+
+    def test_transitions_per_entity_are_capped(self):
+        """A hot entity reaching STATE_MAX_TRANSITIONS is flushed in several batches"""
+        flushed = []
+
+        async def flush_callback(batch):
+            flushed.append([len(item['transitions']) for item in batch])
+
+        async def scenario():
+            pipeline = StateIngestionPipeline(
+                flush_callback, flush_size=10, flush_interval_ms=1000,
+                queue_depth=STATE_MAX_TRANSITIONS * 3,
+            )
+            for i in range(STATE_MAX_TRANSITIONS + 5):
+                await pipeline.submit('sensor.hot', {'state': str(i)})
+            await pipeline.flush()
+
+        self._run(scenario())
+
+        self.assertEqual(flushed, [[STATE_MAX_TRANSITIONS], [5]])
+
+    def test_transitions_use_ha_timestamps(self):
+        """Transitions carry HA's last_changed / last_updated, not the receive time"""
+        flushed = []
+
+        async def flush_callback(batch):
+            flushed.extend(batch)
+
+        async def scenario():
+            pipeline = StateIngestionPipeline(flush_callback, flush_size=10, flush_interval_ms=1000)
+            await pipeline.submit('sensor.power', {
+                'state': '10',
+                'last_changed': '2026-01-02T03:04:05.123456+00:00',
+                'last_updated': '2026-01-02T03:04:06.000000+00:00',
+            })
+            await pipeline.flush()
+
+        self._run(scenario())
+
+        transition = flushed[0]['transitions'][0]
+        self.assertEqual(transition['last_changed'], datetime(2026, 1, 2, 3, 4, 5))
+        self.assertEqual(transition['last_updated'], datetime(2026, 1, 2, 3, 4, 6))
+
+    def test_stats_registry_by_instance(self):
+        """Pipelines registered with a db_name are reported by get_ingestion_stats"""
+        async def flush_callback(batch):
+            pass
+
+        pipeline = StateIngestionPipeline(
+            flush_callback, db_name='test_ingestion_db', instance_id=42
+        )
+        try:
+            stats = get_ingestion_stats('test_ingestion_db')
+            self.assertIn(42, stats)
+            self.assertEqual(stats[42]['events_in'], 0)
+        finally:
+            pipeline.close()
+        self.assertEqual(get_ingestion_stats('test_ingestion_db'), {})
+
+
+@tagged('post_install', '-at_install')
+class TestStateBatchFlush(TransactionCase):
+    """Test cases for HassWebSocketService._sync_flush_state_batch database writes"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ha_instance = cls.env['ha.instance'].sudo().create({
+            'name': 'Batch Flush Test HA Instance',
+            'api_url': 'http://batch-flush-test.local:8123',
+            'api_token': 'batch_flush_test_token_12345',
+            'active': True,
+        })
+        cls.entity = cls.env['ha.entity'].sudo().with_context(from_ha_sync=True).create({
+            'name': 'Batch Flush Light',
+            'entity_id': 'light.batch_flush',
+            'domain': 'light',
+            'entity_state': 'on',
+            'last_changed': datetime(2026, 1, 1, 0, 0, 0),
+            'attributes': {'friendly_name': 'Batch Flush Light'},
+            'enable_record': True,
+            'ha_instance_id': cls.ha_instance.id,
+        })
+
+    def _flush(self, batch):
+        """以測試 cursor 執行批次 flush（不真正 commit），回傳 (新 entity 列表, 兩個通知的 mock)"""
+        service = HassWebSocketService(
+            db_name=self.env.cr.dbname, ha_url='http://batch-flush-test.local:8123',
+            ha_token='batch_flush_test_token_12345', instance_id=self.ha_instance.id,
+        )
+        connection = type('Connection', (), {'cursor': lambda _self: nullcontext(self.env.cr)})()
+        Realtime = self.registry['ha.realtime.update']
+        with patch.object(hass_websocket_service.db, 'db_connect', return_value=connection), \
+                patch.object(self.env.cr, 'commit'), \
+                patch.object(Realtime, 'notify_entity_state_changes') as notify, \
+                patch.object(Realtime, 'notify_portal_entity_states') as notify_portal:
+            new_entity_ids = service._sync_flush_state_batch(batch)
+        self.env.invalidate_all()
+        return new_entity_ids, notify, notify_portal
+
+    def _item(self, states):
+        """建立一個 light.batch_flush 的合併項目，states 為 [(state, 分鐘), ...]"""
+        transitions = [{
+            'state': state,
+            'attributes': {'friendly_name': 'Batch Flush Light'},
+            'last_changed': datetime(2026, 1, 1, 0, minute, 0),
+            'last_updated': datetime(2026, 1, 1, 0, minute, 0),
+        } for state, minute in states]
+        final_state, final_minute = states[-1]
+        return {
+            'entity_id': 'light.batch_flush',
+            'old_state': {'state': 'on'},
+            'new_state': {
+                'state': final_state,
+                'attributes': {'friendly_name': 'Batch Flush Light'},
+                'last_changed': f'2026-01-01T00:{final_minute:02d}:00+00:00',
+            },
+            'received_at': datetime(2026, 1, 1, 0, final_minute, 0),
+            'transitions': transitions,
+        }
+
+    def _history_states(self):
+        return self.env['ha.entity.history'].search(
+            [('entity_id', '=', self.entity.id)], order='last_changed'
+        ).mapped('entity_state')
+
+    def test_flap_within_window_updates_row(self):
+        """視窗內 on→off→on 最終指紋相同：寫入歷史、更新 last_changed 並發送通知"""
+        new_entity_ids, notify, notify_portal = self._flush([self._item([('off', 1), ('on', 2)])])
+
+        self.assertEqual(new_entity_ids, [])
+        self.assertEqual(self._history_states(), ['off', 'on'])
+        self.assertEqual(self.entity.entity_state, 'on')
+        self.assertEqual(self.entity.last_changed, datetime(2026, 1, 1, 0, 2, 0))
+        notify.assert_called_once()
+        self.assertEqual([change[0] for change in notify.call_args.args[0]], ['light.batch_flush'])
+        notify_portal.assert_called_once_with([self.entity.id])
+
+    def test_unchanged_state_is_skipped(self):
+        """只有 last_updated 變動（state 與指紋皆相同）：不寫入、不通知"""
+        _new_entity_ids, notify, notify_portal = self._flush([self._item([('on', 3)])])
+
+        self.assertEqual(self._history_states(), [])
+        self.assertEqual(self.entity.last_changed, datetime(2026, 1, 1, 0, 0, 0))
+        notify.assert_not_called()
+        notify_portal.assert_not_called()
+
+    def test_fallback_keeps_intermediate_transitions(self):
+        """批次寫入失敗時逐筆退回的路徑仍寫入每次中間轉換的歷史記錄"""
+        # 第一次呼叫（批次路徑）失敗，之後（退回路徑）使用原本的實作
+        service_cls = HassWebSocketService
+        original = service_cls._changed_transitions
+        calls = []
+
+        def failing_once(previous, transitions):
+            calls.append(previous)
+            if len(calls) == 1:
+                raise RuntimeError('batch failed')
+            return original(previous, transitions)
+
+        with patch.object(service_cls, '_changed_transitions', staticmethod(failing_once)), \
+                self.assertLogs(hass_websocket_service.__name__, level='ERROR'):
+            self._flush([self._item([('off', 1), ('on', 2)])])
+
+        self.assertEqual(len(calls), 2, "The per-entity fallback must run after the batch failure")
+        self.assertEqual(self._history_states(), ['off', 'on'])
+        self.assertEqual(self.entity.last_changed, datetime(2026, 1, 1, 0, 2, 0))
+
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Part of odoo_ha_addon. See LICENSE file for full copyright and licensing details.
+
+"""
+Tests for the WebSocket heartbeat liveness store.
+
+The benchmark class is excluded from the standard run; execute it with
+--test-tags /odoo_ha_addon:TestLivenessCacheBenchmark
+"""
+
+import logging
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+from odoo.tools.cache import STAT
+
+from odoo.addons.odoo_ha_addon.models.common import ws_liveness
+from odoo.addons.odoo_ha_addon.models.common.websocket_thread_manager import (
+    clear_status_cache,
+    get_websocket_status_details,
+)
+
+READ_AGES = 'odoo.addons.odoo_ha_addon.models.common.websocket_thread_manager._read_heartbeat_ages'
+
+_logger = logging.getLogger(__name__)
+
+
+def _create_instances(env, count, prefix):
+    return env['ha.instance'].sudo().create([{
+        'name': f'{prefix} {i}',
+        'api_url': f'http://{prefix.lower().replace(" ", "-")}-{i}.local:8123',
+        'api_token': f'liveness_test_token_{i}',
+        'active': True,
+    } for i in range(count)])
+
+
+@tagged('post_install', '-at_install')
+class TestWsLiveness(TransactionCase):
+    """Test cases for ws_liveness and the batched WebSocket status lookup"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.instances = _create_instances(cls.env, 3, 'Liveness Test')
+
+    def setUp(self):
+        super().setUp()
+        clear_status_cache()
+        self.addCleanup(clear_status_cache)
+
+    def _read_on_test_cursor(self, db_name, instance_ids=None):
+        return ws_liveness.read_liveness(self.env.cr, instance_ids)
+
+    def test_beat_is_upsert(self):
+        """同一實例重複心跳只保留一列"""
+        instance = self.instances[0]
+        ws_liveness.beat(self.env.cr, instance.id)
+        ws_liveness.beat(self.env.cr, instance.id)
+        self.env.cr.execute(f"SELECT COUNT(*) FROM {ws_liveness.TABLE} WHERE instance_id = %s", (instance.id,))
+        self.assertEqual(self.env.cr.fetchone()[0], 1)
+
+        ages = ws_liveness.read_liveness(self.env.cr, self.instances.ids)
+        self.assertEqual(list(ages), [instance.id])
+        self.assertLess(ages[instance.id], 5)
+
+    def test_beat_does_not_invalidate_caches(self):
+        """心跳不再經過 ir.config_parameter，不會清除 registry cache"""
+        invalidated = set(self.env.registry.cache_invalidated)
+        ws_liveness.beat(self.env.cr, self.instances[0].id)
+        self.assertEqual(set(self.env.registry.cache_invalidated), invalidated)
+
+    def test_batched_status(self):
+        """所有實例的狀態由一次心跳查詢決定"""
+        fresh, stale, missing = self.instances
+        ws_liveness.beat(self.env.cr, fresh.id)
+        ws_liveness.beat(self.env.cr, stale.id)
+        self.env.cr.execute(
+            f"UPDATE {ws_liveness.TABLE} SET last_beat = last_beat - interval '1 minute' WHERE instance_id = %s",
+            (stale.id,)
+        )
+
+        with patch(READ_AGES, side_effect=self._read_on_test_cursor) as read_ages:
+            self.instances.invalidate_recordset(['websocket_status'])
+            statuses = self.instances.mapped('websocket_status')
+
+        self.assertEqual(read_ages.call_count, 1)
+        self.assertEqual(statuses, ['connected', 'disconnected', 'disconnected'])
+
+    def test_status_cache_shared_between_calls(self):
+        """短時間內的多次狀態查詢共用同一次心跳查詢"""
+        ws_liveness.beat(self.env.cr, self.instances[0].id)
+        with patch(READ_AGES, side_effect=self._read_on_test_cursor) as read_ages:
+            first = get_websocket_status_details(self.env, self.instances.ids)
+            second = get_websocket_status_details(self.env, self.instances[:1].ids)
+            self.assertEqual(read_ages.call_count, 1)
+
+            clear_status_cache(self.env.cr.dbname)
+            get_websocket_status_details(self.env, self.instances.ids)
+            self.assertEqual(read_ages.call_count, 2)
+
+        self.assertEqual(set(first), set(self.instances.ids))
+        self.assertTrue(first[self.instances[0].id]['running'])
+        self.assertEqual(first[self.instances[0].id]['source'], 'heartbeat')
+        self.assertFalse(first[self.instances[1].id]['running'])
+        self.assertIsNone(first[self.instances[1].id]['heartbeat_age'])
+        self.assertTrue(second[self.instances[0].id]['running'])
+
+    def test_status_query_failure(self):
+        """心跳查詢失敗時回報未連線且不快取"""
+        with patch(READ_AGES, side_effect=Exception('timeout')) as read_ages:
+            details = get_websocket_status_details(self.env, self.instances.ids)
+            get_websocket_status_details(self.env, self.instances.ids)
+        self.assertEqual(read_ages.call_count, 2)
+        self.assertFalse(any(detail['running'] for detail in details.values()))
+
+    def test_instance_delete_removes_heartbeat(self):
+        """刪除實例時心跳記錄一併刪除"""
+        instance = _create_instances(self.env, 1, 'Liveness Delete')
+        ws_liveness.beat(self.env.cr, instance.id)
+        instance.unlink()
+        self.assertEqual(ws_liveness.read_liveness(self.env.cr, instance.ids), {})
+
+
+@tagged('post_install', '-at_install', '-standard', 'ha_benchmark')
+class TestLivenessCacheBenchmark(TransactionCase):
+    """ormcache hit rate of a busy worker while 20 instances send heartbeats"""
+
+    REQUESTS = 1000
+    # 20 個實例、10 秒心跳 = 每秒 2 次心跳；以每秒 10 個請求計，每 5 個請求一次心跳
+    REQUESTS_PER_HEARTBEAT = 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.instances = _create_instances(cls.env, 20, 'Liveness Benchmark')
+
+    def _hit_counts(self):
+        db_name = self.env.cr.dbname
+        hits = misses = 0
+        for key, counter in STAT.items():
+            if key[0] == db_name:
+                hits += counter.hit
+                misses += counter.miss
+        return hits, misses
+
+    def _serve_requests(self, heartbeat):
+        """模擬忙碌 worker：每個請求做幾次 ormcache 查詢，並穿插心跳寫入"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        IMD = self.env['ir.model.data']
+        hits_before, misses_before = self._hit_counts()
+        for i in range(self.REQUESTS):
+            ICP.get_param('odoo_ha_addon.ha_ws_heartbeat_interval')
+            ICP.get_param('web.base.url')
+            IMD._xmlid_lookup('base.user_admin')
+            if i % self.REQUESTS_PER_HEARTBEAT == 0:
+                heartbeat(self.instances[(i // self.REQUESTS_PER_HEARTBEAT) % len(self.instances)], i)
+        hits_after, misses_after = self._hit_counts()
+        hits, misses = hits_after - hits_before, misses_after - misses_before
+        return hits / (hits + misses) if hits + misses else 1.0
+
+    def test_benchmark_ormcache_hit_rate(self):
+        db_name = self.env.cr.dbname
+        ICP = self.env['ir.config_parameter'].sudo()
+
+        def legacy_heartbeat(instance, i):
+            # 舊版：每次心跳 set_param（值每次不同），清除 registry cache
+            ICP.set_param(f'odoo_ha_addon.ws_heartbeat_{db_name}_instance_{instance.id}', f'2026-01-01 00:00:{i % 60:02d}.{i}')
+
+        def liveness_heartbeat(instance, i):
+            ws_liveness.beat(self.env.cr, instance.id)
+
+        before = self._serve_requests(legacy_heartbeat)
+        after = self._serve_requests(liveness_heartbeat)
+        _logger.info(
+            f"Heartbeat ormcache benchmark ({self.REQUESTS} requests, heartbeat every "
+            f"{self.REQUESTS_PER_HEARTBEAT}): hit rate set_param={before:.1%}, liveness table={after:.1%}"
+        )
+        self.assertGreater(after, 0.99)
+        self.assertGreater(after, before)